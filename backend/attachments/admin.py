@@ -39,26 +39,16 @@ from django.db import models
 
 @admin.register(Attachment)
 class AttachmentAdmin(admin.ModelAdmin):
-	list_display = ('id', 'file', 'uploaded_by', 'description', 'content_type', 'related_model', 'object_id', 'is_active', 'is_confidential', 'download_count', 'created_at', 'expiry_date', 'is_approved', 'download_limit', 'file_preview', 'soft_delete_restore')
-	list_filter = ('is_active', 'is_confidential', 'content_type', 'related_model', 'created_at', 'expiry_date', 'is_approved', 'tags')
+	list_display = ('id', 'file', 'uploaded_by', 'description', 'content_type', 'related_model', 'object_id', 'is_active', 'is_confidential', 'download_count', 'created_at', 'expiry_date', 'is_approved', 'download_limit', 'file_preview', 'scan_status', 'processing_status', 'soft_delete_restore')
+	list_filter = ('is_active', 'is_confidential', 'scan_status', 'processing_status', 'content_type', 'related_model', 'created_at', 'expiry_date', 'is_approved', 'tags')
 	search_fields = ('description', 'file', 'uploaded_by__email', 'object_id', 'tags__name')
-	readonly_fields = ('created_at', 'updated_at', 'download_count', 'file_preview')
+	readonly_fields = ('created_at', 'updated_at', 'download_count', 'file_preview', 'scan_status', 'processing_status', 'processing_error', 'processed_at', 'metadata')
 	filter_horizontal = ('tags', 'shared_with_users', 'shared_with_groups')
 	actions = ['export_as_csv', 'soft_delete_selected', 'restore_selected', 'send_notifications', 'scan_for_viruses', 'create_new_version']
 	def scan_for_viruses(self, request, queryset):
-		import requests
-		scanned = 0
-		for obj in queryset:
-			# Example: VirusTotal public API (replace with your scanner)
-			try:
-				# This is a placeholder. Replace with real scan logic.
-				obj.is_virus_free = True
-				obj.virus_scan_report = 'No virus detected (placeholder)'
-				obj.save()
-				scanned += 1
-			except Exception as e:
-				continue
-		self.message_user(request, f"Virus scan completed for {scanned} attachments.")
+		from .processing import queue_processing
+		queued = queue_processing(queryset)
+		self.message_user(request, f"Virus scan queued for {queued} attachments.")
 	scan_for_viruses.short_description = 'Scan selected attachments for viruses'
 
 	def create_new_version(self, request, queryset):
@@ -0,0 +1,115 @@
+import io
+import shutil
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from reportlab.pdfgen import canvas
+
+from attachments.models import Attachment
+from attachments.processing import BATCH_SIZE, process_attachment, process_attachments
+from attachments.scanning import get_scanner
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _photo(width, height):
+    out = io.BytesIO()
+    Image.effect_noise((width, height), 64).convert('RGB').save(out, format='JPEG', quality=85)
+    return out.getvalue()
+
+
+def _pdf(pages):
+    out = io.BytesIO()
+    c = canvas.Canvas(out)
+    for page in range(pages):
+        c.drawString(72, 720, f'Benchmark page {page + 1}')
+        c.showPage()
+    c.save()
+    return out.getvalue()
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure attachment processing: the upload path (store and queue) against processing inline, '
+        'then worker throughput with batched bulk_update against one save() per attachment.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--files', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def _samples(self):
+        return [
+            ('photo.jpg', _photo(3000, 2000)),
+            ('scan.png', _photo(1600, 1200)),
+            ('handout.pdf', _pdf(40)),
+            ('notes.txt', b'lecture notes\n' * 5000),
+        ]
+
+    def _create(self, user, samples, count):
+        attachments = []
+        for i in range(count):
+            name, content = samples[i % len(samples)]
+            attachments.append(Attachment.objects.create(file=ContentFile(content, name=name), uploaded_by=user))
+        return attachments
+
+    def _report(self, label, count, elapsed, queries=None):
+        line = f'{label:<28} {count} files in {elapsed:.2f}s ({count / elapsed:,.1f} files/s, {elapsed / count * 1000:.1f} ms/file'
+        if queries is not None:
+            line += f', {queries} queries'
+        self.stdout.write(line + ')')
+
+    def handle(self, *args, **options):
+        count, batch_size = options['files'], options['batch_size']
+        samples = self._samples()
+        scanner = get_scanner()
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                # Everything the benchmark writes is rolled back afterwards
+                with transaction.atomic():
+                    user = get_user_model().objects.create_user('attachment-bench@example.invalid', 'pass')
+
+                    started = time.perf_counter()
+                    self._create(user, samples, count)
+                    self._report('upload (store + queue)', count, time.perf_counter() - started)
+
+                    started = time.perf_counter()
+                    for attachment in self._create(user, samples, count):
+                        process_attachment(attachment, scanner)
+                    self._report('upload (processed inline)', count, time.perf_counter() - started)
+                    Attachment.objects.update(processing_status='pending')
+
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        baseline = list(Attachment.objects.filter(processing_status='pending')[:count])
+                        for attachment in baseline:
+                            process_attachment(attachment, scanner)
+                            attachment.save()
+                        elapsed = time.perf_counter() - started
+                    self._report('worker, save() each', count, elapsed, len(queries))
+                    Attachment.objects.filter(pk__in=[a.pk for a in baseline]).update(processing_status='pending')
+
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        handled = 0
+                        while handled < count:
+                            batch = process_attachments(batch_size=min(batch_size, count - handled), scanner=scanner)
+                            if not batch:
+                                break
+                            handled += len(batch)
+                        elapsed = time.perf_counter() - started
+                    self._report(f'worker, batches of {batch_size}', handled, elapsed, len(queries))
+                    raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
@@ -0,0 +1,120 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.utils import timezone
+
+from attachments.models import Attachment
+from attachments.visibility import visible_to
+
+
+class _Rollback(Exception):
+    pass
+
+
+def legacy_visible_to(queryset, user, now):
+    """The filter AttachmentViewSet used before attachments.visibility."""
+    return queryset.exclude(expiry_date__isnull=False, expiry_date__lt=now).filter(
+        models.Q(is_approved=True)
+        | models.Q(shared_with_users=user)
+        | models.Q(shared_with_groups__in=user.groups.all())
+        | models.Q(uploaded_by=user)
+        | models.Q(is_confidential=False)
+    ).distinct()
+
+
+class Command(BaseCommand):
+    help = 'Compare the old JOIN + DISTINCT attachment visibility filter with the EXISTS version: timings and query plans.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attachments', type=int, default=1000000)
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def _seed(self, count, users, groups):
+        rng = random.Random(42)
+        user_ids = [u.pk for u in users]
+        group_ids = [g.pk for g in groups]
+        now = timezone.now()
+        UserShare = Attachment.shared_with_users.through
+        GroupShare = Attachment.shared_with_groups.through
+        user_field = Attachment.shared_with_users.field.m2m_reverse_field_name()
+        batch = 20000
+        for start in range(0, count, batch):
+            rows = Attachment.objects.bulk_create([
+                Attachment(
+                    file=f'attachments/bench/{start + i}.pdf',
+                    uploaded_by_id=rng.choice(user_ids),
+                    is_confidential=rng.random() < 0.7,
+                    is_approved=rng.random() < 0.1,
+                    expiry_date=now - timezone.timedelta(days=1) if rng.random() < 0.05 else None,
+                    processing_status='ready',
+                    scan_status='clean',
+                )
+                for i in range(min(batch, count - start))
+            ])
+            user_shares, group_shares = [], []
+            for attachment in rows:
+                if rng.random() < 0.2:
+                    for user_id in rng.sample(user_ids, 2):
+                        user_shares.append(UserShare(attachment_id=attachment.pk, **{f'{user_field}_id': user_id}))
+                if rng.random() < 0.1:
+                    for group_id in rng.sample(group_ids, rng.randint(1, 3)):
+                        group_shares.append(GroupShare(attachment_id=attachment.pk, group_id=group_id))
+            UserShare.objects.bulk_create(user_shares)
+            GroupShare.objects.bulk_create(group_shares)
+
+    def _time(self, repeat, fn):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best * 1000, result
+
+    def _compare(self, label, repeat, old, new):
+        old_ms, old_result = self._time(repeat, old)
+        new_ms, new_result = self._time(repeat, new)
+        if old_result != new_result:
+            raise RuntimeError(f'{label}: old and new filters disagree')
+        self.stdout.write(f'{label:<22} old {old_ms:9.1f} ms   new {new_ms:9.1f} ms   ({old_ms / max(new_ms, 0.001):.1f}x)')
+
+    def handle(self, *args, **options):
+        count, repeat = options['attachments'], options['repeat']
+        try:
+            # Everything the benchmark writes is rolled back afterwards
+            with transaction.atomic():
+                User = get_user_model()
+                users = User.objects.bulk_create([
+                    User(email=f'visibility-bench-{i}@example.invalid', password='!') for i in range(options['users'])
+                ])
+                users = list(User.objects.filter(email__startswith='visibility-bench-').order_by('id'))
+                groups = [Group.objects.create(name=f'visibility-bench-{i}') for i in range(options['groups'])]
+                viewer = users[0]
+                viewer.groups.set(groups[:5])
+                started = time.perf_counter()
+                self._seed(count, users, groups)
+                self.stdout.write(f'seeded {count} attachments in {time.perf_counter() - started:.1f}s')
+
+                now = timezone.now()
+                old = legacy_visible_to(Attachment.objects.all(), viewer, now)
+                new = visible_to(Attachment.objects.all(), viewer, now)
+                probe = Attachment.objects.filter(is_confidential=True, is_approved=False).exclude(uploaded_by=viewer).order_by('-id').values_list('id', flat=True).first()
+                self._compare('count', repeat, old.count, new.count)
+                self._compare('first page (20)', repeat,
+                              lambda: list(old.order_by('id').values_list('id', flat=True)[:20]),
+                              lambda: list(new.order_by('id').values_list('id', flat=True)[:20]))
+                self._compare('single attachment', repeat,
+                              lambda: old.filter(pk=probe).exists(),
+                              lambda: new.filter(pk=probe).exists())
+                for label, queryset in (('old', old), ('new', new)):
+                    self.stdout.write(f'\n{label} plan (first page):')
+                    self.stdout.write(queryset.order_by('id')[:20].explain())
+                raise _Rollback
+        except _Rollback:
+            pass
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attachments', '0005_alter_attachmentaccesslog_action_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='metadata',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='processing_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], db_index=True, default='pending', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='scan_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('clean', 'Clean'), ('infected', 'Infected'), ('error', 'Error')], db_index=True, default='pending', max_length=16),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attachments', '0006_attachment_processing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,26 +1,24 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-import os
-from io import BytesIO
-from django.core.files.base import ContentFile
-
-
-try:
-    from PIL import Image
-except ImportError:
-    Image = None
-try:
-    import fitz  # PyMuPDF
-except ImportError:
-    fitz = None
-
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.contrib.auth import get_user_model
 
 
 
 class Attachment(models.Model):
+    PROCESSING_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+    SCAN_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('clean', 'Clean'),
+        ('infected', 'Infected'),
+        ('error', 'Error'),
+    ]
 
     file = models.FileField(upload_to='attachments/%Y/%m/%d/')
     uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
@@ -41,6 +39,14 @@ class Attachment(models.Model):
     # Virus scan
     is_virus_free = models.BooleanField(default=True, db_index=True)
     virus_scan_report = models.TextField(blank=True)
+    scan_status = models.CharField(max_length=16, choices=SCAN_STATUS_CHOICES, default='pending', db_index=True)
+    # Background processing (thumbnail, scan, metadata)
+    processing_status = models.CharField(max_length=16, choices=PROCESSING_STATUS_CHOICES, default='pending', db_index=True)
+    processing_error = models.TextField(blank=True)
+    # When a worker claimed it; a claim older than processing.CLAIM_TIMEOUT is taken over
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    metadata = models.JSONField(default=dict, blank=True)
     # Advanced features
     expiry_date = models.DateTimeField(null=True, blank=True, db_index=True)
     is_approved = models.BooleanField(default=False, db_index=True)
@@ -88,35 +94,10 @@ class AttachmentNotificationLog(models.Model):
 
 
 
-# File preview generation logic (must be after Attachment definition)
+# Uploads are processed by a Celery worker (see attachments.processing)
 @receiver(post_save, sender=Attachment)
-def generate_file_preview(sender, instance, created, **kwargs):
-    if not created:
+def queue_attachment_processing(sender, instance, created, **kwargs):
+    if not created or not instance.file:
         return
-    if not instance.file:
-        return
-    ext = os.path.splitext(instance.file.name)[1].lower()
-    preview = None
-    # Image preview
-    if ext in ['.jpg', '.jpeg', '.png'] and Image:
-        try:
-            instance.file.seek(0)
-            img = Image.open(instance.file)
-            img.thumbnail((300, 300))
-            thumb_io = BytesIO()
-            img.save(thumb_io, format='JPEG')
-            preview = ContentFile(thumb_io.getvalue(), name=f"preview_{instance.pk}.jpg")
-        except Exception:
-            pass
-    # PDF preview
-    elif ext == '.pdf' and fitz:
-        try:
-            instance.file.seek(0)
-            pdf = fitz.open(stream=instance.file.read(), filetype="pdf")
-            page = pdf.load_page(0)
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-            img_bytes = pix.tobytes("jpeg")
-            preview = ContentFile(img_bytes, name=f"preview_{instance.pk}.jpg")
-        except Exception:
-            pass
-
+    from .tasks import process_attachments_task
+    transaction.on_commit(lambda: process_attachments_task.delay([instance.pk]))
@@ -0,0 +1,205 @@
+"""Background processing of uploaded attachments.
+
+An upload only stores the file; ``Attachment.processing_status`` starts
+at ``pending`` and the post-save receiver queues
+``process_attachments_task`` once the upload commits. A worker claims a
+batch of pending attachments (``skip_locked``, so several workers can
+drain the queue side by side), stamping ``claimed_at``, then for each
+one outside any transaction:
+
+* runs the configured scanner (``attachments.scanning``),
+* extracts metadata (size, SHA-256, MIME type, image dimensions or PDF
+  page count),
+* writes a JPEG thumbnail to ``file_preview`` for images, and for PDFs
+  when PyMuPDF is installed, but only for files the scan found clean.
+
+The results of the whole batch are written with one ``bulk_update``.
+Attachments still ``processing`` more than ``CLAIM_TIMEOUT`` after their
+claim belong to a worker that died; the next claim takes them over, and
+the periodic ``process_attachments_task`` makes sure one runs.
+An attachment whose scan or preview failed ends up ``failed`` with the
+reason in ``processing_error``; the admin can queue it again.
+"""
+import hashlib
+import io
+import logging
+import mimetypes
+import os
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Attachment
+from .scanning import ScanError, get_scanner
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+CLAIM_TIMEOUT = timedelta(minutes=30)
+PREVIEW_SIZE = (300, 300)
+PREVIEW_QUALITY = 80
+HASH_CHUNK = 1024 * 1024
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+RESULT_FIELDS = [
+    'is_virus_free', 'virus_scan_report', 'scan_status', 'processing_status',
+    'processing_error', 'processed_at', 'metadata', 'file_preview', 'updated_at',
+]
+
+
+def _jpeg(image):
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    out = io.BytesIO()
+    image.save(out, format='JPEG', quality=PREVIEW_QUALITY)
+    return out.getvalue()
+
+
+def image_preview(fileobj, metadata):
+    image = Image.open(fileobj)
+    metadata.update(width=image.width, height=image.height, format=image.format)
+    # JPEGs are decoded straight at (roughly) the preview size
+    image.draft('RGB', PREVIEW_SIZE)
+    image.thumbnail(PREVIEW_SIZE)
+    return _jpeg(image)
+
+
+def pdf_preview(fileobj, metadata):
+    if fitz is None:
+        from PyPDF2 import PdfReader
+        metadata['pages'] = len(PdfReader(fileobj).pages)
+        return None
+    with fitz.open(stream=fileobj.read(), filetype='pdf') as pdf:
+        metadata['pages'] = pdf.page_count
+        page = pdf.load_page(0)
+        # Render the first page at the preview size rather than upscaled
+        zoom = min(PREVIEW_SIZE[0] / page.rect.width, PREVIEW_SIZE[1] / page.rect.height)
+        return page.get_pixmap(matrix=fitz.Matrix(zoom, zoom)).tobytes('jpeg')
+
+
+def file_metadata(fileobj, name):
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: fileobj.read(HASH_CHUNK), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    return {
+        'size': size,
+        'sha256': digest.hexdigest(),
+        'mime_type': mimetypes.guess_type(name)[0] or 'application/octet-stream',
+        'extension': os.path.splitext(name)[1].lower(),
+    }
+
+
+def process_attachment(attachment, scanner):
+    """Scan ``attachment`` and fill in its metadata and preview, without saving it."""
+    errors = []
+    with attachment.file.open('rb') as fileobj:
+        try:
+            result = scanner.scan(fileobj)
+        except ScanError as exc:
+            # No verdict is not a clean verdict
+            attachment.scan_status = 'error'
+            attachment.is_virus_free = False
+            attachment.virus_scan_report = str(exc)
+            errors.append(f'Scan failed: {exc}')
+        else:
+            attachment.scan_status = 'clean' if result.clean else 'infected'
+            attachment.is_virus_free = result.clean
+            attachment.virus_scan_report = result.report
+        fileobj.seek(0)
+        metadata = file_metadata(fileobj, attachment.file.name)
+        preview = None
+        # Only files the scanner passed are ever opened by a decoder
+        if attachment.scan_status == 'clean':
+            fileobj.seek(0)
+            try:
+                if metadata['extension'] in IMAGE_EXTENSIONS and Image:
+                    preview = image_preview(fileobj, metadata)
+                elif metadata['extension'] == '.pdf':
+                    preview = pdf_preview(fileobj, metadata)
+            except Exception as exc:
+                logger.warning("Could not build a preview for attachment %s", attachment.pk, exc_info=True)
+                errors.append(f'Preview failed: {exc}')
+    if preview:
+        if attachment.file_preview:
+            attachment.file_preview.delete(save=False)
+        attachment.file_preview.save(f'preview_{attachment.pk}.jpg', ContentFile(preview), save=False)
+    attachment.metadata = metadata
+    attachment.processing_error = '\n'.join(errors)
+    attachment.processing_status = 'failed' if errors else 'ready'
+
+
+def claim(attachment_ids=None, batch_size=BATCH_SIZE):
+    """Mark up to ``batch_size`` pending (or abandoned) attachments as processing and return them."""
+    now = timezone.now()
+    abandoned = Q(processing_status='processing') & (Q(claimed_at__lt=now - CLAIM_TIMEOUT) | Q(claimed_at__isnull=True))
+    with transaction.atomic():
+        pending = Attachment.objects.filter(Q(processing_status='pending') | abandoned)
+        if attachment_ids is not None:
+            pending = pending.filter(id__in=attachment_ids)
+        batch = list(pending.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+        if batch:
+            Attachment.objects.filter(id__in=[a.id for a in batch]).update(processing_status='processing', claimed_at=now)
+    return batch
+
+
+def process_attachments(attachment_ids=None, batch_size=BATCH_SIZE, scanner=None):
+    """Process one batch of pending attachments; returns the processed attachments."""
+    batch = claim(attachment_ids, batch_size)
+    if not batch:
+        return []
+    scanner = scanner or get_scanner()
+    for attachment in batch:
+        if not attachment.file:
+            attachment.processing_status = 'failed'
+            attachment.processing_error = 'No file'
+            continue
+        try:
+            process_attachment(attachment, scanner)
+        except Exception as exc:
+            # Missing or unreadable file: record it and carry on with the batch
+            logger.exception("Processing attachment %s failed", attachment.pk)
+            attachment.processing_status = 'failed'
+            attachment.processing_error = str(exc)[:2000]
+    now = timezone.now()
+    for attachment in batch:
+        attachment.processed_at = now
+        attachment.updated_at = now
+    Attachment.objects.bulk_update(batch, RESULT_FIELDS)
+    return batch
+
+
+def drain_attachments(attachment_ids=None, batch_size=BATCH_SIZE):
+    """Process pending attachments until none are left; returns how many were handled."""
+    handled = 0
+    scanner = get_scanner()
+    while True:
+        batch = process_attachments(attachment_ids, batch_size, scanner)
+        if not batch:
+            return handled
+        handled += len(batch)
+
+
+def queue_processing(queryset):
+    """Reset the attachments in ``queryset`` to pending and queue them; returns the count."""
+    from .tasks import process_attachments_task
+    ids = list(queryset.values_list('id', flat=True))
+    Attachment.objects.filter(id__in=ids).update(
+        processing_status='pending', scan_status='pending', processing_error='', updated_at=timezone.now(),
+    )
+    for start in range(0, len(ids), BATCH_SIZE):
+        chunk = ids[start:start + BATCH_SIZE]
+        transaction.on_commit(lambda chunk=chunk: process_attachments_task.delay(chunk))
+    return len(ids)
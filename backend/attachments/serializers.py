@@ -33,4 +33,9 @@ class AttachmentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Attachment
         fields = '__all__'
+        # Written by the processing pipeline only
+        read_only_fields = [
+            'is_virus_free', 'virus_scan_report', 'scan_status', 'processing_status',
+            'processing_error', 'processed_at', 'metadata',
+        ]
 
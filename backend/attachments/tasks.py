@@ -0,0 +1,9 @@
+from celery import shared_task
+
+from .processing import drain_attachments
+
+
+@shared_task
+def process_attachments_task(attachment_ids=None):
+    """Scan, preview and extract metadata for pending attachments (all of them when no ids are given)."""
+    return drain_attachments(attachment_ids)
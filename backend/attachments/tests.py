@@ -9,6 +9,11 @@ User = get_user_model()
 
 class AttachmentTests(APITestCase):
     def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
         self.user = User.objects.create_user('user@example.com', 'pass', first_name='Test', last_name='User')
         self.client.force_authenticate(self.user)
 
@@ -44,3 +49,213 @@ class AttachmentTests(APITestCase):
         restore_url = f'/api/attachments/attachments/{att_id}/restore/'
         resp3 = self.client.post(restore_url, follow=True)
         self.assertEqual(resp3.status_code, status.HTTP_200_OK)
+
+
+import shutil
+import socketserver
+import struct
+import tempfile
+import threading
+from io import BytesIO
+
+from django.test import TestCase, override_settings
+
+from .processing import process_attachments, queue_processing
+
+TEST_SIGNATURE = b'UZURI-TEST-SIGNATURE'
+
+
+class ClamdStubHandler(socketserver.BaseRequestHandler):
+    """Answers clamd's zINSTREAM command, flagging streams that contain TEST_SIGNATURE."""
+
+    def _read(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def handle(self):
+        assert self._read(len(b'zINSTREAM\0')) == b'zINSTREAM\0'
+        stream = b''
+        while True:
+            (size,) = struct.unpack('!L', self._read(4))
+            if not size:
+                break
+            stream += self._read(size)
+        if TEST_SIGNATURE in stream:
+            self.request.sendall(b'stream: Uzuri-Test-Signature FOUND\0')
+        else:
+            self.request.sendall(b'stream: OK\0')
+
+
+class AttachmentProcessingTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create_user('processing@example.com', 'pass')
+
+    def _clamd(self):
+        server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), ClamdStubHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        scanner = override_settings(
+            ATTACHMENT_SCANNER='attachments.scanning.ClamdScanner',
+            CLAMD_HOST='127.0.0.1', CLAMD_PORT=server.server_address[1],
+        )
+        scanner.enable()
+        self.addCleanup(scanner.disable)
+
+    def _attachment(self, name, content):
+        with self.captureOnCommitCallbacks(execute=False):
+            return Attachment.objects.create(file=SimpleUploadedFile(name, content), uploaded_by=self.user)
+
+    def test_upload_returns_before_processing(self):
+        from rest_framework.test import APIClient
+        from rest_framework.reverse import reverse
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            resp = client.post(reverse('attachment-list'), {'file': SimpleUploadedFile('a.txt', b'hello')}, format='multipart')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.data['processing_status'], 'pending')
+        self.assertEqual(resp.data['scan_status'], 'pending')
+        self.assertEqual(len(callbacks), 1)
+        self.assertIsNone(resp.data['file_preview'])
+
+    def test_image_gets_preview_and_metadata(self):
+        from PIL import Image
+        image = BytesIO()
+        Image.new('RGBA', (1200, 600), (200, 10, 10, 128)).save(image, format='PNG')
+        attachment = self._attachment('photo.png', image.getvalue())
+        self.assertEqual(len(process_attachments([attachment.pk])), 1)
+        attachment.refresh_from_db()
+        self.assertEqual(attachment.processing_status, 'ready')
+        self.assertEqual(attachment.scan_status, 'clean')
+        self.assertEqual(attachment.metadata['width'], 1200)
+        self.assertEqual(attachment.metadata['mime_type'], 'image/png')
+        self.assertIsNotNone(attachment.processed_at)
+        with attachment.file_preview.open('rb') as preview:
+            self.assertEqual(Image.open(preview).size, (300, 150))
+        # Processed attachments are not picked up again
+        self.assertEqual(process_attachments([attachment.pk]), [])
+
+    def test_clamd_scanner_flags_infected_files_in_one_batch(self):
+        self._clamd()
+        clean = self._attachment('notes.txt', b'lecture notes')
+        infected = self._attachment('payload.txt', b'xx' + TEST_SIGNATURE + b'xx')
+        with self.assertNumQueries(5):
+            # Claim (savepoint, select, update, release), then one bulk_update for the batch
+            process_attachments()
+        clean.refresh_from_db()
+        infected.refresh_from_db()
+        self.assertEqual((clean.scan_status, clean.is_virus_free), ('clean', True))
+        self.assertEqual(clean.virus_scan_report, 'stream: OK')
+        self.assertEqual((infected.scan_status, infected.is_virus_free), ('infected', False))
+        self.assertIn('FOUND', infected.virus_scan_report)
+        from rest_framework.test import APIClient
+        client = APIClient()
+        client.force_authenticate(self.user)
+        resp = client.post(f'/api/attachments/attachments/{infected.pk}/download/')
+        self.assertEqual(resp.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(ATTACHMENT_SCANNER='attachments.scanning.ClamdScanner', CLAMD_HOST='127.0.0.1', CLAMD_PORT=1)
+    def test_unreachable_scanner_fails_and_can_be_requeued(self):
+        from PIL import Image
+        image = BytesIO()
+        Image.new('RGB', (40, 40)).save(image, format='PNG')
+        attachment = self._attachment('photo.png', image.getvalue())
+        process_attachments()
+        attachment.refresh_from_db()
+        self.assertEqual(attachment.processing_status, 'failed')
+        self.assertEqual(attachment.scan_status, 'error')
+        self.assertIn('Scan failed', attachment.processing_error)
+        # Without a verdict the file is neither trusted, decoded nor served
+        self.assertFalse(attachment.is_virus_free)
+        self.assertFalse(attachment.file_preview)
+        from rest_framework.test import APIClient
+        client = APIClient()
+        client.force_authenticate(self.user)
+        resp = client.post(f'/api/attachments/attachments/{attachment.pk}/download/')
+        self.assertEqual(resp.status_code, status.HTTP_403_FORBIDDEN)
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.assertEqual(queue_processing(Attachment.objects.filter(pk=attachment.pk)), 1)
+        self.assertEqual(len(callbacks), 1)
+        attachment.refresh_from_db()
+        self.assertEqual((attachment.processing_status, attachment.scan_status), ('pending', 'pending'))
+
+
+    def test_abandoned_claims_are_taken_over(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .processing import CLAIM_TIMEOUT
+        stale = self._attachment('stale.txt', b'worker died')
+        busy = self._attachment('busy.txt', b'still running')
+        now = timezone.now()
+        Attachment.objects.filter(pk=stale.pk).update(processing_status='processing', claimed_at=now - CLAIM_TIMEOUT - timedelta(minutes=1))
+        Attachment.objects.filter(pk=busy.pk).update(processing_status='processing', claimed_at=now)
+        self.assertEqual([a.pk for a in process_attachments()], [stale.pk])
+        stale.refresh_from_db()
+        busy.refresh_from_db()
+        self.assertEqual((stale.processing_status, busy.processing_status), ('ready', 'processing'))
+
+class AttachmentVisibilityTests(TestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from django.contrib.auth.models import Group
+        from django.utils import timezone
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create_user('viewer@example.com', 'pass')
+        self.other = User.objects.create_user('owner@example.com', 'pass')
+        groups = [Group.objects.create(name=f'visibility-{i}') for i in range(3)]
+        self.user.groups.set(groups)
+
+        def attachment(**fields):
+            with self.captureOnCommitCallbacks(execute=False):
+                return Attachment.objects.create(
+                    file=SimpleUploadedFile('f.txt', b'x'), **{'uploaded_by': self.other, 'is_confidential': True, **fields},
+                )
+
+        self.hidden = attachment()
+        self.expired = attachment(is_confidential=False, expiry_date=timezone.now() - timedelta(days=1))
+        self.visible = {
+            attachment(is_approved=True).pk,
+            attachment(is_confidential=False).pk,
+            attachment(uploaded_by=self.user).pk,
+        }
+        shared = attachment()
+        shared.shared_with_users.add(self.user)
+        # Shared with the user directly and through every group: still listed once
+        shared.shared_with_groups.set(groups)
+        group_shared = attachment()
+        group_shared.shared_with_groups.add(groups[1])
+        self.visible |= {shared.pk, group_shared.pk}
+
+    def test_visible_to_matches_the_sharing_rules_without_distinct(self):
+        from .visibility import visible_to
+        queryset = visible_to(Attachment.objects.order_by('id'), self.user)
+        self.assertEqual(list(queryset.values_list('id', flat=True)), sorted(self.visible))
+        sql = str(queryset.query).upper()
+        self.assertNotIn('DISTINCT', sql)
+        self.assertIn('EXISTS', sql)
+
+    def test_detail_actions_respect_visibility(self):
+        from rest_framework.test import APIClient
+        client = APIClient()
+        client.force_authenticate(self.user)
+        resp = client.get('/api/attachments/attachments/')
+        self.assertEqual({row['id'] for row in resp.data}, self.visible)
+        for pk in self.visible:
+            self.assertEqual(client.get(f'/api/attachments/attachments/{pk}/').status_code, status.HTTP_200_OK)
+        for pk in (self.hidden.pk, self.expired.pk):
+            self.assertEqual(client.get(f'/api/attachments/attachments/{pk}/').status_code, status.HTTP_404_NOT_FOUND)
@@ -1,3 +1,7 @@
+import shutil
+import tempfile
+
+from django.test import override_settings
 from rest_framework.test import APITestCase
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -8,6 +12,11 @@ User = get_user_model()
 
 class AttachmentOwnerRegressionTests(APITestCase):
     def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
         self.user = User.objects.create_user(email='owner@example.com', password='pass')
         self.client.force_authenticate(self.user)
 
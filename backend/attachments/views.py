@@ -1,10 +1,10 @@
-from django.db import models
 from rest_framework import viewsets, permissions, throttling, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from .models import Attachment, AttachmentComment, AttachmentTag, AttachmentAccessLog
 from .serializers import AttachmentSerializer, AttachmentCommentSerializer, AttachmentTagSerializer, AttachmentAccessLogSerializer
-from django.utils import timezone
+from .scanning import scanner_configured
+from .visibility import visible_to
 # ViewSet for AttachmentTag
 from rest_framework import permissions
 class AttachmentTagViewSet(viewsets.ModelViewSet):
@@ -44,22 +44,11 @@ class AttachmentViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         qs = super().get_queryset()
-        user = self.request.user
         # Only show attachments that are approved or owned/shared/non-confidential.
         # Previously we applied `is_approved=True` first which excluded
         # attachments uploaded by the current user (which are often unapproved
         # immediately after upload) and caused detail actions to return 404.
-        now = timezone.now()
-        qs = qs.exclude(
-            expiry_date__isnull=False,
-            expiry_date__lt=now
-        ).filter(
-            models.Q(is_approved=True) |
-            models.Q(shared_with_users=user) |
-            models.Q(shared_with_groups__in=user.groups.all()) |
-            models.Q(uploaded_by=user) |
-            models.Q(is_confidential=False)
-        ).distinct()
+        qs = visible_to(qs, self.request.user)
         return qs
 
     def retrieve(self, request, *args, **kwargs):
@@ -76,6 +65,10 @@ class AttachmentViewSet(viewsets.ModelViewSet):
         instance = self.get_object()
         if instance.download_limit is not None and instance.download_count >= instance.download_limit:
             return Response({'detail': 'Download limit reached.'}, status=403)
+        if instance.scan_status == 'infected':
+            return Response({'detail': 'This file failed the virus scan.'}, status=403)
+        if scanner_configured() and instance.scan_status != 'clean':
+            return Response({'detail': 'This file has not passed the virus scan yet.'}, status=403)
         instance.download_count += 1
         instance.save()
         AttachmentAccessLog.objects.create(attachment=instance, user=request.user, action='download')
@@ -0,0 +1,40 @@
+"""Which attachments a user may see.
+
+An attachment is visible when it has not expired and it is approved,
+not confidential, uploaded by the user, or shared with the user or one
+of the user's groups.
+
+The two sharing rules are ``EXISTS`` subqueries against the M2M through
+tables rather than joins. Each one is a lookup on the through table's
+unique ``(attachment, user)`` / ``(attachment, group)`` index, and a row
+can no longer be repeated once per share, so no ``DISTINCT`` is needed.
+A single attachment (retrieve, download) is one primary-key lookup plus
+those probes.
+"""
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import Attachment
+
+
+def visibility_filter(user):
+    """``Q`` matching the attachments ``user`` may see, ignoring expiry."""
+    user_shares = Attachment.shared_with_users.through.objects.filter(
+        attachment_id=OuterRef('pk'), **{Attachment.shared_with_users.field.m2m_reverse_field_name(): user.pk},
+    )
+    group_shares = Attachment.shared_with_groups.through.objects.filter(
+        attachment_id=OuterRef('pk'), group_id__in=user.groups.values('id'),
+    )
+    return (
+        Q(is_approved=True)
+        | Q(is_confidential=False)
+        | Q(uploaded_by=user.pk)
+        | Exists(user_shares)
+        | Exists(group_shares)
+    )
+
+
+def visible_to(queryset, user, now=None):
+    """Restrict ``queryset`` to unexpired attachments ``user`` may see."""
+    now = now or timezone.now()
+    return queryset.filter(Q(expiry_date__isnull=True) | Q(expiry_date__gte=now)).filter(visibility_filter(user))
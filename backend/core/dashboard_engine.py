@@ -0,0 +1,191 @@
+"""Role sections for the unified dashboard.
+
+Every section is a bounded query: lists are paginated with ``page`` /
+``page_size`` and institution-wide figures are aggregated in the database,
+so a section's payload depends on the page size rather than on how many
+students, invoices or transactions exist. The notification summary is
+shared by all sections and loaded once per request.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.paginator import Paginator, EmptyPage
+from django.db import connection, connections
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .dashboard_snapshot import get_dashboard_snapshot, get_snapshot_metrics
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 50
+
+
+def paginate(queryset, params):
+    """Return one page of ``queryset`` as ``{'count', 'page', 'results'}``."""
+    try:
+        page_size = min(int(params.get('page_size', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        page_number = max(int(params.get('page', 1)), 1)
+    except (TypeError, ValueError):
+        page_size, page_number = DEFAULT_PAGE_SIZE, 1
+    paginator = Paginator(queryset, max(page_size, 1))
+    try:
+        page = paginator.page(page_number)
+    except EmptyPage:
+        return {'count': paginator.count, 'page': page_number, 'results': []}
+    return {'count': paginator.count, 'page': page_number, 'results': list(page.object_list)}
+
+
+def student_section(user, params):
+    return get_dashboard_snapshot(user)
+
+
+def lecturer_section(user, params):
+    from timetable.models import TimetableEntry
+    names = [user.email, f"{user.first_name} {user.last_name}".strip()]
+    classes = (
+        TimetableEntry.objects.filter(lecturer__in=names, is_active=True)
+        .order_by('day_of_week', 'start_time', 'id')
+        .values('id', 'unit_code', 'unit_name', 'day_of_week', 'start_time', 'end_time', 'venue')
+    )
+    return {'classes': paginate(classes, params)}
+
+
+def registrar_section(user, params):
+    from uzuri_calendar.models import CalendarEvent
+    from core.models import Transcript
+    from core.results_analytics import cohort_gpa
+    from final_results.models import ResultAggregate
+    from core.models_shared import StudentProfile
+    from graduation.models import GraduationApplication
+    from unit_registration.models import UnitRegistration
+
+    registrations = (
+        UnitRegistration.objects.filter(status='pending')
+        .order_by('-created_at', '-id')
+        .values('id', 'student_id', 'semester', 'status', 'created_at')
+    )
+    shared = CalendarEvent.shared_with.through.objects.filter(customuser_id=user.id).values('calendarevent_id')
+    calendar = (
+        CalendarEvent.objects.filter(Q(created_by=user) | Q(id__in=shared), start_time__gte=timezone.now())
+        .order_by('start_time', 'id')
+        .values('id', 'title', 'category', 'start_time', 'end_time')
+    )
+    return {
+        'students_by_program': list(
+            StudentProfile.objects.values('program').annotate(count=Count('id')).order_by('program')
+        ),
+        'registrations': paginate(registrations, params),
+        'pending_graduation_applications': GraduationApplication.objects.filter(status='pending').count(),
+        'transcripts_issued': Transcript.objects.count(),
+        # Read from the per-term aggregates, never from individual results
+        'gpa_by_program': cohort_gpa(ResultAggregate, year=params.get('year'), semester=params.get('semester')),
+        'calendar': paginate(calendar, params),
+    }
+
+
+def finance_section(user, params):
+    from fees.models import Invoice, Transaction
+
+    transactions = (
+        Transaction.objects.order_by('-created_at', '-id')
+        .values('id', 'student_id', 'invoice_id', 'amount', 'method', 'reference', 'status', 'created_at')
+    )
+    by_status = Transaction.objects.values('status').annotate(count=Count('id'), total=Sum('amount')).order_by('status')
+    invoices = Invoice.objects.aggregate(
+        outstanding=Sum('amount', filter=~Q(status='paid')),
+        overdue_count=Count('id', filter=Q(status='overdue')),
+        overdue_total=Sum('amount', filter=Q(status='overdue')),
+    )
+    return {
+        'transactions': paginate(transactions, params),
+        'analytics': {
+            'cash_flow': Transaction.objects.filter(status='success').aggregate(total=Sum('amount')),
+            'transactions_by_status': list(by_status),
+            'invoices': invoices,
+        },
+    }
+
+
+def hod_section(user, params):
+    from core.models import Program
+    from core.models_shared import StudentProfile
+    from unit_registration.models import UnitRegistration
+
+    department = params.get('department')
+    if not department:
+        return {'department': None}
+    programs = Program.objects.filter(department=department).values_list('name', flat=True)
+    approvals = (
+        UnitRegistration.objects.filter(status='pending', student__program__in=programs)
+        .order_by('-created_at', '-id')
+        .values('id', 'student_id', 'semester', 'created_at')
+    )
+    return {
+        'department': department,
+        'students_by_program': list(
+            StudentProfile.objects.filter(program__in=programs)
+            .values('program', 'year')
+            .annotate(count=Count('id'))
+            .order_by('program', 'year')
+        ),
+        'approvals': paginate(approvals, params),
+    }
+
+
+def it_admin_section(user, params):
+    return {'dashboard_cache': get_snapshot_metrics()}
+
+
+SECTION_BUILDERS = {
+    'student': student_section,
+    'lecturer': lecturer_section,
+    'registrar': registrar_section,
+    'finance': finance_section,
+    'hod': hod_section,
+    'it_admin': it_admin_section,
+}
+
+ROLE_ALIASES = {
+    'student': 'student',
+    'lecturer': 'lecturer',
+    'registrar': 'registrar',
+    'finance': 'finance',
+    'finance staff': 'finance',
+    'hod': 'hod',
+    'head of department': 'hod',
+    'it_admin': 'it_admin',
+    'system administrator': 'it_admin',
+}
+
+
+def resolve_sections(user):
+    """Work out which role sections apply to ``user``."""
+    if user.is_superuser:
+        return list(SECTION_BUILDERS)
+    sections = []
+    role = ROLE_ALIASES.get((getattr(user, 'role', '') or '').strip().lower())
+    if role:
+        sections.append(role)
+    if user.is_staff and 'it_admin' not in sections:
+        sections.append('it_admin')
+    return sections
+
+
+def _run_section(name, user, params):
+    try:
+        return SECTION_BUILDERS[name](user, params)
+    finally:
+        # Worker threads open their own connections; release them here.
+        connections.close_all()
+
+
+def build_sections(user, names, params):
+    """Compute the requested sections, concurrently where the database allows it."""
+    workers = getattr(settings, 'DASHBOARD_SECTION_WORKERS', 4)
+    # SQLite serialises access anyway and test databases are not visible
+    # across connections, so only fan out on a real database server.
+    if len(names) < 2 or workers < 2 or connection.vendor == 'sqlite':
+        return {name: SECTION_BUILDERS[name](user, params) for name in names}
+    with ThreadPoolExecutor(max_workers=min(workers, len(names))) as pool:
+        futures = {name: pool.submit(_run_section, name, user, params) for name in names}
+        return {name: future.result() for name, future in futures.items()}
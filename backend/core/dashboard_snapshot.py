@@ -0,0 +1,203 @@
+"""Per-student dashboard snapshots kept in the default cache.
+
+Each dashboard section is stored under its own key so that a write to, say,
+an Invoice only drops the ``invoices`` section. A dashboard read fetches all
+sections with a single ``get_many`` and only rebuilds the ones that are
+missing.
+"""
+import logging
+
+from django.core.cache import cache
+from django.db.models import Count
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_TTL = 60 * 15
+# Lists in the snapshot are capped so the cached payload stays compact.
+SECTION_LIMIT = 20
+
+SECTIONS = (
+    'profile',
+    'units',
+    'invoices',
+    'transactions',
+    'results',
+    'academic_summary',
+    'leaves',
+    'graduation',
+    'timetable',
+)
+
+HITS_KEY = 'dashboard_snapshot:metrics:hits'
+MISSES_KEY = 'dashboard_snapshot:metrics:misses'
+
+
+def section_key(user_id, section):
+    return f'dashboard_snapshot:{user_id}:{section}'
+
+
+def _build_profile(user):
+    from core.models_shared import StudentProfile
+    return (
+        StudentProfile.objects.filter(user=user)
+        .values('id', 'student_id', 'program', 'year', 'gpa')
+        .first()
+    ) or {}
+
+
+def _build_units(user):
+    from unit_registration.models import UnitRegistration
+    qs = (
+        UnitRegistration.objects.filter(student__user=user)
+        .annotate(unit_count=Count('items'))
+        .order_by('-created_at')
+        .values('id', 'semester', 'status', 'unit_count', 'created_at')
+    )
+    return list(qs[:SECTION_LIMIT])
+
+
+def _build_invoices(user):
+    from fees.models import Invoice
+    qs = (
+        Invoice.objects.filter(student=user)
+        .order_by('-created_at')
+        .values('id', 'description', 'category', 'amount', 'due_date', 'status')
+    )
+    return list(qs[:SECTION_LIMIT])
+
+
+def _build_transactions(user):
+    from fees.models import Transaction
+    qs = (
+        Transaction.objects.filter(student=user)
+        .order_by('-created_at')
+        .values('id', 'invoice_id', 'amount', 'method', 'reference', 'status', 'created_at')
+    )
+    return list(qs[:SECTION_LIMIT])
+
+
+def _build_results(user):
+    from provisional_results.models import Result
+    qs = (
+        Result.objects.filter(student=user)
+        .order_by('-year', '-semester', 'unit_code')
+        .values('id', 'unit_code', 'unit_name', 'marks', 'grade', 'semester', 'year', 'status')
+    )
+    return list(qs[:SECTION_LIMIT])
+
+
+def _build_academic_summary(user):
+    from core.results_analytics import combine, student_terms
+    from provisional_results.models import ResultAggregate
+    terms = student_terms(ResultAggregate, user)
+    return {
+        'cumulative': combine(terms),
+        'terms': [
+            {key: term[key] for key in ('semester', 'year', 'units', 'gpa', 'average')}
+            for term in terms[-SECTION_LIMIT:]
+        ],
+    }
+
+
+def _build_leaves(user):
+    from academic_leave.models import AcademicLeaveRequest
+    qs = (
+        AcademicLeaveRequest.objects.filter(student__user=user)
+        .order_by('-created_at')
+        .values('id', 'leave_type', 'start_date', 'end_date', 'status')
+    )
+    return list(qs[:SECTION_LIMIT])
+
+
+def _build_graduation(user):
+    from graduation.models import GraduationApplication
+    return (
+        GraduationApplication.objects.filter(student=user)
+        .order_by('-submitted_at')
+        .values('id', 'event_id', 'status', 'is_eligible', 'is_cleared', 'submitted_at')
+        .first()
+    ) or {}
+
+
+def _build_timetable(user):
+    from core.models_shared import StudentProfile
+    from timetable.models import Timetable
+    profile = StudentProfile.objects.filter(user=user).values('program', 'year').first()
+    if not profile:
+        return []
+    qs = (
+        Timetable.objects.filter(program=profile['program'], year_of_study=profile['year'], is_active=True)
+        .order_by('-created_at')
+        .values('id', 'semester', 'academic_year')
+    )
+    return list(qs[:SECTION_LIMIT])
+
+
+BUILDERS = {
+    'profile': _build_profile,
+    'units': _build_units,
+    'invoices': _build_invoices,
+    'transactions': _build_transactions,
+    'results': _build_results,
+    'academic_summary': _build_academic_summary,
+    'leaves': _build_leaves,
+    'graduation': _build_graduation,
+    'timetable': _build_timetable,
+}
+
+
+def _incr(key, delta):
+    # cache.incr raises on a missing key, so seed the counter first
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        pass
+
+
+def get_dashboard_snapshot(user):
+    """Return the dashboard sections for ``user``, rebuilding any that are missing."""
+    keys = {section: section_key(user.id, section) for section in SECTIONS}
+    cached = cache.get_many(keys.values())
+    snapshot = {}
+    missing = {}
+    for section, key in keys.items():
+        if key in cached:
+            snapshot[section] = cached[key]
+        else:
+            snapshot[section] = BUILDERS[section](user)
+            missing[key] = snapshot[section]
+    if missing:
+        cache.set_many(missing, SNAPSHOT_TTL)
+        _incr(MISSES_KEY, 1)
+        logger.debug("Dashboard snapshot miss for user %s: %s", user.id, sorted(missing))
+    else:
+        _incr(HITS_KEY, 1)
+    return snapshot
+
+
+def invalidate_section(user_id, *sections):
+    """Drop cached sections for a user; they are rebuilt on the next read."""
+    if user_id is None:
+        return
+    cache.delete_many([section_key(user_id, section) for section in (sections or SECTIONS)])
+
+
+def invalidate_users(user_ids, *sections):
+    """Drop the given sections for many users in one cache round trip."""
+    cache.delete_many([
+        section_key(user_id, section)
+        for user_id in user_ids
+        for section in (sections or SECTIONS)
+    ])
+
+
+def get_snapshot_metrics():
+    hits = cache.get(HITS_KEY) or 0
+    misses = cache.get(MISSES_KEY) or 0
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+    }
@@ -0,0 +1,72 @@
+import time
+from urllib.parse import parse_qs, urlparse
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.pagination import Cursor
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.pagination import TimeOrderedCursorPagination
+from fees.models import AuditTrail
+from fees.views import AuditTrailViewSet
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare page latency of page-number and cursor pagination at increasing depth (fees audit trail).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000)
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def _time(self, view, user, params, repeat):
+        factory = APIRequestFactory()
+        best = None
+        for _ in range(repeat):
+            request = factory.get('/api/fees/audittrails/', params, HTTP_HOST='localhost')
+            force_authenticate(request, user=user)
+            started = time.perf_counter()
+            response = view(request)
+            response.render()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best * 1000
+
+    def _cursor_at(self, depth):
+        # Build the cursor a client would hold after scrolling ``depth`` rows
+        row = AuditTrail.objects.order_by('-timestamp', '-id').values('timestamp')[depth]
+        paginator = TimeOrderedCursorPagination()
+        paginator.base_url = 'http://testserver/'
+        paginator.ordering = ('-timestamp', '-id')
+        url = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=str(row['timestamp'])))
+        return parse_qs(urlparse(url).query)['cursor'][0]
+
+    def handle(self, *args, **options):
+        rows, page_size, repeat = options['rows'], options['page_size'], options['repeat']
+        view = AuditTrailViewSet.as_view({'get': 'list'}, throttle_classes=[])
+        try:
+            # Everything the benchmark writes is rolled back afterwards
+            with transaction.atomic():
+                user = get_user_model().objects.create_user(email='pagination-benchmark@example.invalid', password=None)
+                AuditTrail.objects.bulk_create(
+                    [AuditTrail(user=user, action='update', model='Invoice', object_id=str(i), changes='{}') for i in range(rows)],
+                    batch_size=2000,
+                )
+                self.stdout.write(f'{"depth":>8} {"page (ms)":>10} {"nocount (ms)":>13} {"cursor (ms)":>12}')
+                for depth in (0, rows // 10, rows // 2, rows - page_size):
+                    page = depth // page_size + 1
+                    page_ms = self._time(view, user, {'pagination': 'page', 'page': page, 'page_size': page_size}, repeat)
+                    nocount_ms = self._time(view, user, {'pagination': 'nocount', 'page': page, 'page_size': page_size}, repeat)
+                    params = {'page_size': page_size}
+                    if depth:
+                        params['cursor'] = self._cursor_at(depth)
+                    cursor_ms = self._time(view, user, params, repeat)
+                    self.stdout.write(f'{depth:>8} {page_ms:>10.2f} {nocount_ms:>13.2f} {cursor_ms:>12.2f}')
+                raise _Rollback
+        except _Rollback:
+            pass
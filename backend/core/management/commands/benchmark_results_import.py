@@ -0,0 +1,61 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from core.results_import import ResultImporter
+from provisional_results.models import GradingScale, Result, ResultAuditEntry
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measure bulk marks import throughput (provisional results): a fresh import, then a re-import with changed marks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000)
+        parser.add_argument('--units', type=int, default=10, help='Units per student')
+
+    def _rows(self, students, units, offset):
+        return [
+            {
+                'student': email, 'unit_code': f'BENCH{u:03d}', 'unit_name': f'Benchmark unit {u}',
+                'academic_hours': '3', 'marks': str((i * 7 + u * 13 + offset) % 100), 'semester': 'Sem 1', 'year': '2025',
+            }
+            for i, email in enumerate(students) for u in range(units)
+        ]
+
+    def _run(self, label, importer, rows):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            summary, errors = importer.run(rows)
+            elapsed = time.perf_counter() - started
+        if errors:
+            raise RuntimeError(errors[:3])
+        self.stdout.write(
+            f'{label:<9} {len(rows)} rows in {elapsed:.2f}s ({len(rows) / elapsed:,.0f} rows/s, '
+            f'{len(queries)} queries): {summary}'
+        )
+
+    def handle(self, *args, **options):
+        units = options['units']
+        count = max(options['rows'] // units, 1)
+        try:
+            # Everything the benchmark writes is rolled back afterwards
+            with transaction.atomic():
+                User = get_user_model()
+                GradingScale.objects.all().delete()
+                for grade, low, high in (('A', 70, 100), ('B', 60, 69.99), ('C', 50, 59.99), ('D', 40, 49.99), ('E', 0, 39.99)):
+                    GradingScale.objects.create(grade=grade, min_score=low, max_score=high, description=grade)
+                students = [f'import-bench-{i}@example.invalid' for i in range(count)]
+                User.objects.bulk_create([User(email=email, password='!') for email in students], batch_size=2000)
+                importer = ResultImporter(Result, GradingScale, ResultAuditEntry, 'result_imported')
+                self._run('create', importer, self._rows(students, units, 0))
+                self._run('update', importer, self._rows(students, units, 1))
+                raise _Rollback
+        except _Rollback:
+            pass
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.results_analytics import rebuild_aggregates
+from final_results.models import Result as FinalResult, ResultAggregate as FinalResultAggregate
+from provisional_results.models import Result as ProvisionalResult, ResultAggregate as ProvisionalResultAggregate
+
+SOURCES = {
+    'provisional': (ProvisionalResult, ProvisionalResultAggregate),
+    'final': (FinalResult, FinalResultAggregate),
+}
+
+
+class Command(BaseCommand):
+    help = 'Recompute per-student, per-term GPA aggregates for a cohort (all students by default).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=[*SOURCES, 'all'], default='all')
+        parser.add_argument('--program')
+        parser.add_argument('--year', type=int)
+        parser.add_argument('--semester')
+
+    def handle(self, *args, **options):
+        sources = SOURCES if options['source'] == 'all' else {options['source']: SOURCES[options['source']]}
+        for name, (result_model, aggregate_model) in sources.items():
+            started = time.perf_counter()
+            written = rebuild_aggregates(
+                result_model, aggregate_model,
+                program=options['program'], year=options['year'], semester=options['semester'],
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f'{name}: {written} term aggregates rebuilt in {time.perf_counter() - started:.2f}s'
+            ))
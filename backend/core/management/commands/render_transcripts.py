@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.transcripts import CHUNK_SIZE, KINDS, render_cohort
+
+
+class Command(BaseCommand):
+    help = 'Render the transcripts of a cohort to media storage and bundle them into a zip.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=list(KINDS), default='final')
+        parser.add_argument('--program')
+        parser.add_argument('--year', type=int)
+        parser.add_argument('--semester')
+        parser.add_argument('--workers', type=int, help='Render processes (default: one per CPU)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--no-bundle', action='store_true')
+        parser.add_argument('--queue', action='store_true', help='Hand the cohort to the Celery workers instead')
+
+    def handle(self, *args, **options):
+        scope = {'program': options['program'], 'year': options['year'], 'semester': options['semester']}
+        if options['queue']:
+            from core.tasks import render_cohort_transcripts_task
+            render_cohort_transcripts_task.delay(options['source'], chunk_size=options['chunk_size'], **scope)
+            self.stdout.write(self.style.SUCCESS('Transcript rendering queued.'))
+            return
+        started = time.perf_counter()
+        summary = render_cohort(
+            options['source'], workers=options['workers'], chunk_size=options['chunk_size'],
+            bundle=not options['no_bundle'], **scope,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['students']} transcripts ({summary['rendered']} rendered, {summary['reused']} reused) "
+            f"in {time.perf_counter() - started:.2f}s; bundle: {summary['bundle'] or '-'}"
+        ))
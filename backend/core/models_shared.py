@@ -60,6 +60,9 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
 
         return None
 
+    def get_full_name(self):
+        return f"{self.first_name} {self.last_name}".strip() or self.email
+
     def __str__(self):
         return self.email
 
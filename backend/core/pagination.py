@@ -0,0 +1,125 @@
+"""Pagination styles shared by the API.
+
+``FlexiblePagination`` lets a viewset pick a default style with
+``pagination_mode`` and lets clients override it with ``?pagination=``:
+
+* ``cursor``: keyset pagination on ``cursor_ordering`` (a timestamp plus
+  ``id`` as tie-breaker), so every page costs the same however deep it is;
+* ``page``: classic ``?page=N`` with a total ``count``;
+* ``nocount``: ``?page=N`` without the ``COUNT(*)`` query.
+"""
+from collections import OrderedDict
+
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class StandardPageNumberPagination(PageNumberPagination):
+    page_size = DEFAULT_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+
+
+class NoCountPageNumberPagination(StandardPageNumberPagination):
+    """Page-number pagination that skips ``COUNT(*)``.
+
+    One extra row is fetched to tell whether a next page exists.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        try:
+            self.page_number = max(int(request.query_params.get(self.page_query_param, 1)), 1)
+        except (TypeError, ValueError):
+            self.page_number = 1
+        offset = (self.page_number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        self.has_next = len(rows) > page_size
+        return rows[:page_size]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.page_number <= 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page_number - 1)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        response = super().get_paginated_response_schema(schema)
+        response['properties'].pop('count', None)
+        response['required'] = ['results']
+        return response
+
+
+class TimeOrderedCursorPagination(CursorPagination):
+    """Keyset pagination ordered by the view's ``cursor_ordering``."""
+    page_size = DEFAULT_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+    ordering = ('-created_at', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        return tuple(getattr(view, 'cursor_ordering', self.ordering))
+
+
+class FlexiblePagination(BasePagination):
+    """Delegates to one of the styles above per request."""
+    mode_query_param = 'pagination'
+    default_mode = 'cursor'
+    styles = {
+        'cursor': TimeOrderedCursorPagination,
+        'page': StandardPageNumberPagination,
+        'nocount': NoCountPageNumberPagination,
+    }
+
+    def get_style(self, request, view):
+        mode = request.query_params.get(self.mode_query_param) or getattr(view, 'pagination_mode', self.default_mode)
+        if mode not in self.styles:
+            mode = getattr(view, 'pagination_mode', self.default_mode)
+        return self.styles[mode]()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.style = self.get_style(request, view)
+        if isinstance(self.style, PageNumberPagination):
+            # Offset pages need a deterministic order as well
+            ordering = getattr(view, 'cursor_ordering', TimeOrderedCursorPagination.ordering)
+            queryset = queryset.order_by(*ordering)
+        return self.style.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.style.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return TimeOrderedCursorPagination().get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        parameters = TimeOrderedCursorPagination().get_schema_operation_parameters(view)
+        parameters.append({
+            'name': self.mode_query_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Pagination style: cursor, page or nocount.',
+            'schema': {'type': 'string', 'enum': list(self.styles)},
+        })
+        return parameters
@@ -0,0 +1,186 @@
+"""GPA, averages and grade distributions for provisional and final results.
+
+Per-term numbers live in each results app's ``ResultAggregate`` table (one
+row per student, semester and year). ``refresh_aggregates`` recomputes just
+the terms a write touched with a single grouped query. GPA quality points
+come from a conditional ``Sum`` over ``GRADE_POINTS``, so no result rows are
+loaded into Python. ``rebuild_aggregates`` recomputes a whole cohort
+(program, year and/or semester) in one pass with pandas.
+
+Readers (transcripts, dashboards, PDFs) only touch the aggregate rows;
+cumulative figures are sums over a student's handful of terms.
+"""
+from collections import defaultdict
+
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+from django.utils import timezone
+
+GRADE_POINTS = {'A': 5, 'B': 4, 'C': 3, 'D': 2, 'E': 1, 'F': 0}
+AGGREGATE_FIELDS = ['units', 'academic_hours', 'quality_points', 'marks_total', 'gpa', 'average', 'grade_counts', 'updated_at']
+TERM_FIELDS = ('student_id', 'semester', 'year')
+
+
+def grade_points():
+    """SQL expression for the grade points of a result row."""
+    return Case(
+        *[When(grade=grade, then=Value(float(points))) for grade, points in GRADE_POINTS.items()],
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def _ratio(numerator, denominator):
+    return round(numerator / denominator, 2) if denominator else 0
+
+
+def _scope(queryset, program=None, year=None, semester=None):
+    if program:
+        queryset = queryset.filter(student__profile__program=program)
+    if year:
+        queryset = queryset.filter(year=year)
+    if semester:
+        queryset = queryset.filter(semester=semester)
+    return queryset
+
+
+def _save(aggregate_model, rows, stale):
+    """Upsert ``rows`` (dicts keyed by TERM_FIELDS + AGGREGATE_FIELDS) and delete ``stale`` terms."""
+    now = timezone.now()
+    objs = []
+    for row in rows:
+        row.update(
+            gpa=_ratio(row['quality_points'], row['academic_hours']),
+            average=_ratio(row['marks_total'], row['units']),
+            updated_at=now,
+        )
+        objs.append(aggregate_model(**row))
+    if objs:
+        aggregate_model.objects.bulk_create(
+            objs, batch_size=500, update_conflicts=True,
+            unique_fields=['student', 'semester', 'year'], update_fields=AGGREGATE_FIELDS,
+        )
+    for student_id, semester, year in stale:
+        aggregate_model.objects.filter(student_id=student_id, semester=semester, year=year).delete()
+    return len(objs)
+
+
+def refresh_aggregates(result_model, aggregate_model, terms, chunk_size=2000):
+    """Recompute the aggregates of ``terms``, an iterable of (student_id, semester, year)."""
+    terms = {t for t in terms if t[0] is not None}
+    students = sorted({t[0] for t in terms})
+    written = 0
+    for start in range(0, len(students), chunk_size):
+        chunk = set(students[start:start + chunk_size])
+        written += _refresh(result_model, aggregate_model, {t for t in terms if t[0] in chunk})
+    return written
+
+
+def _refresh(result_model, aggregate_model, terms):
+    qs = result_model.objects.filter(
+        student_id__in={t[0] for t in terms},
+        semester__in={t[1] for t in terms},
+        year__in={t[2] for t in terms},
+    ).order_by()
+    rows = {}
+    totals = qs.values(*TERM_FIELDS).annotate(
+        n_units=Count('id'),
+        hours=Sum('academic_hours'),
+        points=Sum(grade_points() * F('academic_hours'), output_field=FloatField()),
+        marks_sum=Sum('marks'),
+    )
+    for row in totals:
+        key = (row['student_id'], row['semester'], row['year'])
+        if key in terms:
+            rows[key] = {
+                'student_id': key[0], 'semester': key[1], 'year': key[2],
+                'units': row['n_units'], 'academic_hours': row['hours'] or 0,
+                'quality_points': row['points'] or 0, 'marks_total': row['marks_sum'] or 0,
+                'grade_counts': {},
+            }
+    for student_id, semester, year, grade, n in qs.values_list(*TERM_FIELDS, 'grade').annotate(n=Count('id')):
+        if (student_id, semester, year) in rows:
+            rows[(student_id, semester, year)]['grade_counts'][grade] = n
+    return _save(aggregate_model, list(rows.values()), terms - set(rows))
+
+
+def rebuild_aggregates(result_model, aggregate_model, program=None, year=None, semester=None):
+    """Recompute every aggregate in a cohort with one vectorized pass; returns the rows written."""
+    import pandas as pd
+
+    scope = _scope(result_model.objects.all(), program, year, semester)
+    frame = pd.DataFrame.from_records(
+        scope.values_list(*TERM_FIELDS, 'grade', 'academic_hours', 'marks').iterator(chunk_size=5000),
+        columns=[*TERM_FIELDS, 'grade', 'academic_hours', 'marks'],
+    )
+    existing = set(_scope(aggregate_model.objects.all(), program, year, semester).values_list(*TERM_FIELDS))
+    if frame.empty:
+        return _save(aggregate_model, [], existing)
+    frame['quality_points'] = frame['grade'].map(GRADE_POINTS).fillna(0) * frame['academic_hours']
+    keys = list(TERM_FIELDS)
+    totals = frame.groupby(keys).agg(
+        units=('grade', 'size'),
+        academic_hours=('academic_hours', 'sum'),
+        quality_points=('quality_points', 'sum'),
+        marks_total=('marks', 'sum'),
+    )
+    counts = frame.groupby(keys + ['grade']).size()
+    grade_counts = defaultdict(dict)
+    for (student_id, term_semester, term_year, grade), n in counts.items():
+        grade_counts[(student_id, term_semester, term_year)][grade] = int(n)
+    rows = []
+    for key, total in zip(totals.index, totals.itertuples(index=False)):
+        rows.append({
+            'student_id': int(key[0]), 'semester': key[1], 'year': int(key[2]),
+            'units': int(total.units), 'academic_hours': int(total.academic_hours),
+            'quality_points': float(total.quality_points), 'marks_total': float(total.marks_total),
+            'grade_counts': grade_counts[key],
+        })
+    written = {(r['student_id'], r['semester'], r['year']) for r in rows}
+    return _save(aggregate_model, rows, existing - written)
+
+
+def student_terms(aggregate_model, student, semester=None, year=None):
+    """The student's per-term aggregates, oldest first."""
+    qs = aggregate_model.objects.filter(student=student)
+    if semester:
+        qs = qs.filter(semester=semester)
+    if year:
+        qs = qs.filter(year=year)
+    return list(qs.order_by('year', 'semester').values(
+        'semester', 'year', 'units', 'academic_hours', 'quality_points', 'marks_total', 'gpa', 'average', 'grade_counts',
+    ))
+
+
+def combine(terms):
+    """Cumulative GPA, average and distribution over a list of term aggregates."""
+    hours = sum(t['academic_hours'] for t in terms)
+    units = sum(t['units'] for t in terms)
+    distribution = defaultdict(int)
+    for term in terms:
+        for grade, n in term['grade_counts'].items():
+            distribution[grade] += n
+    return {
+        'units': units,
+        'gpa': _ratio(sum(t['quality_points'] for t in terms), hours),
+        'average': _ratio(sum(t['marks_total'] for t in terms), units),
+        'distribution': dict(distribution),
+    }
+
+
+def student_summary(aggregate_model, student, semester=None, year=None):
+    """``combine`` over the student's terms (optionally one semester/year), from the aggregate table."""
+    return combine(student_terms(aggregate_model, student, semester, year))
+
+
+def cohort_gpa(aggregate_model, group_by='student__profile__program', **scope):
+    """GPA and student count per group (default: programme), aggregated in the database."""
+    qs = _scope(aggregate_model.objects.all(), **scope)
+    rows = qs.values(group_by).annotate(
+        students=Count('student', distinct=True),
+        points=Sum('quality_points'),
+        hours=Sum('academic_hours'),
+    ).order_by(group_by)
+    return [
+        {'group': row[group_by], 'students': row['students'], 'gpa': _ratio(row['points'] or 0, row['hours'] or 0)}
+        for row in rows
+    ]
@@ -0,0 +1,344 @@
+"""Bulk marks import for provisional and final results.
+
+``ResultImporter`` validates a whole upload in memory first. It resolves
+students in a few ``IN`` queries, derives grades from the grading scale
+loaded once, and looks up existing results by (student, unit, semester,
+year). Only then does it write anything: new results with ``bulk_create``,
+changed ones with one ``UPDATE`` per distinct set of new values, one
+``ResultAuditEntry`` per row and one grouped notification per student, all
+in a single transaction. Per-row signals are skipped, so a 50k-row upload
+costs a few hundred statements rather than several per row.
+
+An upload with any invalid row writes nothing; the response lists the
+offending rows instead.
+"""
+import bisect
+import csv
+import io
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.dispatch import Signal
+from django.utils import timezone
+from rest_framework import permissions, status
+from rest_framework.decorators import action
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.response import Response
+
+from core.permissions import HasRole
+from core.results_analytics import refresh_aggregates
+
+COLUMNS = ('student', 'unit_code', 'unit_name', 'academic_hours', 'marks', 'semester', 'year')
+BATCH_SIZE = 1000
+LOOKUP_CHUNK = 2000  # keeps IN (...) lists under SQLite's parameter limit
+MAX_REPORTED_ERRORS = 100
+
+# Sent after an import writes results without per-row signals.
+# Receivers get ``student_ids`` (the students whose results changed).
+results_bulk_written = Signal()
+
+
+class ImportFileError(ValueError):
+    pass
+
+
+def _normalize_header(name):
+    return str(name).strip().lower().replace(' ', '_')
+
+
+def read_rows(upload):
+    """Return the rows of an uploaded CSV or Excel file as dicts keyed by column."""
+    name = (getattr(upload, 'name', '') or '').lower()
+    if name.endswith(('.xlsx', '.xls')):
+        import pandas as pd
+        try:
+            frame = pd.read_excel(upload, dtype=str).fillna('')
+        except Exception as e:
+            raise ImportFileError(f'Could not read Excel file: {e}') from e
+        frame.columns = [_normalize_header(c) for c in frame.columns]
+        return frame.to_dict('records')
+    if name.endswith('.csv'):
+        reader = csv.DictReader(io.TextIOWrapper(upload, encoding='utf-8-sig'))
+        return [{_normalize_header(k): v for k, v in row.items() if k is not None} for row in reader]
+    raise ImportFileError('Upload a .csv or .xlsx file.')
+
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _key(record):
+    return record['student_id'], record['unit_code'], record['semester'], record['year']
+
+
+class GradeBands:
+    """Grading scale held in memory; ``grade_for`` is a binary search on band minimums."""
+
+    def __init__(self, scales):
+        bands = sorted((float(s.min_score), float(s.max_score), s.grade) for s in scales)
+        self._mins = [b[0] for b in bands]
+        self._bands = bands
+
+    def __bool__(self):
+        return bool(self._bands)
+
+    def grade_for(self, marks):
+        index = bisect.bisect_right(self._mins, marks) - 1
+        if index < 0:
+            return None
+        low, high, grade = self._bands[index]
+        return grade if low <= marks <= high else None
+
+
+class ResultImporter:
+    """Validates and writes one upload of marks for ``result_model``."""
+
+    def __init__(self, result_model, scale_model, audit_model, event, actor=None, batch_size=BATCH_SIZE,
+                 aggregate_model=None):
+        self.result_model = result_model
+        self.scale_model = scale_model
+        self.audit_model = audit_model
+        self.aggregate_model = aggregate_model
+        self.event = event
+        self.actor = actor
+        self.batch_size = batch_size
+
+    # --- Validation ---
+
+    def _resolve_students(self, keys):
+        User = get_user_model()
+        ids = {k for k in keys if k.isdigit()}
+        emails = {k.lower() for k in keys if not k.isdigit()}
+        found = {}
+        for chunk in _chunks(ids, LOOKUP_CHUNK):
+            found.update({str(pk): pk for pk in User.objects.filter(id__in=chunk).values_list('id', flat=True)})
+        for chunk in _chunks(emails, LOOKUP_CHUNK):
+            found.update({email.lower(): pk for pk, email in User.objects.filter(email__in=chunk).values_list('id', 'email')})
+        return found
+
+    def _clean(self, index, row, bands, students):
+        errors = []
+        missing = [c for c in COLUMNS if str(row.get(c, '') or '').strip() == '']
+        if missing:
+            return None, [f"Missing {', '.join(missing)}."]
+        student_key = str(row['student']).strip()
+        student_id = students.get(student_key if student_key.isdigit() else student_key.lower())
+        if student_id is None:
+            errors.append(f"Unknown student '{student_key}'.")
+        try:
+            marks = float(row['marks'])
+        except (TypeError, ValueError):
+            marks = None
+            errors.append('Marks must be a number.')
+        grade = bands.grade_for(marks) if marks is not None else None
+        if marks is not None and grade is None:
+            errors.append(f'Marks {marks} fall outside the grading scale.')
+        given = str(row.get('grade', '') or '').strip()
+        if given and grade and given != grade:
+            errors.append(f'Grade {given} does not match marks {marks} (expected {grade}).')
+        try:
+            hours = int(float(row['academic_hours']))
+            if hours <= 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            errors.append('Academic hours must be a positive whole number.')
+            hours = None
+        try:
+            year = int(float(row['year']))
+        except (TypeError, ValueError):
+            errors.append('Year must be a whole number.')
+            year = None
+        if errors:
+            return None, errors
+        return {
+            'row': index,
+            'student_id': student_id,
+            'unit_code': str(row['unit_code']).strip(),
+            'unit_name': str(row['unit_name']).strip(),
+            'academic_hours': hours,
+            'marks': marks,
+            'grade': grade,
+            'semester': str(row['semester']).strip(),
+            'year': year,
+        }, []
+
+    def _existing(self, cleaned):
+        """Map (student, unit, semester, year) to the stored result, in chunked lookups."""
+        by_key = {}
+        semesters = {r['semester'] for r in cleaned}
+        years = {r['year'] for r in cleaned}
+        units = {r['unit_code'] for r in cleaned}
+        for chunk in _chunks({r['student_id'] for r in cleaned}, LOOKUP_CHUNK):
+            qs = self.result_model.objects.filter(
+                student_id__in=chunk, semester__in=semesters, year__in=years, unit_code__in=units,
+            )
+            for result in qs:
+                by_key[(result.student_id, result.unit_code, result.semester, result.year)] = result
+        return by_key
+
+    def validate(self, rows):
+        """Return ``(cleaned rows, errors)``; errors are ``{'row', 'errors'}`` dicts (rows are 1-based)."""
+        bands = GradeBands(self.scale_model.objects.all())
+        if not bands:
+            return [], [{'row': None, 'errors': ['No grading scale is configured.']}]
+        students = self._resolve_students({str(r.get('student', '') or '').strip() for r in rows if isinstance(r, dict)} - {''})
+        cleaned, errors, seen = [], [], {}
+        for index, row in enumerate(rows, start=1):
+            if not isinstance(row, dict):
+                errors.append({'row': index, 'errors': ['Each row must be an object.']})
+                continue
+            record, row_errors = self._clean(index, row, bands, students)
+            if record:
+                key = _key(record)
+                if key in seen:
+                    row_errors = [f'Duplicate of row {seen[key]}.']
+                else:
+                    seen[key] = index
+            if row_errors:
+                errors.append({'row': index, 'errors': row_errors})
+            else:
+                cleaned.append(record)
+        return cleaned, errors
+
+    # --- Writing ---
+
+    def _audit(self, result, text, now):
+        return self.audit_model(result=result, action=text, actor=self.actor, created_at=now)
+
+    def _notifications(self, touched):
+        from notifications.models import Notification
+
+        notifications = []
+        for student_id, results in touched.items():
+            units = ', '.join(sorted({r.unit_code for r in results}))
+            terms = ', '.join(sorted({f'{r.semester} {r.year}' for r in results}))
+            channels = [
+                channel for channel, flag in (('email', 'notify_email'), ('sms', 'notify_sms'), ('in_app', 'notify_in_app'))
+                if any(getattr(r, flag) for r in results)
+            ]
+            notifications.append(Notification(
+                user_id=student_id,
+                category='exams',
+                type=self.event,
+                title='Results published',
+                message=f'Results for {len(results)} unit(s) in {terms} are available: {units}.',
+                urgency='info',
+                channels=channels or ['in_app'],
+                personalized_context={'units': sorted({r.unit_code for r in results}), 'terms': terms},
+            ))
+        return notifications
+
+    def _update(self, changed, now):
+        """Save changed results with one UPDATE per distinct set of new values.
+
+        Marks cluster on a small set of values, so grouping beats
+        ``bulk_update``, whose per-row CASE expressions dominate at this size.
+        """
+        groups = defaultdict(list)
+        for result in changed:
+            groups[(result.marks, result.grade, result.unit_name, result.academic_hours)].append(result.id)
+        for (marks, grade, unit_name, hours), ids in groups.items():
+            for chunk in _chunks(ids, LOOKUP_CHUNK):
+                self.result_model.objects.filter(id__in=chunk).update(
+                    marks=marks, grade=grade, unit_name=unit_name, academic_hours=hours,
+                    version=F('version') + 1, updated_at=now,
+                )
+
+    def write(self, cleaned):
+        from notifications.fanout import bulk_notify
+        from notifications.tasks import send_notification_batch_task
+
+        now = timezone.now()
+        summary = {'created': 0, 'updated': 0, 'unchanged': 0}
+        with transaction.atomic():
+            existing = self._existing(cleaned)
+            matches = [(r, existing.get(_key(r))) for r in cleaned]
+            locked = [{'row': r['row'], 'errors': ['Result is locked.']} for r, result in matches if result and result.is_locked]
+            if locked:
+                return None, locked
+            new, changed, audits = [], [], []
+            touched = defaultdict(list)
+            for r, result in matches:
+                if result is None:
+                    new.append(self.result_model(
+                        student_id=r['student_id'], unit_code=r['unit_code'], unit_name=r['unit_name'],
+                        academic_hours=r['academic_hours'], marks=r['marks'], grade=r['grade'],
+                        semester=r['semester'], year=r['year'],
+                    ))
+                    continue
+                if (result.marks, result.grade, result.unit_name, result.academic_hours) == (
+                        r['marks'], r['grade'], r['unit_name'], r['academic_hours']):
+                    summary['unchanged'] += 1
+                    continue
+                audits.append(self._audit(
+                    result, f"Imported update: marks {result.marks} -> {r['marks']}, grade {result.grade} -> {r['grade']}", now,
+                ))
+                result.marks, result.grade = r['marks'], r['grade']
+                result.unit_name, result.academic_hours = r['unit_name'], r['academic_hours']
+                changed.append(result)
+                touched[result.student_id].append(result)
+            created = self.result_model.objects.bulk_create(new, batch_size=self.batch_size)
+            for result in created:
+                audits.append(self._audit(result, f'Imported: marks {result.marks}, grade {result.grade}', now))
+                touched[result.student_id].append(result)
+            self._update(changed, now)
+            self.audit_model.objects.bulk_create(audits, batch_size=self.batch_size)
+            if self.aggregate_model is not None:
+                refresh_aggregates(self.result_model, self.aggregate_model, {
+                    (r.student_id, r.semester, r.year) for results in touched.values() for r in results
+                })
+            results_bulk_written.send(sender=self.result_model, student_ids=list(touched))
+            notifications = bulk_notify(self._notifications(touched))
+            ids = [n.id for n in notifications if set(n.channels) - {'in_app'}]
+            if ids:
+                transaction.on_commit(lambda: send_notification_batch_task.delay(ids))
+        summary.update(created=len(created), updated=len(changed), students_notified=len(notifications))
+        return summary, []
+
+    def run(self, rows, dry_run=False):
+        """Validate and (unless ``dry_run``) write ``rows``; returns ``(summary, errors)``."""
+        cleaned, errors = self.validate(rows)
+        if errors:
+            return None, errors
+        if dry_run:
+            return {'valid': len(cleaned)}, []
+        return self.write(cleaned)
+
+
+class ResultImportMixin:
+    """Adds ``POST <results>/import/`` (CSV/Excel upload or JSON ``rows``) to a results viewset.
+
+    Viewsets set ``import_result_model``, ``import_scale_model``,
+    ``import_audit_model``, ``import_aggregate_model`` and ``import_event``.
+    """
+    required_roles = ['Lecturer', 'Registrar', 'System Administrator']
+
+    @action(
+        detail=False, methods=['post'], url_path='import',
+        parser_classes=[MultiPartParser, FormParser, JSONParser],
+        permission_classes=[permissions.IsAdminUser | HasRole],
+    )
+    def import_results(self, request):
+        upload = request.FILES.get('file')
+        try:
+            rows = read_rows(upload) if upload else request.data.get('rows')
+        except ImportFileError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(rows, list) or not rows:
+            return Response({'detail': 'Upload a file or send a non-empty "rows" list.'}, status=status.HTTP_400_BAD_REQUEST)
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+        importer = ResultImporter(
+            self.import_result_model, self.import_scale_model, self.import_audit_model,
+            self.import_event, actor=request.user, aggregate_model=getattr(self, 'import_aggregate_model', None),
+        )
+        summary, errors = importer.run(rows, dry_run=dry_run)
+        if errors:
+            return Response(
+                {'detail': 'No results were imported.', 'error_count': len(errors), 'errors': errors[:MAX_REPORTED_ERRORS]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(summary, status=status.HTTP_200_OK if dry_run else status.HTTP_201_CREATED)
@@ -0,0 +1,50 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from fees.models import Invoice, Transaction
+from final_results.models import GradingScale as FinalGradingScale
+from provisional_results.models import GradingScale, Result
+from .results_import import results_bulk_written
+from unit_registration.models import UnitRegistration
+from .dashboard_snapshot import invalidate_section, invalidate_users
+from .transcripts import invalidate_template
+
+
+@receiver([post_save, post_delete], sender=Invoice)
+def invoice_changed(sender, instance, **kwargs):
+    invalidate_section(instance.student_id, 'invoices')
+
+
+@receiver([post_save, post_delete], sender=Transaction)
+def transaction_changed(sender, instance, **kwargs):
+    invalidate_section(instance.student_id, 'transactions', 'invoices')
+
+
+@receiver([post_save, post_delete], sender=UnitRegistration)
+def unit_registration_changed(sender, instance, **kwargs):
+    try:
+        user_id = instance.student.user_id
+    except ObjectDoesNotExist:
+        return
+    invalidate_section(user_id, 'units')
+
+
+@receiver([post_save, post_delete], sender=Result)
+def result_changed(sender, instance, **kwargs):
+    invalidate_section(instance.student_id, 'results', 'academic_summary')
+
+
+@receiver(results_bulk_written, sender=Result)
+def results_bulk_changed(sender, student_ids, **kwargs):
+    invalidate_users(student_ids, 'results', 'academic_summary')
+
+
+@receiver([post_save, post_delete], sender=GradingScale)
+def grading_scale_changed(sender, instance, **kwargs):
+    invalidate_template('provisional')
+
+
+@receiver([post_save, post_delete], sender=FinalGradingScale)
+def final_grading_scale_changed(sender, instance, **kwargs):
+    invalidate_template('final')
@@ -0,0 +1,30 @@
+from celery import chord, shared_task
+
+from . import transcripts
+
+
+@shared_task
+def render_transcript_chunk_task(kind, student_ids, semester=None, year=None):
+    """Render one chunk of a cohort's transcripts."""
+    return transcripts.render_chunk(kind, student_ids, semester, year)
+
+
+@shared_task
+def bundle_transcripts_task(chunks, kind, label):
+    """Zip a cohort's transcripts once every chunk has been rendered."""
+    names = [name for chunk in chunks for name, _ in chunk]
+    return transcripts.bundle_transcripts(kind, names, label) if names else None
+
+
+@shared_task
+def render_cohort_transcripts_task(kind, program=None, year=None, semester=None, chunk_size=transcripts.CHUNK_SIZE):
+    """Fan a cohort out over the workers, one task per chunk, then bundle the results."""
+    student_ids = transcripts.cohort_students(kind, program, year, semester)
+    if not student_ids:
+        return None
+    transcripts.get_template(kind)
+    chunks = [student_ids[i:i + chunk_size] for i in range(0, len(student_ids), chunk_size)]
+    result = chord(
+        render_transcript_chunk_task.s(kind, chunk, semester, year) for chunk in chunks
+    )(bundle_transcripts_task.s(kind, transcripts.cohort_label(program, year, semester)))
+    return result.id
@@ -1,5 +1,5 @@
 from django.test import TestCase
-from .models import StudentProfile
+from .models import CustomUser, StudentProfile
 
 class StudentIDGenerationTests(TestCase):
     def setUp(self):
@@ -41,3 +41,169 @@ class StudentIDGenerationTests(TestCase):
             for t in threads: t.start()
             for t in threads: t.join()
         self.assertEqual(len(set(results)), 5)
+
+
+class DashboardSnapshotTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from .models import CustomUser
+        cache.clear()
+        self.user = CustomUser.objects.create(email='dash@example.com', first_name='D', last_name='S')
+        StudentProfile.objects.create(user=self.user, program='BIT', year=2025, contact_info='A', emergency_contact='B', gpa=3.5)
+
+    def test_second_read_is_served_from_cache(self):
+        from .dashboard_snapshot import get_dashboard_snapshot, get_snapshot_metrics
+        first = get_dashboard_snapshot(self.user)
+        with self.assertNumQueries(0):
+            second = get_dashboard_snapshot(self.user)
+        self.assertEqual(first, second)
+        metrics = get_snapshot_metrics()
+        self.assertEqual(metrics['hits'], 1)
+        self.assertEqual(metrics['misses'], 1)
+
+    def test_delivery_records_refresh_the_dashboard_summary(self):
+        from rest_framework.test import APIClient
+        from notifications.models import Notification, NotificationDeliveryLog
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        notification = Notification.objects.create(user=self.user, category='general', type='info', title='Fees', message='Due')
+        self.assertEqual(client.get('/api/student/').data['notification_delivery_status'], [])
+        log = NotificationDeliveryLog.objects.create(notification=notification, channel='email', status='failed')
+        self.assertEqual(client.get('/api/student/').data['notification_delivery_status'], [{'status': 'failed', 'count': 1}])
+        log.delete()
+        self.assertEqual(client.get('/api/student/').data['notification_delivery_status'], [])
+
+    def test_invoice_write_only_rebuilds_invoice_section(self):
+        import datetime
+        from fees.models import Invoice
+        from .dashboard_snapshot import get_dashboard_snapshot
+        self.assertEqual(get_dashboard_snapshot(self.user)['invoices'], [])
+        Invoice.objects.create(student=self.user, description='Tuition', amount=1000, due_date=datetime.date.today())
+        with self.assertNumQueries(1):
+            snapshot = get_dashboard_snapshot(self.user)
+        self.assertEqual(len(snapshot['invoices']), 1)
+
+    def test_student_dashboard_endpoint(self):
+        from rest_framework.test import APIClient
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.get('/api/student/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['profile']['program'], 'BIT')
+        self.assertEqual(response.data['unread_notification_count'], 0)
+        # The same bounded summary as the role dashboards and the other apps
+        self.assertIsNone(response.data['notifications_next'])
+
+
+class UnifiedDashboardTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+        from .models import CustomUser
+        cache.clear()
+        self.client = APIClient()
+        self.finance = CustomUser.objects.create(email='fin@example.com', first_name='F', last_name='S', role='Finance Staff')
+
+    def _make_transactions(self, count):
+        import datetime
+        from fees.models import Invoice, Transaction
+        student = CustomUser.objects.create(email=f'payer{count}@example.com', first_name='P', last_name='S')
+        invoice = Invoice.objects.create(student=student, description='Tuition', amount=100, due_date=datetime.date.today())
+        Transaction.objects.bulk_create([
+            Transaction(student=student, invoice=invoice, amount=10, method='mpesa', reference=f'R{count}-{i}', status='success')
+            for i in range(count)
+        ])
+
+    def test_sections_follow_role(self):
+        from .dashboard_engine import resolve_sections
+        self.assertEqual(resolve_sections(self.finance), ['finance'])
+        student = CustomUser.objects.create(email='stu@example.com', first_name='S', last_name='T')
+        self.assertEqual(resolve_sections(student), ['student'])
+
+    def test_finance_payload_is_paginated_and_aggregated(self):
+        self._make_transactions(30)
+        self.client.force_authenticate(user=self.finance)
+        response = self.client.get('/api/unified/', {'page_size': 5})
+        self.assertEqual(response.status_code, 200)
+        finance = response.data['role_dashboards']['finance']
+        self.assertEqual(list(response.data['role_dashboards']), ['finance'])
+        self.assertEqual(finance['transactions']['count'], 30)
+        self.assertEqual(len(finance['transactions']['results']), 5)
+        self.assertEqual(finance['analytics']['cash_flow']['total'], 300)
+        # The same bounded notification summary as every other app's responses
+        self.assertIsNone(response.data['notifications_next'])
+
+    def test_query_count_does_not_grow_with_data(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.client.force_authenticate(user=self.finance)
+        self._make_transactions(2)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/api/finance/')
+        self._make_transactions(40)
+        with CaptureQueriesContext(connection) as large:
+            self.client.get('/api/finance/')
+        self.assertLessEqual(len(large), len(small))
+
+    def test_role_dashboards_refuse_other_roles(self):
+        student = CustomUser.objects.create(email='nosy@example.com', first_name='N', last_name='S')
+        self.client.force_authenticate(user=student)
+        for path in ('/api/lecturer/', '/api/registrar/', '/api/finance/', '/api/hod/', '/api/it/'):
+            self.assertEqual(self.client.get(path, {'department': 'Computing'}).status_code, 403, path)
+        self.client.force_authenticate(user=self.finance)
+        self.assertEqual(self.client.get('/api/finance/').status_code, 200)
+        self.assertEqual(self.client.get('/api/registrar/').status_code, 403)
+
+    def test_superuser_gets_every_section(self):
+        admin = CustomUser.objects.create_superuser(email='root@example.com', password='x')
+        self.client.force_authenticate(user=admin)
+        response = self.client.get('/api/unified/', {'department': 'Computing'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(response.data['role_dashboards']),
+            {'student', 'lecturer', 'registrar', 'finance', 'hod', 'it_admin'},
+        )
+
+
+class FlexiblePaginationTests(TestCase):
+    url = '/api/fees/audittrails/'
+
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+        from fees.models import AuditTrail
+        cache.clear()
+        self.user = CustomUser.objects.create(email='auditor@example.com', first_name='A', last_name='U')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        AuditTrail.objects.bulk_create([
+            AuditTrail(user=self.user, action='update', model='Invoice', object_id=str(i), changes='{}')
+            for i in range(7)
+        ])
+        self.expected = list(AuditTrail.objects.order_by('-timestamp', '-id').values_list('object_id', flat=True))
+
+    def _walk(self, params):
+        seen, url = [], self.url
+        while url:
+            data = self.client.get(url, params).json()
+            seen += [row['object_id'] for row in data['results']]
+            url, params = data['next'], None
+        return seen
+
+    def test_cursor_mode_is_the_default_and_stable(self):
+        data = self.client.get(self.url, {'page_size': 3}).json()
+        self.assertNotIn('count', data)
+        self.assertIn('cursor=', data['next'])
+        self.assertEqual(self._walk({'page_size': 3}), self.expected)
+
+    def test_page_and_nocount_modes(self):
+        data = self.client.get(self.url, {'pagination': 'page', 'page_size': 3}).json()
+        self.assertEqual(data['count'], 7)
+        self.assertEqual(self._walk({'pagination': 'nocount', 'page_size': 3}), self.expected)
+        with self.assertNumQueries(1):
+            from fees.views import AuditTrailViewSet
+            from rest_framework.test import APIRequestFactory, force_authenticate
+            request = APIRequestFactory().get(self.url, {'pagination': 'nocount', 'page_size': 3})
+            force_authenticate(request, user=self.user)
+            response = AuditTrailViewSet.as_view({'get': 'list'}, throttle_classes=[])(request)
+        self.assertEqual(len(response.data['results']), 3)
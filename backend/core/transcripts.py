@@ -0,0 +1,288 @@
+"""Transcript PDFs for provisional and final results.
+
+The parts of a transcript page that only depend on the grading scale
+(title, grading-scale footer, watermark) form a ``TranscriptTemplate``.
+It is built once per scale and kept in the cache until a ``GradingScale``
+row changes; each PDF writes it once as a reportlab form and references
+it from every page instead of redrawing it.
+
+Rendered transcripts live on the default (media) storage under a name
+that ends in a hash of everything drawn on them, so an unchanged
+transcript is served from storage and a changed one replaces the old
+file. ``render_cohort`` renders a whole programme/year/semester across a
+process pool and bundles the PDFs into a zip.
+"""
+import hashlib
+import json
+import math
+import multiprocessing
+import shutil
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.utils.text import slugify
+from reportlab.lib.pagesizes import A4
+
+from fees.statements import FONT, FONT_BOLD, MARGIN, ROW_HEIGHT, StatementRenderer, get_or_render
+from .results_analytics import _scope, student_summary
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+KINDS = {
+    'provisional': {
+        'app': 'provisional_results',
+        'title': 'Uzuri University Provisional Transcript',
+        'watermark': 'PROVISIONAL',
+        'filename': 'transcript',
+    },
+    'final': {
+        'app': 'final_results',
+        'title': 'Uzuri University Final Transcript',
+        'watermark': 'FINAL',
+        'filename': 'final_transcript',
+    },
+}
+COLUMNS = [('Unit Code', 90), ('Unit Name', 250), ('Hours', 60), ('Grade', 60), ('Status', 55)]
+SCALE_COLUMNS = 3
+SCALE_ROW_HEIGHT = 11
+# Students per unit of work handed to a pool process or Celery task
+CHUNK_SIZE = 25
+
+
+def _model(kind, name):
+    return apps.get_model(KINDS[kind]['app'], name)
+
+
+class TranscriptTemplate:
+    """Static page furniture for one kind of transcript and grading scale."""
+
+    PAGE_FORM = 'transcript-page'
+    WATERMARK_FORM = 'transcript-watermark'
+
+    def __init__(self, title, watermark, scale):
+        self.title = title
+        self.watermark = watermark
+        self.scale = [f'{grade}: {low}-{high} ({description})' for grade, low, high, description in scale]
+        raw = json.dumps([title, watermark, self.scale]).encode()
+        self.version = hashlib.sha256(raw).hexdigest()[:12]
+        rows = math.ceil(len(self.scale) / SCALE_COLUMNS)
+        self.footer_height = 24 + rows * SCALE_ROW_HEIGHT
+
+    def define(self, c):
+        """Register the template's forms on canvas ``c``."""
+        c.beginForm(self.PAGE_FORM)
+        c.setFont(FONT_BOLD, 16)
+        c.drawString(MARGIN, PAGE_HEIGHT - MARGIN, self.title)
+        top = MARGIN + self.footer_height
+        c.line(MARGIN, top, PAGE_WIDTH - MARGIN, top)
+        c.setFont(FONT_BOLD, 9)
+        c.drawString(MARGIN, top - 12, 'Grading Scale:')
+        c.setFont(FONT, 8)
+        rows = max(math.ceil(len(self.scale) / SCALE_COLUMNS), 1)
+        width = (PAGE_WIDTH - 2 * MARGIN) / SCALE_COLUMNS
+        for i, line in enumerate(self.scale):
+            column, row = divmod(i, rows)
+            c.drawString(MARGIN + column * width, top - 24 - row * SCALE_ROW_HEIGHT, line)
+        c.endForm()
+
+        c.beginForm(self.WATERMARK_FORM)
+        c.saveState()
+        c.setFont(FONT_BOLD, 60)
+        c.setFillGray(0.7, 0.5)
+        c.translate(PAGE_WIDTH / 2, PAGE_HEIGHT / 2)
+        c.rotate(45)
+        c.drawCentredString(0, 0, self.watermark)
+        c.restoreState()
+        c.endForm()
+
+
+def _template_key(kind):
+    return f'transcript_template:{kind}'
+
+
+def get_template(kind):
+    """The kind's template for the current grading scale, built on a cache miss."""
+    template = cache.get(_template_key(kind))
+    if template is None:
+        scale = _model(kind, 'GradingScale').objects.order_by('-min_score', 'grade').values_list(
+            'grade', 'min_score', 'max_score', 'description',
+        )
+        config = KINDS[kind]
+        template = TranscriptTemplate(config['title'], config['watermark'], list(scale))
+        cache.set(_template_key(kind), template, None)
+    return template
+
+
+def invalidate_template(kind):
+    cache.delete(_template_key(kind))
+
+
+class TranscriptRenderer(StatementRenderer):
+    """``StatementRenderer`` whose pages are stamped from a ``TranscriptTemplate``."""
+
+    def __init__(self, fileobj, template, details, watermark=False):
+        super().__init__(fileobj, template.title)
+        self.template = template
+        self.details = details
+        self.watermark = watermark
+        self.bottom = MARGIN + template.footer_height + ROW_HEIGHT
+        template.define(self.canvas)
+
+    def _start_page(self):
+        if self.page:
+            self.canvas.showPage()
+        self.page += 1
+        c = self.canvas
+        c.doForm(self.template.PAGE_FORM)
+        if self.watermark:
+            c.doForm(self.template.WATERMARK_FORM)
+        c.setFont(FONT, 10)
+        y = PAGE_HEIGHT - MARGIN - 20
+        for line in self.details:
+            c.drawString(MARGIN, y, line)
+            y -= 14
+        c.setFont(FONT, 9)
+        c.drawRightString(PAGE_WIDTH - MARGIN, MARGIN / 2, f'Page {self.page}')
+        self.y = y - 10
+
+
+def transcript_content(kind, student, semester=None, year=None):
+    """Everything drawn on a student's transcript, as JSON-friendly data."""
+    results = _model(kind, 'Result').objects.filter(student=student)
+    if semester:
+        results = results.filter(semester=semester)
+    if year:
+        results = results.filter(year=year)
+    rows = [list(row) for row in results.order_by('unit_code').values_list(
+        'unit_code', 'unit_name', 'academic_hours', 'grade', 'status',
+    )]
+    aggregate_model = _model(kind, 'ResultAggregate')
+    recommendation = None
+    if semester and year:
+        recommendation = _model(kind, 'Recommendation').objects.filter(
+            student=student, semester=semester, year=year,
+        ).values_list('text', flat=True).first()
+    profile = getattr(student, 'profile', None)
+    return {
+        'details': [
+            f"Student: {student.get_full_name()} | Admission No: {student.student_number}",
+            f"Programme: {getattr(profile, 'program', '')}",
+            f"Semester: {semester or '-'} | Year: {year or '-'}",
+        ],
+        'rows': rows,
+        'current': student_summary(aggregate_model, student, semester, year),
+        'cumulative': student_summary(aggregate_model, student),
+        'recommendation': recommendation or 'No recommendation available.',
+    }
+
+
+def render_transcript_pdf(kind, template, content, fileobj):
+    watermark = any(row[4] == kind for row in content['rows'])
+    renderer = TranscriptRenderer(fileobj, template, content['details'], watermark=watermark)
+    renderer.section('Results', COLUMNS, content['rows'])
+    current, cumulative = content['current'], content['cumulative']
+    renderer.lines([
+        f"Current Average: {current['average']} | GPA: {current['gpa']}",
+        f"Cumulative Average: {cumulative['average']} | GPA: {cumulative['gpa']}",
+        f"Recommendation: {content['recommendation']}",
+    ])
+    renderer.finish()
+
+
+def _transcript_prefix(kind, student_id, semester=None, year=None):
+    return f"transcripts/{kind}/{student_id}/{slugify(semester or 'all')}-{year or 'all'}-"
+
+
+def render_transcript(kind, student, semester=None, year=None):
+    """Render (or reuse) a transcript; returns ``(storage name, rendered)``."""
+    template = get_template(kind)
+    content = transcript_content(kind, student, semester, year)
+    raw = json.dumps([template.version, content], sort_keys=True, default=str).encode()
+    prefix = _transcript_prefix(kind, student.pk, semester, year)
+    name = f'{prefix}{hashlib.sha256(raw).hexdigest()[:16]}.pdf'
+    if default_storage.exists(name):
+        return name, False
+    name = get_or_render(
+        name,
+        lambda fileobj: render_transcript_pdf(kind, template, content, fileobj),
+        keep_prefix=prefix,
+    )
+    return name, True
+
+
+def build_transcript(kind, student, semester=None, year=None):
+    """Storage name of the student's current transcript."""
+    return render_transcript(kind, student, semester, year)[0]
+
+
+def cohort_students(kind, program=None, year=None, semester=None):
+    """Ids of the students with results in the cohort."""
+    results = _scope(_model(kind, 'Result').objects.all(), program, year, semester)
+    return list(results.order_by('student_id').values_list('student_id', flat=True).distinct())
+
+
+def render_chunk(kind, student_ids, semester=None, year=None):
+    """Render the transcripts of ``student_ids``; returns ``[storage name, rendered]`` pairs."""
+    students = get_user_model().objects.filter(id__in=student_ids).select_related('profile').order_by('id')
+    return [list(render_transcript(kind, student, semester, year)) for student in students]
+
+
+def bundle_transcripts(kind, names, label):
+    """Zip the given transcripts; an identical bundle is reused rather than rebuilt."""
+    names = sorted(names)
+    digest = hashlib.sha256('\n'.join(names).encode()).hexdigest()[:16]
+    prefix = f'transcripts/{kind}/bundles/{slugify(label)}-'
+
+    def write(fileobj):
+        # PDFs are already compressed, so store them as they are
+        with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_STORED) as bundle:
+            for name in names:
+                _, student_id, filename = name.rsplit('/', 2)
+                with default_storage.open(name, 'rb') as source, bundle.open(f'{student_id}-{filename}', 'w') as target:
+                    shutil.copyfileobj(source, target)
+
+    return get_or_render(f'{prefix}{digest}.zip', write, keep_prefix=prefix)
+
+
+def cohort_label(program=None, year=None, semester=None):
+    return f"{program or 'all'}-{year or 'all'}-{semester or 'all'}"
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def render_cohort(kind, program=None, year=None, semester=None, workers=None, chunk_size=CHUNK_SIZE, bundle=True):
+    """Render every transcript in a cohort, ``workers`` processes at a time.
+
+    ``semester`` and ``year`` select the cohort and also scope each
+    transcript to that term. Returns counts and the bundle's storage name.
+    """
+    student_ids = cohort_students(kind, program, year, semester)
+    chunks = [student_ids[i:i + chunk_size] for i in range(0, len(student_ids), chunk_size)]
+    # Build the template once up front so workers find it in the cache
+    get_template(kind)
+    workers = min(workers or multiprocessing.cpu_count(), len(chunks))
+    if workers <= 1:
+        done = [render_chunk(kind, chunk, semester, year) for chunk in chunks]
+    else:
+        # Children must open their own database connections
+        connections.close_all()
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as pool:
+            done = list(pool.map(render_chunk, repeat(kind), chunks, repeat(semester), repeat(year)))
+    rendered = [pair for chunk in done for pair in chunk]
+    names = [name for name, _ in rendered]
+    return {
+        'students': len(student_ids),
+        'rendered': sum(1 for _, created in rendered if created),
+        'reused': sum(1 for _, created in rendered if not created),
+        'bundle': bundle_transcripts(kind, names, cohort_label(program, year, semester)) if bundle and names else None,
+    }
@@ -1,5 +1,8 @@
 
-from django.test import TestCase
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from my_profile.models import StudentProfile
 from .models import DisciplinaryCase
@@ -10,6 +13,11 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 
 class DisciplinaryAnalyticsTest(TestCase):
 	def setUp(self):
+		media_root = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+		media = override_settings(MEDIA_ROOT=media_root)
+		media.enable()
+		self.addCleanup(media.disable)
 		User = get_user_model()
 		self.user = User.objects.create_user(email='student1@example.com', password='testpass')
 		self.profile = StudentProfile.objects.create(user=self.user, program='CS', year_of_study=1)
@@ -0,0 +1,172 @@
+"""Per-unit and per-student rollups behind the emasomo dashboards.
+
+``UnitAnalytics`` and ``StudentAnalytics`` hold running totals of the
+``ProgressTracker`` columns plus enrollment, submission, attempt and reply
+counters, so a dashboard reads one row instead of aggregating trackers.
+
+Views change progress through ``record_progress``, which applies the
+increment to the tracker and the same delta to both rollups in one
+transaction. The receivers in ``emasomo.signals`` cover direct writes
+(trackers edited or deleted, enrollments, submissions, attempts,
+replies). ``rebuild_analytics`` recomputes everything from the source
+tables for data written around those paths (fixtures, bulk loads).
+"""
+from decimal import Decimal
+
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+# ProgressTracker column -> rollup column
+TOTALS = {
+    'percent_materials': 'materials_total',
+    'percent_assignments': 'assignments_total',
+    'percent_quizzes': 'quizzes_total',
+    'engagement_score': 'engagement_total',
+}
+# Percentages never go past this
+PERCENT_CAP = Decimal('100')
+CAPPED = ('percent_materials', 'percent_assignments', 'percent_quizzes')
+ACTIVITY_WEEKS = 52
+
+
+def _model(name, registry=global_apps):
+    return registry.get_model('emasomo', name)
+
+
+def _week(now=None):
+    year, week, _ = (now or timezone.now()).isocalendar()
+    return f'{year}-W{week:02d}'
+
+
+def bump(model, key, create=True, **deltas):
+    """Add ``deltas`` to the rollup row matching ``key``, creating it on first use.
+
+    Deletions pass ``create=False``: the unit or student may be going away
+    in the same transaction, and a missing row has nothing to subtract from.
+    """
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+    changes['updated_at'] = timezone.now()
+    if not model.objects.filter(**key).update(**changes) and create:
+        model.objects.bulk_create([model(**key)], ignore_conflicts=True)
+        model.objects.filter(**key).update(**changes)
+
+
+def bump_both(unit_id, student_id, create=True, **deltas):
+    if unit_id is not None:
+        bump(_model('UnitAnalytics'), {'unit_id': unit_id}, create, **deltas)
+    if student_id is not None:
+        bump(_model('StudentAnalytics'), {'student_id': student_id}, create, **deltas)
+
+
+def tracker_deltas(before, after):
+    """Rollup deltas for a tracker going from ``before`` to ``after`` (dicts of TOTALS keys, or None)."""
+    deltas = {'trackers': (after is not None) - (before is not None)}
+    for field, total in TOTALS.items():
+        deltas[total] = (after or {}).get(field, 0) - (before or {}).get(field, 0)
+    return deltas
+
+
+def _record_activity(student_id, events=1):
+    StudentAnalytics = _model('StudentAnalytics')
+    StudentAnalytics.objects.bulk_create([StudentAnalytics(student_id=student_id)], ignore_conflicts=True)
+    row = StudentAnalytics.objects.select_for_update().get(student_id=student_id)
+    week = _week()
+    row.activity[week] = row.activity.get(week, 0) + events
+    if len(row.activity) > ACTIVITY_WEEKS:
+        row.activity = dict(sorted(row.activity.items())[-ACTIVITY_WEEKS:])
+    row.save(update_fields=['activity', 'updated_at'])
+
+
+def record_progress(student, unit, **increments):
+    """Add ``increments`` (tracker field -> amount) to the student's tracker for ``unit``.
+
+    Percentages are capped at 100. The rollups receive the change that
+    was actually applied; a student without a tracker is left untouched.
+    """
+    ProgressTracker = _model('ProgressTracker')
+    with transaction.atomic():
+        tracker = ProgressTracker.objects.select_for_update().filter(student=student, unit=unit).first()
+        if tracker is None:
+            return None
+        before = {field: getattr(tracker, field) for field in TOTALS}
+        for field, amount in increments.items():
+            value = getattr(tracker, field) + Decimal(amount)
+            setattr(tracker, field, min(value, PERCENT_CAP) if field in CAPPED else value)
+        after = {field: getattr(tracker, field) for field in TOTALS}
+        # A queryset update, so the save signals don't count this change twice
+        ProgressTracker.objects.filter(pk=tracker.pk).update(last_updated=timezone.now(), **after)
+        deltas = tracker_deltas(before, after)
+        deltas.pop('trackers')
+        bump_both(tracker.unit_id, tracker.student_id, **deltas)
+        _record_activity(tracker.student_id)
+    return tracker
+
+
+def averages(row):
+    """Average tracker percentages and engagement from a rollup row (or None)."""
+    trackers = row.trackers if row else 0
+    values = {}
+    for total in TOTALS.values():
+        values[total] = round(getattr(row, total) / trackers, 2) if trackers else 0
+    return values
+
+
+def activity_heatmap(row):
+    """``[{'week': n, 'count': c}]`` for the weeks with activity, oldest first."""
+    if not row:
+        return []
+    return [{'week': int(key.rsplit('W', 1)[1]), 'count': count} for key, count in sorted(row.activity.items())]
+
+
+def _counts(queryset, key):
+    return {row[key]: row['n'] for row in queryset.values(key).annotate(n=Count('id')).order_by()}
+
+
+def rebuild_analytics(registry=global_apps):
+    """Recompute every rollup from the source tables; student activity history is kept."""
+    ProgressTracker = _model('ProgressTracker', registry)
+    UnitAnalytics = _model('UnitAnalytics', registry)
+    StudentAnalytics = _model('StudentAnalytics', registry)
+    sums = {total: Sum(field) for field, total in TOTALS.items()}
+    counters = ['trackers', *TOTALS.values(), 'submissions', 'quiz_attempts', 'forum_replies']
+
+    units = {}
+    for row in ProgressTracker.objects.values('unit_id').annotate(trackers=Count('id'), **sums).order_by():
+        units[row.pop('unit_id')] = row
+    extra = {
+        'active_enrollments': _counts(_model('Enrollment', registry).objects.filter(status='active'), 'unit_id'),
+        'submissions': _counts(_model('AssignmentSubmission', registry).objects.all(), 'assignment__unit_id'),
+        'quiz_attempts': _counts(_model('QuizAttempt', registry).objects.all(), 'quiz__unit_id'),
+        'forum_replies': _counts(_model('ForumReply', registry).objects.all(), 'thread__unit_id'),
+    }
+    for field, counts in extra.items():
+        for unit_id, n in counts.items():
+            units.setdefault(unit_id, {})[field] = n
+
+    students = {}
+    for row in ProgressTracker.objects.values('student_id').annotate(trackers=Count('id'), **sums).order_by():
+        students[row.pop('student_id')] = row
+    for field, model in (('submissions', 'AssignmentSubmission'), ('quiz_attempts', 'QuizAttempt'), ('forum_replies', 'ForumReply')):
+        for student_id, n in _counts(_model(model, registry).objects.all(), 'student_id').items():
+            students.setdefault(student_id, {})[field] = n
+
+    now = timezone.now()
+    with transaction.atomic():
+        UnitAnalytics.objects.all().delete()
+        UnitAnalytics.objects.bulk_create(
+            [UnitAnalytics(unit_id=unit_id, updated_at=now, **{k: v or 0 for k, v in row.items()}) for unit_id, row in units.items()],
+            batch_size=500,
+        )
+        # Student rows are reset rather than deleted to keep their activity history
+        StudentAnalytics.objects.update(updated_at=now, **{field: 0 for field in counters})
+        StudentAnalytics.objects.bulk_create(
+            [StudentAnalytics(student_id=student_id, updated_at=now, **{k: v or 0 for k, v in row.items()}) for student_id, row in students.items()],
+            batch_size=500, update_conflicts=True, unique_fields=['student'],
+            update_fields=[*counters, 'updated_at'],
+        )
+    return len(units), len(students)
@@ -0,0 +1,315 @@
+"""Watermarked learning-material downloads.
+
+A PDF is parsed once per file. ``material_layout`` rewrites every object
+except the pages into a stored body, and for every page records the page
+dictionary rewritten to wrap its original content and draw one extra
+content stream, plus a resources dictionary that adds the watermark font
+and transparency. That layout does not depend on the user and is cached.
+
+A user's copy is a complete new file: the body, the rewritten pages, one
+small watermark stream per page size and a single cross-reference table
+for all of it. None of the original page objects are carried over, so
+no unwatermarked revision can be cut out of the copy. Producing it only
+formats those streams (no parsing, no page merging), the tail is cached
+per (material, user) for ``COPY_TTL`` and the response streams the body
+in chunks followed by the tail, one page at a time.
+"""
+import hashlib
+import io
+import logging
+import math
+import tempfile
+
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject
+from reportlab.pdfgen import canvas
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_TTL = 60 * 60 * 24 * 7
+COPY_TTL = 60 * 60
+CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+HEADER = b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n'
+# Containers PyPDF2 has already unpacked; the copy gets a classic xref instead
+SKIPPED_TYPES = ('/ObjStm', '/XRef')
+FONT_NAME = '/UzuriWm'
+STATE_NAME = '/UzuriWmGs'
+FONT_SIZE = 24
+
+
+def watermark_text(user):
+    return f"Uzuri University | {user.email} | {user.student_number}"
+
+
+def _serialize(obj):
+    out = io.BytesIO()
+    obj.write_to_stream(out, None)
+    return out.getvalue()
+
+
+def _object(num, body, gen=0):
+    return b'%d %d obj\n%s\nendobj\n' % (num, gen, body)
+
+
+def _stream(num, data):
+    return _object(num, b'<< /Length %d >>\nstream\n%s\nendstream' % (len(data), data))
+
+
+def _inherited(page, key):
+    node = page
+    while node is not None:
+        if key in node:
+            return node[key]
+        node = node.get('/Parent')
+        node = node.get_object() if node is not None else None
+    return None
+
+
+def _with_entry(value, name, ref):
+    """Copy of resource sub-dictionary ``value`` with ``name`` added."""
+    entries = DictionaryObject(value.get_object()) if value is not None else DictionaryObject()
+    entries[NameObject(name)] = ref
+    return entries
+
+
+def _content_refs(page):
+    contents = page.raw_get('/Contents') if '/Contents' in page else None
+    if contents is None:
+        return []
+    if isinstance(contents, IndirectObject) and not isinstance(contents.get_object(), ArrayObject):
+        return [contents]
+    return list(contents.get_object())
+
+
+def _body_objects(reader, skip):
+    """``(num, gen)`` of every live object worth copying, in file order of numbers."""
+    refs = [(num, gen) for gen, numbers in reader.xref.items() for num in numbers]
+    refs += [(num, 0) for num in reader.xref_objStm]
+    for num, gen in sorted(set(refs)):
+        if num in skip:
+            continue
+        obj = reader.get_object(IndirectObject(num, gen, reader))
+        if obj is None:
+            continue
+        if isinstance(obj, DictionaryObject) and (obj.get('/Type') in SKIPPED_TYPES or '/Linearized' in obj):
+            continue
+        yield num, gen, obj
+
+
+def build_layout(fileobj, body):
+    """Parse a PDF once: write its non-page objects to ``body`` and return the rest of the layout."""
+    reader = PdfReader(fileobj)
+    if reader.is_encrypted:
+        return None
+    trailer = reader.trailer
+    next_num = int(trailer['/Size'])
+    font_num, state_num, open_num = next_num, next_num + 1, next_num + 2
+    boxes, pages = [], []
+    for page in reader.pages:
+        box = tuple(float(v) for v in page.mediabox)
+        if box not in boxes:
+            boxes.append(box)
+        pages.append((page, boxes.index(box)))
+    mark_base = open_num + 1
+    resources_base = mark_base + len(boxes)
+
+    shared = [
+        (font_num, _object(font_num, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')),
+        (state_num, _object(state_num, b'<< /Type /ExtGState /ca 0.3 >>')),
+        (open_num, _stream(open_num, b'q')),
+    ]
+    layout_pages = []
+    for index, (page, box_index) in enumerate(pages):
+        resources = _inherited(page, '/Resources')
+        resources = DictionaryObject(resources.get_object()) if resources is not None else DictionaryObject()
+        resources[NameObject('/Font')] = _with_entry(resources.get('/Font'), FONT_NAME, IndirectObject(font_num, 0, reader))
+        resources[NameObject('/ExtGState')] = _with_entry(resources.get('/ExtGState'), STATE_NAME, IndirectObject(state_num, 0, reader))
+        rewritten = DictionaryObject({NameObject(key): page.raw_get(key) for key in page})
+        rewritten[NameObject('/Contents')] = ArrayObject([
+            IndirectObject(open_num, 0, reader), *_content_refs(page), IndirectObject(mark_base + box_index, 0, reader),
+        ])
+        rewritten[NameObject('/Resources')] = IndirectObject(resources_base + index, 0, reader)
+        ref = page.indirect_ref
+        layout_pages.append({
+            'num': ref.idnum,
+            'gen': ref.generation,
+            'page': _serialize(rewritten),
+            'resources_num': resources_base + index,
+            'resources': _serialize(resources),
+        })
+
+    entries = []
+    body.write(HEADER)
+    position = len(HEADER)
+    for num, gen, obj in _body_objects(reader, {page['num'] for page in layout_pages}):
+        data = _object(num, _serialize(obj), gen)
+        body.write(data)
+        entries.append((num, gen, position))
+        position += len(data)
+
+    extra = b''
+    if '/Info' in trailer:
+        extra += b' /Info ' + _serialize(trailer.raw_get('/Info'))
+    if '/ID' in trailer:
+        extra += b' /ID ' + _serialize(trailer['/ID'])
+    return {
+        'body_size': position,
+        'entries': entries,
+        'next_num': resources_base + len(pages),
+        'root': _serialize(trailer.raw_get('/Root')),
+        'trailer_extra': extra,
+        'shared': shared,
+        'mark_base': mark_base,
+        'boxes': boxes,
+        'pages': layout_pages,
+    }
+
+
+def _layout_key(material):
+    digest = hashlib.sha1(material.file.name.encode()).hexdigest()[:16]
+    return f'material_layout:{material.pk}:{digest}:{material.file.size}'
+
+
+def _build_body(material, name):
+    with material.file.open('rb') as fileobj, tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as body:
+        layout = build_layout(fileobj, body)
+        if layout is None:
+            return None
+        body.seek(0)
+        # The offsets in ``layout`` are only valid for the body written just now
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        layout['body'] = default_storage.save(name, File(body))
+    return layout
+
+
+def material_layout(material):
+    """The cached layout of a material's PDF, parsed on first use (None if it cannot be rewritten)."""
+    key = _layout_key(material)
+    layout = cache.get(key)
+    if layout and not default_storage.exists(layout['body']):
+        layout = None
+    if layout is None:
+        name = f"emasomo/watermark/{key.split(':', 1)[1].replace(':', '-')}.body"
+        try:
+            layout = _build_body(material, name)
+        except Exception:
+            logger.warning("Could not parse material %s for watermarking", material.pk, exc_info=True)
+            layout = None
+        # False marks a file we have already failed to parse
+        cache.set(key, layout or False, LAYOUT_TTL)
+    return layout or None
+
+
+def _escape(text):
+    raw = text.encode('cp1252', 'replace')
+    return raw.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def _mark_stream(box, text):
+    x0, y0, x1, y1 = box
+    cos = sin = math.sqrt(0.5)
+    return (
+        b'Q\nq /%s gs 0.6 0.6 0.6 rg BT /%s %d Tf %.4f %.4f %.4f %.4f %.2f %.2f Tm (%s) Tj ET Q' % (
+            STATE_NAME[1:].encode(), FONT_NAME[1:].encode(), FONT_SIZE,
+            cos, sin, -sin, cos, x0 + (x1 - x0) * 0.15, y0 + (y1 - y0) * 0.3, _escape(text),
+        )
+    )
+
+
+def _xref(entries):
+    """Classic cross-reference section for ``entries`` of ``(num, gen, offset)``."""
+    lines = [b'xref\n', b'0 1\n', b'0000000000 65535 f\r\n']
+    entries = sorted(entries)
+    start = 0
+    while start < len(entries):
+        end = start + 1
+        while end < len(entries) and entries[end][0] == entries[end - 1][0] + 1:
+            end += 1
+        lines.append(b'%d %d\n' % (entries[start][0], end - start))
+        lines.extend(b'%010d %05d n\r\n' % (offset, gen) for _, gen, offset in entries[start:end])
+        start = end
+    return b''.join(lines)
+
+
+def build_tail(layout, text):
+    """The pages watermarked with ``text`` and the file's cross-reference table, as a list of chunks."""
+    chunks, entries = [], list(layout['entries'])
+    position = layout['body_size']
+
+    def add(num, data, gen=0):
+        nonlocal position
+        entries.append((num, gen, position))
+        chunks.append(data)
+        position += len(data)
+
+    for num, data in layout['shared']:
+        add(num, data)
+    for index, box in enumerate(layout['boxes']):
+        add(layout['mark_base'] + index, _stream(layout['mark_base'] + index, _mark_stream(box, text)))
+    for page in layout['pages']:
+        add(page['num'], _object(page['num'], page['page'], page['gen']), page['gen'])
+        add(page['resources_num'], _object(page['resources_num'], page['resources']))
+    xref_offset = position
+    chunks.append(_xref(entries) + b'trailer\n<< /Size %d /Root %s%s >>\nstartxref\n%d\n%%%%EOF\n' % (
+        layout['next_num'], layout['root'], layout['trailer_extra'], xref_offset,
+    ))
+    return chunks
+
+
+def user_tail(material, user, layout):
+    """The user's pages and cross-reference table, cached for ``COPY_TTL``."""
+    key = f'material_copy:{_layout_key(material)}:{user.pk}'
+    tail = cache.get(key)
+    if tail is None:
+        tail = build_tail(layout, watermark_text(user))
+        cache.set(key, tail, COPY_TTL)
+    return tail
+
+
+def stream_copy(layout, tail):
+    """Yield the stored body in chunks, then the watermarked pages and xref."""
+    with default_storage.open(layout['body'], 'rb') as fileobj:
+        while True:
+            chunk = fileobj.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    yield from tail
+
+
+def merge_watermark(material, user):
+    """Fallback for PDFs that cannot be rewritten from a layout: merge a watermark into every page."""
+    watermark_io = io.BytesIO()
+    c = canvas.Canvas(watermark_io)
+    c.setFont('Helvetica', FONT_SIZE)
+    c.setFillColorRGB(0.6, 0.6, 0.6, alpha=0.3)
+    c.saveState()
+    c.translate(300, 400)
+    c.rotate(45)
+    c.drawString(0, 0, watermark_text(user))
+    c.restoreState()
+    c.save()
+    watermark_page = PdfReader(watermark_io).pages[0]
+    writer = PdfWriter()
+    with material.file.open('rb') as fileobj:
+        for page in PdfReader(fileobj).pages:
+            page.merge_page(watermark_page)
+            writer.add_page(page)
+    output = io.BytesIO()
+    writer.write(output)
+    return [output.getvalue()]
+
+
+def watermarked_copy(material, user):
+    """Return ``(chunks iterable, content length)`` for the user's watermarked copy."""
+    layout = material_layout(material)
+    if layout is None:
+        chunks = merge_watermark(material, user)
+        return chunks, len(chunks[0])
+    tail = user_tail(material, user, layout)
+    return stream_copy(layout, tail), layout['body_size'] + sum(len(chunk) for chunk in tail)
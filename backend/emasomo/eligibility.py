@@ -0,0 +1,175 @@
+"""Enrollment and prerequisite checks for emasomo assignments and quizzes.
+
+``StudentEligibility`` loads what a student has done (enrollments, best
+grade per assignment, best score per quiz) in three queries, keeps it in
+the cache for ``STATE_TTL`` seconds and on the request for the rest of
+the request. Writes to those tables drop the cached copy (see
+``emasomo.signals``).
+
+Prerequisites are resolved in memory: the ``prerequisites`` graph
+reachable from the items being checked is loaded one level per query, and
+an item is eligible only when every prerequisite along the chain is
+satisfied. A prerequisite without ``min_score_required`` is satisfied by
+any submission or attempt.
+"""
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils import timezone
+
+STATE_TTL = 60
+NODE_FIELDS = ('id', 'title', 'min_score_required', 'unit_id', 'unit__code', 'unit__name')
+
+
+def _state_key(student_id):
+    return f'emasomo_eligibility:{student_id}'
+
+
+def invalidate_student(student_id):
+    cache.delete(_state_key(student_id))
+
+
+def _best(queryset, key, value):
+    return {
+        row[key]: row['best']
+        for row in queryset.values(key).annotate(best=Max(value)).order_by()
+    }
+
+
+def load_state(student_id):
+    from .models import AssignmentSubmission, Enrollment, QuizAttempt
+    state = cache.get(_state_key(student_id))
+    if state is None:
+        state = {
+            'enrollments': dict(Enrollment.objects.filter(student_id=student_id).values_list('unit_id', 'status')),
+            'assignments': _best(AssignmentSubmission.objects.filter(student_id=student_id), 'assignment_id', 'grade'),
+            'quizzes': _best(QuizAttempt.objects.filter(student_id=student_id), 'quiz_id', 'score'),
+        }
+        cache.set(_state_key(student_id), state, STATE_TTL)
+    return state
+
+
+class PrerequisiteGraph:
+    """The part of a model's ``prerequisites`` graph reachable from some items."""
+
+    def __init__(self, model, ids, extra_fields=()):
+        through = model.prerequisites.through
+        name = model._meta.model_name
+        source, target = f'from_{name}_id', f'to_{name}_id'
+        self.edges = defaultdict(list)
+        seen = set(ids)
+        frontier = set(seen)
+        while frontier:
+            rows = through.objects.filter(**{f'{source}__in': frontier}).values_list(source, target)
+            frontier = set()
+            for node, prerequisite in rows:
+                self.edges[node].append(prerequisite)
+                if prerequisite not in seen:
+                    seen.add(prerequisite)
+                    frontier.add(prerequisite)
+        for prerequisites in self.edges.values():
+            prerequisites.sort()
+        self.nodes = {row['id']: row for row in model.objects.filter(id__in=seen).values(*NODE_FIELDS, *extra_fields)}
+
+    def label(self, node_id):
+        node = self.nodes[node_id]
+        return f"{node['unit__code']} - {node['unit__name']}: {node['title']}"
+
+
+class StudentEligibility:
+    def __init__(self, student):
+        self.student = student
+        self.state = load_state(student.pk)
+
+    @classmethod
+    def for_request(cls, request):
+        """One instance per request, shared by permission checks and views."""
+        eligibility = getattr(request, '_emasomo_eligibility', None)
+        if eligibility is None or eligibility.student.pk != request.user.pk:
+            eligibility = cls(request.user)
+            request._emasomo_eligibility = eligibility
+        return eligibility
+
+    def is_enrolled(self, unit_id, active_only=False):
+        status = self.state['enrollments'].get(unit_id)
+        return status is not None and (status == 'active' or not active_only)
+
+    def _satisfied(self, kind, node):
+        best = self.state[kind].get(node['id'], False)
+        if best is False:
+            return False
+        required = node['min_score_required']
+        return required is None or (best is not None and best >= required)
+
+    def _first_missing(self, kind, graph, node_id, memo, visiting):
+        """The first unmet prerequisite of ``node_id``, deepest first, or None."""
+        if node_id in memo:
+            return memo[node_id]
+        visiting.add(node_id)
+        missing = None
+        for prerequisite in graph.edges.get(node_id, ()):
+            if prerequisite in visiting:
+                continue
+            missing = self._first_missing(kind, graph, prerequisite, memo, visiting)
+            if missing is None and not self._satisfied(kind, graph.nodes[prerequisite]):
+                missing = prerequisite
+            if missing is not None:
+                break
+        visiting.discard(node_id)
+        memo[node_id] = missing
+        return missing
+
+    def _check(self, kind, graph, node_id, memo, now):
+        node = graph.nodes[node_id]
+        if not self.is_enrolled(node['unit_id']):
+            return False, 'Not enrolled in this unit.'
+        missing = self._first_missing(kind, graph, node_id, memo, set())
+        if missing is not None:
+            return False, f'Missing prerequisite: {graph.label(missing)}'
+        if kind == 'assignments':
+            due = node['due_date'] or node['deadline']
+            if due and now > due:
+                return False, 'Assignment deadline has passed.'
+        return True, ''
+
+    def _check_many(self, kind, model, items, extra_fields=()):
+        ids = [getattr(item, 'pk', item) for item in items]
+        graph = PrerequisiteGraph(model, ids, extra_fields)
+        memo, now = {}, timezone.now()
+        return {pk: self._check(kind, graph, pk, memo, now) for pk in ids}
+
+    def check_assignments(self, assignments):
+        """``{assignment id: (eligible, reason)}`` for assignments (instances or ids)."""
+        from .models import Assignment
+        return self._check_many('assignments', Assignment, assignments, ('due_date', 'deadline'))
+
+    def check_quizzes(self, quizzes):
+        """``{quiz id: (eligible, reason)}`` for quizzes (instances or ids)."""
+        from .models import Quiz
+        return self._check_many('quizzes', Quiz, quizzes)
+
+    def assignment(self, assignment):
+        return self.check_assignments([assignment])[assignment.pk]
+
+    def quiz(self, quiz):
+        return self.check_quizzes([quiz])[quiz.pk]
+
+    def unit_report(self, unit):
+        """Eligibility of every assignment and quiz in ``unit``."""
+        from .models import Assignment, Quiz
+        assignments = list(Assignment.objects.filter(unit=unit).order_by('id').values_list('id', 'title'))
+        quizzes = list(Quiz.objects.filter(unit=unit).order_by('id').values_list('id', 'title'))
+        assignment_checks = self.check_assignments([pk for pk, _ in assignments])
+        quiz_checks = self.check_quizzes([pk for pk, _ in quizzes])
+        return {
+            'enrolled': self.is_enrolled(unit.pk),
+            'assignments': [
+                {'id': pk, 'title': title, 'eligible': assignment_checks[pk][0], 'reason': assignment_checks[pk][1]}
+                for pk, title in assignments
+            ],
+            'quizzes': [
+                {'id': pk, 'title': title, 'eligible': quiz_checks[pk][0], 'reason': quiz_checks[pk][1]}
+                for pk, title in quizzes
+            ],
+        }
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from emasomo.analytics import rebuild_analytics
+
+
+class Command(BaseCommand):
+    help = 'Recompute the emasomo per-unit and per-student dashboard rollups from the source tables.'
+
+    def handle(self, *args, **options):
+        units, students = rebuild_analytics()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt analytics for {units} units and {students} students.'))
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_analytics(apps, schema_editor):
+    from emasomo.analytics import rebuild_analytics
+    rebuild_analytics(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emasomo', '0002_badge_assignment_due_date_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentAnalytics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trackers', models.IntegerField(default=0)),
+                ('materials_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('assignments_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('quizzes_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('engagement_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('submissions', models.IntegerField(default=0)),
+                ('quiz_attempts', models.IntegerField(default=0)),
+                ('forum_replies', models.IntegerField(default=0)),
+                ('activity', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='emasomo_analytics', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UnitAnalytics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('active_enrollments', models.IntegerField(default=0)),
+                ('trackers', models.IntegerField(default=0)),
+                ('materials_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('assignments_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('quizzes_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('engagement_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('submissions', models.IntegerField(default=0)),
+                ('quiz_attempts', models.IntegerField(default=0)),
+                ('forum_replies', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('unit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='analytics', to='emasomo.unit')),
+            ],
+        ),
+        migrations.RunPython(backfill_analytics, migrations.RunPython.noop),
+    ]
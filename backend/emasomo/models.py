@@ -59,19 +59,9 @@ class Assignment(models.Model):
 	def __str__(self):
 		return f"{self.unit}: {self.title}"
 	def is_eligible(self, user):
-		# Check enrollment
-		if not Enrollment.objects.filter(student=user, unit=self.unit).exists():
-			return False, 'Not enrolled in this unit.'
-		# Check prerequisites
-		for prereq in self.prerequisites.all():
-			sub = AssignmentSubmission.objects.filter(assignment=prereq, student=user, grade__gte=prereq.min_score_required).exists()
-			if not sub:
-				return False, f'Missing prerequisite: {prereq}'
-		# Check deadline
-		from django.utils import timezone
-		if timezone.now() > self.due_date:
-			return False, 'Assignment deadline has passed.'
-		return True, ''
+		# Enrollment, the prerequisite chain and the deadline (see emasomo.eligibility)
+		from .eligibility import StudentEligibility
+		return StudentEligibility(user).assignment(self)
 
 class AssignmentSubmission(models.Model):
 	student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -99,15 +89,9 @@ class Quiz(models.Model):
 	def __str__(self):
 		return f"{self.unit}: {self.title}"
 	def is_eligible(self, user):
-		# Check enrollment
-		if not Enrollment.objects.filter(student=user, unit=self.unit).exists():
-			return False, 'Not enrolled in this unit.'
-		# Check prerequisites
-		for prereq in self.prerequisites.all():
-			attempt = QuizAttempt.objects.filter(quiz=prereq, student=user, score__gte=prereq.min_score_required).exists()
-			if not attempt:
-				return False, f'Missing prerequisite: {prereq}'
-		return True, ''
+		# Enrollment and the prerequisite chain (see emasomo.eligibility)
+		from .eligibility import StudentEligibility
+		return StudentEligibility(user).quiz(self)
 	def get_randomized_questions(self, user=None):
 		qs = list(self.questions.all())
 		import random
@@ -282,6 +266,38 @@ class DashboardWidget(models.Model):
     def __str__(self):
         return f"{self.student} - {self.widget_type}"
 
+# Running totals behind the emasomo dashboards, maintained by emasomo.analytics
+class UnitAnalytics(models.Model):
+	unit = models.OneToOneField(Unit, on_delete=models.CASCADE, related_name='analytics')
+	active_enrollments = models.IntegerField(default=0)
+	trackers = models.IntegerField(default=0)
+	materials_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+	assignments_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+	quizzes_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+	engagement_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+	submissions = models.IntegerField(default=0)
+	quiz_attempts = models.IntegerField(default=0)
+	forum_replies = models.IntegerField(default=0)
+	updated_at = models.DateTimeField(auto_now=True)
+	def __str__(self):
+		return f"{self.unit} analytics"
+
+class StudentAnalytics(models.Model):
+	student = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='emasomo_analytics')
+	trackers = models.IntegerField(default=0)
+	materials_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+	assignments_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+	quizzes_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+	engagement_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+	submissions = models.IntegerField(default=0)
+	quiz_attempts = models.IntegerField(default=0)
+	forum_replies = models.IntegerField(default=0)
+	# Learning events per ISO week, e.g. {"2025-W07": 4}
+	activity = models.JSONField(default=dict, blank=True)
+	updated_at = models.DateTimeField(auto_now=True)
+	def __str__(self):
+		return f"{self.student} analytics"
+
 @receiver(post_save, sender=ProgressTracker)
 def award_badges_on_progress(sender, instance, **kwargs):
     # 100% Completion
@@ -1,5 +1,7 @@
 from rest_framework import permissions
 
+from .eligibility import StudentEligibility
+
 class IsStudent(permissions.BasePermission):
     def has_permission(self, request, view):
         return hasattr(request.user, 'is_student') and request.user.is_student
@@ -19,7 +21,7 @@ class IsEnrolledOrLecturer(permissions.BasePermission):
             if hasattr(request.user, 'is_lecturer') and request.user.is_lecturer:
                 return obj.unit.lecturer == request.user
             if hasattr(request.user, 'is_student') and request.user.is_student:
-                return obj.unit.enrollment_set.filter(student=request.user, status='active').exists()
+                return StudentEligibility.for_request(request).is_enrolled(obj.unit_id, active_only=True)
         return False
 
 class IsGroupMember(permissions.BasePermission):
@@ -1,3 +1,4 @@
+from django.core.exceptions import ObjectDoesNotExist
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from .models import (
@@ -31,3 +32,99 @@ def log_marketplace_item(sender, instance, created, **kwargs):
 def log_purchase(sender, instance, created, **kwargs):
     if created:
         AuditLog.objects.create(user=instance.buyer, action='MarketplaceItemPurchased', details={'item': instance.item.id})
+
+
+# --- Dashboard rollups (see emasomo.analytics) ---
+from django.db.models.signals import post_delete, pre_save
+from .analytics import TOTALS, bump, bump_both, tracker_deltas
+from .models import AssignmentSubmission, Enrollment, ForumReply, ProgressTracker, QuizAttempt, UnitAnalytics
+
+
+@receiver(pre_save, sender=ProgressTracker)
+def stash_tracker(sender, instance, raw=False, **kwargs):
+    instance._rollup_previous = None
+    if instance.pk and not raw:
+        instance._rollup_previous = sender.objects.filter(pk=instance.pk).values('unit_id', 'student_id', *TOTALS).first()
+
+
+@receiver(post_save, sender=ProgressTracker)
+def tracker_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_rollup_previous', None)
+    current = {field: getattr(instance, field) for field in TOTALS}
+    if previous and (previous['unit_id'], previous['student_id']) != (instance.unit_id, instance.student_id):
+        bump_both(previous['unit_id'], previous['student_id'], create=False, **tracker_deltas(previous, None))
+        previous = None
+    bump_both(instance.unit_id, instance.student_id, **tracker_deltas(previous, current))
+
+
+@receiver(post_delete, sender=ProgressTracker)
+def tracker_deleted(sender, instance, **kwargs):
+    before = {field: getattr(instance, field) for field in TOTALS}
+    bump_both(instance.unit_id, instance.student_id, create=False, **tracker_deltas(before, None))
+
+
+@receiver(pre_save, sender=Enrollment)
+def stash_enrollment(sender, instance, raw=False, **kwargs):
+    instance._rollup_previous = None
+    if instance.pk and not raw:
+        instance._rollup_previous = sender.objects.filter(pk=instance.pk).values_list('unit_id', 'status').first()
+
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous and previous[1] == 'active':
+        bump(UnitAnalytics, {'unit_id': previous[0]}, create=False, active_enrollments=-1)
+    if instance.status == 'active':
+        bump(UnitAnalytics, {'unit_id': instance.unit_id}, active_enrollments=1)
+
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_deleted(sender, instance, **kwargs):
+    if instance.status == 'active':
+        bump(UnitAnalytics, {'unit_id': instance.unit_id}, create=False, active_enrollments=-1)
+
+
+ACTIVITY_COUNTERS = {
+    AssignmentSubmission: ('submissions', 'assignment'),
+    QuizAttempt: ('quiz_attempts', 'quiz'),
+    ForumReply: ('forum_replies', 'thread'),
+}
+
+
+def activity_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counter, parent = ACTIVITY_COUNTERS[sender]
+        bump_both(getattr(instance, parent).unit_id, instance.student_id, **{counter: 1})
+
+
+def activity_deleted(sender, instance, **kwargs):
+    counter, parent = ACTIVITY_COUNTERS[sender]
+    try:
+        unit_id = getattr(instance, parent).unit_id
+    except ObjectDoesNotExist:
+        # Cascade from the parent's deletion
+        unit_id = None
+    bump_both(unit_id, instance.student_id, create=False, **{counter: -1})
+
+
+for model in ACTIVITY_COUNTERS:
+    post_save.connect(activity_created, sender=model, dispatch_uid=f'emasomo_rollup_created_{model.__name__}')
+    post_delete.connect(activity_deleted, sender=model, dispatch_uid=f'emasomo_rollup_deleted_{model.__name__}')
+
+
+# --- Cached eligibility state (see emasomo.eligibility) ---
+from .eligibility import invalidate_student
+
+
+def eligibility_changed(sender, instance, **kwargs):
+    invalidate_student(instance.student_id)
+
+
+for model in (Enrollment, AssignmentSubmission, QuizAttempt):
+    post_save.connect(eligibility_changed, sender=model, dispatch_uid=f'emasomo_eligibility_saved_{model.__name__}')
+    post_delete.connect(eligibility_changed, sender=model, dispatch_uid=f'emasomo_eligibility_deleted_{model.__name__}')
@@ -20,3 +20,237 @@ class LoginWithEmailTests(APITestCase):
         response = self.client.post(url, {'email': 'student@example.com', 'password': 'wrongpass'}, follow=True)
         self.assertEqual(response.status_code, 401)
         self.assertIn('error', response.data)
+
+
+class MaterialDownloadTests(APITestCase):
+    def setUp(self):
+        import io
+        import shutil
+        import tempfile
+        from django.core.cache import cache
+        from django.core.files.base import ContentFile
+        from django.test import override_settings
+        from reportlab.pdfgen import canvas
+        from .models import Department, Enrollment, LearningMaterial, ProgressTracker, Unit
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        self.student = CustomUser.objects.create_user(email='reader@example.com', password='testpass123')
+        self.student.is_student = True
+        department = Department.objects.create(name='Computing', faculty='Science')
+        unit = Unit.objects.create(code='CS101', name='Intro', department=department, year=1, semester=1)
+        Enrollment.objects.create(student=self.student, unit=unit)
+        self.progress = ProgressTracker.objects.create(student=self.student, unit=unit, percent_materials=95)
+        source = io.BytesIO()
+        c = canvas.Canvas(source)
+        for page in range(12):
+            c.drawString(100, 700, f'Lecture page {page}')
+            c.showPage()
+        c.save()
+        self.material = LearningMaterial(unit=unit, topic='Week 1')
+        self.material.file.save('week1.pdf', ContentFile(source.getvalue()))
+        self.original = source.getvalue()
+        self.client.force_authenticate(user=self.student)
+
+    def _download(self):
+        response = self.client.get(f'/api/emasomo/materials/{self.material.pk}/download/')
+        self.assertEqual(response.status_code, 200)
+        body = b''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        return body
+
+    def test_download_rewrites_every_page_with_the_watermark(self):
+        import io
+        from PyPDF2 import PdfReader
+
+        body = self._download()
+        self.assertFalse(body.startswith(self.original))
+        # One revision only: nothing to cut back to an unwatermarked file
+        self.assertEqual(body.count(b'startxref'), 1)
+        self.assertNotIn(b'/Prev', body)
+        pages = PdfReader(io.BytesIO(body), strict=True).pages
+        self.assertEqual(len(pages), 12)
+        self.assertIn('Lecture page 11', pages[11].extract_text())
+        self.assertIn('reader@example.com', pages[11].extract_text())
+        self.progress.refresh_from_db()
+        self.assertEqual(self.progress.percent_materials, 100)
+
+    def test_pdf_is_parsed_once_and_copies_are_cached_per_user(self):
+        from unittest import mock
+        from . import delivery
+
+        with mock.patch.object(delivery, 'build_layout', wraps=delivery.build_layout) as parse, \
+                mock.patch.object(delivery, 'build_tail', wraps=delivery.build_tail) as render:
+            first = self._download()
+            self.assertEqual(self._download(), first)
+            other = CustomUser.objects.create_user(email='other@example.com', password='testpass123')
+            other.is_student = True
+            from .models import Enrollment
+            Enrollment.objects.create(student=other, unit=self.material.unit)
+            self.client.force_authenticate(user=other)
+            self.assertIn(b'other@example.com', self._download())
+        self.assertEqual(parse.call_count, 1)
+        self.assertEqual(render.call_count, 2)
+
+
+class AnalyticsRollupTests(APITestCase):
+    def setUp(self):
+        from .models import Department, Enrollment, ForumThread, ProgressTracker, Unit
+        self.lecturer = CustomUser.objects.create_user(email='lecturer@example.com', password='testpass123')
+        self.lecturer.is_lecturer = True
+        department = Department.objects.create(name='Computing', faculty='Science')
+        self.unit = Unit.objects.create(code='CS201', name='Data', department=department, year=2, semester=1, lecturer=self.lecturer)
+        self.students = []
+        for i, materials in enumerate((40, 95)):
+            student = CustomUser.objects.create_user(email=f'rollup{i}@example.com', password='testpass123')
+            student.is_student = True
+            Enrollment.objects.create(student=student, unit=self.unit)
+            ProgressTracker.objects.create(student=student, unit=self.unit, percent_materials=materials, engagement_score=80)
+            self.students.append(student)
+        self.thread = ForumThread.objects.create(unit=self.unit, student=self.students[0], title='Help', body='?')
+
+    def _rollups(self):
+        from .models import StudentAnalytics, UnitAnalytics
+        fields = ['trackers', 'materials_total', 'assignments_total', 'quizzes_total', 'engagement_total', 'submissions', 'quiz_attempts', 'forum_replies']
+        return (
+            UnitAnalytics.objects.values('active_enrollments', *fields).get(unit=self.unit),
+            list(StudentAnalytics.objects.order_by('student_id').values(*fields)),
+        )
+
+    def test_progress_updates_flow_into_unit_and_student_rollups(self):
+        from decimal import Decimal
+        from .analytics import record_progress
+        from .models import Enrollment, ProgressTracker, StudentAnalytics, UnitAnalytics
+
+        self.client.force_authenticate(user=self.students[1])
+        response = self.client.post(f'/api/emasomo/forums/{self.thread.pk}/reply/', {'body': 'Try this'})
+        self.assertEqual(response.status_code, 200)
+        record_progress(self.students[1], self.unit, percent_materials=10)
+
+        unit = UnitAnalytics.objects.get(unit=self.unit)
+        self.assertEqual((unit.active_enrollments, unit.trackers, unit.forum_replies), (2, 2, 1))
+        # 95 + 10 is capped at 100, so only 5 reaches the totals
+        self.assertEqual(unit.materials_total, Decimal('140'))
+        self.assertEqual(unit.engagement_total, Decimal('165'))
+        student = StudentAnalytics.objects.get(student=self.students[1])
+        self.assertEqual((student.materials_total, student.forum_replies), (Decimal('100'), 1))
+        self.assertEqual(sum(student.activity.values()), 2)
+
+        tracker = ProgressTracker.objects.get(student=self.students[0])
+        tracker.percent_quizzes = 60
+        tracker.save()
+        Enrollment.objects.filter(student=self.students[0]).get().delete()
+        ProgressTracker.objects.get(student=self.students[1]).delete()
+        incremental = self._rollups()
+        self.assertEqual(incremental[0]['trackers'], 1)
+        self.assertEqual(incremental[0]['active_enrollments'], 1)
+
+        from .analytics import rebuild_analytics
+        rebuild_analytics()
+        self.assertEqual(self._rollups(), incremental)
+
+    def test_dashboards_read_rollup_rows(self):
+        from .analytics import record_progress
+        record_progress(self.students[0], self.unit, percent_assignments=20)
+
+        self.client.force_authenticate(user=self.students[0])
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/emasomo/analytics/student-dashboard/')
+        self.assertEqual(response.data['avg_assignment'], 20)
+        self.assertEqual(response.data['avg_materials'], 40)
+        self.assertEqual(len(response.data['activity_heatmap']), 1)
+
+        self.client.force_authenticate(user=self.lecturer)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/emasomo/analytics/lecturer-dashboard/')
+        unit = response.data['units'][0]
+        self.assertEqual((unit['enrollments'], unit['avg_progress'], unit['avg_assignment']), (2, 67.5, 10))
+
+    def test_unit_dashboard_caps_each_list(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import Assignment
+        Assignment.objects.bulk_create([
+            Assignment(unit=self.unit, title=f'A{i}', description='-', deadline=timezone.now() + timedelta(days=i))
+            for i in range(12)
+        ])
+        self.client.force_authenticate(user=self.students[0])
+        response = self.client.get(f'/api/emasomo/units/{self.unit.pk}/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['assignments']), 10)
+        self.assertEqual(response.data['has_more'], {'assignments': True, 'quizzes': False, 'materials': False, 'forum_threads': False})
+        self.assertEqual(response.data['analytics']['enrollments'], 2)
+
+
+class EligibilityTests(APITestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from django.core.cache import cache
+        from django.utils import timezone
+        from .models import Assignment, Department, Enrollment, Quiz, Unit
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.student = CustomUser.objects.create_user(email='eligible@example.com', password='testpass123')
+        self.student.is_student = True
+        department = Department.objects.create(name='Computing', faculty='Science')
+        self.unit = Unit.objects.create(code='CS301', name='Algorithms', department=department, year=3, semester=1)
+        Enrollment.objects.create(student=self.student, unit=self.unit)
+        due = timezone.now() + timedelta(days=7)
+        self.chain = []
+        for i in range(3):
+            assignment = Assignment.objects.create(
+                unit=self.unit, title=f'Part {i}', description='-', deadline=due, due_date=due, min_score_required=50,
+            )
+            if self.chain:
+                assignment.prerequisites.add(self.chain[-1])
+            self.chain.append(assignment)
+        self.quiz_a = Quiz.objects.create(unit=self.unit, title='Warm-up', questions=[])
+        self.quiz_b = Quiz.objects.create(unit=self.unit, title='Main', questions=[])
+        self.quiz_b.prerequisites.add(self.quiz_a)
+
+    def _submit(self, assignment, grade):
+        from .models import AssignmentSubmission
+        AssignmentSubmission.objects.create(student=self.student, assignment=assignment, file='submissions/x.pdf', grade=grade)
+
+    def test_prerequisites_are_resolved_through_the_whole_chain(self):
+        from .models import QuizAttempt
+        # Part 1 is done but Part 0, which it depends on, never passed
+        self._submit(self.chain[0], 30)
+        self._submit(self.chain[1], 90)
+        eligible, reason = self.chain[2].is_eligible(self.student)
+        self.assertFalse(eligible)
+        self.assertEqual(reason, 'Missing prerequisite: CS301 - Algorithms: Part 0')
+
+        self._submit(self.chain[0], 70)
+        self.assertEqual(self.chain[2].is_eligible(self.student), (True, ''))
+        self.assertFalse(self.quiz_b.is_eligible(self.student)[0])
+        QuizAttempt.objects.create(student=self.student, quiz=self.quiz_a, answers={})
+        self.assertEqual(self.quiz_b.is_eligible(self.student), (True, ''))
+
+    def test_unit_report_costs_the_same_however_many_items(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .models import Assignment
+
+        self.client.force_authenticate(user=self.student)
+        url = f'/api/emasomo/units/{self.unit.pk}/eligibility/'
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get(url)
+        self.assertEqual(
+            [(a['title'], a['eligible']) for a in response.data['assignments']],
+            [('Part 0', True), ('Part 1', False), ('Part 2', False)],
+        )
+        for i in range(20):
+            extra = Assignment.objects.create(unit=self.unit, title=f'Extra {i}', description='-', deadline=self.chain[0].deadline)
+            extra.prerequisites.add(self.chain[i % 3])
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['assignments']), 23)
+        # The student's record is cached; only unit, item and graph queries remain
+        self.assertLessEqual(len(large), len(small))
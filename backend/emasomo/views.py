@@ -4,7 +4,6 @@ from rest_framework.response import Response
 from .models import *
 from .serializers import *
 from .permissions import IsStudent, IsLecturer, IsOwnerOrReadOnly, IsEnrolledOrLecturer
-from django.db.models import F, Avg, Count
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -14,10 +13,14 @@ from rest_framework import status
 from rest_framework.throttling import ScopedRateThrottle
 from django.utils import timezone
 from rest_framework import exceptions
-from django.http import FileResponse
-import io
-from reportlab.pdfgen import canvas
-from PyPDF2 import PdfReader, PdfWriter
+from django.http import FileResponse, StreamingHttpResponse
+import os
+from .analytics import activity_heatmap, averages, record_progress
+from .delivery import watermarked_copy
+from .eligibility import StudentEligibility
+
+# Items of each kind shown on a unit dashboard
+DASHBOARD_ITEMS = 10
 
 class DepartmentViewSet(viewsets.ModelViewSet):
 	queryset = Department.objects.all()
@@ -33,20 +36,32 @@ class UnitViewSet(viewsets.ModelViewSet):
 	def dashboard(self, request, pk=None):
 		unit = self.get_object()
 		progress = ProgressTracker.objects.filter(student=request.user, unit=unit).first()
-		assignments = Assignment.objects.filter(unit=unit)
-		quizzes = Quiz.objects.filter(unit=unit)
-		materials = LearningMaterial.objects.filter(unit=unit)
-		forum_threads = ForumThread.objects.filter(unit=unit)
+		rollup = UnitAnalytics.objects.filter(unit=unit).first()
 		data = {
 			'unit': UnitSerializer(unit).data,
 			'progress': ProgressTrackerSerializer(progress).data if progress else {},
-			'assignments': AssignmentSerializer(assignments, many=True).data,
-			'quizzes': QuizSerializer(quizzes, many=True).data,
-			'materials': LearningMaterialSerializer(materials, many=True).data,
-			'forum_threads': ForumThreadSerializer(forum_threads, many=True).data,
+			'analytics': {'enrollments': rollup.active_enrollments if rollup else 0, **averages(rollup)},
+			'has_more': {},
 		}
+		# Only the latest few of each; the full lists are paginated on their own endpoints
+		sections = (
+			('assignments', Assignment.objects.filter(unit=unit).order_by('-created_at', '-id'), AssignmentSerializer),
+			('quizzes', Quiz.objects.filter(unit=unit).order_by('-created_at', '-id'), QuizSerializer),
+			('materials', LearningMaterial.objects.filter(unit=unit).order_by('-created_at', '-id'), LearningMaterialSerializer),
+			('forum_threads', ForumThread.objects.filter(unit=unit).order_by('-is_pinned', '-created_at', '-id'), ForumThreadSerializer),
+		)
+		for key, queryset, serializer in sections:
+			rows = list(queryset[:DASHBOARD_ITEMS + 1])
+			data[key] = serializer(rows[:DASHBOARD_ITEMS], many=True).data
+			data['has_more'][key] = len(rows) > DASHBOARD_ITEMS
 		return Response(data)
 
+	@action(detail=True, methods=['get'], url_path='eligibility')
+	def eligibility(self, request, pk=None):
+		# Every assignment and quiz in the unit, checked against one load of the student's record
+		unit = self.get_object()
+		return Response(StudentEligibility.for_request(request).unit_report(unit))
+
 class EnrollmentViewSet(viewsets.ModelViewSet):
 	queryset = Enrollment.objects.all()
 	serializer_class = EnrollmentSerializer
@@ -84,37 +99,14 @@ class LearningMaterialViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'], url_path='download')
     def download(self, request, pk=None):
         material = self.get_object()
-        if material.file.name.endswith('.pdf'):
-            # Add watermark to PDF
-            watermark_text = f"Uzuri University | {request.user.email} | {request.user.student_number}"
-            # Create watermark PDF in memory
-            watermark_io = io.BytesIO()
-            c = canvas.Canvas(watermark_io)
-            c.setFont('Helvetica', 24)
-            c.setFillColorRGB(0.6, 0.6, 0.6, alpha=0.3)
-            c.saveState()
-            c.translate(300, 400)
-            c.rotate(45)
-            c.drawString(0, 0, watermark_text)
-            c.restoreState()
-            c.save()
-            watermark_io.seek(0)
-            # Merge watermark with original PDF
-            original_pdf = PdfReader(material.file)
-            watermark_pdf = PdfReader(watermark_io)
-            writer = PdfWriter()
-            watermark_page = watermark_pdf.pages[0]
-            for page in original_pdf.pages:
-                page.merge_page(watermark_page)
-                writer.add_page(page)
-            output_io = io.BytesIO()
-            writer.write(output_io)
-            output_io.seek(0)
-            return FileResponse(output_io, as_attachment=True, filename=f"watermarked_{material.file.name}")
-        # For non-PDF, just return the file
-        return FileResponse(material.file, as_attachment=True)
-        # Update progress
-        ProgressTracker.objects.filter(student=request.user, unit=material.unit).update(percent_materials=F('percent_materials')+10)
+        record_progress(request.user, material.unit, percent_materials=10)
+        if not material.file.name.endswith('.pdf'):
+            return FileResponse(material.file, as_attachment=True)
+        chunks, length = watermarked_copy(material, request.user)
+        response = StreamingHttpResponse(chunks, content_type='application/pdf')
+        response['Content-Length'] = str(length)
+        response['Content-Disposition'] = f'attachment; filename="watermarked_{os.path.basename(material.file.name)}"'
+        return response
 
 class AssignmentViewSet(viewsets.ModelViewSet):
     queryset = Assignment.objects.all()
@@ -130,7 +122,7 @@ class AssignmentViewSet(viewsets.ModelViewSet):
 
     def retrieve(self, request, *args, **kwargs):
         assignment = self.get_object()
-        eligible, reason = assignment.is_eligible(request.user)
+        eligible, reason = StudentEligibility.for_request(request).assignment(assignment)
         if not eligible:
             raise exceptions.PermissionDenied(detail=reason)
         return super().retrieve(request, *args, **kwargs)
@@ -148,7 +140,7 @@ class AssignmentSubmissionViewSet(viewsets.ModelViewSet):
         # TODO: Integrate with plagiarism checker
         serializer.save(student=self.request.user, is_late=is_late, attempt=attempt)
         # Update progress
-        ProgressTracker.objects.filter(student=self.request.user, unit=assignment.unit).update(percent_assignments=F('percent_assignments')+20)
+        record_progress(self.request.user, assignment.unit, percent_assignments=20)
 
 class QuizViewSet(viewsets.ModelViewSet):
     queryset = Quiz.objects.all()
@@ -164,7 +156,7 @@ class QuizViewSet(viewsets.ModelViewSet):
 
     def retrieve(self, request, *args, **kwargs):
         quiz = self.get_object()
-        eligible, reason = quiz.is_eligible(request.user)
+        eligible, reason = StudentEligibility.for_request(request).quiz(quiz)
         if not eligible:
             raise exceptions.PermissionDenied(detail=reason)
         # Randomize/adapt questions
@@ -198,7 +190,7 @@ class QuizAttemptViewSet(viewsets.ModelViewSet):
         # TODO: Enforce time limit, randomize questions, adaptive difficulty
         serializer.save(student=self.request.user)
         # Update progress
-        ProgressTracker.objects.filter(student=self.request.user, unit=quiz.unit).update(percent_quizzes=F('percent_quizzes')+20)
+        record_progress(self.request.user, quiz.unit, percent_quizzes=20)
 
 class ForumThreadViewSet(viewsets.ModelViewSet):
     queryset = ForumThread.objects.all()
@@ -210,7 +202,7 @@ class ForumThreadViewSet(viewsets.ModelViewSet):
         thread = self.get_object()
         reply = ForumReply.objects.create(thread=thread, student=request.user, body=request.data.get('body'))
         # Update engagement score
-        ProgressTracker.objects.filter(student=request.user, unit=thread.unit).update(engagement_score=F('engagement_score')+5)
+        record_progress(request.user, thread.unit, engagement_score=5)
         return Response(ForumReplySerializer(reply).data)
 
 class ForumReplyViewSet(viewsets.ModelViewSet):
@@ -258,19 +250,14 @@ class AnalyticsViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'], url_path='student-dashboard')
     def student_dashboard(self, request):
         # Progress ring chart, heatmap, performance graphs
-        progress = ProgressTracker.objects.filter(student=request.user)
-        avg_assignment = progress.aggregate(avg=Avg('percent_assignments'))['avg'] or 0
-        avg_quiz = progress.aggregate(avg=Avg('percent_quizzes'))['avg'] or 0
-        avg_materials = progress.aggregate(avg=Avg('percent_materials'))['avg'] or 0
-        engagement = progress.aggregate(avg=Avg('engagement_score'))['avg'] or 0
-        # Heatmap: activity by week
-        activity = ProgressTracker.objects.filter(student=request.user).annotate(week=F('last_updated__week')).values('week').annotate(count=Count('id')).order_by('week')
+        rollup = StudentAnalytics.objects.filter(student=request.user).first()
+        avg = averages(rollup)
         return Response({
-            'avg_assignment': avg_assignment,
-            'avg_quiz': avg_quiz,
-            'avg_materials': avg_materials,
-            'engagement': engagement,
-            'activity_heatmap': list(activity),
+            'avg_assignment': avg['assignments_total'],
+            'avg_quiz': avg['quizzes_total'],
+            'avg_materials': avg['materials_total'],
+            'engagement': avg['engagement_total'],
+            'activity_heatmap': activity_heatmap(rollup),
         })
 
     @action(detail=False, methods=['get'], url_path='lecturer-dashboard')
@@ -278,33 +265,27 @@ class AnalyticsViewSet(viewsets.ViewSet):
         # Analytics for lecturer's units
         if not hasattr(request.user, 'is_lecturer') or not request.user.is_lecturer:
             return Response({'error': 'Not a lecturer'}, status=403)
-        units = Unit.objects.filter(lecturer=request.user)
         data = []
-        for unit in units:
-            enrollments = Enrollment.objects.filter(unit=unit, status='active').count()
-            avg_progress = ProgressTracker.objects.filter(unit=unit).aggregate(avg=Avg('percent_materials'))['avg'] or 0
-            avg_assignment = ProgressTracker.objects.filter(unit=unit).aggregate(avg=Avg('percent_assignments'))['avg'] or 0
-            avg_quiz = ProgressTracker.objects.filter(unit=unit).aggregate(avg=Avg('percent_quizzes'))['avg'] or 0
+        for unit in Unit.objects.filter(lecturer=request.user).select_related('analytics').order_by('code'):
+            rollup = getattr(unit, 'analytics', None)
+            avg = averages(rollup)
             data.append({
                 'unit': unit.name,
-                'enrollments': enrollments,
-                'avg_progress': avg_progress,
-                'avg_assignment': avg_assignment,
-                'avg_quiz': avg_quiz,
+                'enrollments': rollup.active_enrollments if rollup else 0,
+                'avg_progress': avg['materials_total'],
+                'avg_assignment': avg['assignments_total'],
+                'avg_quiz': avg['quizzes_total'],
             })
         return Response({'units': data})
 
     @action(detail=False, methods=['get'], url_path='engagement-stats')
     def engagement_stats(self, request):
         # Forum, assignment, quiz engagement
-        progress = ProgressTracker.objects.filter(student=request.user)
-        forum_count = ForumReply.objects.filter(student=request.user).count()
-        assignment_count = AssignmentSubmission.objects.filter(student=request.user).count()
-        quiz_count = QuizAttempt.objects.filter(student=request.user).count()
+        rollup = StudentAnalytics.objects.filter(student=request.user).first()
         return Response({
-            'forum_replies': forum_count,
-            'assignments_submitted': assignment_count,
-            'quizzes_attempted': quiz_count,
+            'forum_replies': rollup.forum_replies if rollup else 0,
+            'assignments_submitted': rollup.submissions if rollup else 0,
+            'quizzes_attempted': rollup.quiz_attempts if rollup else 0,
         })
 
 class BadgeViewSet(viewsets.ModelViewSet):
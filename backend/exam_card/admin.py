@@ -1,3 +1,27 @@
 from django.contrib import admin
+from django.db import transaction
 
-# Register your models here.
+from .models import ExamCardIssuance
+
+@admin.register(ExamCardIssuance)
+class ExamCardIssuanceAdmin(admin.ModelAdmin):
+	list_display = ("id", "semester", "exam_type", "status", "total", "rendered_count", "failed_count", "created_at", "finished_at")
+	list_filter = ("status", "semester")
+	readonly_fields = ("status", "total", "rendered_count", "failed_count", "error", "created_at", "updated_at", "finished_at")
+	actions = ['resume_issuance']
+
+	def save_model(self, request, obj, form, change):
+		if not change:
+			obj.created_by = request.user
+		super().save_model(request, obj, form, change)
+		if not change:
+			from .tasks import issue_exam_cards_task
+			transaction.on_commit(lambda: issue_exam_cards_task.delay(obj.pk))
+
+	def resume_issuance(self, request, queryset):
+		from .tasks import issue_exam_cards_task
+		runs = list(queryset.exclude(status='completed').values_list('id', flat=True))
+		for run_id in runs:
+			transaction.on_commit(lambda run_id=run_id: issue_exam_cards_task.delay(run_id))
+		self.message_user(request, f"Resuming {len(runs)} issuance runs.")
+	resume_issuance.short_description = 'Resume selected issuance runs'
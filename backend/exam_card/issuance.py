@@ -0,0 +1,326 @@
+"""Batch exam-card issuance.
+
+An ``ExamCardIssuance`` run issues the cards of one semester in stages:
+
+1. ``eligible_students`` finds the cohort in one annotated query over
+   ``StudentProfile``: approved finance and unit registration for the
+   semester, a fee balance (from the ``fees.StudentBalance`` ledger) of at
+   most ``EXAM_CARD_MAX_BALANCE``, and no card of the run's type yet.
+2. ``create_cards`` ``bulk_create``s the cards, with their unit lists,
+   and their ``generated`` events.
+3. The cards still without a PDF are handed to ``render_chunk`` in chunks
+   of ``CHUNK_SIZE``, one Celery task each. A chunk draws the QR code and
+   the PDF of each card; the branding images are decoded once per worker
+   process (``get_assets``) and drawn once per PDF as a reportlab form.
+
+Progress is kept on the run (``total``, ``rendered_count``,
+``failed_count``). Every stage only picks up what is left to do, so
+running an unfinished run again (``run_issuance``, the
+``issue_exam_cards`` command or the admin action) resumes it after a
+worker crash without issuing or rendering a card twice.
+"""
+import io
+import logging
+from decimal import Decimal
+
+import qrcode
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Case, Exists, F, OuterRef, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.text import slugify
+from reportlab.lib.utils import ImageReader
+
+from fees.statements import FONT, FONT_BOLD, MARGIN, PAGE_HEIGHT, PAGE_WIDTH, StatementRenderer
+from finance_registration.models import FinanceRegistration
+from my_profile.models import StudentProfile
+from unit_registration.models import UnitRegistration, UnitRegistrationItem
+from .models import ExamCard, ExamCardEvent, ExamCardIssuance
+
+logger = logging.getLogger(__name__)
+
+# Cards per render task
+CHUNK_SIZE = 50
+BATCH_SIZE = 500
+UNFINISHED = ('queued', 'running', 'failed')
+QR_SALT = 'exam_card.qr'
+QR_SIZE = 90
+LOGO_SIZE = 50
+COLUMNS = [('Unit Code', 110), ('Unit Name', 405)]
+
+
+def current_semester():
+    """``EXAM_CARD_SEMESTER``, else the semester of the latest approved unit registration."""
+    semester = getattr(settings, 'EXAM_CARD_SEMESTER', None)
+    if semester:
+        return semester
+    return (
+        UnitRegistration.objects.filter(status='approved')
+        .order_by('-created_at').values_list('semester', flat=True).first()
+    )
+
+
+def eligible_students(semester, exam_type='ordinary'):
+    """``(profile id, user id)`` of the students who should get a card, in one query."""
+    registered = {'student': OuterRef('pk'), 'semester': semester, 'status': 'approved'}
+    max_balance = Decimal(str(getattr(settings, 'EXAM_CARD_MAX_BALANCE', 0)))
+    return (
+        StudentProfile.objects
+        .annotate(
+            finance_ok=Exists(FinanceRegistration.objects.filter(**registered)),
+            units_ok=Exists(UnitRegistration.objects.filter(**registered)),
+            has_card=Exists(ExamCard.objects.filter(student=OuterRef('user_id'), semester=semester, exam_type=exam_type)),
+            # Students without a ledger row owe nothing
+            fee_balance=Coalesce('user__fee_balance__balance', Value(Decimal('0'))),
+        )
+        .filter(finance_ok=True, units_ok=True, has_card=False, fee_balance__lte=max_balance)
+        .order_by('pk')
+        .values_list('pk', 'user_id')
+    )
+
+
+def unit_lists(semester, profile_ids):
+    """``{profile id: [{'unit_code', 'unit_title'}]}`` from the approved registrations of the semester."""
+    wanted = set(profile_ids)
+    units = {}
+    rows = UnitRegistrationItem.objects.filter(
+        registration__semester=semester, registration__status='approved', selected=True,
+    ).order_by('registration__student_id', 'unit__code').values_list('registration__student_id', 'unit__code', 'unit__name')
+    for profile_id, code, name in rows.iterator(chunk_size=2000):
+        if profile_id in wanted:
+            units.setdefault(profile_id, []).append({'unit_code': code, 'unit_title': name})
+    return units
+
+
+def create_cards(run):
+    """Issue a card to every eligible student without one; returns how many were created."""
+    with transaction.atomic():
+        students = list(eligible_students(run.semester, run.exam_type))
+        units = unit_lists(run.semester, [profile_id for profile_id, _ in students])
+        expiry = timezone.now().date() + timezone.timedelta(days=getattr(settings, 'EXAM_CARD_EXPIRY_DAYS', 30))
+        cards = ExamCard.objects.bulk_create([
+            ExamCard(
+                student_id=user_id, semester=run.semester, exam_type=run.exam_type, expiry_date=expiry,
+                finance_confirmed=True, exam_schedule=units.get(profile_id, []), issuance=run,
+            )
+            for profile_id, user_id in students
+        ], batch_size=BATCH_SIZE)
+        ExamCardEvent.objects.bulk_create([
+            ExamCardEvent(card=card, event_type='generated', user_id=profile_id, details=f'Issued by run {run.pk}.')
+            for card, (profile_id, _) in zip(cards, students)
+        ], batch_size=BATCH_SIZE)
+    return len(cards)
+
+
+class CardAssets:
+    """Branding drawn on every card, loaded once per worker process."""
+
+    PAGE_FORM = 'exam-card-page'
+
+    def __init__(self):
+        self.title = getattr(settings, 'EXAM_CARD_TITLE', 'Uzuri University Examination Card')
+        self.watermark = getattr(settings, 'EXAM_CARD_WATERMARK_TEXT', '')
+        self.footer = getattr(settings, 'EXAM_CARD_PDF_FOOTER', '')
+        self.images = {}
+        for name in ('logo', 'signature', 'stamp'):
+            path = getattr(settings, f'EXAM_CARD_{name.upper()}_PATH', None)
+            try:
+                # ImageReader keeps the decoded pixels, so each PDF only re-embeds them
+                self.images[name] = ImageReader(str(path)) if path else None
+            except OSError:
+                self.images[name] = None
+
+    def define(self, c):
+        """Register the page furniture as a form on canvas ``c``."""
+        c.beginForm(self.PAGE_FORM)
+        if self.images['logo']:
+            c.drawImage(self.images['logo'], MARGIN, PAGE_HEIGHT - MARGIN - LOGO_SIZE + 14, LOGO_SIZE, LOGO_SIZE, mask='auto')
+        c.setFont(FONT_BOLD, 16)
+        c.drawString(MARGIN + LOGO_SIZE + 10, PAGE_HEIGHT - MARGIN, self.title)
+        if self.watermark:
+            c.saveState()
+            c.setFont(FONT_BOLD, 40)
+            c.setFillGray(0.85, 0.5)
+            c.translate(PAGE_WIDTH / 2, PAGE_HEIGHT / 2)
+            c.rotate(45)
+            c.drawCentredString(0, 0, self.watermark)
+            c.restoreState()
+        x = MARGIN
+        for name in ('signature', 'stamp'):
+            if self.images[name]:
+                c.drawImage(self.images[name], x, MARGIN + 14, 80, 40, mask='auto')
+            x += 100
+        c.setFont(FONT, 8)
+        c.drawString(MARGIN, MARGIN, self.footer)
+        c.endForm()
+
+
+_assets = None
+
+
+def get_assets():
+    global _assets
+    if _assets is None:
+        _assets = CardAssets()
+    return _assets
+
+
+def reset_assets():
+    """Drop the process's assets, e.g. after the branding settings change."""
+    global _assets
+    _assets = None
+
+
+class CardRenderer(StatementRenderer):
+    """``StatementRenderer`` whose pages carry the card branding, details and QR code."""
+
+    def __init__(self, fileobj, assets, details, qr):
+        super().__init__(fileobj, assets.title)
+        self.assets = assets
+        self.details = details
+        self.qr = qr
+        self.bottom = MARGIN + 70
+        assets.define(self.canvas)
+
+    def _start_page(self):
+        if self.page:
+            self.canvas.showPage()
+        self.page += 1
+        c = self.canvas
+        c.doForm(self.assets.PAGE_FORM)
+        c.drawImage(self.qr, PAGE_WIDTH - MARGIN - QR_SIZE, PAGE_HEIGHT - MARGIN - QR_SIZE - 20, QR_SIZE, QR_SIZE)
+        c.setFont(FONT, 10)
+        y = PAGE_HEIGHT - MARGIN - 40
+        for line in self.details:
+            c.drawString(MARGIN, y, line)
+            y -= 14
+        c.setFont(FONT, 9)
+        c.drawRightString(PAGE_WIDTH - MARGIN, MARGIN / 2, f'Page {self.page}')
+        self.y = min(y, PAGE_HEIGHT - MARGIN - QR_SIZE - 30) - 10
+
+
+def qr_payload(card):
+    """Signed card reference encoded in the QR code."""
+    key = getattr(settings, 'EXAM_CARD_QR_ENCRYPTION_KEY', None) or None
+    return signing.Signer(key=key, salt=QR_SALT).sign(f'{card.pk}:{card.student_id}:{card.semester}:{card.exam_type}')
+
+
+def card_details(card):
+    student = card.student
+    profile = getattr(student, 'profile', None)
+    return [
+        f"Student: {student.get_full_name()} | Admission No: {student.student_number or '-'}",
+        f"Programme: {getattr(profile, 'program', '') or '-'} | Year: {getattr(profile, 'year_of_study', '') or '-'}",
+        f"Semester: {card.semester} | Type: {card.get_exam_type_display()} | Expires: {card.expiry_date or '-'}",
+    ]
+
+
+def render_card_pdf(card, assets, qr_png, fileobj):
+    renderer = CardRenderer(fileobj, assets, card_details(card), ImageReader(io.BytesIO(qr_png)))
+    renderer.section(
+        'Registered Units', COLUMNS, ([unit.get('unit_code'), unit.get('unit_title')] for unit in card.exam_schedule),
+    )
+    renderer.finish()
+
+
+def _store(name, content):
+    # Fixed names, so a card rendered again after a crash replaces its files
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(content))
+
+
+def render_card(card, assets):
+    """Draw ``card``'s QR code and PDF to media storage and set the fields (not saved)."""
+    buffer = io.BytesIO()
+    qrcode.make(qr_payload(card)).save(buffer, format='PNG')
+    qr_png = buffer.getvalue()
+    pdf = io.BytesIO()
+    render_card_pdf(card, assets, qr_png, pdf)
+    folder = slugify(card.semester) or 'semester'
+    card.qr_code.name = _store(f'exam_cards/qrcodes/{folder}/{card.pk}.png', qr_png)
+    card.pdf.name = _store(f'exam_cards/pdfs/{folder}/{card.pk}.pdf', pdf.getvalue())
+    card.rendered_at = timezone.now()
+
+
+def finish_if_done(run_id):
+    """Close the run once every card is rendered or has failed."""
+    ExamCardIssuance.objects.filter(
+        pk=run_id, status='running', rendered_count__gte=F('total') - F('failed_count'),
+    ).update(
+        status=Case(When(failed_count=0, then=Value('completed')), default=Value('failed')),
+        finished_at=timezone.now(),
+    )
+
+
+def render_chunk(run_id, card_ids):
+    """Render the cards of ``card_ids`` that still lack a PDF; returns ``(rendered, failed)``."""
+    assets = get_assets()
+    rendered = failed = 0
+    with transaction.atomic():
+        # Locked while rendering, so a resumed run's task never draws the same card
+        cards = list(
+            ExamCard.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(id__in=card_ids, rendered_at__isnull=True)
+            .select_related('student', 'student__profile')
+            .order_by('id')
+        )
+        done = []
+        for card in cards:
+            try:
+                render_card(card, assets)
+            except Exception:
+                logger.exception("Rendering exam card %s failed", card.pk)
+                failed += 1
+            else:
+                done.append(card)
+        ExamCard.objects.bulk_update(done, ['qr_code', 'pdf', 'rendered_at'])
+        rendered = len(done)
+        ExamCardIssuance.objects.filter(pk=run_id).update(
+            rendered_count=F('rendered_count') + rendered, failed_count=F('failed_count') + failed,
+        )
+    finish_if_done(run_id)
+    return rendered, failed
+
+
+def start_issuance(semester, exam_type='ordinary', created_by=None):
+    """The semester's unfinished run (to resume) or a new one."""
+    run = ExamCardIssuance.objects.filter(semester=semester, exam_type=exam_type, status__in=UNFINISHED).order_by('-pk').first()
+    return run or ExamCardIssuance.objects.create(semester=semester, exam_type=exam_type, created_by=created_by)
+
+
+def run_issuance(run, chunk_size=CHUNK_SIZE, inline=False):
+    """Create the run's missing cards and render the ones without a PDF.
+
+    Rendering is queued as one task per chunk once the transaction
+    commits; with ``inline`` the chunks are rendered here instead.
+    Returns the run, refreshed.
+    """
+    from .tasks import render_exam_card_chunk_task
+
+    ExamCardIssuance.objects.filter(pk=run.pk).update(status='running', error='', finished_at=None)
+    create_cards(run)
+    cards = ExamCard.objects.filter(issuance=run)
+    pending = list(cards.filter(rendered_at__isnull=True).order_by('id').values_list('id', flat=True))
+    # Counts start again from what is stored; failed cards are retried
+    ExamCardIssuance.objects.filter(pk=run.pk).update(
+        total=cards.count(), rendered_count=cards.filter(rendered_at__isnull=False).count(), failed_count=0,
+    )
+    chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+    if not chunks:
+        finish_if_done(run.pk)
+    for chunk in chunks:
+        if inline:
+            render_chunk(run.pk, chunk)
+        else:
+            transaction.on_commit(lambda chunk=chunk: render_exam_card_chunk_task.delay(run.pk, chunk))
+    run.refresh_from_db()
+    return run
+
+
+def fail_run(run_id, error):
+    ExamCardIssuance.objects.filter(pk=run_id).update(status='failed', error=str(error), finished_at=timezone.now())
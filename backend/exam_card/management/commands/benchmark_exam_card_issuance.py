@@ -0,0 +1,114 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from PIL import Image
+
+from exam_card import issuance
+from exam_card.models import ExamCard
+from finance_registration.models import FinanceRegistration
+from my_profile.models import StudentProfile
+from unit_registration.models import UnitRegistration
+
+SEMESTER = 'bench-2'
+
+
+class _Rollback(Exception):
+    pass
+
+
+def naive_cohort(semester):
+    """The old loop: two ``exists()`` per student, then one more for the card."""
+    eligible = []
+    for profile in StudentProfile.objects.all():
+        finance_ok = FinanceRegistration.objects.filter(student=profile, semester=semester, status='approved').exists()
+        unit_ok = UnitRegistration.objects.filter(student=profile, semester=semester, status='approved').exists()
+        if finance_ok and unit_ok and not ExamCard.objects.filter(student_id=profile.user_id, semester=semester).exists():
+            eligible.append(profile.pk)
+    return eligible
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = 'Compare per-student eligibility checks with the annotated cohort query, and time card rendering.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=5000)
+        parser.add_argument('--render', type=int, default=200, help='Cards rendered in the rendering comparison')
+
+    def _seed(self, count):
+        User = get_user_model()
+        User.objects.bulk_create([User(email=f'card-bench-{i}@example.invalid', password='!') for i in range(count)])
+        users = User.objects.filter(email__startswith='card-bench-').order_by('id').values_list('id', flat=True)
+        profiles = StudentProfile.objects.bulk_create([
+            StudentProfile(user_id=user_id, program='BENCH', year_of_study=1, gender='F', phone='0700', address='A')
+            for user_id in users
+        ])
+        # Nine in ten have both registrations approved
+        approved = [profile for i, profile in enumerate(profiles) if i % 10]
+        FinanceRegistration.objects.bulk_create([FinanceRegistration(student=p, semester=SEMESTER, status='approved') for p in approved])
+        UnitRegistration.objects.bulk_create([UnitRegistration(student=p, semester=SEMESTER, status='approved') for p in approved])
+
+    def _render(self, cards, fresh_assets):
+        started = time.perf_counter()
+        for card in cards:
+            assets = issuance.CardAssets() if fresh_assets else issuance.get_assets()
+            issuance.render_card_pdf(card, assets, self.qr_png, io.BytesIO())
+        return time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        branding = tempfile.mkdtemp()
+        logo = os.path.join(branding, 'logo.png')
+        Image.new('RGB', (600, 600), 'navy').save(logo)
+        buffer = io.BytesIO()
+        Image.new('RGB', (290, 290), 'white').save(buffer, format='PNG')
+        self.qr_png = buffer.getvalue()
+        try:
+            with override_settings(EXAM_CARD_LOGO_PATH=logo, EXAM_CARD_SIGNATURE_PATH=logo, EXAM_CARD_STAMP_PATH=logo), \
+                    transaction.atomic():
+                issuance.reset_assets()
+                self._seed(options['students'])
+                started = time.perf_counter()
+                queries = QueryCounter()
+                with connection.execute_wrapper(queries):
+                    naive = naive_cohort(SEMESTER)
+                naive_s = time.perf_counter() - started
+                self.stdout.write(f'per-student checks: {naive_s:8.3f} s, {queries.count:6d} queries, {len(naive)} eligible')
+                started = time.perf_counter()
+                queries = QueryCounter()
+                with connection.execute_wrapper(queries):
+                    cohort = list(issuance.eligible_students(SEMESTER))
+                cohort_s = time.perf_counter() - started
+                self.stdout.write(f'annotated cohort:   {cohort_s:8.3f} s, {queries.count:6d} queries, {len(cohort)} eligible')
+
+                run = issuance.start_issuance(SEMESTER)
+                started = time.perf_counter()
+                created = issuance.create_cards(run)
+                self.stdout.write(f'bulk_create cards:  {time.perf_counter() - started:8.3f} s for {created} cards')
+
+                cards = list(ExamCard.objects.filter(issuance=run).select_related('student', 'student__profile')[:options['render']])
+                fresh_s = self._render(cards, fresh_assets=True)
+                cached_s = self._render(cards, fresh_assets=False)
+                self.stdout.write(
+                    f'render {len(cards)} PDFs:  {fresh_s:8.3f} s loading branding per card, {cached_s:8.3f} s with cached assets'
+                )
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            issuance.reset_assets()
+            shutil.rmtree(branding, ignore_errors=True)
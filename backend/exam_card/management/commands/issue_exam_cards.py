@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from exam_card import issuance
+from exam_card.models import EXAM_TYPE_CHOICES, ExamCardIssuance
+
+
+class Command(BaseCommand):
+    help = 'Issue the exam cards of a semester, or resume an unfinished issuance run.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--semester', help='Defaults to the current semester')
+        parser.add_argument('--exam-type', choices=[value for value, _ in EXAM_TYPE_CHOICES], default='ordinary')
+        parser.add_argument('--resume', type=int, metavar='RUN_ID', help='Resume this run')
+        parser.add_argument('--chunk-size', type=int, default=issuance.CHUNK_SIZE)
+        parser.add_argument('--queue', action='store_true', help='Render on the Celery workers instead')
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            run = ExamCardIssuance.objects.filter(id=options['resume']).first()
+            if run is None:
+                raise CommandError(f"No issuance run {options['resume']}.")
+        else:
+            semester = options['semester'] or issuance.current_semester()
+            if not semester:
+                raise CommandError('No semester given and none could be determined.')
+            run = issuance.start_issuance(semester, options['exam_type'])
+        started = time.perf_counter()
+        run = issuance.run_issuance(run, chunk_size=options['chunk_size'], inline=not options['queue'])
+        if options['queue']:
+            self.stdout.write(self.style.SUCCESS(f'Run {run.id}: {run.total} cards, rendering queued.'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Run {run.id} {run.status}: {run.rendered_count}/{run.total} cards rendered, '
+            f'{run.failed_count} failed, in {time.perf_counter() - started:.2f}s'
+        ))
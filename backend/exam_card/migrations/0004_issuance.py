@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam_card', '0003_examcard_exam_schedule_examcard_failed_units_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examcard',
+            name='pdf',
+            field=models.FileField(blank=True, null=True, upload_to='exam_cards/pdfs/'),
+        ),
+        migrations.AddField(
+            model_name='examcard',
+            name='rendered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ExamCardIssuance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('semester', models.CharField(max_length=16)),
+                ('exam_type', models.CharField(choices=[('ordinary', 'Ordinary'), ('special', 'Special'), ('supplementary', 'Supplementary'), ('retake', 'Retake')], default='ordinary', max_length=16)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='queued', max_length=16)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('rendered_count', models.PositiveIntegerField(default=0)),
+                ('failed_count', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='exam_card_issuances', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='examcard',
+            name='issuance',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cards', to='exam_card.examcardissuance'),
+        ),
+        migrations.AddIndex(
+            model_name='examcardissuance',
+            index=models.Index(fields=['semester', 'status'], name='exam_card_issuance_sem_idx'),
+        ),
+    ]
@@ -61,6 +61,9 @@ class ExamCard(models.Model):
     failed_units = models.JSONField(default=list, blank=True, help_text="List of failed units for supplementary card")
     exam_schedule = models.JSONField(default=list, blank=True, help_text="Exam schedule for this card")
     history = models.JSONField(default=list, blank=True, help_text="Tracking and history for special exam approvals")
+    issuance = models.ForeignKey('ExamCardIssuance', on_delete=models.SET_NULL, null=True, blank=True, related_name='cards')
+    pdf = models.FileField(upload_to='exam_cards/pdfs/', null=True, blank=True)
+    rendered_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"ExamCard {self.student} {self.semester} {self.exam_type}"
@@ -82,4 +85,30 @@ class ExamCard(models.Model):
     def file(self, value):
         self.supporting_document = value
 
-# Create your models here.
+
+class ExamCardIssuance(models.Model):
+    """One run of the batch issuance pipeline for a semester (see ``exam_card.issuance``)."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    semester = models.CharField(max_length=16)
+    exam_type = models.CharField(max_length=16, choices=EXAM_TYPE_CHOICES, default='ordinary')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='queued')
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='exam_card_issuances')
+    total = models.PositiveIntegerField(default=0)  # Cards issued by this run
+    rendered_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['semester', 'status'], name='exam_card_issuance_sem_idx')]
+
+    def __str__(self):
+        return f"Issuance {self.id} {self.semester} ({self.status}: {self.rendered_count}/{self.total})"
+
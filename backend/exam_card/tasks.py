@@ -1,22 +1,31 @@
 from celery import shared_task
 from django.utils import timezone
-from exam_card.models import ExamCard, ExamCardEvent
-from finance_registration.models import FinanceRegistration
-from unit_registration.models import UnitRegistration
-from my_profile.models import StudentProfile
+from exam_card.models import ExamCard, ExamCardIssuance
+from exam_card import issuance
 
 @shared_task
-def auto_generate_exam_cards():
-    # Automatically generate exam cards for eligible students
-    today = timezone.now().date()
-    for profile in StudentProfile.objects.all():
-        semester = '2025-2'  # Replace with dynamic semester logic
-        finance_ok = FinanceRegistration.objects.filter(student=profile, semester=semester, status='approved').exists()
-        unit_ok = UnitRegistration.objects.filter(student=profile, semester=semester, status='approved').exists()
-        if finance_ok and unit_ok:
-            if not ExamCard.objects.filter(student=profile, semester=semester).exists():
-                card = ExamCard.objects.create(student=profile, semester=semester, exam_type='ordinary', expiry_date=today + timezone.timedelta(days=30))
-                ExamCardEvent.objects.create(card=card, event_type='generated', user=profile, details='Auto-generated exam card.')
+def auto_generate_exam_cards(semester=None, exam_type='ordinary'):
+    """Issue the semester's exam cards (the current one by default), resuming an unfinished run."""
+    semester = semester or issuance.current_semester()
+    if not semester:
+        return None
+    return issue_exam_cards_task(issuance.start_issuance(semester, exam_type).id)
+
+@shared_task
+def issue_exam_cards_task(run_id, chunk_size=issuance.CHUNK_SIZE):
+    """Create a run's cards and queue their rendering; safe to run again to resume."""
+    run = ExamCardIssuance.objects.get(id=run_id)
+    try:
+        issuance.run_issuance(run, chunk_size=chunk_size)
+    except Exception as e:
+        issuance.fail_run(run_id, e)
+        raise
+    return run_id
+
+@shared_task
+def render_exam_card_chunk_task(run_id, card_ids):
+    """Draw the QR codes and PDFs of one chunk of a run's cards."""
+    return issuance.render_chunk(run_id, card_ids)
 
 @shared_task
 def send_exam_card_notifications():
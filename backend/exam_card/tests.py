@@ -1,7 +1,19 @@
+import shutil
+import tempfile
+from io import StringIO
 
-from django.test import TestCase
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
-from .models import ExamCard
+
+from core.models import Course, Program, Unit
+from fees.models import Invoice
+from finance_registration.models import FinanceRegistration
+from my_profile.models import StudentProfile
+from unit_registration.models import UnitRegistration, UnitRegistrationItem
+from .issuance import eligible_students, run_issuance, start_issuance
+from .models import ExamCard, ExamCardEvent, ExamCardIssuance
 
 class ExamCardModuleTests(TestCase):
 	def setUp(self):
@@ -12,3 +24,60 @@ class ExamCardModuleTests(TestCase):
 	def test_exam_card_creation(self):
 		self.assertEqual(self.card.card_type, 'regular')
 		self.assertTrue(self.card.file)
+
+
+class ExamCardIssuanceTests(TestCase):
+	def setUp(self):
+		media_root = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+		media = override_settings(MEDIA_ROOT=media_root)
+		media.enable()
+		self.addCleanup(media.disable)
+		program = Program.objects.create(name='CS', department='Computing')
+		course = Course.objects.create(code='BSC-CS', name='Computer Science', program=program)
+		self.unit = Unit.objects.create(code='CS101', name='Intro', course=course, semester='1', credits=3)
+		User = get_user_model()
+		self.students = {}
+		for name in ('eligible', 'unregistered', 'owing', 'carded'):
+			user = User.objects.create_user(f'{name}@example.com', 'pass')
+			profile = StudentProfile.objects.create(user=user, program='CS', year_of_study=1, gender='F', phone='0700', address='A')
+			FinanceRegistration.objects.create(student=profile, semester='2025-2', status='approved')
+			if name != 'unregistered':
+				registration = UnitRegistration.objects.create(student=profile, semester='2025-2', status='approved')
+				UnitRegistrationItem.objects.create(registration=registration, unit=self.unit)
+			self.students[name] = user
+		Invoice.objects.create(student=self.students['owing'], description='Tuition', amount=500, due_date='2025-10-01')
+		ExamCard.objects.create(student=self.students['carded'], semester='2025-2', exam_type='ordinary')
+
+	def test_cohort_is_one_query(self):
+		with self.assertNumQueries(1):
+			cohort = list(eligible_students('2025-2'))
+		self.assertEqual([user_id for _, user_id in cohort], [self.students['eligible'].id])
+		self.assertEqual(list(eligible_students('2025-1')), [])
+
+	def test_command_issues_and_renders(self):
+		call_command('issue_exam_cards', '--semester', '2025-2', stdout=StringIO())
+		run = ExamCardIssuance.objects.get()
+		self.assertEqual((run.status, run.total, run.rendered_count, run.failed_count), ('completed', 1, 1, 0))
+		card = ExamCard.objects.get(issuance=run)
+		self.assertEqual(card.student, self.students['eligible'])
+		self.assertEqual(card.exam_schedule, [{'unit_code': 'CS101', 'unit_title': 'Intro'}])
+		self.assertTrue(card.rendered_at)
+		with default_storage.open(card.pdf.name, 'rb') as pdf:
+			self.assertEqual(pdf.read(4), b'%PDF')
+		self.assertTrue(default_storage.exists(card.qr_code.name))
+		self.assertEqual(ExamCardEvent.objects.filter(card=card, event_type='generated').count(), 1)
+
+	def test_unfinished_run_resumes(self):
+		run = start_issuance('2025-2')
+		# Issued, but the render tasks never ran (a worker crash)
+		run = run_issuance(run)
+		self.assertEqual((run.status, run.total, run.rendered_count), ('running', 1, 0))
+		self.assertEqual(start_issuance('2025-2'), run)
+		run = run_issuance(run, inline=True)
+		self.assertEqual((run.status, run.total, run.rendered_count), ('completed', 1, 1))
+		self.assertEqual(ExamCard.objects.filter(semester='2025-2').count(), 2)
+		# A finished run is not picked up again; a new one finds nobody left to issue
+		again = run_issuance(start_issuance('2025-2'), inline=True)
+		self.assertNotEqual(again, run)
+		self.assertEqual((again.status, again.total), ('completed', 0))
@@ -1,6 +1,8 @@
 
 from django.contrib import admin
-from .models import Invoice, Transaction, Receipt, FeeStructure
+from django.urls import reverse
+from django.utils.html import format_html
+from .models import Invoice, Transaction, Receipt, FeeStructure, StudentBalance, ReconciliationRun, ReconciliationResult
 
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
@@ -23,3 +25,29 @@ class ReceiptAdmin(admin.ModelAdmin):
 class FeeStructureAdmin(admin.ModelAdmin):
 	list_display = ('id', 'program', 'year', 'semester', 'category', 'base_amount', 'created_at')
 	search_fields = ('program',)
+
+@admin.register(StudentBalance)
+class StudentBalanceAdmin(admin.ModelAdmin):
+	list_display = ('student', 'total_invoiced', 'total_paid', 'total_awarded', 'balance', 'is_cleared', 'updated_at')
+	search_fields = ('student__email',)
+	list_filter = ('is_cleared',)
+	readonly_fields = ('student', 'total_invoiced', 'total_paid', 'total_receipted', 'total_awarded', 'balance', 'is_cleared', 'cleared_at', 'updated_at')
+
+@admin.register(ReconciliationRun)
+class ReconciliationRunAdmin(admin.ModelAdmin):
+	list_display = ('id', 'source', 'statement_file', 'status', 'line_count', 'matched_count', 'flagged_count', 'started_at', 'view_results')
+	list_filter = ('source', 'status')
+	readonly_fields = ('source', 'statement_file', 'status', 'created_by', 'line_count', 'matched_count', 'flagged_count', 'summary', 'error', 'started_at', 'finished_at')
+
+	def view_results(self, obj):
+		url = reverse('admin:fees_reconciliationresult_changelist') + f'?run__id__exact={obj.id}&is_flagged__exact=1'
+		return format_html('<a href="{}">Flagged lines</a>', url)
+	view_results.short_description = 'Results'
+
+@admin.register(ReconciliationResult)
+class ReconciliationResultAdmin(admin.ModelAdmin):
+	list_display = ('run', 'line_number', 'reference', 'receipt', 'amount', 'occurred_at', 'status', 'match_method', 'payment', 'transaction', 'is_flagged')
+	list_filter = ('status', 'match_method', 'is_flagged')
+	search_fields = ('reference', 'receipt', 'phone')
+	raw_id_fields = ('run', 'payment', 'transaction')
+	list_select_related = ('run', 'payment', 'transaction')
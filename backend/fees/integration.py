@@ -8,42 +8,17 @@ from rest_framework.throttling import AnonRateThrottle
 from rest_framework.response import Response
 from .models import Transaction, Invoice
 from .tasks import generate_receipt_pdf_task, send_notification_task
+from payments.daraja import DarajaError, get_daraja_client
 
 # M-Pesa STK Push Initiation (production)
 def initiate_mpesa_stk_push(phone_number, amount, reference):
-    # Use production credentials from settings
-    mpesa_env = getattr(settings, 'MPESA_ENV', 'sandbox')
-    consumer_key = getattr(settings, 'MPESA_CONSUMER_KEY', 'your_key')
-    consumer_secret = getattr(settings, 'MPESA_CONSUMER_SECRET', 'your_secret')
-    shortcode = getattr(settings, 'MPESA_SHORTCODE', '123456')
-    passkey = getattr(settings, 'MPESA_PASSKEY', 'passkey')
-    callback_url = getattr(settings, 'MPESA_CALLBACK_URL', 'https://yourdomain.com/api/fees/mpesa-webhook/')
-    # Token request
-    auth_url = 'https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials' if mpesa_env == 'sandbox' else 'https://api.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials'
-    r = requests.get(auth_url, auth=(consumer_key, consumer_secret))
-    access_token = r.json().get('access_token')
-    # STK push request
-    stk_url = 'https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest' if mpesa_env == 'sandbox' else 'https://api.safaricom.co.ke/mpesa/stkpush/v1/processrequest'
-    from datetime import datetime
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    import base64
-    password = base64.b64encode(f"{shortcode}{passkey}{timestamp}".encode()).decode()
-    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
-    payload = {
-        "BusinessShortCode": shortcode,
-        "Password": password,
-        "Timestamp": timestamp,
-        "TransactionType": "CustomerPayBillOnline",
-        "Amount": int(amount),
-        "PartyA": phone_number,
-        "PartyB": shortcode,
-        "PhoneNumber": phone_number,
-        "CallBackURL": callback_url,
-        "AccountReference": reference,
-        "TransactionDesc": "Fee Payment"
-    }
-    resp = requests.post(stk_url, json=payload, headers=headers)
-    return resp.json()
+    """Send an STK push through the shared Daraja client and return Daraja's response."""
+    client = get_daraja_client()
+    if client is None:
+        raise DarajaError('M-Pesa credentials are not configured.')
+    callback_url = getattr(settings, 'MPESA_CALLBACK_URL', '') or 'https://yourdomain.com/api/fees/mpesa-webhook/'
+    _, response, _ = client.stk_push(phone_number, amount, reference, callback_url, description='Fee Payment')
+    return response
 
 
 # Webhook for M-Pesa payment confirmation
@@ -0,0 +1,150 @@
+"""The ``StudentBalance`` ledger.
+
+One row per student holds the totals the fee statement and clearance
+need: amount invoiced, successful payments, the part of those payments
+that has a receipt, and scholarship awards (fixed amounts plus a
+percentage of the amount invoiced, capped at 100%). ``balance`` is what
+is still owed; it is stored so clearance can run as one set-based
+``UPDATE ... WHERE balance <= 0``.
+
+Saving or deleting an ``Invoice``, ``Transaction``, ``Receipt`` or
+``Scholarship`` calls ``refresh_balances`` for the students involved in
+the same database transaction. The student's ledger row is locked first,
+so concurrent writes for one student are applied one after the other and
+each recomputes from committed rows. Code that bypasses model signals
+(``bulk_create``, ``QuerySet.update``) must call ``refresh_balances``
+itself; ``rebuild_balances`` (the ``rebuild_balances`` command) finds and
+fixes whatever drift is left.
+"""
+from decimal import Decimal
+
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+ZERO = Decimal('0.00')
+CENTS = Decimal('0.01')
+TOTAL_FIELDS = ['total_invoiced', 'total_paid', 'total_receipted', 'total_awarded', 'balance']
+CHUNK_SIZE = 1000
+
+
+def _model(name, registry=global_apps):
+    return registry.get_model('fees', name)
+
+
+def compute_balances(student_ids, registry=global_apps):
+    """``{student id: {field: value}}`` for ``TOTAL_FIELDS``, from the source rows."""
+    totals = {
+        student_id: {'invoiced': ZERO, 'paid': ZERO, 'receipted': ZERO, 'fixed': ZERO, 'percentage': ZERO}
+        for student_id in student_ids
+    }
+    rows = (
+        _model('Invoice', registry).objects.filter(student_id__in=student_ids)
+        .values('student_id').annotate(invoiced=Sum('amount')).order_by()
+    )
+    for row in rows:
+        totals[row['student_id']]['invoiced'] = row['invoiced'] or ZERO
+    rows = (
+        _model('Transaction', registry).objects.filter(student_id__in=student_ids, status='success')
+        .values('student_id')
+        .annotate(paid=Sum('amount'), receipted=Sum('amount', filter=Q(receipt__isnull=False)))
+        .order_by()
+    )
+    for row in rows:
+        totals[row['student_id']].update(paid=row['paid'] or ZERO, receipted=row['receipted'] or ZERO)
+    rows = (
+        _model('Scholarship', registry).objects.filter(student_id__in=student_ids)
+        .values('student_id').annotate(fixed=Sum('amount'), percentage=Sum('percentage')).order_by()
+    )
+    for row in rows:
+        totals[row['student_id']].update(fixed=row['fixed'] or ZERO, percentage=row['percentage'] or ZERO)
+    balances = {}
+    for student_id, t in totals.items():
+        awarded = (t['fixed'] + t['invoiced'] * min(t['percentage'], Decimal(100)) / 100).quantize(CENTS)
+        balances[student_id] = {
+            'total_invoiced': t['invoiced'],
+            'total_paid': t['paid'],
+            'total_receipted': t['receipted'],
+            'total_awarded': awarded,
+            'balance': t['invoiced'] - t['paid'] - awarded,
+        }
+    return balances
+
+
+def refresh_balances(student_ids, registry=global_apps):
+    """Recompute the ledger rows of ``student_ids`` (created if missing); returns them."""
+    StudentBalance = _model('StudentBalance', registry)
+    student_ids = sorted({student_id for student_id in student_ids if student_id is not None})
+    if not student_ids:
+        return []
+    with transaction.atomic():
+        StudentBalance.objects.bulk_create(
+            [StudentBalance(student_id=student_id) for student_id in student_ids], ignore_conflicts=True,
+        )
+        # Lock in a fixed order so two refreshes never wait on each other
+        rows = list(StudentBalance.objects.select_for_update().filter(student_id__in=student_ids).order_by('student_id'))
+        balances = compute_balances(student_ids, registry)
+        now = timezone.now()
+        for row in rows:
+            row.updated_at = now
+            for field, value in balances[row.student_id].items():
+                setattr(row, field, value)
+        StudentBalance.objects.bulk_update(rows, TOTAL_FIELDS + ['updated_at'])
+    return rows
+
+
+def get_balance(student, registry=global_apps):
+    """The student's ledger row, created on first use."""
+    StudentBalance = _model('StudentBalance', registry)
+    row = StudentBalance.objects.filter(student=student).first()
+    return row or refresh_balances([student.pk], registry)[0]
+
+
+def ledger_students(registry=global_apps):
+    """Ids of every student with fee rows or a ledger row, ascending."""
+    ids = set()
+    for name in ('Invoice', 'Transaction', 'Scholarship', 'StudentBalance'):
+        ids.update(_model(name, registry).objects.values_list('student_id', flat=True).distinct().order_by())
+    return sorted(ids)
+
+
+def rebuild_balances(chunk_size=CHUNK_SIZE, dry_run=False, registry=global_apps, stdout=None):
+    """Recompute the whole ledger ``chunk_size`` students at a time.
+
+    Returns ``{'students', 'drifted', 'missing', 'drift'}``: how many rows
+    were checked, how many disagreed with the source rows, how many did
+    not exist, and the summed absolute balance difference. With
+    ``dry_run`` nothing is written.
+    """
+    StudentBalance = _model('StudentBalance', registry)
+    student_ids = ledger_students(registry)
+    report = {'students': len(student_ids), 'drifted': 0, 'missing': 0, 'drift': ZERO}
+    for start in range(0, len(student_ids), chunk_size):
+        chunk = student_ids[start:start + chunk_size]
+        with transaction.atomic():
+            stored = {
+                row.student_id: row
+                for row in StudentBalance.objects.select_for_update().filter(student_id__in=chunk)
+            }
+            expected = compute_balances(chunk, registry)
+            changed, created = [], []
+            for student_id, values in expected.items():
+                row = stored.get(student_id)
+                if row is None:
+                    report['missing'] += 1
+                    created.append(StudentBalance(student_id=student_id, **values))
+                    continue
+                if any(getattr(row, field) != value for field, value in values.items()):
+                    report['drifted'] += 1
+                    report['drift'] += abs(row.balance - values['balance'])
+                    if stdout is not None:
+                        stdout.write(f"student {student_id}: balance {row.balance} -> {values['balance']}")
+                    for field, value in values.items():
+                        setattr(row, field, value)
+                    row.updated_at = timezone.now()
+                    changed.append(row)
+            if not dry_run:
+                StudentBalance.objects.bulk_create(created, batch_size=500)
+                StudentBalance.objects.bulk_update(changed, TOTAL_FIELDS + ['updated_at'], batch_size=500)
+    return report
@@ -0,0 +1,144 @@
+import csv
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from fees.models import ReconciliationResult
+from fees.reconciliation import read_statement, reconcile_statement, time_window
+from payments.models import Payment, PaymentMethod
+
+
+class _Rollback(Exception):
+    pass
+
+
+HEADER = ['Receipt No.', 'Completion Time', 'Initiation Time', 'Details', 'Transaction Status',
+          'Paid In', 'Withdrawn', 'Balance', 'Other Party Info', 'A/C No.']
+
+
+def naive_match(line, window):
+    """What a per-line lookup costs: one query per strategy until one hits."""
+    if line.reference or line.receipt:
+        found = Payment.objects.filter(Q(reference=line.reference) | Q(transaction_id=line.receipt)).first()
+        if found:
+            return found
+    amount = Decimal(line.cents) / 100
+    near = Payment.objects.filter(created_at__range=(line.when - window, line.when + window))
+    if line.phone:
+        found = near.filter(amount=amount, metadata__phone__endswith=line.phone).first()
+        if found:
+            return found
+    return near.filter(amount__range=(amount - 1, amount + 1)).first()
+
+
+class Command(BaseCommand):
+    help = 'Reconcile a synthetic M-Pesa statement against synthetic payments and compare with per-line queries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=200000)
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--naive-sample', type=int, default=2000, help='Lines timed with per-line queries')
+
+    def _seed(self, count, users):
+        rng = random.Random(7)
+        method = PaymentMethod.objects.get_or_create(name='MPESA')[0]
+        start = timezone.now() - timedelta(days=30)
+        user_ids = list(users)
+        payments = []
+        for i in range(count):
+            payments.append(Payment(
+                user_id=rng.choice(user_ids), amount=Decimal(rng.randrange(500, 60000)), method=method,
+                status='successful' if rng.random() < 0.97 else 'pending',
+                reference=f'BENCH{i:07d}', transaction_id=f'R{i:09d}',
+                metadata={'phone': f'2547{rng.randrange(10 ** 8):08d}'},
+                # Spread over the month
+                created_at=start + timedelta(seconds=i * 30 * 86400 // count),
+            ))
+        created_at = Payment._meta.get_field('created_at')
+        created_at.auto_now_add = False
+        try:
+            Payment.objects.bulk_create(payments, batch_size=5000)
+        finally:
+            created_at.auto_now_add = True
+        return list(Payment.objects.filter(reference__startswith='BENCH').order_by('id').values(
+            'reference', 'transaction_id', 'amount', 'created_at', 'metadata',
+        ))
+
+    def _write_statement(self, path, payments):
+        rng = random.Random(11)
+        kinds = {'reference': 0, 'phone': 0, 'fuzzy': 0, 'unknown': 0}
+        with open(path, 'w', newline='') as fileobj:
+            writer = csv.writer(fileobj)
+            writer.writerow(['Account Statement'])
+            writer.writerow(HEADER)
+            for p in payments:
+                roll = rng.random()
+                when = p['created_at'] + timedelta(minutes=rng.randrange(0, 30))
+                amount, phone, ref, receipt = p['amount'], p['metadata']['phone'], p['reference'], p['transaction_id']
+                if roll < 0.80:
+                    kinds['reference'] += 1
+                elif roll < 0.90:
+                    kinds['phone'] += 1
+                    ref = receipt = f'X{rng.randrange(10 ** 9)}'
+                elif roll < 0.95:
+                    kinds['fuzzy'] += 1
+                    ref = receipt = f'X{rng.randrange(10 ** 9)}'
+                    phone, amount = '2547*****123', amount - Decimal('0.50')
+                else:
+                    kinds['unknown'] += 1
+                    ref = receipt = f'X{rng.randrange(10 ** 9)}'
+                    phone, amount, when = '', Decimal(rng.randrange(70000, 90000)), when + timedelta(days=3)
+                writer.writerow([receipt, when.strftime('%d/%m/%Y %H:%M:%S'), '', 'Pay Bill from', 'Completed',
+                                 f'{amount:,.2f}', '', '', f'{phone} - STUDENT', ref])
+        return kinds
+
+    def handle(self, *args, **options):
+        count = options['lines']
+        path = os.path.join(tempfile.mkdtemp(), 'statement.csv')
+        try:
+            # Everything the benchmark writes is rolled back afterwards
+            with transaction.atomic():
+                User = get_user_model()
+                User.objects.bulk_create([User(email=f'recon-bench-{i}@example.invalid', password='!') for i in range(options['users'])])
+                users = User.objects.filter(email__startswith='recon-bench-').values_list('id', flat=True)
+                started = time.perf_counter()
+                payments = self._seed(count, users)
+                kinds = self._write_statement(path, payments)
+                self.stdout.write(f'seeded {count} payments and a {count}-line statement in {time.perf_counter() - started:.1f}s: {kinds}')
+
+                started = time.perf_counter()
+                with open(path, 'rb') as fileobj:
+                    _, lines = read_statement(fileobj, path)
+                    lines = list(lines)
+                parse_s = time.perf_counter() - started
+                self.stdout.write(f'parse only:          {parse_s:8.2f} s')
+
+                started = time.perf_counter()
+                run = reconcile_statement(path)
+                total_s = time.perf_counter() - started
+                self.stdout.write(f'reconcile (end to end, incl. writing {ReconciliationResult.objects.filter(run=run).count()} results): {total_s:8.2f} s')
+                self.stdout.write(f'  {run.summary}')
+
+                sample = random.Random(3).sample(lines, min(options['naive_sample'], len(lines)))
+                window = time_window()
+                started = time.perf_counter()
+                for line in sample:
+                    naive_match(line, window)
+                naive_s = (time.perf_counter() - started) * len(lines) / len(sample)
+                self.stdout.write(f'per-line queries (matching only, extrapolated from {len(sample)} lines): {naive_s:8.2f} s')
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+                os.rmdir(os.path.dirname(path))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from fees.ledger import CHUNK_SIZE, rebuild_balances
+
+
+class Command(BaseCommand):
+    help = 'Recompute the StudentBalance ledger from invoices, transactions, receipts and scholarships, reporting drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Students recomputed per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it')
+        parser.add_argument('--verbose-drift', action='store_true', help='List every drifted student')
+
+    def handle(self, *args, **options):
+        report = rebuild_balances(
+            chunk_size=options['chunk_size'], dry_run=options['dry_run'],
+            stdout=self.stdout if options['verbose_drift'] else None,
+        )
+        summary = (
+            f"Checked {report['students']} students: {report['drifted']} drifted "
+            f"(total balance drift {report['drift']}), {report['missing']} missing."
+        )
+        if options['dry_run']:
+            summary += ' Nothing was written (--dry-run).'
+        style = self.style.WARNING if report['drifted'] or report['missing'] else self.style.SUCCESS
+        self.stdout.write(style(summary))
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fees', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='audittrail',
+            index=models.Index(fields=['timestamp', 'id'], name='fees_audit_ts_id_idx'),
+        ),
+    ]
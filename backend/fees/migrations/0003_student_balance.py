@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_balances(apps, schema_editor):
+    from fees.ledger import rebuild_balances
+    rebuild_balances(registry=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fees', '0002_audittrail_fees_audit_ts_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_invoiced', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_receipted', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_awarded', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('is_cleared', models.BooleanField(default=False)),
+                ('cleared_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='fee_balance', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['balance'], name='fees_balance_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
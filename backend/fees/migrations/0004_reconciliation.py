@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fees', '0003_student_balance'),
+        ('payments', '0006_paymentcallback_queue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconciliationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('mpesa', 'M-Pesa statement'), ('bank', 'Bank statement')], max_length=10)),
+                ('statement_file', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=10)),
+                ('line_count', models.PositiveIntegerField(default=0)),
+                ('matched_count', models.PositiveIntegerField(default=0)),
+                ('flagged_count', models.PositiveIntegerField(default=0)),
+                ('summary', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReconciliationResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('line_number', models.PositiveIntegerField(blank=True, null=True)),
+                ('reference', models.CharField(blank=True, max_length=128)),
+                ('receipt', models.CharField(blank=True, max_length=128)),
+                ('phone', models.CharField(blank=True, max_length=20)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('occurred_at', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('matched', 'Matched'), ('fuzzy', 'Matched on amount and time (review)'), ('amount_mismatch', 'Amount differs'), ('status_mismatch', 'Payment not marked successful'), ('duplicate', 'Payment already matched'), ('unmatched', 'No matching payment'), ('missing', 'Payment missing from statement'), ('invalid', 'Unreadable line')], max_length=16)),
+                ('match_method', models.CharField(blank=True, choices=[('reference', 'Reference'), ('phone_amount', 'Phone and amount'), ('fuzzy', 'Amount and time window')], max_length=16)),
+                ('is_flagged', models.BooleanField(default=False)),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reconciliation_results', to='payments.payment')),
+                ('transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reconciliation_results', to='fees.transaction')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='fees.reconciliationrun')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['run', 'status'], name='fees_recon_run_status_idx'), models.Index(fields=['run', 'is_flagged'], name='fees_recon_run_flagged_idx')],
+            },
+        ),
+    ]
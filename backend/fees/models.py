@@ -135,5 +135,122 @@ class AuditTrail(models.Model):
 	changes = models.TextField()
 	timestamp = models.DateTimeField(auto_now_add=True)
 
+	class Meta:
+		indexes = [models.Index(fields=['timestamp', 'id'], name='fees_audit_ts_id_idx')]
+
 	def __str__(self):
 		return f"{self.timestamp} - {self.user} - {self.action} {self.model} {self.object_id}"
+
+
+class StudentBalance(models.Model):
+	"""Running fee totals of one student, maintained by ``fees.ledger``."""
+	student = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='fee_balance')
+	total_invoiced = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+	total_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+	total_receipted = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+	total_awarded = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+	balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+	is_cleared = models.BooleanField(default=False)
+	cleared_at = models.DateTimeField(null=True, blank=True)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		indexes = [models.Index(fields=['balance'], name='fees_balance_idx')]
+
+	def __str__(self):
+		return f"{self.student} - balance {self.balance}"
+
+
+def _remember_student(sender, instance, **kwargs):
+	# The student (or transaction) the row was loaded with, so a move refreshes both sides
+	instance._ledger_owner = instance.transaction_id if sender is Receipt else instance.student_id
+
+
+def _ledger_students(sender, instance):
+	if sender is Receipt:
+		transaction_ids = {instance.transaction_id, getattr(instance, '_ledger_owner', None)} - {None}
+		return list(Transaction.objects.filter(id__in=transaction_ids).values_list('student_id', flat=True))
+	return [instance.student_id, getattr(instance, '_ledger_owner', None)]
+
+
+def _refresh_ledger(sender, instance, origin=None, **kwargs):
+	from .ledger import refresh_balances
+	# Deleting a user takes its fee rows and ledger row with it
+	if isinstance(origin, get_user_model()):
+		return
+	refresh_balances(_ledger_students(sender, instance))
+	instance._ledger_owner = instance.transaction_id if sender is Receipt else instance.student_id
+
+
+for _sender in (Invoice, Transaction, Receipt, Scholarship):
+	models.signals.post_init.connect(_remember_student, sender=_sender, dispatch_uid=f'fees_ledger_init_{_sender.__name__}')
+	models.signals.post_save.connect(_refresh_ledger, sender=_sender, dispatch_uid=f'fees_ledger_save_{_sender.__name__}')
+	models.signals.post_delete.connect(_refresh_ledger, sender=_sender, dispatch_uid=f'fees_ledger_delete_{_sender.__name__}')
+
+
+class ReconciliationRun(models.Model):
+	"""One bank or M-Pesa statement matched against payments by ``fees.reconciliation``."""
+	SOURCE_CHOICES = [
+		('mpesa', 'M-Pesa statement'),
+		('bank', 'Bank statement'),
+	]
+	STATUS_CHOICES = [
+		('running', 'Running'),
+		('completed', 'Completed'),
+		('failed', 'Failed'),
+	]
+	source = models.CharField(max_length=10, choices=SOURCE_CHOICES)
+	statement_file = models.CharField(max_length=255)
+	status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='running')
+	created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+	line_count = models.PositiveIntegerField(default=0)
+	matched_count = models.PositiveIntegerField(default=0)
+	flagged_count = models.PositiveIntegerField(default=0)
+	summary = models.JSONField(default=dict, blank=True)
+	error = models.TextField(blank=True)
+	started_at = models.DateTimeField(auto_now_add=True)
+	finished_at = models.DateTimeField(null=True, blank=True)
+
+	def __str__(self):
+		return f"Reconciliation {self.id} ({self.source}) - {self.status}"
+
+
+class ReconciliationResult(models.Model):
+	"""How one statement line matched, or a payment the statement is missing (``line_number`` empty)."""
+	STATUS_CHOICES = [
+		('matched', 'Matched'),
+		('fuzzy', 'Matched on amount and time (review)'),
+		('amount_mismatch', 'Amount differs'),
+		('status_mismatch', 'Payment not marked successful'),
+		('duplicate', 'Payment already matched'),
+		('unmatched', 'No matching payment'),
+		('missing', 'Payment missing from statement'),
+		('invalid', 'Unreadable line'),
+	]
+	METHOD_CHOICES = [
+		('reference', 'Reference'),
+		('phone_amount', 'Phone and amount'),
+		('fuzzy', 'Amount and time window'),
+	]
+	run = models.ForeignKey(ReconciliationRun, on_delete=models.CASCADE, related_name='results')
+	line_number = models.PositiveIntegerField(null=True, blank=True)
+	reference = models.CharField(max_length=128, blank=True)
+	receipt = models.CharField(max_length=128, blank=True)
+	phone = models.CharField(max_length=20, blank=True)
+	amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+	occurred_at = models.DateTimeField(null=True, blank=True)
+	payment = models.ForeignKey('payments.Payment', on_delete=models.SET_NULL, null=True, blank=True, related_name='reconciliation_results')
+	transaction = models.ForeignKey(Transaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='reconciliation_results')
+	status = models.CharField(max_length=16, choices=STATUS_CHOICES)
+	match_method = models.CharField(max_length=16, choices=METHOD_CHOICES, blank=True)
+	is_flagged = models.BooleanField(default=False)
+	note = models.CharField(max_length=255, blank=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['run', 'status'], name='fees_recon_run_status_idx'),
+			models.Index(fields=['run', 'is_flagged'], name='fees_recon_run_flagged_idx'),
+		]
+
+	def __str__(self):
+		return f"Line {self.line_number} of run {self.run_id}: {self.status}"
@@ -0,0 +1,558 @@
+"""Reconciliation of bank and M-Pesa statement exports.
+
+``reconcile_statement`` reads a CSV (or Excel) export row by row into
+compact ``Line`` objects, loads the payments the statement could refer to
+in a few bulk queries, and matches every line in memory:
+
+1. **Reference**: the line's account reference or receipt number (and,
+   for bank lines without a reference column, each word of the
+   narration) is looked up in a hash index over ``Payment.reference``,
+   ``Payment.transaction_id`` and ``Transaction.reference``.
+2. **Phone and amount**: a hash index on (phone, amount in cents), the
+   nearest unmatched payment within the time window.
+3. **Fuzzy**: payments bucketed by amount and sorted by time; the
+   buckets next to the line's amount are binary-searched for the time
+   window and the closest payment within the amount tolerance wins.
+   These matches are flagged for review.
+
+Reference matches are made for the whole statement before the looser
+ones, and a payment matches at most one line. Matches on a payment that is not
+marked successful, or whose amount differs, are flagged, as are lines
+nothing matched and successful payments of the statement's channel and
+period that no line matched (``missing``). Results are written to
+``ReconciliationResult`` in batched multi-row inserts; nothing about the
+payments themselves is changed.
+"""
+import csv
+import io
+import logging
+import os
+import re
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import CharField, Value
+from django.db.models.fields.json import KT
+from django.db.models.functions import Coalesce, NullIf
+from django.utils import timezone
+
+from payments.models import Payment
+from .models import ReconciliationResult, ReconciliationRun, Transaction
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 2000
+LOOKUP_CHUNK = 2000  # keeps IN (...) lists under SQLite's parameter limit
+SUCCESS_STATUSES = {'successful', 'success'}
+# Normalised header -> field, for the M-Pesa C2B statement and the common bank exports
+HEADERS = {
+    'receipt_no': 'receipt', 'receipt': 'receipt', 'transaction_id': 'receipt', 'trans_id': 'receipt',
+    'mpesa_receipt': 'receipt', 'bank_reference': 'receipt', 'transaction_reference': 'receipt',
+    'a/c_no': 'reference', 'account_no': 'reference', 'account_reference': 'reference',
+    'bill_reference': 'reference', 'billrefnumber': 'reference', 'reference': 'reference', 'ref': 'reference',
+    'customer_reference': 'reference',
+    'paid_in': 'amount', 'credit': 'amount', 'credit_amount': 'amount', 'amount': 'amount', 'trans_amount': 'amount',
+    'withdrawn': 'debit', 'debit': 'debit', 'debit_amount': 'debit',
+    'completion_time': 'time', 'transaction_date': 'time', 'trans_time': 'time', 'date': 'time',
+    'value_date': 'time', 'posting_date': 'time', 'initiation_time': 'initiated',
+    'other_party_info': 'phone', 'opposite_party': 'phone', 'msisdn': 'phone', 'phone': 'phone', 'phone_number': 'phone',
+    'transaction_status': 'status', 'details': 'details', 'description': 'details', 'narration': 'details',
+}
+MPESA_HEADERS = {'paid_in', 'other_party_info', 'receipt_no', 'completion_time'}
+TIME_FORMATS = (
+    '%Y%m%d%H%M%S', '%d-%b-%Y', '%d %b %Y', '%d-%b-%Y %H:%M:%S', '%Y/%m/%d %H:%M:%S', '%Y/%m/%d',
+)
+# Day-first dates (31/01/2025 14:05:09, 31-01-2025, 31.01.2025 14:05), the common export format
+DAY_FIRST = re.compile(r'(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})(?:[ T](\d{1,2}):(\d{2})(?::(\d{2}))?)?$')
+PHONE = re.compile(r'\+?\d[\d ]{8,14}')
+TOKEN = re.compile(r'[A-Za-z0-9-]{6,}')
+
+
+class StatementError(ValueError):
+    pass
+
+
+def _normalize_header(name):
+    return str(name or '').strip().lower().replace(' ', '_').replace('.', '')
+
+
+def time_window():
+    return timedelta(hours=getattr(settings, 'RECONCILIATION_TIME_WINDOW_HOURS', 72))
+
+
+def amount_tolerance():
+    """Largest amount difference (in cents) a fuzzy match accepts."""
+    return int(Decimal(str(getattr(settings, 'RECONCILIATION_AMOUNT_TOLERANCE', '1.00'))) * 100)
+
+
+def _ref(value):
+    return str(value or '').strip().upper()
+
+
+def to_cents(value):
+    if value in (None, ''):
+        return None
+    if isinstance(value, Decimal):
+        return int((value * 100).to_integral_value())
+    if isinstance(value, int):
+        return value * 100
+    if isinstance(value, float):
+        return int((Decimal(str(value)) * 100).to_integral_value())
+    text = str(value).replace(',', '').replace('KES', '').replace('KSh', '').strip()
+    if not text:
+        return None
+    try:
+        return int((Decimal(text) * 100).to_integral_value())
+    except InvalidOperation:
+        raise StatementError(f'Bad amount {value!r}')
+
+
+def normalize_phone(value):
+    """The last nine digits of a phone number (07.., 2547.., +254 7..), or '' if masked or absent."""
+    if not value or '*' in str(value):
+        return ''
+    if isinstance(value, str) and value.isdigit():
+        return value[-9:] if len(value) >= 9 else ''
+    match = PHONE.search(str(value))
+    if not match:
+        return ''
+    digits = re.sub(r'\D', '', match.group())
+    return digits[-9:] if len(digits) >= 9 else ''
+
+
+class TimeParser:
+    """Parses statement timestamps, trying the format that worked last time first."""
+
+    def __init__(self):
+        self.format = None
+        self.tz = timezone.get_current_timezone()
+
+    def _aware(self, value):
+        return timezone.make_aware(value, self.tz) if timezone.is_naive(value) else value
+
+    def __call__(self, value):
+        if isinstance(value, datetime):
+            return self._aware(value)
+        text = str(value or '').strip()
+        if not text:
+            raise StatementError('Missing date')
+        # A regex beats strptime by several times, which matters at 200k lines
+        match = DAY_FIRST.match(text)
+        if match:
+            day, month, year, hour, minute, second = match.groups()
+            try:
+                return datetime(
+                    int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0), tzinfo=self.tz,
+                )
+            except ValueError:
+                raise StatementError(f'Bad date {value!r}')
+        if self.format:
+            try:
+                return self._aware(datetime.strptime(text, self.format))
+            except ValueError:
+                pass
+        try:
+            return self._aware(datetime.fromisoformat(text))
+        except ValueError:
+            pass
+        for fmt in TIME_FORMATS:
+            try:
+                parsed = datetime.strptime(text, fmt)
+            except ValueError:
+                continue
+            self.format = fmt
+            return self._aware(parsed)
+        raise StatementError(f'Bad date {value!r}')
+
+
+class Line:
+    __slots__ = ('number', 'reference', 'receipt', 'phone', 'cents', 'when', 'ts', 'tokens', 'error')
+
+    def __init__(self, number):
+        self.number = number
+        self.reference = self.receipt = self.phone = ''
+        self.cents = self.when = self.ts = None
+        self.tokens = ()
+        self.error = ''
+
+    def refs(self):
+        return [ref for ref in (self.reference, self.receipt) if ref] + list(self.tokens)
+
+
+class Record:
+    """A payment or fee transaction as the matcher sees it."""
+    __slots__ = ('kind', 'id', 'refs', 'cents', 'ts', 'status', 'phone', 'channel', 'claimed')
+
+    def __init__(self, kind, id, refs, amount, created_at, status, phone, channel):
+        self.kind = kind
+        self.id = id
+        self.refs = [ref for ref in map(_ref, refs) if ref]
+        self.cents = to_cents(amount)
+        self.ts = created_at.timestamp()
+        self.status = status
+        self.phone = normalize_phone(phone)
+        self.channel = channel
+        self.claimed = False
+
+
+def _rows_csv(fileobj):
+    reader = csv.reader(io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''))
+    for row in reader:
+        yield row
+
+
+def _rows_excel(fileobj):
+    if openpyxl is not None:
+        workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+        try:
+            yield from workbook.active.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+        return
+    # Without openpyxl's streaming reader, fall back to loading the sheet with pandas
+    import pandas as pd
+    frame = pd.read_excel(fileobj, header=None, dtype=object)
+    for row in frame.itertuples(index=False):
+        yield [None if pd.isna(value) else value for value in row]
+
+
+def read_statement(fileobj, name):
+    """``(source, lines)``: the statement's kind and a generator of parsed ``Line`` objects.
+
+    Rows before the header (M-Pesa exports start with a summary block)
+    are skipped; the header is the first row with an amount column and a
+    date column.
+    """
+    rows = _rows_excel(fileobj) if name.lower().endswith(('.xlsx', '.xlsm')) else _rows_csv(fileobj)
+    columns = None
+    header_row = 0
+    for row in rows:
+        header_row += 1
+        headers = [_normalize_header(cell) for cell in row]
+        fields = {HEADERS.get(header) for header in headers}
+        if 'amount' in fields and 'time' in fields:
+            columns = headers
+            break
+    if columns is None:
+        raise StatementError('No header row with an amount and a date column was found.')
+    source = 'mpesa' if MPESA_HEADERS & set(columns) else 'bank'
+    return source, _parse_lines(rows, columns, header_row)
+
+
+def _parse_lines(rows, columns, header_row):
+    width = len(columns)
+    index = {}
+    for position, header in enumerate(columns):
+        field = HEADERS.get(header)
+        if field and field not in index:
+            index[field] = position
+    # Absent columns read the padding cell past the end of every row
+    status_at, amount_at, time_at, initiated_at, reference_at, receipt_at, phone_at, details_at = (
+        index.get(field, width)
+        for field in ('status', 'amount', 'time', 'initiated', 'reference', 'receipt', 'phone', 'details')
+    )
+    parse_time = TimeParser()
+    number = header_row
+    for row in rows:
+        number += 1
+        cells = list(row[:width])
+        cells.extend([None] * (width + 1 - len(cells)))
+        if cells[amount_at] in (None, ''):
+            # Blank rows, withdrawals and trailing summary rows carry no amount paid in
+            continue
+        status = str(cells[status_at] or '').strip().lower()
+        if status and status != 'completed':
+            continue
+        line = Line(number)
+        try:
+            line.cents = to_cents(cells[amount_at])
+            if not line.cents or line.cents < 0:
+                # Withdrawals and charges are not payments to the university
+                continue
+            line.when = parse_time(cells[time_at] or cells[initiated_at])
+            line.ts = line.when.timestamp()
+        except StatementError as exc:
+            line.error = str(exc)
+        line.reference = _ref(cells[reference_at])[:128]
+        line.receipt = _ref(cells[receipt_at])[:128]
+        line.phone = normalize_phone(cells[phone_at])
+        if not line.reference and cells[details_at]:
+            line.tokens = tuple(_ref(token) for token in TOKEN.findall(str(cells[details_at])))
+        yield line
+
+
+class Matcher:
+    """Hash and interval indexes over the payments a statement could refer to."""
+
+    def __init__(self, window, tolerance):
+        self.window = window.total_seconds()
+        self.tolerance = max(tolerance, 1)
+        self.records = []
+        self.by_ref = defaultdict(list)
+        self.by_phone = defaultdict(list)
+        self.buckets = defaultdict(list)
+        self._bucket_times = {}
+
+    def add(self, records):
+        for record in records:
+            if record.cents is None:
+                continue
+            self.records.append(record)
+            for ref in record.refs:
+                self.by_ref[ref].append(record)
+            if record.phone:
+                self.by_phone[(record.phone, record.cents)].append(record)
+            self.buckets[record.cents // self.tolerance].append(record)
+        self._bucket_times.clear()
+
+    def _times(self, bucket):
+        times = self._bucket_times.get(bucket)
+        if times is None:
+            records = self.buckets.get(bucket, [])
+            records.sort(key=lambda r: r.ts)
+            times = self._bucket_times[bucket] = [r.ts for r in records]
+        return times
+
+    def _nearest(self, candidates, line):
+        best, best_key = None, None
+        for record in candidates:
+            gap = abs(record.ts - line.ts)
+            if record.claimed or gap > self.window:
+                continue
+            key = (abs(record.cents - line.cents), gap)
+            if best_key is None or key < best_key:
+                best, best_key = record, key
+        return best
+
+    def match_reference(self, line):
+        """``(record, duplicate)`` by reference; record is None if no reference is known."""
+        claimed = None
+        for ref in line.refs():
+            candidates = self.by_ref.get(ref)
+            if not candidates:
+                continue
+            for record in candidates:
+                if not record.claimed:
+                    return record, False
+            claimed = candidates[0]
+        return claimed, claimed is not None
+
+    def match_loose(self, line):
+        """``(record, method)`` by phone and amount, else by amount and time; record may be None."""
+        if line.phone:
+            record = self._nearest(self.by_phone.get((line.phone, line.cents), ()), line)
+            if record is not None:
+                return record, 'phone_amount'
+        bucket = line.cents // self.tolerance
+        candidates = []
+        for b in (bucket - 1, bucket, bucket + 1):
+            times = self._times(b)
+            if not times:
+                continue
+            records = self.buckets[b]
+            lo = bisect_left(times, line.ts - self.window)
+            hi = bisect_right(times, line.ts + self.window)
+            candidates.extend(r for r in records[lo:hi] if abs(r.cents - line.cents) <= self.tolerance)
+        record = self._nearest(candidates, line)
+        return record, 'fuzzy' if record is not None else ''
+
+
+def _payment_records(queryset):
+    # The phone is read out of the metadata in SQL, so no row's JSON is decoded here
+    rows = queryset.annotate(
+        payer_phone=Coalesce(
+            NullIf(KT('metadata__phone'), Value('')), NullIf(KT('metadata__phone_number'), Value('')), 'user__profile__phone',
+            output_field=CharField(),
+        ),
+    ).values_list('id', 'reference', 'transaction_id', 'amount', 'created_at', 'status', 'payer_phone', 'method__name')
+    for pk, reference, receipt, amount, created_at, status, phone, method in rows.iterator(chunk_size=LOOKUP_CHUNK):
+        channel = 'mpesa' if (method or '').upper() == 'MPESA' else (method or '').lower()
+        yield Record('payment', pk, (reference, receipt), amount, created_at, status, phone, channel)
+
+
+def _transaction_records(queryset):
+    rows = queryset.values_list('id', 'reference', 'amount', 'created_at', 'status', 'student__profile__phone', 'method')
+    for pk, reference, amount, created_at, status, phone, method in rows.iterator(chunk_size=LOOKUP_CHUNK):
+        yield Record('transaction', pk, (reference,), amount, created_at, status, phone, method)
+
+
+def load_records(matcher, start, end, refs=()):
+    """Index the payments created in ``[start, end]``, plus any others carrying one of ``refs``."""
+    matcher.add(_payment_records(Payment.objects.filter(created_at__range=(start, end))))
+    matcher.add(_transaction_records(Transaction.objects.filter(created_at__range=(start, end))))
+    missing = sorted({ref for ref in refs if ref not in matcher.by_ref})
+    for start_at in range(0, len(missing), LOOKUP_CHUNK):
+        chunk = missing[start_at:start_at + LOOKUP_CHUNK]
+        outside = Payment.objects.exclude(created_at__range=(start, end))
+        matcher.add(_payment_records(outside.filter(reference__in=chunk)))
+        matcher.add(_payment_records(outside.filter(transaction_id__in=chunk)))
+        matcher.add(_transaction_records(
+            Transaction.objects.exclude(created_at__range=(start, end)).filter(reference__in=chunk),
+        ))
+
+
+COLUMNS = (
+    'run', 'line_number', 'reference', 'receipt', 'phone', 'amount', 'occurred_at',
+    'payment', 'transaction', 'status', 'match_method', 'is_flagged', 'note',
+)
+
+
+def _result(ops, run, line, record, status, method='', note=''):
+    """One ``ReconciliationResult`` row as a tuple in ``COLUMNS`` order, adapted by ``ops`` for the database."""
+    amount = when = None
+    if line is not None:
+        if line.cents is not None:
+            amount = ops.adapt_decimalfield_value(Decimal(line.cents) / 100, 12, 2)
+        if line.when is not None:
+            when = ops.adapt_datetimefield_value(line.when)
+    return (
+        run.pk,
+        line.number if line else None,
+        line.reference if line else '',
+        line.receipt if line else '',
+        line.phone if line else '',
+        amount,
+        when,
+        record.id if record and record.kind == 'payment' else None,
+        record.id if record and record.kind == 'transaction' else None,
+        status,
+        method,
+        status != 'matched',
+        note[:255],
+    )
+
+
+def _insert_results(rows):
+    # Plain executemany: for a 200k-line statement, building and preparing model
+    # instances for bulk_create costs several times the matching itself.
+    meta = ReconciliationResult._meta
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(meta.get_field(name).column) for name in COLUMNS)
+    sql = (
+        f'INSERT INTO {quote(meta.db_table)} ({columns}) '
+        f"VALUES ({', '.join(['%s'] * len(COLUMNS))})"
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def _classify(line, record, method, duplicate):
+    """``(status, note)`` for a line's match; status is None for a clean match."""
+    if record is None:
+        return 'unmatched', 'No payment with this reference, phone or amount near this time.'
+    label = record.kind.capitalize()
+    if duplicate:
+        return 'duplicate', f'{label} {record.id} is already matched to another line.'
+    if record.status not in SUCCESS_STATUSES:
+        return 'status_mismatch', f'{label} is {record.status}.'
+    if method == 'fuzzy':
+        return 'fuzzy', f'{label} amount is {Decimal(record.cents) / 100}.'
+    if record.cents != line.cents:
+        return 'amount_mismatch', f'{label} amount is {Decimal(record.cents) / 100}.'
+    return None, ''
+
+
+def reconcile_lines(run, lines, batch_size=BATCH_SIZE):
+    """Match parsed ``lines`` for ``run`` and store the results; returns the status counts."""
+    window, tolerance = time_window(), amount_tolerance()
+    lines = list(lines)
+    counts = Counter()
+    times = [line.when for line in lines if line.when is not None]
+    matcher = Matcher(window, tolerance)
+    if times:
+        load_records(matcher, min(times) - window, max(times) + window, [ref for line in lines for ref in (line.reference, line.receipt) if ref])
+    # References first, so a fuzzy match never takes a payment another line names outright
+    outcomes = [None] * len(lines)
+    for i, line in enumerate(lines):
+        if not line.error:
+            record, duplicate = matcher.match_reference(line)
+            if record is not None:
+                outcomes[i] = (record, 'reference', duplicate)
+                record.claimed = True
+    for i, line in enumerate(lines):
+        if not line.error and outcomes[i] is None:
+            record, method = matcher.match_loose(line)
+            outcomes[i] = (record, method, False)
+            if record is not None:
+                record.claimed = True
+    pending = []
+    ops = connection.ops
+
+    def flush():
+        if pending:
+            _insert_results(pending)
+        pending.clear()
+
+    for line, outcome in zip(lines, outcomes):
+        if line.error:
+            status, record, method, note = 'invalid', None, '', line.error
+        else:
+            record, method, duplicate = outcome
+            status, note = _classify(line, record, method, duplicate)
+            status = status or 'matched'
+        counts[status] += 1
+        pending.append(_result(ops, run, line, record, status, method, note))
+        if len(pending) >= batch_size:
+            flush()
+    if times:
+        # Successful payments of this channel and period that no line accounts for
+        start, end = min(times).timestamp(), max(times).timestamp()
+        for record in matcher.records:
+            if (not record.claimed and record.channel == run.source and start <= record.ts <= end
+                    and record.status in SUCCESS_STATUSES):
+                counts['missing'] += 1
+                pending.append(_result(ops, run, None, record, 'missing', note='Not on the statement.'))
+                if len(pending) >= batch_size:
+                    flush()
+    flush()
+    return counts
+
+
+def _open(path):
+    # Absolute paths are local exports; anything else is a name in media storage
+    if os.path.isabs(path):
+        return open(path, 'rb')
+    return default_storage.open(path, 'rb')
+
+
+def reconcile_statement(path, source=None, user=None, run=None):
+    """Reconcile the statement at ``path`` (media storage or local); returns the ``ReconciliationRun``."""
+    run = run or ReconciliationRun.objects.create(source=source or 'bank', statement_file=str(path)[:255], created_by=user)
+    try:
+        with _open(path) as fileobj:
+            detected, lines = read_statement(fileobj, str(path))
+            run.source = source or detected
+            # A run that fails part-way leaves no partial results behind
+            with transaction.atomic():
+                counts = reconcile_lines(run, lines)
+    except (StatementError, OSError) as exc:
+        logger.warning("Reconciliation run %s failed", run.pk, exc_info=True)
+        run.status = 'failed'
+        run.error = str(exc)
+    except Exception as exc:
+        # Undecodable files, database errors, bugs: never leave the run 'running'
+        logger.exception("Reconciliation run %s failed", run.pk)
+        run.status = 'failed'
+        run.error = f'{type(exc).__name__}: {exc}'
+        run.finished_at = timezone.now()
+        run.save()
+        raise
+    else:
+        run.status = 'completed'
+        run.summary = dict(counts)
+        run.line_count = sum(count for status, count in counts.items() if status != 'missing')
+        run.matched_count = counts['matched']
+        run.flagged_count = sum(counts.values()) - counts['matched']
+    run.finished_at = timezone.now()
+    run.save()
+    return run
@@ -0,0 +1,169 @@
+"""Paginated statement PDFs.
+
+``StatementRenderer`` lays rows out over as many A4 pages as needed,
+repeating the column header on every page, and takes rows from any
+iterable so callers can feed it ``.iterator()`` / ``values_list`` streams
+instead of loading a whole history into memory.
+
+``get_or_render`` keeps rendered statements on the default (media) storage
+under a name derived from the data they were rendered from, so an
+unchanged account is served from storage instead of being re-rendered.
+"""
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+MARGIN = 40
+ROW_HEIGHT = 14
+FONT = 'Helvetica'
+FONT_BOLD = 'Helvetica-Bold'
+FONT_SIZE = 9
+# Spool renders in memory up to this size, then to a temporary file
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+def _fit(text, width, font=FONT, size=FONT_SIZE):
+    """Clip ``text`` so it fits in ``width`` points."""
+    text = '' if text is None else str(text)
+    if stringWidth(text, font, size) <= width:
+        return text
+    while text and stringWidth(text + '...', font, size) > width:
+        text = text[:-1]
+    return text + '...'
+
+
+class StatementRenderer:
+    """Writes a multi-page statement PDF to ``fileobj``.
+
+    ``columns`` passed to ``section`` are ``(label, width)`` pairs; widths
+    are in points and should add up to at most the usable page width.
+    """
+
+    def __init__(self, fileobj, title, subtitle=''):
+        self.canvas = canvas.Canvas(fileobj, pagesize=A4, pageCompression=1)
+        self.title = title
+        self.subtitle = subtitle
+        self.page = 0
+        self.y = None
+        # Lowest y a row may be drawn at; subclasses reserve footer space here
+        self.bottom = MARGIN
+        self._columns = None
+        self._heading = None
+
+    def _start_page(self):
+        if self.page:
+            self.canvas.showPage()
+        self.page += 1
+        c = self.canvas
+        c.setFont(FONT_BOLD, 14)
+        c.drawString(MARGIN, PAGE_HEIGHT - MARGIN, self.title)
+        c.setFont(FONT, FONT_SIZE)
+        if self.subtitle:
+            c.drawString(MARGIN, PAGE_HEIGHT - MARGIN - 16, self.subtitle)
+        c.drawRightString(PAGE_WIDTH - MARGIN, MARGIN / 2, f'Page {self.page}')
+        self.y = PAGE_HEIGHT - MARGIN - 40
+
+    def _ensure_space(self, rows=1):
+        if self.y is None or self.y - rows * ROW_HEIGHT < self.bottom:
+            self._start_page()
+            if self._columns:
+                self._draw_heading(f'{self._heading} (continued)')
+                self._draw_columns()
+
+    def _draw_heading(self, text):
+        self.canvas.setFont(FONT_BOLD, 11)
+        self.canvas.drawString(MARGIN, self.y, text)
+        self.y -= ROW_HEIGHT + 2
+
+    def _draw_columns(self):
+        self._draw_cells([label for label, _ in self._columns], FONT_BOLD)
+        self.canvas.line(MARGIN, self.y + ROW_HEIGHT - 3, PAGE_WIDTH - MARGIN, self.y + ROW_HEIGHT - 3)
+
+    def _draw_cells(self, values, font=FONT):
+        self.canvas.setFont(font, FONT_SIZE)
+        x = MARGIN
+        for value, (_, width) in zip(values, self._columns):
+            self.canvas.drawString(x, self.y, _fit(value, width - 4, font))
+            x += width
+        self.y -= ROW_HEIGHT
+
+    def section(self, heading, columns, rows):
+        """Draw a table; returns the number of rows written."""
+        self._heading, self._columns = heading, None
+        self._ensure_space(3)
+        self._columns = columns
+        self._draw_heading(heading)
+        self._draw_columns()
+        count = 0
+        for row in rows:
+            self._ensure_space()
+            self._draw_cells(row)
+            count += 1
+        if not count:
+            self._draw_cells(['No records.'])
+        self._columns = None
+        self.y -= ROW_HEIGHT / 2
+        return count
+
+    def lines(self, lines, bold=False):
+        for line in lines:
+            self._ensure_space()
+            self.canvas.setFont(FONT_BOLD if bold else FONT, FONT_SIZE + 1)
+            self.canvas.drawString(MARGIN, self.y, str(line))
+            self.y -= ROW_HEIGHT
+
+    def finish(self):
+        if not self.page:
+            self._start_page()
+        self.canvas.save()
+
+
+def stream_rows(queryset, chunk_size=500):
+    """Iterate a queryset (ideally ``values_list``) without caching its rows."""
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+def get_or_render(name, render, keep_prefix=None):
+    """Return the storage name of a rendered statement, rendering it if missing.
+
+    ``render(fileobj)`` writes the PDF. Files under ``keep_prefix`` written
+    before this render started are treated as stale renders of the same
+    statement and removed; anything saved while it ran belongs to a
+    concurrent render and is left alone.
+    """
+    if default_storage.exists(name):
+        return name
+    started = timezone.now()
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as fileobj:
+        render(fileobj)
+        fileobj.seek(0)
+        saved = default_storage.save(name, File(fileobj))
+    if saved != name:
+        # A concurrent render stored the same statement first; keep its file
+        default_storage.delete(saved)
+    if keep_prefix:
+        _remove_stale(name, keep_prefix, started)
+    return name
+
+
+def _remove_stale(current, prefix, before):
+    directory, _, stem = prefix.rpartition('/')
+    try:
+        _, files = default_storage.listdir(directory)
+    except (FileNotFoundError, NotImplementedError):
+        return
+    for filename in files:
+        path = f'{directory}/{filename}'
+        if not filename.startswith(stem) or path == current:
+            continue
+        try:
+            if default_storage.get_modified_time(path) < before:
+                default_storage.delete(path)
+        except (FileNotFoundError, NotImplementedError):
+            continue
@@ -1,12 +1,9 @@
-from django.db import models
-
-
-
 from celery import shared_task
 from django.core.mail import send_mail
 from django.conf import settings
+from django.utils import timezone
 from twilio.rest import Client
-from .models import Receipt, Transaction, Invoice
+from .models import Receipt, Transaction, Invoice, StudentBalance
 from core.models_shared import CustomUser
 import qrcode
 import io
@@ -70,9 +67,11 @@ def send_notification_task(user_id, message):
         )
 
 @shared_task
-def reconcile_payments_task(statement_file_path):
-    # TODO: Parse bank statement and reconcile payments
-    pass
+def reconcile_payments_task(statement_file_path, source=None, user_id=None):
+    """Match a bank or M-Pesa statement export against payments; returns the run id."""
+    from .reconciliation import reconcile_statement
+    user = CustomUser.objects.filter(id=user_id).first() if user_id else None
+    return reconcile_statement(statement_file_path, source=source, user=user).id
 
 
 @shared_task
@@ -99,12 +98,15 @@ def auto_generate_invoices_task():
 
 @shared_task
 def auto_clearance_task():
-    # Example: Auto-clear students who have paid all fees (stub logic)
-    from my_profile.models import StudentProfile
-    students = StudentProfile.objects.all()
-    for student in students:
-        total_invoiced = Invoice.objects.filter(student=student).aggregate(models.Sum('amount'))['amount__sum'] or 0
-        total_paid = Transaction.objects.filter(student=student, status='success').aggregate(models.Sum('amount'))['amount__sum'] or 0
-        if total_paid >= total_invoiced and total_invoiced > 0:
-            # Mark as cleared (add a field or status as needed)
-            pass
+    """Clear students who owe nothing and revoke clearance from those who owe again.
+
+    Both are single UPDATEs over the ``StudentBalance`` ledger.
+    """
+    now = timezone.now()
+    cleared = StudentBalance.objects.filter(balance__lte=0, total_invoiced__gt=0, is_cleared=False).update(
+        is_cleared=True, cleared_at=now, updated_at=now,
+    )
+    revoked = StudentBalance.objects.filter(is_cleared=True, balance__gt=0).update(
+        is_cleared=False, cleared_at=None, updated_at=now,
+    )
+    return {'cleared': cleared, 'revoked': revoked}
@@ -1,7 +1,22 @@
+import csv
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
 
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
 from django.contrib.auth import get_user_model
-from .models import Invoice, Transaction
+from rest_framework.test import APIClient
+
+from my_profile.models import StudentProfile
+from payments.models import Payment, PaymentMethod
+from .models import Invoice, ReconciliationRun, Transaction, Receipt, Scholarship, StudentBalance
+from .ledger import rebuild_balances
+from .reconciliation import reconcile_statement
+from .tasks import auto_clearance_task, reconcile_payments_task
 
 class FeesModuleTests(TestCase):
 	def setUp(self):
@@ -16,3 +31,161 @@ class FeesModuleTests(TestCase):
 	def test_payment_workflow(self):
 		tx = Transaction.objects.create(student=self.user, invoice=self.invoice, amount=1000, status='successful')
 		self.assertEqual(tx.status, 'successful')
+
+
+class StudentBalanceTests(TestCase):
+	def setUp(self):
+		User = get_user_model()
+		self.student = User.objects.create(email='ledger@example.com', password='!')
+		self.other = User.objects.create(email='ledger2@example.com', password='!')
+		self.invoice = Invoice.objects.create(student=self.student, description='Tuition', amount=1000, due_date='2025-10-01')
+
+	def _balance(self, user=None):
+		return StudentBalance.objects.get(student=user or self.student)
+
+	def test_ledger_follows_every_change(self):
+		self.assertEqual(self._balance().balance, 1000)
+		tx = Transaction.objects.create(student=self.student, invoice=self.invoice, amount=300, method='manual', reference='L1')
+		self.assertEqual(self._balance().total_paid, 0)
+		tx.status = 'success'
+		tx.save()
+		Receipt.objects.create(transaction=tx)
+		Scholarship.objects.create(student=self.student, type='bursary', percentage=10)
+		Scholarship.objects.create(student=self.student, type='waiver', amount=50)
+		balance = self._balance()
+		self.assertEqual(
+			(balance.total_invoiced, balance.total_paid, balance.total_receipted, balance.total_awarded, balance.balance),
+			(Decimal('1000'), Decimal('300'), Decimal('300'), Decimal('150'), Decimal('550')),
+		)
+		# Moving an invoice refreshes both students; deleting it cascades to its payment
+		self.invoice.student = self.other
+		self.invoice.save()
+		self.assertEqual(self._balance().balance, Decimal('-350'))
+		self.assertEqual(self._balance(self.other).balance, 1000)
+		self.invoice.delete()
+		self.assertEqual(self._balance().balance, Decimal('-50'))
+		self.assertEqual(self._balance(self.other).balance, 0)
+		# Deleting the student takes the ledger row along
+		self.student.delete()
+		self.assertFalse(StudentBalance.objects.filter(student_id=self.student.id).exists())
+
+	def test_auto_clearance_is_set_based(self):
+		paid = Invoice.objects.create(student=self.other, description='Tuition', amount=500, due_date='2025-10-01')
+		Transaction.objects.create(student=self.other, invoice=paid, amount=500, method='manual', reference='L2', status='success')
+		with self.assertNumQueries(2):
+			self.assertEqual(auto_clearance_task(), {'cleared': 1, 'revoked': 0})
+		self.assertTrue(self._balance(self.other).is_cleared)
+		self.assertFalse(self._balance().is_cleared)
+		Invoice.objects.create(student=self.other, description='Library', amount=20, due_date='2025-10-01')
+		self.assertEqual(auto_clearance_task(), {'cleared': 0, 'revoked': 1})
+
+	def test_rebuild_reports_and_fixes_drift(self):
+		# Writes that bypass the signals leave the ledger behind
+		Invoice.objects.filter(pk=self.invoice.pk).update(amount=1200)
+		StudentBalance.objects.filter(student=self.other).delete()
+		Scholarship.objects.bulk_create([Scholarship(student=self.other, type='bursary', amount=100)])
+		self.assertEqual(rebuild_balances(dry_run=True), {'students': 2, 'drifted': 1, 'missing': 1, 'drift': Decimal('200')})
+		self.assertEqual(self._balance().balance, 1000)
+		out = StringIO()
+		call_command('rebuild_balances', '--chunk-size', '1', stdout=out)
+		self.assertIn('1 drifted (total balance drift 200.00), 1 missing', out.getvalue())
+		self.assertEqual(self._balance().balance, 1200)
+		self.assertEqual(self._balance(self.other).balance, -100)
+		self.assertEqual(rebuild_balances()['drifted'], 0)
+
+	def test_statement_reads_the_ledger(self):
+		StudentProfile.objects.create(user=self.student, program='CS', year_of_study=1, gender='F', phone='0700', address='A')
+		Scholarship.objects.create(student=self.student, type='bursary', amount=200)
+		client = APIClient()
+		client.force_authenticate(self.student)
+		resp = client.get('/api/fees/invoices/statement/')
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual(len(resp.data['invoices']), 1)
+		self.assertEqual(
+			(resp.data['total_invoiced'], resp.data['total_awarded'], resp.data['balance']),
+			(Decimal('1000'), Decimal('200'), Decimal('800')),
+		)
+
+
+class ReconciliationTests(TestCase):
+	def setUp(self):
+		User = get_user_model()
+		self.student = User.objects.create(email='recon@example.com', password='!')
+		mpesa = PaymentMethod.objects.get_or_create(name='MPESA')[0]
+		self.payments = {}
+		for reference, amount, status, phone in [
+			('REF001', 1000, 'successful', ''),
+			('REF002', 500, 'successful', '254711111111'),
+			('REF003', 750, 'successful', ''),
+			('REF004', 300, 'pending', ''),
+			('REF005', 200, 'successful', ''),
+		]:
+			self.payments[reference] = Payment.objects.create(
+				user=self.student, amount=amount, method=mpesa, status=status, reference=reference,
+				metadata={'phone': phone} if phone else {},
+			)
+
+	def _statement(self, rows):
+		fd, path = tempfile.mkstemp(suffix='.csv')
+		self.addCleanup(os.remove, path)
+		now = timezone.localtime()
+		with os.fdopen(fd, 'w', newline='') as fileobj:
+			writer = csv.writer(fileobj)
+			writer.writerow(['Account Statement'])
+			writer.writerow(['Receipt No.', 'Completion Time', 'Details', 'Transaction Status', 'Paid In', 'Withdrawn', 'Other Party Info', 'A/C No.'])
+			for receipt, minutes, amount, phone, reference in rows:
+				when = (now + timedelta(minutes=minutes)).strftime('%d/%m/%Y %H:%M:%S')
+				writer.writerow([receipt, when, 'Pay Bill from', 'Completed', amount, '', phone, reference])
+			writer.writerow(['QX9', now.strftime('%d/%m/%Y %H:%M:%S'), 'Charge', 'Completed', '', '50.00', '', ''])
+		return path
+
+	def test_statement_lines_are_matched_and_flagged(self):
+		path = self._statement([
+			('QA1', -60, '1,000.00', '0799 000000 - JANE', 'ref001'),
+			('QA2', -30, '500.00', '0711 111111 - JOHN', 'WRONG'),
+			('QA3', -20, '749.50', '2547*****123 - MARY', ''),
+			('QA4', -10, '1000.00', '', 'REF001'),
+			('QA5', 0, '300.00', '', 'REF004'),
+			('QA6', 30, '99999.00', '', 'NOPE'),
+			('QA7', 60, 'abc', '', 'REF002'),
+		])
+		run = reconcile_statement(path)
+		self.assertEqual(run.status, 'completed')
+		self.assertEqual(run.source, 'mpesa')
+		self.assertEqual(
+			run.summary,
+			{'matched': 2, 'fuzzy': 1, 'duplicate': 1, 'status_mismatch': 1, 'unmatched': 1, 'invalid': 1, 'missing': 1},
+		)
+		self.assertEqual((run.line_count, run.matched_count, run.flagged_count), (7, 2, 6))
+		results = {result.receipt or result.payment.reference: result for result in run.results.select_related('payment')}
+		self.assertEqual((results['QA1'].payment, results['QA1'].match_method), (self.payments['REF001'], 'reference'))
+		self.assertEqual((results['QA2'].payment, results['QA2'].match_method), (self.payments['REF002'], 'phone_amount'))
+		self.assertEqual((results['QA3'].payment, results['QA3'].status), (self.payments['REF003'], 'fuzzy'))
+		self.assertTrue(results['QA3'].is_flagged)
+		self.assertEqual((results['QA4'].payment, results['QA4'].status), (self.payments['REF001'], 'duplicate'))
+		self.assertEqual(results['QA5'].status, 'status_mismatch')
+		self.assertEqual((results['QA6'].payment, results['QA6'].status), (None, 'unmatched'))
+		self.assertEqual(results['QA7'].status, 'invalid')
+		self.assertEqual(results['REF005'].status, 'missing')
+		self.assertEqual(results['QA1'].amount, Decimal('1000.00'))
+		# Payments are reported on, never changed
+		self.assertEqual(Payment.objects.get(reference='REF004').status, 'pending')
+
+	def test_task_records_the_run(self):
+		path = self._statement([('QB1', 0, '1000.00', '', 'REF001')])
+		run = ReconciliationRun.objects.get(id=reconcile_payments_task(path, user_id=self.student.id))
+		self.assertEqual((run.status, run.created_by, run.matched_count), ('completed', self.student, 1))
+		run = reconcile_statement(path + '.missing')
+		self.assertEqual((run.status, run.results.count()), ('failed', 0))
+		self.assertTrue(run.error)
+
+	def test_unexpected_errors_fail_the_run_and_propagate(self):
+		from unittest import mock
+		from django.db import DatabaseError
+		path = self._statement([('QC1', 0, '1000.00', '', 'REF001')])
+		with mock.patch('fees.reconciliation.reconcile_lines', side_effect=DatabaseError('disk I/O error')):
+			with self.assertRaises(DatabaseError):
+				reconcile_statement(path)
+		run = ReconciliationRun.objects.latest('id')
+		self.assertEqual((run.status, run.error), ('failed', 'DatabaseError: disk I/O error'))
+		self.assertIsNotNone(run.finished_at)
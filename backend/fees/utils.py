@@ -1,6 +1,3 @@
-def generate_fees_pdf(invoices, payments):
-
-
 import io
 import pandas as pd
 from reportlab.pdfgen import canvas
@@ -9,25 +6,45 @@ from reportlab.lib.units import mm
 from reportlab.lib.utils import ImageReader
 import qrcode
 from .models import Invoice, Transaction
+from .statements import StatementRenderer, stream_rows
+
+INVOICE_COLUMNS = [('Description', 170), ('Category', 70), ('Amount', 80), ('Due', 80), ('Status', 115)]
+TRANSACTION_COLUMNS = [('Date', 80), ('Amount', 80), ('Method', 80), ('Reference', 180), ('Status', 95)]
+
+
+def generate_fees_pdf(invoices, transactions, student=None, fileobj=None, balance=None):
+    """Render a fees statement; querysets are streamed with ``.iterator()``.
 
-def generate_fees_pdf(invoices, transactions, student=None):
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(100, 800, "Fees Statement")
-    y = 780
-    c.setFont("Helvetica", 12)
-    if student:
-        c.drawString(100, y, f"Student: {student}")
-        y -= 20
-    for invoice in invoices:
-        c.drawString(100, y, f"Invoice: {invoice.description} | Category: {invoice.category} | Amount: {invoice.amount} | Due: {invoice.due_date} | Status: {invoice.status}")
-        y -= 20
-    for tx in transactions:
-        c.drawString(100, y, f"Payment: {tx.amount} | Date: {tx.created_at.date()} | Method: {tx.method} | Status: {tx.status}")
-        y -= 20
-    c.save()
-    buffer.seek(0)
+    ``balance`` is the student's ``StudentBalance``; its totals close the
+    statement. Writes to ``fileobj`` when given, otherwise returns a ``BytesIO``.
+    """
+    buffer = fileobj if fileobj is not None else io.BytesIO()
+    renderer = StatementRenderer(buffer, "Fees Statement", f"Student: {student}" if student else '')
+    if hasattr(invoices, 'values_list'):
+        invoices = stream_rows(invoices.order_by('due_date', 'id').values_list('description', 'category', 'amount', 'due_date', 'status'))
+    else:
+        invoices = ((i.description, i.category, i.amount, i.due_date, i.status) for i in invoices)
+    if hasattr(transactions, 'values_list'):
+        transactions = (
+            (created.date(), amount, method, reference, status_)
+            for created, amount, method, reference, status_ in stream_rows(
+                transactions.order_by('created_at', 'id').values_list('created_at', 'amount', 'method', 'reference', 'status')
+            )
+        )
+    else:
+        transactions = ((t.created_at.date(), t.amount, t.method, t.reference, t.status) for t in transactions)
+    renderer.section("Invoices", INVOICE_COLUMNS, invoices)
+    renderer.section("Payments", TRANSACTION_COLUMNS, transactions)
+    if balance is not None:
+        renderer.lines([
+            f"Total invoiced: {balance.total_invoiced}",
+            f"Total paid: {balance.total_paid}",
+            f"Scholarships and waivers: {balance.total_awarded}",
+        ])
+        renderer.lines([f"Balance: {balance.balance}"], bold=True)
+    renderer.finish()
+    if fileobj is None:
+        buffer.seek(0)
     return buffer
 
 
@@ -15,6 +15,10 @@ from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from django.db import transaction as db_transaction
+from core.pagination import FlexiblePagination
+from payments.daraja import DarajaError
+from .ledger import get_balance, refresh_balances
 from .serializers import InvoiceSerializer, TransactionSerializer, ReceiptSerializer, FeeStructureSerializer, ScholarshipSerializer, AuditTrailSerializer
 class ScholarshipViewSet(viewsets.ModelViewSet):
     serializer_class = ScholarshipSerializer
@@ -28,12 +32,13 @@ class ScholarshipViewSet(viewsets.ModelViewSet):
 class AuditTrailViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = AuditTrailSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = FlexiblePagination
+    cursor_ordering = ('-timestamp', '-id')
 
     def get_queryset(self):
         return AuditTrail.objects.all()
 from my_profile.models import StudentProfile
 from django.shortcuts import get_object_or_404
-from django.db import models
 
 
 # Permission: Only allow students to access their own records
@@ -46,7 +51,10 @@ class InvoiceViewSet(viewsets.ModelViewSet):
     def bulk_create(self, request):
         serializer = InvoiceSerializer(data=request.data, many=True)
         serializer.is_valid(raise_exception=True)
-        Invoice.objects.bulk_create([Invoice(**item) for item in serializer.validated_data])
+        with db_transaction.atomic():
+            invoices = Invoice.objects.bulk_create([Invoice(**item) for item in serializer.validated_data])
+            # bulk_create sends no signals; bring the ledger up to date here
+            refresh_balances(invoice.student_id for invoice in invoices)
         return Response({'detail': 'Bulk invoices created.'}, status=201)
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['student', 'status', 'due_date']
@@ -56,18 +64,19 @@ class InvoiceViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], url_path='statement')
     def statement(self, request):
         try:
-            profile = get_object_or_404(StudentProfile, user=request.user)
-            invoices = Invoice.objects.filter(student=profile)
-            transactions = Transaction.objects.filter(student=profile)
-            total_invoiced = invoices.aggregate(models.Sum('amount'))['amount__sum'] or 0
-            total_paid = transactions.filter(status='success').aggregate(models.Sum('amount'))['amount__sum'] or 0
-            balance = total_invoiced - total_paid
+            get_object_or_404(StudentProfile, user=request.user)
+            # Totals come from the ledger instead of being summed on every request
+            ledger = get_balance(request.user)
+            invoices = Invoice.objects.filter(student=request.user)
+            transactions = Transaction.objects.filter(student=request.user)
             return Response({
                 'invoices': InvoiceSerializer(invoices, many=True).data,
                 'transactions': TransactionSerializer(transactions, many=True).data,
-                'total_invoiced': total_invoiced,
-                'total_paid': total_paid,
-                'balance': balance
+                'total_invoiced': ledger.total_invoiced,
+                'total_paid': ledger.total_paid,
+                'total_awarded': ledger.total_awarded,
+                'balance': ledger.balance,
+                'is_cleared': ledger.is_cleared,
             })
         except Exception as e:
             return Response({'detail': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -83,7 +92,9 @@ class TransactionViewSet(viewsets.ModelViewSet):
     def bulk_create(self, request):
         serializer = TransactionSerializer(data=request.data, many=True)
         serializer.is_valid(raise_exception=True)
-        Transaction.objects.bulk_create([Transaction(**item) for item in serializer.validated_data])
+        with db_transaction.atomic():
+            transactions = Transaction.objects.bulk_create([Transaction(**item) for item in serializer.validated_data])
+            refresh_balances(tx.student_id for tx in transactions)
         return Response({'detail': 'Bulk transactions created.'}, status=201)
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['student', 'invoice', 'status', 'method']
@@ -125,11 +136,14 @@ class TransactionViewSet(viewsets.ModelViewSet):
                 return Response({'detail': 'Amount must be a positive number.'}, status=400)
             if method == 'mpesa' and (not phone or len(str(phone)) < 10):
                 return Response({'detail': 'Valid phone number required for M-Pesa.'}, status=400)
-            invoice = get_object_or_404(Invoice, id=invoice_id, student__user=request.user)
+            invoice = get_object_or_404(Invoice, id=invoice_id, student=request.user)
             AuditTrail.objects.create(user=request.user, action='initiate_payment', model='Transaction', object_id=reference, changes=f'before: {invoice.status}')
             if method == 'mpesa':
-                resp = initiate_mpesa_stk_push(phone, amount, reference)
-                transaction = Transaction.objects.create(
+                try:
+                    resp = initiate_mpesa_stk_push(phone, amount, reference)
+                except DarajaError as e:
+                    return Response({'detail': f'M-Pesa is unavailable: {e}'}, status=503)
+                tx = Transaction.objects.create(
                     student=invoice.student,
                     invoice=invoice,
                     amount=amount,
@@ -137,9 +151,9 @@ class TransactionViewSet(viewsets.ModelViewSet):
                     reference=reference,
                     status='pending',
                 )
-                send_notification_task.delay(invoice.student.user.id, f'Payment initiated via M-Pesa. Await confirmation.')
-                AuditTrail.objects.create(user=request.user, action='payment_created', model='Transaction', object_id=transaction.id, changes=f'after: pending')
-                return Response({'transaction_id': transaction.id, 'status': 'pending', 'gateway': resp})
+                db_transaction.on_commit(lambda: send_notification_task.delay(invoice.student_id, 'Payment initiated via M-Pesa. Await confirmation.'))
+                AuditTrail.objects.create(user=request.user, action='payment_created', model='Transaction', object_id=tx.id, changes=f'after: pending')
+                return Response({'transaction_id': tx.id, 'status': 'pending', 'gateway': resp})
             elif method == 'manual':
                 tx = record_manual_payment(invoice_id, amount, reference, request.user)
                 AuditTrail.objects.create(user=request.user, action='manual_payment', model='Transaction', object_id=tx.id, changes=f'after: success')
@@ -1,6 +1,15 @@
 from django.contrib import admin
-from .models import Result, GradingScale, Recommendation
+from .models import Result, GradingScale, Recommendation, ResultAuditEntry
 
 admin.site.register(Result)
 admin.site.register(GradingScale)
 admin.site.register(Recommendation)
+
+
+@admin.register(ResultAuditEntry)
+class ResultAuditEntryAdmin(admin.ModelAdmin):
+    list_display = ("result", "action", "actor", "created_at")
+    readonly_fields = ("result", "action", "actor", "created_at")
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_aggregates(apps, schema_editor):
+    from core.results_analytics import rebuild_aggregates
+    rebuild_aggregates(apps.get_model('final_results', 'Result'), apps.get_model('final_results', 'ResultAggregate'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('final_results', '0002_result_audit_entries'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('semester', models.CharField(max_length=20)),
+                ('year', models.PositiveIntegerField()),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('academic_hours', models.PositiveIntegerField(default=0)),
+                ('quality_points', models.FloatField(default=0)),
+                ('marks_total', models.FloatField(default=0)),
+                ('gpa', models.FloatField(default=0)),
+                ('average', models.FloatField(default=0)),
+                ('grade_counts', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='final_result_aggregates', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('student', 'semester', 'year'), name='final_result_agg_term_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_aggregates, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.utils import timezone
 from django.dispatch import receiver
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_save
+
+from core.results_analytics import GRADE_POINTS, refresh_aggregates, student_summary
 
 class GradingScale(models.Model):
     grade = models.CharField(max_length=2)
@@ -61,33 +63,15 @@ class Result(models.Model):
 
     @classmethod
     def calculate_gpa(cls, student, semester=None, year=None):
-        results = cls.objects.filter(student=student)
-        if semester:
-            results = results.filter(semester=semester)
-        if year:
-            results = results.filter(year=year)
-        total_points = 0
-        total_hours = 0
-        for r in results:
-            points = cls.grade_to_points(r.grade)
-            total_points += points * r.academic_hours
-            total_hours += r.academic_hours
-        return round(total_points / total_hours, 2) if total_hours else 0
+        return student_summary(ResultAggregate, student, semester, year)['gpa']
 
     @classmethod
     def calculate_average(cls, student, semester=None, year=None):
-        results = cls.objects.filter(student=student)
-        if semester:
-            results = results.filter(semester=semester)
-        if year:
-            results = results.filter(year=year)
-        avg = results.aggregate(models.Avg('marks'))['marks__avg']
-        return round(avg, 2) if avg else 0
+        return student_summary(ResultAggregate, student, semester, year)['average']
 
     @staticmethod
     def grade_to_points(grade):
-        mapping = {'A': 5, 'B': 4, 'C': 3, 'D': 2, 'E': 1, 'F': 0}
-        return mapping.get(grade, 0)
+        return GRADE_POINTS.get(grade, 0)
 
     def verify(self, user):
         self.is_verified = True
@@ -95,7 +79,7 @@ class Result(models.Model):
         self.verified_at = timezone.now()
         self.is_locked = True
         self.save()
-        self.log_action(f"Verified by {user}")
+        self.log_action(f"Verified by {user}", actor=user)
 
     def reject(self, user):
         self.is_verified = False
@@ -103,43 +87,75 @@ class Result(models.Model):
         self.verified_at = timezone.now()
         self.is_locked = False
         self.save()
-        self.log_action(f"Rejected by {user}")
+        self.log_action(f"Rejected by {user}", actor=user)
 
     def save(self, *args, **kwargs):
         if self.pk:
             self.version += 1
         super().save(*args, **kwargs)
 
-    def log_action(self, action):
-        entry = f"{timezone.now()}: {action}\n"
-        self.audit_log += entry
-        self.save(update_fields=['audit_log'])
+    # ``audit_log`` is kept for entries written before ResultAuditEntry
+    def log_action(self, action, actor=None):
+        ResultAuditEntry.objects.create(result=self, action=action, actor=actor)
 
     def track_download(self, user):
         self.last_downloaded_at = timezone.now()
         self.last_downloaded_by = user
         self.save(update_fields=['last_downloaded_at', 'last_downloaded_by'])
-        self.log_action(f"Downloaded by {user}")
+        self.log_action(f"Downloaded by {user}", actor=user)
 
     @classmethod
     def grade_distribution(cls, student, semester=None, year=None):
-        results = cls.objects.filter(student=student)
-        if semester:
-            results = results.filter(semester=semester)
-        if year:
-            results = results.filter(year=year)
-        dist = {}
-        for r in results:
-            dist[r.grade] = dist.get(r.grade, 0) + 1
-        return dist
+        return student_summary(ResultAggregate, student, semester, year)['distribution']
 
     @classmethod
     def performance_trend(cls, student):
-        results = cls.objects.filter(student=student).order_by('year', 'semester')
-        trend = []
-        for r in results:
-            trend.append({'semester': r.semester, 'year': r.year, 'marks': r.marks, 'grade': r.grade})
-        return trend
+        return list(
+            cls.objects.filter(student=student).order_by('year', 'semester', 'id')
+            .values('semester', 'year', 'marks', 'grade')
+        )
+
+
+class ResultAuditEntry(models.Model):
+    """Append-only audit trail for a result; entries are never edited."""
+    result = models.ForeignKey(Result, on_delete=models.CASCADE, related_name='audit_entries')
+    action = models.CharField(max_length=255)
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, related_name='final_result_audit_entries', on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+
+    def __str__(self):
+        return f"{self.created_at}: {self.action}"
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("Result audit entries are append-only.")
+        super().save(*args, **kwargs)
+
+
+class ResultAggregate(models.Model):
+    """Per-student, per-term totals maintained by ``core.results_analytics``."""
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='final_result_aggregates')
+    semester = models.CharField(max_length=20)
+    year = models.PositiveIntegerField()
+    units = models.PositiveIntegerField(default=0)
+    academic_hours = models.PositiveIntegerField(default=0)
+    quality_points = models.FloatField(default=0)
+    marks_total = models.FloatField(default=0)
+    gpa = models.FloatField(default=0)
+    average = models.FloatField(default=0)
+    grade_counts = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'semester', 'year'], name='final_result_agg_term_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.student} {self.semester} {self.year}: GPA {self.gpa}"
 
 # Signals for notifications and audit trail
 from my_profile.tasks import send_notification
@@ -159,7 +175,7 @@ def final_result_saved(sender, instance, created, **kwargs):
         channels.append('sms')
     if instance.notify_in_app:
         channels.append('in_app')
-    send_notification.delay(instance.student.email, f'final_result_{action}', context, channels)
+    transaction.on_commit(lambda: send_notification.delay(instance.student.email, f'final_result_{action}', context, channels))
     instance.log_action(f"Final result {action} by {instance.student} for {instance.unit_code} ({instance.semester} {instance.year})")
 
 @receiver(post_delete, sender=Result)
@@ -176,5 +192,25 @@ def final_result_deleted(sender, instance, **kwargs):
         channels.append('sms')
     if instance.notify_in_app:
         channels.append('in_app')
-    send_notification.delay(instance.student.email, 'final_result_deleted', context, channels)
+    transaction.on_commit(lambda: send_notification.delay(instance.student.email, 'final_result_deleted', context, channels))
     # Could log deletion elsewhere
+
+
+# Keep ResultAggregate in step with single-row writes (bulk imports refresh it themselves)
+@receiver(pre_save, sender=Result)
+def stash_result_term(sender, instance, raw=False, **kwargs):
+    instance._previous_term = None
+    if instance.pk and not raw:
+        instance._previous_term = (
+            sender.objects.filter(pk=instance.pk).values_list('student_id', 'semester', 'year').first()
+        )
+
+
+@receiver([post_save, post_delete], sender=Result)
+def refresh_result_aggregate(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    terms = {(instance.student_id, instance.semester, instance.year)}
+    if getattr(instance, '_previous_term', None):
+        terms.add(instance._previous_term)
+    refresh_aggregates(sender, ResultAggregate, terms)
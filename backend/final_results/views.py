@@ -1,24 +1,29 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import Result, GradingScale, Recommendation
+from .models import Result, GradingScale, Recommendation, ResultAggregate, ResultAuditEntry
 from .serializers import ResultSerializer
+from django.core.files.storage import default_storage
 from django.http import FileResponse
 import io
 import pandas as pd
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
 from my_profile.tasks import send_notification
-from django.db.models import Avg
+from core.transcripts import build_transcript
+from core.results_import import ResultImportMixin
 
-class FinalResultViewSet(viewsets.ModelViewSet):
+class FinalResultViewSet(ResultImportMixin, viewsets.ModelViewSet):
     serializer_class = ResultSerializer
     permission_classes = [permissions.IsAuthenticated]
+    import_result_model = Result
+    import_scale_model = GradingScale
+    import_audit_model = ResultAuditEntry
+    import_aggregate_model = ResultAggregate
+    import_event = 'final_result_imported'
 
     def get_queryset(self):
         user = self.request.user
         profile = getattr(user, 'profile', None)
-        queryset = Result.objects.filter(student=profile)
+        queryset = Result.objects.filter(student=user)
         semester = self.request.query_params.get('semester')
         year = self.request.query_params.get('year')
         if semester:
@@ -31,76 +36,23 @@ class FinalResultViewSet(viewsets.ModelViewSet):
     def current(self, request):
         user = request.user
         profile = getattr(user, 'profile', None)
-        current_semester = Result.objects.filter(student=profile).order_by('-created_at').first()
+        current_semester = Result.objects.filter(student=user).order_by('-created_at').first()
         if not current_semester:
             return Response({'detail': 'No results found.'}, status=status.HTTP_404_NOT_FOUND)
         semester = current_semester.semester
         year = current_semester.year
-        results = Result.objects.filter(student=profile, semester=semester, year=year)
+        results = Result.objects.filter(student=user, semester=semester, year=year)
         serializer = ResultSerializer(results, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def download_pdf(self, request):
         user = request.user
-        profile = getattr(user, 'profile', None)
         semester = request.query_params.get('semester')
         year = request.query_params.get('year')
-        results = Result.objects.filter(student=profile)
-        if semester:
-            results = results.filter(semester=semester)
-        if year:
-            results = results.filter(year=year)
-        results = results.order_by('unit_code')
-        buffer = io.BytesIO()
-        p = canvas.Canvas(buffer, pagesize=A4)
-        p.setFont("Helvetica-Bold", 16)
-        p.drawString(100, 800, "Uzuri University Final Transcript")
-        p.setFont("Helvetica", 12)
-        p.drawString(100, 780, f"Student: {profile.user.get_full_name()} | Admission No: {profile.user.student_number}")
-        p.drawString(100, 765, f"Programme: {getattr(profile, 'program', '')}")
-        p.drawString(100, 750, f"Semester: {semester or '-'} | Year: {year or '-'}")
-        y = 730
-        p.setFont("Helvetica-Bold", 12)
-        p.drawString(100, y, "Unit Code")
-        p.drawString(200, y, "Unit Name")
-        p.drawString(400, y, "Hours")
-        p.drawString(450, y, "Grade")
-        y -= 20
-        p.setFont("Helvetica", 12)
-        for r in results:
-            p.drawString(100, y, r.unit_code)
-            p.drawString(200, y, r.unit_name)
-            p.drawString(400, y, str(r.academic_hours))
-            p.drawString(450, y, r.grade)
-            y -= 18
-            if y < 100:
-                p.showPage()
-                y = 800
-        avg = results.aggregate(avg_marks=pd.models.Avg('marks'))['avg_marks'] or 0
-        p.drawString(100, y-20, f"Current Average: {round(avg,2)}")
-        all_results = Result.objects.filter(student=profile)
-        cum_avg = all_results.aggregate(avg_marks=pd.models.Avg('marks'))['avg_marks'] or 0
-        p.drawString(100, y-40, f"Cumulative Average: {round(cum_avg,2)}")
-        rec = Recommendation.objects.filter(student=profile, semester=semester, year=year).first()
-        rec_text = rec.text if rec else "No recommendation available."
-        p.drawString(100, y-60, f"Recommendation: {rec_text}")
-        if any(r.status == 'final' for r in results):
-            p.setFont("Helvetica-Bold", 40)
-            p.setFillGray(0.7, 0.5)
-            p.drawString(200, 400, "FINAL")
-        avg = results.aggregate(avg_marks=Avg('marks'))['avg_marks'] or 0
-        p.setFillGray(0, 1)
-        p.drawString(100, y-100, "Grading Scale:")
-        cum_avg = all_results.aggregate(avg_marks=Avg('marks'))['avg_marks'] or 0
-        for gs in GradingScale.objects.all():
-            p.setFont("Helvetica", 10)
-            p.drawString(100, y2, f"{gs.grade}: {gs.min_score}-{gs.max_score} ({gs.description})")
-            y2 -= 14
-        p.showPage()
-        p.save()
-        buffer.seek(0)
-        return FileResponse(buffer, as_attachment=True, filename=f"final_transcript_{profile.user.student_number}_{semester or 'all'}.pdf")
+        # Rendered once per distinct content and served from media storage
+        name = build_transcript('final', user, semester, year)
+        return FileResponse(default_storage.open(name, 'rb'), as_attachment=True, filename=f"final_transcript_{user.student_number}_{semester or 'all'}.pdf")
 
     @action(detail=False, methods=['get'])
     def download_excel(self, request):
@@ -108,7 +60,7 @@ class FinalResultViewSet(viewsets.ModelViewSet):
         profile = getattr(user, 'profile', None)
         semester = request.query_params.get('semester')
         year = request.query_params.get('year')
-        results = Result.objects.filter(student=profile)
+        results = Result.objects.filter(student=user)
         if semester:
             results = results.filter(semester=semester)
         if year:
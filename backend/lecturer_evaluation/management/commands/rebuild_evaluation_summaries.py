@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from lecturer_evaluation.summaries import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recompute lecturer evaluation summaries (running per-question totals) from the responses.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--semester', help='Only rebuild summaries for this semester')
+
+    def handle(self, *args, **options):
+        scope = {'semester': options['semester']} if options['semester'] else {}
+        count = rebuild_summaries(**scope)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} evaluation summaries.'))
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:13
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def drop_duplicates(apps, schema_editor):
+    # Rows the new unique constraints would reject; the oldest one is kept
+    for name, fields in (('EvaluationResponse', ('form', 'student_hash')), ('EvaluationSummary', ('unit', 'lecturer', 'semester'))):
+        model = apps.get_model('lecturer_evaluation', name)
+        duplicates = model.objects.values(*fields).annotate(n=Count('id'), keep=Min('id')).filter(n__gt=1).order_by()
+        for row in duplicates:
+            model.objects.filter(**{field: row[field] for field in fields}).exclude(id=row['keep']).delete()
+
+
+def backfill_summaries(apps, schema_editor):
+    from lecturer_evaluation.summaries import rebuild_summaries
+    rebuild_summaries(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_systemmetric_alter_customuser_groups_and_more'),
+        ('lecturer_evaluation', '0002_evaluationform_deadline_evaluationresponse_gamified_and_more'),
+        ('unit_registration', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='evaluationsummary',
+            name='registered_students',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='evaluationsummary',
+            name='response_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='evaluationsummary',
+            name='score_counts',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='evaluationsummary',
+            name='score_sums',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(drop_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='evaluationresponse',
+            constraint=models.UniqueConstraint(fields=('form', 'student_hash'), name='unique_evaluation_per_student'),
+        ),
+        migrations.AddConstraint(
+            model_name='evaluationsummary',
+            constraint=models.UniqueConstraint(fields=('unit', 'lecturer', 'semester'), name='unique_evaluation_summary'),
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
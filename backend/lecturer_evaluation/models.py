@@ -33,6 +33,11 @@ class EvaluationResponse(models.Model):
     student_hash = models.CharField(max_length=64, db_index=True)  # anonymized identifier
     gamified = models.BooleanField(default=False)  # For badge/completion
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['form', 'student_hash'], name='unique_evaluation_per_student'),
+        ]
+
     def __str__(self):
         return f"Response for {self.form} at {self.submitted_at}"
 
@@ -42,11 +47,12 @@ class EvaluationResponse(models.Model):
             raise Exception('Evaluation period closed.')
         if EvaluationResponse.objects.filter(form=form, student_hash=student_hash).exists():
             raise Exception('Already submitted.')
+        from .summaries import record_response
         with transaction.atomic():
             response = EvaluationResponse.objects.create(
                 form=form, answers=answers, comment=comment, student_hash=student_hash
             )
-            EvaluationSummary.update_summary(form)
+            record_response(form, answers)
             return response
 
 class EvaluationSummary(models.Model):
@@ -60,44 +66,32 @@ class EvaluationSummary(models.Model):
     strong_areas = models.JSONField(default=list, blank=True)
     weak_areas = models.JSONField(default=list, blank=True)
     trend_data = models.JSONField(default=dict, blank=True)
+    # Running totals behind avg_scores (see lecturer_evaluation.summaries)
+    score_sums = models.JSONField(default=dict, blank=True)  # {question_id: sum of scores}
+    score_counts = models.JSONField(default=dict, blank=True)  # {question_id: number of scores}
+    response_count = models.PositiveIntegerField(default=0)
+    registered_students = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['unit', 'lecturer', 'semester'], name='unique_evaluation_summary'),
+        ]
 
     def __str__(self):
         return f"Summary: {self.unit} - {self.lecturer} ({self.semester})"
 
     @staticmethod
     def update_summary(form):
-        responses = EvaluationResponse.objects.filter(form=form)
-        if not responses.exists():
-            return
-        question_keys = form.questions
-        avg_scores = {}
-        for q in question_keys:
-            scores = [r.answers.get(str(q), 0) for r in responses if str(q) in r.answers]
-            avg_scores[q] = round(sum(scores)/len(scores), 2) if scores else 0
-        participation = responses.count() / max(1, form.unit.unitregistrationitem_set.count())
-        # Analytics: strong/weak areas
-        sorted_scores = sorted(avg_scores.items(), key=lambda x: x[1], reverse=True)
-        strong_areas = [k for k, v in sorted_scores[:2]]
-        weak_areas = [k for k, v in sorted_scores[-2:]]
-        # Trend data (could be extended)
-        trend_data = {'count': responses.count()}
-        summary, _ = EvaluationSummary.objects.get_or_create(
-            unit=form.unit, lecturer=form.lecturer, semester=form.semester
-        )
-        summary.avg_scores = avg_scores
-        summary.participation_rate = round(participation, 2)
-        summary.strong_areas = strong_areas
-        summary.weak_areas = weak_areas
-        summary.trend_data = trend_data
-        summary.save()
+        # Summaries are maintained as responses arrive; this recomputes one from scratch
+        from .summaries import rebuild_summaries
+        rebuild_summaries(unit_id=form.unit_id, lecturer_id=form.lecturer_id, semester=form.semester)
 
     @staticmethod
     def badge_earned(student_profile, semester):
         # Returns True if student has evaluated all registered units for the semester
         registered_units = student_profile.unit_registrations.filter(semester=semester, status='approved').values_list('items__unit', flat=True)
         forms = EvaluationForm.objects.filter(unit_id__in=registered_units, semester=semester, active=True)
-        for form in forms:
-            student_hash = hash(str(student_profile.user.id) + str(form.id) + str(timezone.now().date()))
-            if not EvaluationResponse.objects.filter(form=form, student_hash=str(student_hash)).exists():
-                return False
-        return True
+        from .summaries import student_hashes
+        hashes = student_hashes(student_profile.user_id, forms.values_list('id', flat=True))
+        answered = EvaluationResponse.objects.filter(student_hash__in=hashes).count()
+        return answered == len(hashes)
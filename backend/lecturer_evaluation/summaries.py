@@ -0,0 +1,152 @@
+"""Running per-question totals behind ``EvaluationSummary``.
+
+A summary covers one (unit, lecturer, semester). Alongside the published
+averages it keeps ``score_sums`` and ``score_counts`` per question and the
+number of responses, so ``record_response`` folds a new response in by
+locking the summary row and touching each question once, however many
+responses came before. ``rebuild_summaries`` recomputes every summary
+from the responses in a single pass.
+
+Responses are anonymous: ``student_hash`` is a keyed HMAC of the student
+and form ids. It is stable across processes and days, so the responses of
+one student are found with a single indexed ``IN`` query over the hashes
+of the forms they could have answered.
+"""
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils.crypto import salted_hmac
+
+HASH_SALT = 'lecturer_evaluation.student_hash'
+# Number of questions reported as strong and as weak areas
+AREAS = 2
+
+
+def _model(name, registry=global_apps, app='lecturer_evaluation'):
+    return registry.get_model(app, name)
+
+
+def student_hash(user_id, form_id):
+    """Anonymous, stable identifier of one student's response to one form."""
+    secret = getattr(settings, 'EVALUATION_HASH_SECRET', None) or None
+    return salted_hmac(HASH_SALT, f'{user_id}:{form_id}', secret=secret, algorithm='sha256').hexdigest()
+
+
+def student_hashes(user_id, form_ids):
+    """``{hash: form id}`` for the given forms."""
+    return {student_hash(user_id, form_id): form_id for form_id in form_ids}
+
+
+def score(value):
+    """An answer as a number, or None if it is not one."""
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def add_answers(summary, questions, answers):
+    """Fold one response's answers to ``questions`` into the summary's running totals."""
+    for question in questions:
+        key = str(question)
+        summary.score_sums.setdefault(key, 0)
+        summary.score_counts.setdefault(key, 0)
+        value = score(answers.get(key)) if key in answers else None
+        if value is not None:
+            summary.score_sums[key] += value
+            summary.score_counts[key] += 1
+    summary.response_count += 1
+
+
+def publish(summary):
+    """Derive the published fields (averages, areas, participation) from the running totals."""
+    avg_scores = {
+        key: round(summary.score_sums[key] / count, 2) if count else 0
+        for key, count in summary.score_counts.items()
+    }
+    ranked = sorted(avg_scores, key=avg_scores.get, reverse=True)
+    summary.avg_scores = avg_scores
+    summary.strong_areas = ranked[:AREAS]
+    summary.weak_areas = ranked[-AREAS:]
+    summary.trend_data = {**summary.trend_data, 'count': summary.response_count}
+    summary.participation_rate = round(summary.response_count / max(1, summary.registered_students), 2)
+
+
+def registered_counts(registry=global_apps, units=None, semester=None):
+    """``{(unit id, semester): students}`` from approved unit registrations."""
+    items = _model('UnitRegistrationItem', registry, 'unit_registration').objects.filter(registration__status='approved')
+    if units is not None:
+        items = items.filter(unit_id__in=units)
+    if semester is not None:
+        items = items.filter(registration__semester=semester)
+    rows = items.values('unit_id', 'registration__semester').annotate(n=Count('registration__student', distinct=True)).order_by()
+    return {(row['unit_id'], row['registration__semester']): row['n'] for row in rows}
+
+
+def record_response(form, answers):
+    """Add a response to ``form``'s summary; O(questions) whatever the number of responses."""
+    EvaluationSummary = _model('EvaluationSummary')
+    key = {'unit_id': form.unit_id, 'lecturer_id': form.lecturer_id, 'semester': form.semester}
+    # Counted on every response, so registrations approved since the last one are included
+    registered = registered_counts(units=[form.unit_id], semester=form.semester).get((form.unit_id, form.semester), 0)
+    with transaction.atomic():
+        summary = EvaluationSummary.objects.select_for_update().filter(**key).first()
+        if summary is None:
+            EvaluationSummary.objects.get_or_create(**key, defaults={'registered_students': registered})
+            summary = EvaluationSummary.objects.select_for_update().get(**key)
+        summary.registered_students = registered
+        add_answers(summary, form.questions, answers)
+        publish(summary)
+        summary.save()
+    return summary
+
+
+def rebuild_summaries(registry=global_apps, **scope):
+    """Recompute summaries from the responses; returns how many summaries have responses.
+
+    ``scope`` (``unit_id``, ``lecturer_id``, ``semester``) limits the
+    rebuild to matching summaries; without it every summary is rebuilt.
+    """
+    EvaluationForm = _model('EvaluationForm', registry)
+    EvaluationResponse = _model('EvaluationResponse', registry)
+    EvaluationSummary = _model('EvaluationSummary', registry)
+    forms = {
+        row['id']: row
+        for row in EvaluationForm.objects.filter(**scope).values('id', 'unit_id', 'lecturer_id', 'semester', 'questions')
+    }
+    registered = registered_counts(registry, units=[scope['unit_id']] if 'unit_id' in scope else None)
+    responses = EvaluationResponse.objects.order_by('id').values_list('form_id', 'answers')
+    if scope:
+        responses = responses.filter(form_id__in=list(forms))
+    summaries = {}
+    for form_id, answers in responses.iterator(chunk_size=2000):
+        form = forms[form_id]
+        key = (form['unit_id'], form['lecturer_id'], form['semester'])
+        summary = summaries.get(key)
+        if summary is None:
+            summary = summaries[key] = EvaluationSummary(
+                unit_id=key[0], lecturer_id=key[1], semester=key[2],
+                score_sums={}, score_counts={}, response_count=0, trend_data={},
+                registered_students=registered.get((key[0], key[2]), 0),
+            )
+        add_answers(summary, form['questions'], answers or {})
+    for summary in summaries.values():
+        publish(summary)
+    fields = [
+        'avg_scores', 'participation_rate', 'strong_areas', 'weak_areas', 'trend_data',
+        'score_sums', 'score_counts', 'response_count', 'registered_students', 'updated_at',
+    ]
+    with transaction.atomic():
+        # Summaries whose responses are all gone keep their row, emptied
+        EvaluationSummary.objects.filter(**scope).update(
+            avg_scores={}, participation_rate=0, strong_areas=[], weak_areas=[], trend_data={},
+            score_sums={}, score_counts={}, response_count=0,
+        )
+        EvaluationSummary.objects.bulk_create(
+            list(summaries.values()), batch_size=500, update_conflicts=True,
+            unique_fields=['unit', 'lecturer', 'semester'], update_fields=fields,
+        )
+    return len(summaries)
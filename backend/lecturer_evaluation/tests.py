@@ -1,3 +1,85 @@
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from core.models import Course, Program, Unit
+from my_profile.models import StudentProfile
+from unit_registration.models import UnitRegistration, UnitRegistrationItem
+
+from .models import EvaluationForm, EvaluationResponse, EvaluationSummary
+from .summaries import rebuild_summaries, student_hash
+
+User = get_user_model()
+
+
+class EvaluationSummaryTests(TestCase):
+    def setUp(self):
+        program = Program.objects.create(name='CS', department='Computing')
+        course = Course.objects.create(code='BSC-CS', name='Computer Science', program=program)
+        self.unit = Unit.objects.create(code='CS101', name='Intro', course=course, semester='1', credits=3)
+        self.lecturer = User.objects.create_user('lecturer@example.com', 'pass', role='lecturer')
+        self.form = EvaluationForm.objects.create(
+            unit=self.unit, lecturer=self.lecturer, semester='2025-1', questions=['q1', 'q2', 'q3'],
+        )
+        self.students = []
+        for i in range(4):
+            user = User.objects.create_user(f'student{i}@example.com', 'pass')
+            profile = StudentProfile.objects.create(user=user, program='CS', year_of_study=1, gender='F', phone='0700', address='A')
+            registration = UnitRegistration.objects.create(student=profile, semester='2025-1', status='approved')
+            UnitRegistrationItem.objects.create(registration=registration, unit=self.unit)
+            self.students.append(user)
+
+    def _submit(self, user, answers):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.post('/api/lecturer-evaluation/student-evaluations/submit/', {'form': self.form.id, 'answers': answers}, format='json')
+
+    def test_submissions_update_running_totals(self):
+        self.assertEqual(self._submit(self.students[0], {'q1': 5, 'q2': 3, 'q3': 1}).status_code, 200)
+        self.assertEqual(self._submit(self.students[1], {'q1': '4', 'q2': 2}).status_code, 200)
+        # The same student again is turned away
+        self.assertEqual(self._submit(self.students[1], {'q1': 1}).status_code, 400)
+        summary = EvaluationSummary.objects.get(unit=self.unit, lecturer=self.lecturer, semester='2025-1')
+        self.assertEqual(summary.avg_scores, {'q1': 4.5, 'q2': 2.5, 'q3': 1.0})
+        self.assertEqual(summary.score_counts, {'q1': 2, 'q2': 2, 'q3': 1})
+        self.assertEqual(summary.strong_areas, ['q1', 'q2'])
+        self.assertEqual(summary.weak_areas, ['q2', 'q3'])
+        self.assertEqual(summary.response_count, 2)
+        self.assertEqual(summary.registered_students, 4)
+        self.assertEqual(summary.participation_rate, 0.5)
+        self.assertEqual(summary.trend_data, {'count': 2})
+
+        incremental = {field: getattr(summary, field) for field in ('avg_scores', 'score_sums', 'score_counts', 'response_count')}
+        EvaluationSummary.objects.update(avg_scores={}, score_sums={}, score_counts={}, response_count=0)
+        self.assertEqual(rebuild_summaries(), 1)
+        summary.refresh_from_db()
+        self.assertEqual({field: getattr(summary, field) for field in incremental}, incremental)
+
+    def test_registrations_approved_later_are_counted(self):
+        self.assertEqual(self._submit(self.students[0], {'q1': 5}).status_code, 200)
+        user = User.objects.create_user('late@example.com', 'pass')
+        profile = StudentProfile.objects.create(user=user, program='CS', year_of_study=1, gender='F', phone='0700', address='A')
+        registration = UnitRegistration.objects.create(student=profile, semester='2025-1', status='approved')
+        UnitRegistrationItem.objects.create(registration=registration, unit=self.unit)
+        self.assertEqual(self._submit(user, {'q1': 4}).status_code, 200)
+        summary = EvaluationSummary.objects.get(unit=self.unit, lecturer=self.lecturer, semester='2025-1')
+        self.assertEqual((summary.registered_students, summary.participation_rate), (5, 0.4))
+
+    def test_status_and_history_use_stable_hashes(self):
+        other = EvaluationForm.objects.create(unit=self.unit, lecturer=self.lecturer, semester='2025-1', questions=['q1'])
+        student = self.students[0]
+        self._submit(student, {'q1': 5})
+        self.assertEqual(
+            EvaluationResponse.objects.get().student_hash, student_hash(student.id, self.form.id),
+        )
+        client = APIClient()
+        client.force_authenticate(student)
+        with self.assertNumQueries(2):
+            # The forms, then one IN query over their hashes
+            resp = client.get('/api/lecturer-evaluation/student-evaluations/status/', {'semester': '2025-1'})
+        evaluated = {(row['unit'], row['evaluated']) for row in resp.data}
+        self.assertEqual(len(resp.data), 2)
+        self.assertEqual(evaluated, {(self.unit.id, True), (self.unit.id, False)})
+        resp = client.get('/api/lecturer-evaluation/student-evaluations/history/')
+        self.assertEqual([row['form'] for row in resp.data], [self.form.id])
+        self.assertNotIn(other.id, [row['form'] for row in resp.data])
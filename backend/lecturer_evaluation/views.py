@@ -4,8 +4,9 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from .models import EvaluationForm, EvaluationResponse, EvaluationSummary
 from .serializers import EvaluationFormSerializer, EvaluationResponseSerializer, EvaluationSummarySerializer
-from django.utils import timezone
-from django.db.models import Avg, Count
+from django.db import IntegrityError
+from django.shortcuts import get_object_or_404
+from .summaries import student_hash, student_hashes
 
 # Create your views here.
 
@@ -26,37 +27,42 @@ class StudentEvaluationViewSet(viewsets.ViewSet):
         form_id = request.data.get('form')
         answers = request.data.get('answers')
         comment = request.data.get('comment', '')
-        student_hash = hash(str(request.user.id) + str(form_id) + str(timezone.now().date()))
-        form = EvaluationForm.objects.get(id=form_id)
-        semester = form.semester
-        unit = form.unit
-        lecturer = form.lecturer
-        exists = EvaluationResponse.objects.filter(form=form, student_hash=str(student_hash)).exists()
-        if exists:
+        form = get_object_or_404(EvaluationForm.objects.select_related('unit'), id=form_id)
+        if not form.is_open():
+            return Response({'detail': 'Evaluation period closed.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(answers, dict):
+            return Response({'detail': 'answers must be an object of question: score.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            EvaluationResponse.submit_evaluation(form, answers, comment, student_hash(request.user.id, form.id))
+        except IntegrityError:
+            # A concurrent submission got there first
             return Response({'detail': 'Already submitted.'}, status=status.HTTP_400_BAD_REQUEST)
-        EvaluationResponse.objects.create(form=form, answers=answers, comment=comment, student_hash=str(student_hash))
-        return Response({'detail': f'Your evaluation for {unit} has been received.'})
+        except Exception as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'detail': f'Your evaluation for {form.unit} has been received.'})
 
     @action(detail=False, methods=['get'])
     def status(self, request):
         student = request.user.profile
         semester = request.query_params.get('semester')
         registered_units = student.unit_registrations.filter(semester=semester, status='approved').values_list('items__unit', flat=True)
-        forms = EvaluationForm.objects.filter(unit_id__in=registered_units, semester=semester, active=True)
-        status_list = []
-        for form in forms:
-            submitted = EvaluationResponse.objects.filter(form=form, student_hash=hash(str(request.user.id) + str(form.id) + str(timezone.now().date()))).exists()
-            status_list.append({
-                'unit': form.unit.id,
-                'lecturer': form.lecturer.id,
-                'evaluated': submitted
-            })
+        forms = list(EvaluationForm.objects.filter(unit_id__in=registered_units, semester=semester, active=True).values_list('id', 'unit_id', 'lecturer_id'))
+        hashes = student_hashes(request.user.id, [form_id for form_id, _, _ in forms])
+        answered = {hashes[h] for h in EvaluationResponse.objects.filter(student_hash__in=hashes).values_list('student_hash', flat=True)}
+        status_list = [
+            {'unit': unit_id, 'lecturer': lecturer_id, 'evaluated': form_id in answered}
+            for form_id, unit_id, lecturer_id in forms
+        ]
         return Response(status_list)
 
     @action(detail=False, methods=['get'])
     def history(self, request):
-        student_hashes = [hash(str(request.user.id) + str(form.id) + str(timezone.now().date())) for form in EvaluationForm.objects.all()]
-        responses = EvaluationResponse.objects.filter(student_hash__in=[str(h) for h in student_hashes])
+        # Only forms for units the student registered for can hold their responses
+        profile = getattr(request.user, 'profile', None)
+        registered_units = profile.unit_registrations.values_list('items__unit', flat=True) if profile else []
+        form_ids = EvaluationForm.objects.filter(unit_id__in=registered_units).values_list('id', flat=True)
+        hashes = student_hashes(request.user.id, form_ids)
+        responses = EvaluationResponse.objects.filter(student_hash__in=hashes).order_by('-submitted_at')
         serializer = EvaluationResponseSerializer(responses, many=True)
         return Response(serializer.data)
 
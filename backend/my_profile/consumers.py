@@ -22,6 +22,10 @@ class NotificationConsumer(AsyncWebsocketConsumer):
     async def send_notification(self, event):
         await self.send(text_data=json.dumps(event["content"]))
 
+    async def send_counters(self, event):
+        # Deltas pushed by notifications.counters when the counters change
+        await self.send(text_data=json.dumps({"counters": event["content"]}))
+
     @database_sync_to_async
     def get_unread_count(self):
         return Notification.objects.filter(user=self.scope["user"], is_read=False).count()
@@ -21,8 +21,7 @@ from .serializers import (
     IDCardReplacementRequestSerializer,
 )
 from notifications.models import Notification
-from notifications.utils import get_unread_count, get_notification_types, get_delivery_status
-from .serializers import NotificationSerializer
+from notifications.summary import get_notification_summary
 import logging
 logger = logging.getLogger(__name__)
 from rest_framework.views import APIView
@@ -35,7 +34,7 @@ class StudentProfileAPIView(APIView):
         profile = get_object_or_404(StudentProfile, user=request.user)
         serializer = StudentProfileSerializer(profile, context={"request": request, "format": None})
         data = serializer.data
-        data.update(get_notification_context(request.user))
+        data.update(get_notification_summary(request.user, request))
         return Response(data, status=status.HTTP_200_OK)
 
     def patch(self, request):
@@ -45,7 +44,7 @@ class StudentProfileAPIView(APIView):
         serializer.save()
         Notification.objects.create(user=request.user, message="Your profile was updated successfully.")
         data = serializer.data
-        data.update(get_notification_context(request.user))
+        data.update(get_notification_summary(request.user, request))
         return Response(data, status=status.HTTP_200_OK)
 
 
@@ -62,7 +61,7 @@ class IDCardRequestAPIView(APIView):
         Notification.objects.create(user=request.user, message="Your ID replacement request has been submitted for review.")
         serializer = IDCardReplacementRequestSerializer(req)
         data = serializer.data
-        data.update(get_notification_context(request.user))
+        data.update(get_notification_summary(request.user, request))
         return Response(data, status=status.HTTP_201_CREATED)
 
 
@@ -86,22 +85,6 @@ class IDCardDownloadAPIView(APIView):
         return response
 
 
-def get_notification_context(user):
-    # Notification model uses `timestamp` for when it was created
-    notifications_qs = Notification.objects.filter(user=user).order_by("-timestamp")
-    # Serialize notifications so the response is JSON serializable
-    notifications = NotificationSerializer(notifications_qs, many=True, context={"request": None}).data
-    unread_count = get_unread_count(user)
-    notification_types = get_notification_types(user)
-    delivery_status = get_delivery_status(user)
-    return {
-        "notifications": notifications,
-        "unread_notification_count": unread_count,
-        "notification_types": notification_types,
-        "notification_delivery_status": delivery_status,
-    }
-
-
 class StudentProfileViewSet(viewsets.GenericViewSet):
     """Endpoints used by the test-suite for student profiles."""
 
@@ -119,7 +102,7 @@ class StudentProfileViewSet(viewsets.GenericViewSet):
         profile = self.get_object()
         serializer = self.get_serializer(profile)
         data = serializer.data
-        data.update(get_notification_context(request.user))
+        data.update(get_notification_summary(request.user, request))
         return Response(data, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=["patch", "put"], url_path="", url_name="profile-update")
@@ -131,7 +114,7 @@ class StudentProfileViewSet(viewsets.GenericViewSet):
         serializer.save()
         self.send_in_app_notification(request.user, "Your profile was updated successfully.")
         data = serializer.data
-        data.update(get_notification_context(request.user))
+        data.update(get_notification_summary(request.user, request))
         return Response(data, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=["post"], url_path="id-card/request", url_name="id-card-request")
@@ -144,7 +127,7 @@ class StudentProfileViewSet(viewsets.GenericViewSet):
         self.send_in_app_notification(request.user, "Your ID replacement request has been submitted for review.")
         serializer = IDCardReplacementRequestSerializer(req)
         data = serializer.data
-        data.update(get_notification_context(request.user))
+        data.update(get_notification_summary(request.user, request))
         return Response(data, status=status.HTTP_201_CREATED)
 
     @action(detail=False, methods=["get"], url_path="id-card", url_name="id-card")
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from .models import (
-	Notification, NotificationPreference, NotificationAuditLog, NotificationAnalytics, NotificationSchedule, NotificationGroup, NotificationActionResponse
+	Notification, NotificationPreference, NotificationAuditLog, NotificationAnalytics, NotificationSchedule, NotificationGroup, NotificationActionResponse,
+	NotificationFanoutJob,
 )
 
 @admin.register(Notification)
@@ -35,3 +36,9 @@ class NotificationGroupAdmin(admin.ModelAdmin):
 @admin.register(NotificationActionResponse)
 class NotificationActionResponseAdmin(admin.ModelAdmin):
 	list_display = ("notification", "user", "response", "responded_at")
+
+@admin.register(NotificationFanoutJob)
+class NotificationFanoutJobAdmin(admin.ModelAdmin):
+	list_display = ("id", "created_by", "status", "total", "created_count", "delivered_count", "created_at", "finished_at")
+	list_filter = ("status",)
+	readonly_fields = ("recipient_ids",)
@@ -0,0 +1,145 @@
+"""Incremental maintenance of ``NotificationCounter`` rows."""
+import logging
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+
+logger = logging.getLogger(__name__)
+
+
+def _models(apps=None):
+    if apps is None:
+        from .models import Notification, NotificationCounter, NotificationDeliveryLog
+        return Notification, NotificationCounter, NotificationDeliveryLog
+    return (
+        apps.get_model('notifications', 'Notification'),
+        apps.get_model('notifications', 'NotificationCounter'),
+        apps.get_model('notifications', 'NotificationDeliveryLog'),
+    )
+
+
+def notification_deltas(is_read, type_, sign):
+    """Counter deltas for adding (sign=1) or removing (sign=-1) a notification."""
+    deltas = Counter({('total', ''): sign, ('type', type_ or ''): sign})
+    if not is_read:
+        deltas[('unread', '')] += sign
+    return deltas
+
+
+def apply_deltas(user_id, deltas, push=True):
+    """Atomically add ``deltas`` ({(kind, key): n}) to the user's counters."""
+    _, NotificationCounter, _ = _models()
+    deltas = {k: v for k, v in deltas.items() if v}
+    if user_id is None or not deltas:
+        return
+    for (kind, key), delta in deltas.items():
+        rows = NotificationCounter.objects.filter(user_id=user_id, kind=kind, key=key)
+        if rows.update(count=F('count') + delta) or delta < 0:
+            # Decrements never create rows: a missing row means there is
+            # nothing to take away from (or the user is being deleted).
+            continue
+        try:
+            with transaction.atomic():
+                NotificationCounter.objects.create(user_id=user_id, kind=kind, key=key, count=delta)
+        except IntegrityError:
+            # Another writer created the row first
+            rows.update(count=F('count') + delta)
+    if push:
+        transaction.on_commit(lambda: push_counter_deltas(user_id, deltas))
+
+
+def apply_bulk_deltas(user_ids, deltas):
+    """Add the same ``deltas`` to the counters of every user in ``user_ids``.
+
+    Used by bulk writers that bypass model signals. ``user_ids`` must not
+    contain duplicates: each user is incremented once per call.
+    """
+    _, NotificationCounter, _ = _models()
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not user_ids or not deltas:
+        return
+    # Make sure every row exists, then increment them all in one UPDATE per key.
+    NotificationCounter.objects.bulk_create(
+        [
+            NotificationCounter(user_id=user_id, kind=kind, key=key, count=0)
+            for user_id in user_ids
+            for (kind, key) in deltas
+        ],
+        ignore_conflicts=True,
+        batch_size=1000,
+    )
+    for (kind, key), delta in deltas.items():
+        NotificationCounter.objects.filter(user_id__in=user_ids, kind=kind, key=key).update(count=F('count') + delta)
+
+
+def push_counter_deltas(user_id, deltas):
+    """Send counter deltas to the user's websocket group (best effort)."""
+    try:
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        channel_layer = get_channel_layer()
+        async_to_sync(channel_layer.group_send)(f"notifications_{user_id}", {
+            "type": "send_counters",
+            "content": {
+                "deltas": [
+                    {"kind": kind, "key": key, "delta": delta}
+                    for (kind, key), delta in deltas.items()
+                ],
+            },
+        })
+    except Exception:
+        logger.debug("Could not push notification counter deltas for user %s", user_id, exc_info=True)
+
+
+def compute_counters(user_ids=None, apps=None):
+    """Recompute counters from the source tables; returns {user_id: {(kind, key): n}}."""
+    Notification, _, NotificationDeliveryLog = _models(apps)
+    notifications = Notification.objects.all()
+    logs = NotificationDeliveryLog.objects.filter(notification__isnull=False)
+    if user_ids is not None:
+        notifications = notifications.filter(user_id__in=user_ids)
+        logs = logs.filter(notification__user_id__in=user_ids)
+    result = {}
+    by_type = notifications.values('user_id', 'type').annotate(
+        total=Count('id'), unread=Count('id', filter=Q(is_read=False))
+    ).order_by()
+    for row in by_type:
+        counters = result.setdefault(row['user_id'], Counter())
+        counters[('type', row['type'] or '')] += row['total']
+        counters[('total', '')] += row['total']
+        counters[('unread', '')] += row['unread']
+    by_status = logs.values('notification__user_id', 'status').annotate(total=Count('id')).order_by()
+    for row in by_status:
+        counters = result.setdefault(row['notification__user_id'], Counter())
+        counters[('delivery', row['status'])] += row['total']
+    return result
+
+
+def rebuild_counters(user_ids=None, apps=None):
+    """Replace stored counters with recomputed ones; returns the number of drifted rows."""
+    _, NotificationCounter, _ = _models(apps)
+    expected = compute_counters(user_ids, apps=apps)
+    stored = NotificationCounter.objects.all()
+    if user_ids is not None:
+        stored = stored.filter(user_id__in=user_ids)
+    current = {}
+    for row in stored.values('user_id', 'kind', 'key', 'count'):
+        current.setdefault(row['user_id'], {})[(row['kind'], row['key'])] = row['count']
+    drift = 0
+    for user_id in set(expected) | set(current):
+        want = {k: v for k, v in expected.get(user_id, {}).items() if v}
+        have = {k: v for k, v in current.get(user_id, {}).items() if v}
+        drift += sum(1 for k in set(want) | set(have) if want.get(k, 0) != have.get(k, 0))
+    with transaction.atomic():
+        stored.delete()
+        NotificationCounter.objects.bulk_create(
+            [
+                NotificationCounter(user_id=user_id, kind=kind, key=key, count=count)
+                for user_id, counters in expected.items()
+                for (kind, key), count in counters.items()
+                if count
+            ],
+            batch_size=1000,
+        )
+    return drift
@@ -0,0 +1,311 @@
+"""Batched multi-channel delivery for notifications.
+
+``deliver_notifications`` takes a batch of notification ids and groups the
+work by channel instead of by notification: one SMTP connection for every
+email, Africa's Talking and OneSignal calls with many recipients per
+request, FCM multicast via ``registration_ids``, and one ``bulk_create``
+for the audit log. HTTP calls share a pooled ``requests.Session`` per
+thread and always carry a timeout.
+
+The ``sent`` flags are written in one UPDATE as soon as the external calls
+return, before push statuses and audit rows. A task retried after a later
+failure passes ``unsent_only`` so recipients are not messaged twice.
+"""
+import logging
+import threading
+from collections import defaultdict
+
+import requests
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from .inbox import invalidate_inbox
+from .models import Notification, NotificationAuditLog
+
+logger = logging.getLogger(__name__)
+
+# (connect, read) timeout for every outbound HTTP call
+HTTP_TIMEOUT = (3.05, 10)
+HTTP_POOL_SIZE = 20
+FCM_BATCH_SIZE = 1000  # legacy FCM limit for registration_ids
+ONESIGNAL_BATCH_SIZE = 2000
+SMS_BATCH_SIZE = 100
+MIXPANEL_BATCH_SIZE = 50
+GA_BATCH_SIZE = 25  # Measurement Protocol events per request
+
+_local = threading.local()
+
+
+def get_http_session():
+    """Return this thread's keep-alive session, creating it on first use."""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _local.session = session
+    return session
+
+
+def _url(name, default):
+    # Overridable so delivery can be pointed at a local stub server
+    return getattr(settings, name, None) or default
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _post(url, **kwargs):
+    response = get_http_session().post(url, timeout=HTTP_TIMEOUT, **kwargs)
+    response.raise_for_status()
+    return response
+
+
+class DeliveryBatch:
+    """Collects per-channel outcomes for one batch of notifications."""
+
+    def __init__(self, notifications):
+        self.notifications = notifications
+        self.logs = []
+        self.push_results = {}
+
+    def record(self, notif, channel, status, response=''):
+        self.logs.append(NotificationAuditLog(
+            notification=notif,
+            channel=channel,
+            status=status,
+            attempt=1,
+            response=str(response)[:2000],
+        ))
+
+    def record_push(self, notif, ok, response=''):
+        # A push counts as sent if any provider accepted it
+        self.push_results[notif.id] = self.push_results.get(notif.id, False) or ok
+        self.record(notif, 'push', 'success' if ok else 'failed', response or ('sent' if ok else ''))
+
+
+def send_analytics(notifications):
+    """Report ``notification_sent`` events to GA and Mixpanel (best effort)."""
+    ga_id = getattr(settings, 'GA_MEASUREMENT_ID', None)
+    ga_secret = getattr(settings, 'GA_API_SECRET', None)
+    mixpanel_token = getattr(settings, 'MIXPANEL_TOKEN', None)
+    try:
+        if ga_id and ga_secret:
+            ga_url = _url('GA_COLLECT_URL', 'https://www.google-analytics.com/mp/collect')
+            by_user = defaultdict(list)
+            for notif in notifications:
+                by_user[notif.user_id].append({
+                    'name': 'notification_sent',
+                    'params': {
+                        'category': notif.category,
+                        'channels': ','.join(notif.channels),
+                        'urgency': notif.urgency,
+                    },
+                })
+            for user_id, events in by_user.items():
+                for chunk in _batches(events, GA_BATCH_SIZE):
+                    _post(ga_url, params={'measurement_id': ga_id, 'api_secret': ga_secret},
+                          json={'client_id': str(user_id), 'events': chunk})
+        if mixpanel_token:
+            mixpanel_url = _url('MIXPANEL_TRACK_URL', 'https://api.mixpanel.com/track')
+            events = [{
+                'event': 'Notification Sent',
+                'properties': {
+                    'token': mixpanel_token,
+                    'distinct_id': str(notif.user_id),
+                    'category': notif.category,
+                    'channels': notif.channels,
+                    'urgency': notif.urgency,
+                },
+            } for notif in notifications]
+            for chunk in _batches(events, MIXPANEL_BATCH_SIZE):
+                _post(mixpanel_url, json=chunk)
+    except Exception:
+        logger.debug("Notification analytics hook failed", exc_info=True)
+
+
+def send_emails(batch, notifications):
+    """Send every email in the batch over a single SMTP connection."""
+    messages, sent = [], []
+    for notif in notifications:
+        if not notif.user.email:
+            batch.record(notif, 'email', 'skipped', 'no email address')
+            continue
+        messages.append(EmailMessage(notif.title, notif.message, settings.DEFAULT_FROM_EMAIL, [notif.user.email]))
+        sent.append(notif)
+    if not messages:
+        return
+    try:
+        connection = get_connection(fail_silently=False)
+        connection.send_messages(messages)
+    except Exception as e:
+        for notif in sent:
+            batch.record(notif, 'email', 'failed', e)
+        return
+    for notif in sent:
+        batch.record(notif, 'email', 'success', 'sent')
+
+
+def _sms_client():
+    username = getattr(settings, 'AFRICASTALKING_USERNAME', None)
+    api_key = getattr(settings, 'AFRICASTALKING_API_KEY', None)
+    sender = getattr(settings, 'AFRICASTALKING_FROM_NUMBER', None)
+    if not (username and api_key and sender):
+        return None, None
+    import africastalking
+    africastalking.initialize(username, api_key)
+    return africastalking.SMS, sender
+
+
+def send_sms(batch, notifications):
+    """Send SMS with one Africa's Talking request per message text."""
+    by_message = defaultdict(list)
+    for notif in notifications:
+        phone = getattr(notif.user, 'phone', None)
+        if not phone:
+            batch.record(notif, 'sms', 'skipped', 'no phone number')
+            continue
+        by_message[notif.message].append((phone, notif))
+    if not by_message:
+        return
+    client, sender = _sms_client()
+    if client is None:
+        for pairs in by_message.values():
+            for _, notif in pairs:
+                batch.record(notif, 'sms', 'skipped', 'sms gateway not configured')
+        return
+    for message, pairs in by_message.items():
+        for chunk in _batches(pairs, SMS_BATCH_SIZE):
+            try:
+                response = client.send(message, [phone for phone, _ in chunk], sender_id=sender)
+                recipients = {
+                    r.get('number'): r.get('status')
+                    for r in response.get('SMSMessageData', {}).get('Recipients', [])
+                }
+            except Exception as e:
+                for _, notif in chunk:
+                    batch.record(notif, 'sms', 'failed', e)
+                continue
+            for phone, notif in chunk:
+                result = recipients.get(phone, 'Success')
+                batch.record(notif, 'sms', 'success' if result == 'Success' else 'failed', result)
+
+
+def _push_groups(pairs):
+    # Recipients of the same title/message share one multicast request
+    groups = defaultdict(list)
+    for token, notif in pairs:
+        groups[(notif.title, notif.message)].append((token, notif))
+    return groups
+
+
+def send_fcm(batch, notifications):
+    server_key = getattr(settings, 'FCM_SERVER_KEY', None)
+    pairs = [(getattr(n.user, 'device_token', None), n) for n in notifications]
+    pairs = [(token, n) for token, n in pairs if token]
+    if not server_key or not pairs:
+        return
+    url = _url('FCM_SEND_URL', 'https://fcm.googleapis.com/fcm/send')
+    headers = {'Authorization': f'key={server_key}'}
+    for (title, message), group in _push_groups(pairs).items():
+        for chunk in _batches(group, FCM_BATCH_SIZE):
+            payload = {
+                'registration_ids': [token for token, _ in chunk],
+                'notification': {'title': title, 'body': message},
+                'data': {'notification_ids': [n.id for _, n in chunk]},
+            }
+            try:
+                results = _post(url, json=payload, headers=headers).json().get('results', [])
+            except Exception as e:
+                for _, notif in chunk:
+                    batch.record_push(notif, False, e)
+                continue
+            # FCM returns one result per registration id, in order
+            for index, (_, notif) in enumerate(chunk):
+                error = results[index].get('error') if index < len(results) else None
+                batch.record_push(notif, not error, error or 'sent')
+
+
+def send_onesignal(batch, notifications):
+    app_id = getattr(settings, 'ONESIGNAL_APP_ID', None)
+    api_key = getattr(settings, 'ONESIGNAL_API_KEY', None)
+    pairs = [(n.push_token, n) for n in notifications if n.push_token]
+    if not (app_id and api_key and pairs):
+        return
+    url = _url('ONESIGNAL_URL', 'https://onesignal.com/api/v1/notifications')
+    headers = {'Authorization': f'Basic {api_key}'}
+    for (title, message), group in _push_groups(pairs).items():
+        for chunk in _batches(group, ONESIGNAL_BATCH_SIZE):
+            payload = {
+                'app_id': app_id,
+                'include_player_ids': [token for token, _ in chunk],
+                'headings': {'en': title},
+                'contents': {'en': message},
+                'data': {'notification_ids': [n.id for _, n in chunk]},
+            }
+            try:
+                body = _post(url, json=payload, headers=headers).json()
+            except Exception as e:
+                for _, notif in chunk:
+                    batch.record_push(notif, False, e)
+                continue
+            errors = body.get('errors') or {}
+            invalid = set(errors.get('invalid_player_ids', [])) if isinstance(errors, dict) else set()
+            for token, notif in chunk:
+                ok = token not in invalid
+                batch.record_push(notif, ok, 'sent' if ok else 'invalid player id')
+
+
+def deliver_notifications(notification_ids, unsent_only=False):
+    """Deliver a batch of notifications over their channels; returns {channel: {status: n}}.
+
+    With ``unsent_only`` notifications already marked sent are skipped.
+    """
+    queryset = Notification.objects.filter(id__in=notification_ids)
+    if unsent_only:
+        queryset = queryset.filter(sent=False)
+    notifications = list(queryset.select_related('user').order_by('id'))
+    if not notifications:
+        return {}
+    batch = DeliveryBatch(notifications)
+    send_analytics(notifications)
+
+    by_channel = defaultdict(list)
+    for notif in notifications:
+        for channel in dict.fromkeys(notif.channels):
+            by_channel[channel].append(notif)
+    for channel, members in by_channel.items():
+        if channel == 'email':
+            send_emails(batch, members)
+        elif channel == 'sms':
+            send_sms(batch, members)
+        elif channel == 'push':
+            send_fcm(batch, members)
+            send_onesignal(batch, members)
+        else:
+            for notif in members:
+                batch.record(notif, channel, 'success', 'sent')
+
+    now = timezone.now()
+    # Recorded first so a retry after any later failure does not send again
+    Notification.objects.filter(id__in=[notif.id for notif in notifications]).update(sent=True, sent_at=now)
+    pushed = []
+    for notif in notifications:
+        notif.sent = True
+        notif.sent_at = now
+        if notif.id in batch.push_results:
+            notif.push_status = 'sent' if batch.push_results[notif.id] else 'failed'
+            pushed.append(notif)
+    Notification.objects.bulk_update(pushed, ['push_status'], batch_size=500)
+    NotificationAuditLog.objects.bulk_create(batch.logs, batch_size=500)
+    invalidate_inbox(*{notif.user_id for notif in notifications})
+
+    summary = defaultdict(lambda: defaultdict(int))
+    for log in batch.logs:
+        summary[log.channel][log.status] += 1
+    return {channel: dict(statuses) for channel, statuses in summary.items()}
@@ -0,0 +1,139 @@
+"""Bulk notification fan-out.
+
+``start_fanout`` records a ``NotificationFanoutJob`` and queues
+``fanout_notifications_task`` once the surrounding transaction commits, so
+callers can return the job id straight away. The task creates notifications
+with chunked ``bulk_create``, updates counters and websocket groups per
+chunk, and hands channel delivery (email/sms/push) to chunked Celery tasks.
+"""
+import asyncio
+import logging
+from collections import Counter, defaultdict
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .counters import apply_bulk_deltas, notification_deltas
+from .models import Notification, NotificationFanoutJob
+from .signals import notifications_bulk_created
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+# Fields a fan-out payload may set on each Notification
+PAYLOAD_FIELDS = ('title', 'message', 'category', 'type', 'urgency', 'channels', 'action_links', 'language', 'group')
+
+
+def start_fanout(user_ids, payload, created_by=None):
+    """Queue a notification for every user in ``user_ids`` and return the job."""
+    from .tasks import fanout_notifications_task
+
+    recipients = list(dict.fromkeys(int(u) for u in user_ids))
+    job = NotificationFanoutJob.objects.create(
+        created_by=created_by,
+        payload={k: v for k, v in payload.items() if k in PAYLOAD_FIELDS and v is not None},
+        recipient_ids=recipients,
+        total=len(recipients),
+    )
+    transaction.on_commit(lambda: fanout_notifications_task.delay(job.id))
+    return job
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def publish_batch(notifications):
+    """Push a chunk of new notifications to their websocket groups in one event loop pass."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    async def _send_all():
+        await asyncio.gather(*(
+            channel_layer.group_send(f"notifications_{n.user_id}", {
+                "type": "send_notification",
+                "content": {
+                    "id": n.id,
+                    "title": n.title,
+                    "message": n.message,
+                    "category": n.category,
+                    "urgency": n.urgency,
+                    "timestamp": n.timestamp.isoformat(),
+                },
+            })
+            for n in notifications
+        ), return_exceptions=True)
+
+    try:
+        async_to_sync(_send_all)()
+    except Exception:
+        logger.warning("Websocket publish failed for a fan-out chunk", exc_info=True)
+
+
+def bulk_notify(notifications):
+    """``bulk_create`` unsaved notifications and do what post_save would have done.
+
+    Counters are updated with one statement per distinct (delta set, key),
+    the bulk-created signal fires once and websocket events are published
+    together after commit. Returns the saved notifications.
+    """
+    if not notifications:
+        return []
+    with transaction.atomic():
+        notifications = Notification.objects.bulk_create(notifications)
+        per_user = defaultdict(Counter)
+        for n in notifications:
+            per_user[n.user_id].update(notification_deltas(n.is_read, n.type, 1))
+        # Users with identical deltas share one UPDATE per counter key
+        groups = defaultdict(list)
+        for user_id, deltas in per_user.items():
+            groups[frozenset(deltas.items())].append(user_id)
+        for deltas, user_ids in groups.items():
+            apply_bulk_deltas(user_ids, dict(deltas))
+    user_ids = list(per_user)
+    notifications_bulk_created.send(sender=Notification, user_ids=user_ids)
+    transaction.on_commit(lambda: publish_batch(notifications))
+    return notifications
+
+
+def create_chunk(job, user_ids):
+    """Create the notifications for one chunk of recipients and return them."""
+    now = timezone.now()
+    with transaction.atomic():
+        notifications = bulk_notify([
+            Notification(user_id=user_id, timestamp=now, **job.payload)
+            for user_id in user_ids
+        ])
+        NotificationFanoutJob.objects.filter(pk=job.pk).update(created_count=F('created_count') + len(notifications))
+    return notifications
+
+
+def run_fanout(job):
+    """Create every chunk of ``job`` and queue channel delivery where needed."""
+    from .tasks import dispatch_notification_chunk
+
+    NotificationFanoutJob.objects.filter(pk=job.pk).update(status='running')
+    external = [c for c in job.payload.get('channels', []) if c != 'in_app']
+    for user_ids in _chunks(job.recipient_ids, CHUNK_SIZE):
+        notifications = create_chunk(job, user_ids)
+        if external:
+            ids = [n.id for n in notifications]
+            transaction.on_commit(lambda ids=ids: dispatch_notification_chunk.delay(job.id, ids))
+    if not external:
+        NotificationFanoutJob.objects.filter(pk=job.pk).update(status='completed', finished_at=timezone.now())
+
+
+def record_delivery_progress(job_id, count):
+    NotificationFanoutJob.objects.filter(pk=job_id).update(delivered_count=F('delivered_count') + count)
+    NotificationFanoutJob.objects.filter(
+        pk=job_id, status='running', delivered_count__gte=F('total')
+    ).update(status='completed', finished_at=timezone.now())
+
+
+def record_delivery_failure(job_id, error):
+    NotificationFanoutJob.objects.filter(pk=job_id).update(status='failed', error=str(error), finished_at=timezone.now())
@@ -0,0 +1,103 @@
+"""Cached, keyset-paginated notification inbox.
+
+Pages are cached already serialized, keyed by user, filters and cursor.
+Every key embeds a per-user version; a write to one of the user's
+notifications drops the version key, which orphans all of their cached
+pages at once. Versions are seeded from the clock rather than counting up
+from 1, so a dropped version can never come back and revive old pages.
+
+Pagination walks ``(timestamp, id)`` downwards, so fetching page N costs the
+same as fetching page 1.
+"""
+import base64
+import hashlib
+import time
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db.models import Q
+
+INBOX_TTL = 60
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _version_key(user_id):
+    return f'notification_inbox:{user_id}:version'
+
+
+def get_inbox_version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def invalidate_inbox(*user_ids):
+    """Orphan every cached inbox page of the given users."""
+    user_ids = [u for u in user_ids if u is not None]
+    if user_ids:
+        cache.delete_many([_version_key(u) for u in user_ids])
+
+
+def encode_cursor(timestamp, pk):
+    raw = f'{timestamp.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor('Invalid cursor.') from e
+
+
+def _page_key(user_id, version, category, unread, cursor, page_size):
+    params = f'{category or ""}|{int(bool(unread))}|{cursor or ""}|{page_size}'
+    digest = hashlib.md5(params.encode()).hexdigest()
+    return f'notification_inbox:{user_id}:{version}:{digest}'
+
+
+def filter_inbox(queryset, category=None, unread=False):
+    if category:
+        queryset = queryset.filter(category=category)
+    if unread:
+        queryset = queryset.filter(is_read=False)
+    return queryset
+
+
+def get_inbox_page(user, queryset, serialize, category=None, unread=False, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """Return ``{'results', 'next_cursor'}`` for one inbox page, from cache when possible.
+
+    ``queryset`` is the user's notifications and ``serialize`` turns a list
+    of instances into JSON-ready data.
+    """
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    position = decode_cursor(cursor) if cursor else None
+    key = _page_key(user.id, get_inbox_version(user.id), category, unread, cursor, page_size)
+    page = cache.get(key)
+    if page is not None:
+        return page
+
+    qs = filter_inbox(queryset, category, unread).order_by('-timestamp', '-id')
+    if position:
+        timestamp, pk = position
+        qs = qs.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+    rows = list(qs[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    page = {
+        'results': serialize(rows),
+        'next_cursor': encode_cursor(rows[-1].timestamp, rows[-1].id) if has_more else None,
+    }
+    cache.set(key, page, INBOX_TTL)
+    return page
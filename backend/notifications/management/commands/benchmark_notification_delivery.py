@@ -0,0 +1,78 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from notifications.delivery import deliver_notifications
+from notifications.models import Notification
+
+
+class _Rollback(Exception):
+    pass
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so pooled connections are reused
+    requests_seen = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        with StubHandler.lock:
+            StubHandler.requests_seen += 1
+        tokens = body.get('registration_ids', []) if isinstance(body, dict) else []
+        payload = json.dumps({'results': [{'message_id': str(i)} for i in range(len(tokens))]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Measure batched notification delivery throughput against a local stub push server.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000, help='Number of notifications to deliver')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        stub = f'http://127.0.0.1:{server.server_port}'
+        count, batch_size = options['count'], options['batch_size']
+        try:
+            with override_settings(
+                EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                ONESIGNAL_APP_ID='benchmark', ONESIGNAL_API_KEY='benchmark', ONESIGNAL_URL=f'{stub}/onesignal',
+                MIXPANEL_TOKEN='benchmark', MIXPANEL_TRACK_URL=f'{stub}/mixpanel',
+            ):
+                # Everything the benchmark writes is rolled back afterwards
+                with transaction.atomic():
+                    user = get_user_model().objects.create_user(email='delivery-benchmark@example.invalid', password=None)
+                    ids = [n.id for n in Notification.objects.bulk_create([
+                        Notification(user=user, title='Benchmark', message='Delivery benchmark', category='general',
+                                     type='benchmark', channels=['in_app', 'email', 'push'], push_token=f'player-{i}')
+                        for i in range(count)
+                    ])]
+                    started = time.perf_counter()
+                    for start in range(0, count, batch_size):
+                        deliver_notifications(ids[start:start + batch_size])
+                    elapsed = time.perf_counter() - started
+                    raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            server.shutdown()
+        self.stdout.write(self.style.SUCCESS(
+            f'Delivered {count} notifications in {elapsed:.2f}s '
+            f'({count / elapsed:.0f}/s, {StubHandler.requests_seen} HTTP requests to the stub)'
+        ))
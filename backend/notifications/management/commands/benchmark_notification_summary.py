@@ -0,0 +1,65 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from my_profile.models import StudentProfile
+from my_profile.views import StudentProfileAPIView
+from notifications.inbox import invalidate_inbox
+from notifications.models import Notification
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measure profile response size and latency as a user\'s notification history grows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,100,1000,10000', help='Comma-separated history sizes')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def _time(self, view, user, repeat, cold):
+        factory = APIRequestFactory()
+        best, size = None, 0
+        for _ in range(repeat):
+            if cold:
+                invalidate_inbox(user.id)
+            request = factory.get('/api/student/profile/', HTTP_HOST='localhost')
+            force_authenticate(request, user=user)
+            started = time.perf_counter()
+            response = view(request)
+            response.render()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+            size = len(response.content)
+        return best * 1000, size
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(s) for s in options['sizes'].split(','))
+        view = StudentProfileAPIView.as_view(throttle_classes=[])
+        try:
+            # Everything the benchmark writes is rolled back afterwards
+            with transaction.atomic():
+                user = get_user_model().objects.create_user(email='summary-benchmark@example.invalid', password=None)
+                StudentProfile.objects.create(
+                    user=user, program='BSc', year_of_study=1, dob='2000-01-01', gender='F',
+                    phone='0700000000', address='Nairobi', emergency_contact='Parent',
+                )
+                self.stdout.write(f'{"history":>8} {"bytes":>8} {"cold (ms)":>10} {"warm (ms)":>10}')
+                created = 0
+                for size in sizes:
+                    Notification.objects.bulk_create([
+                        Notification(user=user, title='Benchmark', message=f'Notification {i}', type='benchmark')
+                        for i in range(created, size)
+                    ], batch_size=2000)
+                    created = size
+                    cold_ms, body = self._time(view, user, options['repeat'], cold=True)
+                    warm_ms, _ = self._time(view, user, options['repeat'], cold=False)
+                    self.stdout.write(f'{size:>8} {body:>8} {cold_ms:>10.2f} {warm_ms:>10.2f}')
+                raise _Rollback
+        except _Rollback:
+            pass
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from notifications.counters import rebuild_counters
+
+class Command(BaseCommand):
+    help = 'Recompute materialized notification counters from notifications and delivery logs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Only reconcile this user id (repeatable)')
+
+    def handle(self, *args, **options):
+        drift = rebuild_counters(user_ids=options['users'])
+        self.stdout.write(self.style.SUCCESS(f'Reconciled notification counters ({drift} drifted rows corrected)'))
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_counters(apps, schema_editor):
+    from notifications.counters import rebuild_counters
+    rebuild_counters(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_auditlog_notificationdeliverylog_userconsent_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('unread', 'Unread'), ('total', 'Total'), ('type', 'Type'), ('delivery', 'Delivery status')], max_length=16)),
+                ('key', models.CharField(blank=True, default='', max_length=64)),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'kind', 'key'), name='unique_notification_counter')],
+            },
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
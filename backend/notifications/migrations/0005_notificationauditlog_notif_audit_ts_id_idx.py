@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_notificationfanoutjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificationauditlog',
+            index=models.Index(fields=['timestamp', 'id'], name='notif_audit_ts_id_idx'),
+        ),
+    ]
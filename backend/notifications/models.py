@@ -104,6 +104,9 @@ class NotificationAuditLog(models.Model):
     response = models.TextField(blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['timestamp', 'id'], name='notif_audit_ts_id_idx')]
+
 
 class NotificationAnalytics(models.Model):
     notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='analytics')
@@ -147,3 +150,58 @@ class NotificationDeliveryLog(models.Model):
     def __str__(self):
         nid = getattr(self, 'notification_id', None)
         return f"Delivery {self.status} for {nid if nid else 'unknown'} at {self.timestamp}"
+
+
+class NotificationCounter(models.Model):
+    """Materialized per-user notification counters.
+
+    One row per (user, kind, key): ``unread``/``total`` use an empty key,
+    ``type`` rows are keyed by notification type and ``delivery`` rows by
+    delivery log status. Maintained by the receivers in ``signals.py`` and
+    rebuilt by the ``reconcile_notification_counters`` command.
+    """
+    UNREAD = 'unread'
+    TOTAL = 'total'
+    TYPE = 'type'
+    DELIVERY = 'delivery'
+    KIND_CHOICES = [
+        (UNREAD, 'Unread'),
+        (TOTAL, 'Total'),
+        (TYPE, 'Type'),
+        (DELIVERY, 'Delivery status'),
+    ]
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notification_counters')
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    key = models.CharField(max_length=64, blank=True, default='')
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind', 'key'], name='unique_notification_counter'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.kind}:{self.key} = {self.count}"
+
+
+class NotificationFanoutJob(models.Model):
+    """Tracks a bulk notification fan-out run by ``fanout_notifications_task``."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='notification_fanout_jobs')
+    payload = models.JSONField(default=dict)  # Notification field values shared by every recipient
+    recipient_ids = models.JSONField(default=list)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='queued')
+    total = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    delivered_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Fan-out {self.id} ({self.status}: {self.created_count}/{self.total})"
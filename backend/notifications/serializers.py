@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import (
-    Notification, NotificationPreference, NotificationAuditLog, NotificationAnalytics, NotificationSchedule, NotificationGroup, NotificationActionResponse
+    Notification, NotificationPreference, NotificationAuditLog, NotificationAnalytics, NotificationSchedule, NotificationGroup, NotificationActionResponse,
+    NotificationFanoutJob,
 )
 
 class NotificationSerializer(serializers.ModelSerializer):
@@ -39,3 +40,8 @@ class NotificationActionResponseSerializer(serializers.ModelSerializer):
     class Meta:
         model = NotificationActionResponse
         fields = '__all__'
+
+class NotificationFanoutJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = NotificationFanoutJob
+        exclude = ('recipient_ids',)
@@ -1,10 +1,18 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from .models import Notification, NotificationSchedule
+from collections import Counter
+from django.db.models.signals import post_save, pre_save, pre_delete, post_delete
+from django.dispatch import receiver, Signal
+from .models import Notification, NotificationSchedule, NotificationDeliveryLog
+from .counters import apply_deltas, notification_deltas
+from .inbox import invalidate_inbox
 from django.utils import timezone
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 import json
+
+# Sent by notifications.fanout after a bulk_create, which skips post_save.
+# Receivers get ``user_ids`` (the recipients of the chunk).
+notifications_bulk_created = Signal()
+
 # Example: Trigger notification send on schedule
 @receiver(post_save, sender=NotificationSchedule)
 def send_scheduled_notification(sender, instance, created, **kwargs):
@@ -37,4 +45,97 @@ def push_notification_ws(sender, instance, created, **kwargs):
         })
     except Exception:
         # best-effort: do not raise errors at signal time
-        pass
\ No newline at end of file
+        pass
+
+
+# --- Materialized counters ---
+# pre_save stashes the stored state so post_save can apply the difference.
+
+@receiver(pre_save, sender=Notification)
+def stash_notification_state(sender, instance, raw=False, **kwargs):
+    instance._counter_previous = None
+    if instance.pk and not raw:
+        instance._counter_previous = (
+            Notification.objects.filter(pk=instance.pk).values('user_id', 'is_read', 'type').first()
+        )
+
+
+@receiver(post_save, sender=Notification)
+def update_counters_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_counter_previous', None)
+    if previous is None:
+        apply_deltas(instance.user_id, notification_deltas(instance.is_read, instance.type, 1))
+        return
+    if previous['user_id'] != instance.user_id:
+        apply_deltas(previous['user_id'], notification_deltas(previous['is_read'], previous['type'], -1))
+        apply_deltas(instance.user_id, notification_deltas(instance.is_read, instance.type, 1))
+        return
+    deltas = notification_deltas(instance.is_read, instance.type, 1)
+    deltas.subtract(notification_deltas(previous['is_read'], previous['type'], 1))
+    apply_deltas(instance.user_id, deltas)
+
+
+@receiver(post_delete, sender=Notification)
+def update_counters_on_delete(sender, instance, **kwargs):
+    apply_deltas(instance.user_id, notification_deltas(instance.is_read, instance.type, -1))
+
+
+def _log_owner(notification_id):
+    if notification_id is None:
+        return None
+    return Notification.objects.filter(pk=notification_id).values_list('user_id', flat=True).first()
+
+
+@receiver(pre_save, sender=NotificationDeliveryLog)
+def stash_delivery_state(sender, instance, raw=False, **kwargs):
+    instance._counter_previous = None
+    if instance.pk and not raw:
+        instance._counter_previous = (
+            NotificationDeliveryLog.objects.filter(pk=instance.pk).values('notification_id', 'status').first()
+        )
+
+
+@receiver(post_save, sender=NotificationDeliveryLog)
+def update_delivery_counters_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_counter_previous', None)
+    if previous and previous == {'notification_id': instance.notification_id, 'status': instance.status}:
+        return
+    owner = _log_owner(instance.notification_id)
+    if previous:
+        previous_owner = _log_owner(previous['notification_id'])
+        apply_deltas(previous_owner, Counter({('delivery', previous['status']): -1}))
+        invalidate_inbox(previous_owner)
+    apply_deltas(owner, Counter({('delivery', instance.status): 1}))
+    # The cached notification summary includes delivery counts
+    invalidate_inbox(owner)
+
+
+@receiver(pre_delete, sender=NotificationDeliveryLog)
+def stash_delivery_owner(sender, instance, **kwargs):
+    # Resolve the owner before anything is deleted: when the parent
+    # notification is deleted too, its row is gone by post_delete time.
+    instance._counter_owner = _log_owner(instance.notification_id)
+
+
+@receiver(post_delete, sender=NotificationDeliveryLog)
+def update_delivery_counters_on_delete(sender, instance, **kwargs):
+    owner = getattr(instance, '_counter_owner', None)
+    apply_deltas(owner, Counter({('delivery', instance.status): -1}))
+    invalidate_inbox(owner)
+
+
+# --- Inbox cache ---
+
+@receiver([post_save, post_delete], sender=Notification)
+def invalidate_inbox_on_write(sender, instance, **kwargs):
+    previous = getattr(instance, '_counter_previous', None)
+    invalidate_inbox(instance.user_id, previous['user_id'] if previous else None)
+
+
+@receiver(notifications_bulk_created)
+def invalidate_inbox_on_bulk_create(sender, user_ids, **kwargs):
+    invalidate_inbox(*user_ids)
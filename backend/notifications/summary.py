@@ -0,0 +1,60 @@
+"""Bounded notification summary embedded in other apps' responses.
+
+Profile, timetable, payments and unit-registration responses carry the
+unread count, the user's newest few notifications and a link to the
+cursor-paginated inbox for the rest, never the full history. The summary
+is cached per user under the inbox version (see ``notifications.inbox``),
+so any write that invalidates the inbox also refreshes it.
+"""
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+
+from .inbox import INBOX_TTL, encode_cursor, get_inbox_version
+from .models import Notification
+from .utils import get_delivery_status, get_notification_types, get_unread_count
+
+SUMMARY_SIZE = 5
+# The 'notification-list' route name is registered by more than one router
+INBOX_PATH = '/api/notifications/notifications/'
+
+
+def _summary_key(user_id, version, limit):
+    return f'notification_summary:{user_id}:{version}:{limit}'
+
+
+def _build_summary(user, limit):
+    from .serializers import NotificationSerializer
+
+    rows = list(Notification.objects.filter(user=user).order_by('-timestamp', '-id')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'notifications': list(NotificationSerializer(rows, many=True, context={'request': None}).data),
+        'unread_notification_count': get_unread_count(user),
+        'notification_types': list(get_notification_types(user)),
+        'notification_delivery_status': get_delivery_status(user),
+        'next_cursor': encode_cursor(rows[-1].timestamp, rows[-1].id) if has_more else None,
+    }
+
+
+def _inbox_link(request, cursor):
+    path = f'{INBOX_PATH}?{urlencode({"cursor": cursor})}'
+    return request.build_absolute_uri(path) if request is not None else path
+
+
+def get_notification_summary(user, request=None, limit=SUMMARY_SIZE):
+    """Return the notification fields merged into API responses for ``user``.
+
+    ``notifications`` holds at most ``limit`` items; ``notifications_next``
+    links to the inbox page that continues after them, or is None.
+    """
+    key = _summary_key(user.id, get_inbox_version(user.id), limit)
+    summary = cache.get(key)
+    if summary is None:
+        summary = _build_summary(user, limit)
+        cache.set(key, summary, INBOX_TTL)
+    summary = dict(summary)
+    cursor = summary.pop('next_cursor')
+    summary['notifications_next'] = _inbox_link(request, cursor) if cursor else None
+    return summary
@@ -19,3 +19,251 @@ class NotificationDeliveryTest(TestCase):
 		self.assertIn('opened', data)
 		self.assertIn('ignored', data)
 		self.assertIn('total', data)
+
+
+
+class NotificationCounterTest(TestCase):
+	def setUp(self):
+		User = get_user_model()
+		self.user = User.objects.create_user(email='counter@example.com', password='testpass')
+
+	def _notify(self, type_='info', **extra):
+		return Notification.objects.create(user=self.user, category='general', type=type_, title='T', message='M', **extra)
+
+	def test_counters_follow_writes(self):
+		from .models import NotificationDeliveryLog
+		from .utils import get_unread_count, get_notification_types, get_delivery_status
+		first = self._notify('info')
+		self._notify('fees')
+		NotificationDeliveryLog.objects.create(notification=first, channel='email', status='success')
+		NotificationDeliveryLog.objects.create(notification=first, channel='sms', status='success')
+		self.assertEqual(get_unread_count(self.user), 2)
+		self.assertEqual(list(get_notification_types(self.user)), ['fees', 'info'])
+		self.assertEqual(get_delivery_status(self.user), [{'status': 'success', 'count': 2}])
+		first.is_read = True
+		first.save()
+		self.assertEqual(get_unread_count(self.user), 1)
+		first.delete()
+		self.assertEqual(list(get_notification_types(self.user)), ['fees'])
+		self.assertEqual(get_delivery_status(self.user), [])
+
+	def test_lookups_are_single_queries(self):
+		from .utils import get_unread_count
+		for _ in range(5):
+			self._notify()
+		with self.assertNumQueries(1):
+			self.assertEqual(get_unread_count(self.user), 5)
+
+	def test_reconcile_command_fixes_drift(self):
+		from django.core.management import call_command
+		from .models import NotificationCounter
+		from .utils import get_unread_count
+		self._notify()
+		Notification.objects.filter(user=self.user).update(is_read=True)
+		self.assertEqual(get_unread_count(self.user), 1)
+		call_command('reconcile_notification_counters', stdout=open('/dev/null', 'w'))
+		self.assertEqual(get_unread_count(self.user), 0)
+		self.assertTrue(NotificationCounter.objects.filter(user=self.user, kind='total', count=1).exists())
+
+
+class NotificationFanoutTest(TestCase):
+	def setUp(self):
+		User = get_user_model()
+		self.admin = User.objects.create_user(email='fanout-admin@example.com', password='testpass', is_staff=True)
+		self.recipients = [
+			User.objects.create_user(email=f'fanout{i}@example.com', password='testpass')
+			for i in range(5)
+		]
+		self.client = APIClient()
+		self.client.force_authenticate(user=self.admin)
+
+	def test_bulk_send_runs_as_a_job(self):
+		from . import fanout
+		from .models import NotificationFanoutJob
+		from .tasks import fanout_notifications_task
+		from .utils import get_unread_count
+		ids = [u.id for u in self.recipients]
+		with self.captureOnCommitCallbacks(execute=False) as callbacks:
+			response = self.client.post('/api/notifications/notifications/bulk_send/', {
+				'users': ids + ids[:2], 'title': 'Exam week', 'message': 'Check the timetable.',
+			}, format='json')
+		self.assertEqual(response.status_code, 202)
+		self.assertEqual(len(callbacks), 1)
+		job_id = response.json()['job_id']
+		self.assertEqual(Notification.objects.count(), 0)
+
+		fanout.CHUNK_SIZE, original = 2, fanout.CHUNK_SIZE
+		try:
+			fanout_notifications_task(job_id)
+		finally:
+			fanout.CHUNK_SIZE = original
+		self.assertEqual(Notification.objects.filter(type='bulk').count(), 5)
+		self.assertEqual(get_unread_count(self.recipients[0]), 1)
+		job = NotificationFanoutJob.objects.get(id=job_id)
+		self.assertEqual((job.status, job.total, job.created_count), ('completed', 5, 5))
+
+		response = self.client.get(f'/api/notifications/notifications/bulk-jobs/{job_id}/')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.json()['created_count'], 5)
+
+	def test_external_channels_are_dispatched_per_chunk(self):
+		from .fanout import start_fanout
+		from .models import NotificationFanoutJob
+		from .tasks import dispatch_notification_chunk, fanout_notifications_task
+		from unittest import mock
+		with self.captureOnCommitCallbacks(execute=False):
+			job = start_fanout([u.id for u in self.recipients], {'title': 'T', 'message': 'M', 'channels': ['in_app', 'email']})
+		with self.captureOnCommitCallbacks(execute=False) as callbacks:
+			fanout_notifications_task(job.id)
+		# websocket publish + channel dispatch for the single chunk
+		self.assertEqual(len(callbacks), 2)
+		self.assertEqual(NotificationFanoutJob.objects.get(id=job.id).status, 'running')
+		ids = list(Notification.objects.values_list('id', flat=True))
+		with mock.patch('notifications.tasks.deliver_notifications', side_effect=RuntimeError('SMTP down')):
+			with self.assertRaises(RuntimeError):
+				dispatch_notification_chunk(job.id, ids)
+		# A failed attempt is retried, not counted as delivered
+		job.refresh_from_db()
+		self.assertEqual((job.status, job.delivered_count), ('running', 0))
+		dispatch_notification_chunk(job.id, ids)
+		job.refresh_from_db()
+		self.assertEqual((job.status, job.delivered_count), ('completed', 5))
+
+		# Once the retries are spent the job is marked failed
+		NotificationFanoutJob.objects.filter(id=job.id).update(status='running', delivered_count=0)
+		dispatch_notification_chunk.push_request(retries=3)
+		self.addCleanup(dispatch_notification_chunk.pop_request)
+		with mock.patch('notifications.tasks.deliver_notifications', side_effect=RuntimeError('SMTP down')):
+			with self.assertRaises(RuntimeError):
+				dispatch_notification_chunk(job.id, ids)
+		job.refresh_from_db()
+		self.assertEqual((job.status, job.delivered_count, job.error), ('failed', 0, 'SMTP down'))
+
+	def test_retry_after_sending_does_not_send_again(self):
+		from unittest import mock
+		from django.core import mail
+		from .fanout import start_fanout
+		from .models import NotificationAuditLog, NotificationFanoutJob
+		from .tasks import dispatch_notification_chunk, fanout_notifications_task
+		with self.captureOnCommitCallbacks(execute=False):
+			job = start_fanout([u.id for u in self.recipients], {'title': 'T', 'message': 'M', 'channels': ['email']})
+		with self.captureOnCommitCallbacks(execute=False):
+			fanout_notifications_task(job.id)
+		ids = list(Notification.objects.values_list('id', flat=True))
+		# The emails go out, then recording the audit rows fails
+		with mock.patch.object(NotificationAuditLog.objects, 'bulk_create', side_effect=RuntimeError('db gone')):
+			with self.assertRaises(RuntimeError):
+				dispatch_notification_chunk(job.id, ids)
+		self.assertEqual(len(mail.outbox), 5)
+		self.assertEqual(Notification.objects.filter(sent=True).count(), 5)
+		dispatch_notification_chunk(job.id, ids)
+		self.assertEqual(len(mail.outbox), 5)
+		job.refresh_from_db()
+		self.assertEqual((job.status, job.delivered_count), ('completed', 5))
+
+
+class NotificationDeliveryPipelineTest(TestCase):
+	def setUp(self):
+		User = get_user_model()
+		self.users = [User.objects.create_user(email=f'deliver{i}@example.com', password='testpass') for i in range(3)]
+
+	def _notify(self, user, **extra):
+		return Notification.objects.create(user=user, category='general', type='info', title='Fees', message='Due soon', **extra)
+
+	def test_batch_groups_by_channel(self):
+		from unittest.mock import Mock, patch
+		from django.core import mail
+		from django.test import override_settings
+		from .delivery import deliver_notifications
+		from .models import NotificationAuditLog
+		ids = [self._notify(u, channels=['email', 'push'], push_token=f'player-{u.id}').id for u in self.users]
+		response = Mock()
+		response.json.return_value = {'id': 'abc', 'errors': {'invalid_player_ids': [f'player-{self.users[0].id}']}}
+		with override_settings(ONESIGNAL_APP_ID='app', ONESIGNAL_API_KEY='key'), \
+				patch('notifications.delivery.get_http_session') as session:
+			session.return_value.post.return_value = response
+			summary = deliver_notifications(ids)
+		self.assertEqual(len(mail.outbox), 3)
+		self.assertEqual(session.return_value.post.call_count, 1)
+		payload = session.return_value.post.call_args.kwargs['json']
+		self.assertEqual(len(payload['include_player_ids']), 3)
+		self.assertIn('timeout', session.return_value.post.call_args.kwargs)
+		self.assertEqual(summary, {'email': {'success': 3}, 'push': {'success': 2, 'failed': 1}})
+		# One audit row per notification and channel
+		self.assertEqual(NotificationAuditLog.objects.count(), 6)
+		statuses = dict(Notification.objects.filter(id__in=ids).values_list('user_id', 'push_status'))
+		self.assertEqual(statuses[self.users[0].id], 'failed')
+		self.assertEqual(statuses[self.users[1].id], 'sent')
+		self.assertFalse(Notification.objects.filter(id__in=ids, sent=False).exists())
+
+
+class NotificationInboxCacheTest(TestCase):
+	def setUp(self):
+		User = get_user_model()
+		self.user = User.objects.create_user(email='inbox@example.com', password='testpass')
+		self.client = APIClient()
+		self.client.force_authenticate(user=self.user)
+		for i in range(5):
+			Notification.objects.create(user=self.user, category='finance' if i % 2 else 'general', type='info', title=f'N{i}', message='M')
+
+	def test_keyset_pages_cover_the_inbox(self):
+		seen, cursor = [], None
+		while True:
+			params = {'page_size': 2}
+			if cursor:
+				params['cursor'] = cursor
+			data = self.client.get('/api/notifications/notifications/', params).json()
+			seen += [n['id'] for n in data['results']]
+			cursor = data['next_cursor']
+			if not cursor:
+				break
+		expected = list(Notification.objects.order_by('-timestamp', '-id').values_list('id', flat=True))
+		self.assertEqual(seen, expected)
+
+	def test_filters_are_part_of_the_key_and_writes_invalidate(self):
+		url = '/api/notifications/notifications/'
+		self.assertEqual(len(self.client.get(url).json()['results']), 5)
+		self.assertEqual(len(self.client.get(url, {'category': 'finance'}).json()['results']), 2)
+		with self.assertNumQueries(0):
+			self.client.get(url, {'category': 'finance'})
+		first = Notification.objects.filter(category='finance').first()
+		first.is_read = True
+		first.save()
+		self.assertEqual(len(self.client.get(url, {'category': 'finance', 'unread': '1'}).json()['results']), 1)
+		results = self.client.get(url, {'category': 'finance'}).json()['results']
+		self.assertTrue(next(n for n in results if n['id'] == first.id)['is_read'])
+		self.assertEqual(self.client.get(url, {'cursor': 'bogus'}).status_code, 400)
+
+
+class NotificationSummaryTest(TestCase):
+	def setUp(self):
+		from django.core.cache import cache
+		from my_profile.models import StudentProfile
+		cache.clear()
+		User = get_user_model()
+		self.user = User.objects.create_user(email='summary@example.com', password='testpass')
+		StudentProfile.objects.create(user=self.user, program='CS', year_of_study=2, dob='2000-01-01', gender='F', phone='0700', address='A', emergency_contact='P')
+		self.client = APIClient()
+		self.client.force_authenticate(user=self.user)
+		for i in range(12):
+			Notification.objects.create(user=self.user, type='info', title=f'N{i}', message='M')
+
+	def test_profile_carries_a_bounded_summary_with_inbox_link(self):
+		from .summary import SUMMARY_SIZE
+		data = self.client.get('/api/student/profile/').json()
+		self.assertEqual(len(data['notifications']), SUMMARY_SIZE)
+		self.assertEqual(data['unread_notification_count'], 12)
+		self.assertEqual(data['notifications'][0]['id'], Notification.objects.order_by('-timestamp', '-id').first().id)
+		rest = self.client.get(data['notifications_next']).json()['results']
+		expected = list(Notification.objects.order_by('-timestamp', '-id').values_list('id', flat=True))
+		self.assertEqual([n['id'] for n in data['notifications'] + rest], expected[:SUMMARY_SIZE + len(rest)])
+
+	def test_summary_is_cached_until_the_inbox_changes(self):
+		from .summary import get_notification_summary
+		get_notification_summary(self.user)
+		with self.assertNumQueries(0):
+			summary = get_notification_summary(self.user)
+		Notification.objects.create(user=self.user, type='alert', title='Newest', message='M')
+		refreshed = get_notification_summary(self.user)
+		self.assertEqual(refreshed['notifications'][0]['title'], 'Newest')
+		self.assertEqual(refreshed['unread_notification_count'], summary['unread_notification_count'] + 1)
@@ -1,22 +1,29 @@
-from django.db import models
-from django.db.models import F
-from .models import Notification, NotificationDeliveryLog
+from .models import NotificationCounter
+
+# These helpers read the materialized NotificationCounter rows maintained in
+# notifications.signals instead of aggregating Notification and
+# NotificationDeliveryLog on every request.
 
 def get_unread_count(user):
-    return Notification.objects.filter(user=user, is_read=False).count()
+    count = (
+        NotificationCounter.objects.filter(user=user, kind=NotificationCounter.UNREAD, key='')
+        .values_list('count', flat=True)
+        .first()
+    )
+    return count or 0
 
 def get_notification_types(user):
-    return Notification.objects.filter(user=user).values_list('type', flat=True).distinct()
-
-def get_delivery_status(user):
-    # Aggregate by delivery log status (delivery_logs.status) because the
-    # Notification model does not always keep a single delivery_status field
-    # per channel. This returns a list of {'status': <status>, 'count': N}.
-    # Use values('status') directly to avoid creating an annotation
-    # that conflicts with existing model fields named 'status'.
     return (
-        NotificationDeliveryLog.objects.filter(notification__user=user)
-        .values('status')
-        .annotate(count=models.Count('id'))
-        .order_by('-count')
+        NotificationCounter.objects.filter(user=user, kind=NotificationCounter.TYPE, count__gt=0)
+        .order_by('key')
+        .values_list('key', flat=True)
     )
+
+def get_delivery_status(user):
+    # Returns a list of {'status': <status>, 'count': N}, most frequent first.
+    return [
+        {'status': status, 'count': count}
+        for status, count in NotificationCounter.objects.filter(
+            user=user, kind=NotificationCounter.DELIVERY, count__gt=0
+        ).order_by('-count', 'key').values_list('key', 'count')
+    ]
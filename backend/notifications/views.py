@@ -21,6 +21,7 @@ from .models import (
     NotificationGroup,
     NotificationActionResponse,
     NotificationDeliveryLog,
+    NotificationFanoutJob,
     UserPreferences,
 )
 from .serializers import (
@@ -31,8 +32,31 @@ from .serializers import (
     NotificationScheduleSerializer,
     NotificationGroupSerializer,
     NotificationActionResponseSerializer,
+    NotificationFanoutJobSerializer,
 )
-from notifications.tasks import send_notification_task
+from core.pagination import FlexiblePagination
+from notifications.fanout import start_fanout
+from notifications.inbox import DEFAULT_PAGE_SIZE, InvalidCursor, filter_inbox, get_inbox_page, invalidate_inbox
+from notifications.tasks import send_notification_batch_task
+from notifications.utils import get_unread_count
+
+
+def _queue_bulk_send(request):
+    """Start a fan-out job for a bulk_send request and return its id."""
+    users = request.data.get("users", [])
+    try:
+        user_ids = [int(u) for u in users]
+    except (TypeError, ValueError):
+        return Response({"error": "users must be a list of user ids."}, status=status.HTTP_400_BAD_REQUEST)
+    job = start_fanout(user_ids, {
+        "title": request.data.get("title"),
+        "message": request.data.get("message"),
+        "category": request.data.get("category", "general"),
+        "urgency": request.data.get("urgency", "info"),
+        "channels": request.data.get("channels", ["in_app"]),
+        "type": "bulk",
+    }, created_by=request.user)
+    return Response({"detail": "Bulk notifications queued.", "job_id": job.id}, status=status.HTTP_202_ACCEPTED)
 
 
 class UserPreferencesViewSet(viewsets.ModelViewSet):
@@ -68,19 +92,28 @@ class NotificationViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        user = self.request.user
-        cache_key = f"notifications_{user.id}"
-        qs = cache.get(cache_key)
-        if qs is None:
-            qs = Notification.objects.filter(user=user)
-            category = self.request.query_params.get("category")
-            unread = self.request.query_params.get("unread")
-            if category:
-                qs = qs.filter(category=category)
-            if unread == "1":
-                qs = qs.filter(is_read=False)
-            cache.set(cache_key, qs, 60)  # Cache for 60 seconds
-        return qs
+        params = self.request.query_params
+        return filter_inbox(
+            Notification.objects.filter(user=self.request.user),
+            category=params.get("category"),
+            unread=params.get("unread") == "1",
+        )
+
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        try:
+            page = get_inbox_page(
+                request.user,
+                Notification.objects.filter(user=request.user),
+                lambda rows: self.get_serializer(rows, many=True).data,
+                category=params.get("category"),
+                unread=params.get("unread") == "1",
+                cursor=params.get("cursor"),
+                page_size=params.get("page_size", DEFAULT_PAGE_SIZE),
+            )
+        except (InvalidCursor, ValueError):
+            return Response({"error": "Invalid cursor or page_size."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(page)
 
     @action(detail=True, methods=["post"])
     def mark_read(self, request, pk=None):
@@ -93,33 +126,24 @@ class NotificationViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=["get"])
     def unread_count(self, request):
-        user = request.user
-        count = Notification.objects.filter(user=user, is_read=False).count()
-        return Response({"unread_count": count})
+        return Response({"unread_count": get_unread_count(request.user)})
 
     @action(detail=False, methods=["post"])
     def bulk_send(self, request):
         # Admins only
         if not request.user.is_staff:
             return Response({"error": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
-        users = request.data.get("users", [])
-        title = request.data.get("title")
-        message = request.data.get("message")
-        category = request.data.get("category", "general")
-        urgency = request.data.get("urgency", "info")
-        channels = request.data.get("channels", ["in_app"])
-        for user_id in users:
-            Notification.objects.create(
-                user_id=user_id,
-                title=title,
-                message=message,
-                category=category,
-                urgency=urgency,
-                channels=channels,
-                type="bulk",
-                timestamp=timezone.now(),
-            )
-        return Response({"detail": "Bulk notifications sent."})
+        return _queue_bulk_send(request)
+
+    @action(detail=False, methods=["get"], url_path=r"bulk-jobs/(?P<job_id>\d+)")
+    def bulk_job(self, request, job_id=None):
+        if not request.user.is_staff:
+            return Response({"error": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            job = NotificationFanoutJob.objects.get(id=job_id)
+        except NotificationFanoutJob.DoesNotExist:
+            return Response({"error": "Job not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(NotificationFanoutJobSerializer(job).data)
 
     @action(detail=False, methods=["post"])
     def schedule(self, request):
@@ -221,6 +245,8 @@ class NotificationAuditLogViewSet(viewsets.ModelViewSet):
     queryset = NotificationAuditLog.objects.all()
     serializer_class = NotificationAuditLogSerializer
     permission_classes = [permissions.IsAdminUser]
+    pagination_class = FlexiblePagination
+    cursor_ordering = ('-timestamp', '-id')
 
 
 class NotificationAnalyticsViewSet(viewsets.ModelViewSet):
@@ -272,11 +298,11 @@ class NotificationAdminViewSet(viewsets.ModelViewSet):
         ids = request.data.get("ids", [])
         if action_name == "archive":
             Notification.objects.filter(id__in=ids).update(sent=True)
+            invalidate_inbox(*Notification.objects.filter(id__in=ids).values_list("user_id", flat=True).distinct())
         elif action_name == "delete":
             Notification.objects.filter(id__in=ids).delete()
         elif action_name == "send":
-            for nid in ids:
-                send_notification_task.delay(nid)
+            send_notification_batch_task.delay(list(ids))
         return Response({"detail": f"Bulk {action_name} completed."})
 
     def get_queryset(self):
@@ -310,19 +336,4 @@ class NotificationAdminViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=["post"])
     def bulk_send(self, request):
-        users = request.data.get("users", [])
-        title = request.data.get("title")
-        message = request.data.get("message")
-        category = request.data.get("category", "general")
-        urgency = request.data.get("urgency", "info")
-        channels = request.data.get("channels", ["in_app"])
-        for user_id in users:
-            Notification.objects.create(
-                user_id=user_id,
-                title=title,
-                message=message,
-                category=category,
-                urgency=urgency,
-                channels=channels,
-            )
-        return Response({"detail": "Bulk notifications sent."})
+        return _queue_bulk_send(request)
@@ -0,0 +1,291 @@
+"""Shared Safaricom Daraja (M-Pesa) client.
+
+One client per process keeps a pooled ``requests.Session`` to Daraja and
+caches the OAuth token both in process and in the default cache (Redis in
+production) until shortly before it expires, so workers share a token
+instead of fetching one per payment.
+
+Failures are contained two ways: transient errors are retried only while
+the retry budget allows (retries are capped at a fraction of recent
+requests), and after repeated failures a circuit breaker fails calls fast
+for a cool-down period instead of tying up request threads.
+"""
+import base64
+import hashlib
+import logging
+import threading
+import time
+from decimal import Decimal, ROUND_HALF_UP
+from zoneinfo import ZoneInfo
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+logger = logging.getLogger(__name__)
+
+BASE_URLS = {
+    'sandbox': 'https://sandbox.safaricom.co.ke',
+    'production': 'https://api.safaricom.co.ke',
+}
+# (connect, read) timeouts for every Daraja call
+TIMEOUT = (3.05, 15)
+# Refresh the token this many seconds before Daraja expires it
+TOKEN_EXPIRY_MARGIN = 60
+MAX_RETRIES = 2
+RETRY_BACKOFF = 0.2
+# Methods that are safe to send again after a timeout or server error
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+
+class DarajaError(Exception):
+    pass
+
+
+class CircuitOpenError(DarajaError):
+    pass
+
+
+def _never_sent(error):
+    """Whether ``error`` means no connection was made, so the request cannot have arrived."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.ConnectionError):
+        return False
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures for ``reset_timeout`` seconds.
+
+    Once the timeout passes a single trial call is let through (half-open);
+    its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """Allows retries up to ``ratio`` of the requests seen in the last ``window`` seconds.
+
+    ``min_retries`` keeps a trickle of retries available when traffic is low.
+    """
+
+    def __init__(self, ratio=0.2, window=10.0, min_retries=3):
+        self.ratio = ratio
+        self.window = window
+        self.min_retries = min_retries
+        self._requests = []
+        self._retries = []
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        cutoff = now - self.window
+        self._requests = [t for t in self._requests if t > cutoff]
+        self._retries = [t for t in self._retries if t > cutoff]
+
+    def record_request(self):
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            self._requests.append(now)
+
+    def try_spend(self):
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            if len(self._retries) >= max(self.min_retries, self.ratio * len(self._requests)):
+                return False
+            self._retries.append(now)
+            return True
+
+
+class DarajaClient:
+    def __init__(self, consumer_key, consumer_secret, shortcode, passkey, base_url,
+                 timeout=TIMEOUT, max_retries=MAX_RETRIES, breaker=None, budget=None):
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.shortcode = shortcode
+        self.passkey = passkey
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.budget = budget or RetryBudget()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=20)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._token = None
+        self._token_expires = 0.0
+        self._token_lock = threading.Lock()
+        digest = hashlib.sha256(f'{self.base_url}|{consumer_key}'.encode()).hexdigest()[:16]
+        self.token_cache_key = f'daraja:token:{digest}'
+
+    # --- Token handling ---
+
+    def get_token(self):
+        if self._token and time.monotonic() < self._token_expires:
+            return self._token
+        with self._token_lock:
+            if self._token and time.monotonic() < self._token_expires:
+                return self._token
+            cached = cache.get(self.token_cache_key)
+            if cached:
+                token, ttl = cached['token'], cached['expires_at'] - time.time()
+            else:
+                token, ttl = self._fetch_token()
+            self._token = token
+            self._token_expires = time.monotonic() + max(ttl, 0)
+            return token
+
+    def _fetch_token(self):
+        response = self._send(
+            'GET', '/oauth/v1/generate', params={'grant_type': 'client_credentials'},
+            auth=(self.consumer_key, self.consumer_secret),
+        )
+        if response.status_code == 401:
+            raise DarajaError('Daraja rejected the consumer key/secret.')
+        body = response.json()
+        token = body.get('access_token')
+        if not token:
+            raise DarajaError('Daraja did not return an access token.')
+        ttl = max(int(body.get('expires_in', 3599)) - TOKEN_EXPIRY_MARGIN, 1)
+        cache.set(self.token_cache_key, {'token': token, 'expires_at': time.time() + ttl}, ttl)
+        return token, ttl
+
+    def invalidate_token(self):
+        with self._token_lock:
+            self._token = None
+            self._token_expires = 0.0
+        cache.delete(self.token_cache_key)
+
+    # --- Transport ---
+
+    def _send(self, method, path, **kwargs):
+        """Send one request through the breaker, retrying transient failures within budget.
+
+        Only idempotent methods are retried after a timeout or a 5xx: a POST
+        (an STK push) may already have been accepted, and sending it again
+        would prompt the customer twice. A POST is retried only when the
+        connection could not be made, so the request never left.
+        """
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError('Daraja circuit is open; try again shortly.')
+            self.budget.record_request()
+            try:
+                response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            except requests.RequestException as e:
+                self.breaker.record_failure()
+                error = DarajaError(str(e))
+                retryable = _never_sent(e) or (idempotent and isinstance(e, (requests.ConnectionError, requests.Timeout)))
+            except BaseException:
+                # Whatever happens, a half-open trial must not stay running
+                self.breaker.record_failure()
+                raise
+            else:
+                if response.status_code < 500:
+                    self.breaker.record_success()
+                    if response.status_code >= 400 and response.status_code != 401:
+                        raise DarajaError(f'Daraja returned {response.status_code}: {response.text[:200]}')
+                    return response
+                self.breaker.record_failure()
+                error = DarajaError(f'Daraja returned {response.status_code}')
+                retryable = idempotent
+            if not retryable or attempt >= self.max_retries or not self.budget.try_spend():
+                raise error
+            attempt += 1
+            time.sleep(RETRY_BACKOFF * (2 ** (attempt - 1)))
+
+    def _authorized(self, method, path, **kwargs):
+        response = self._send(method, path, headers={'Authorization': f'Bearer {self.get_token()}'}, **kwargs)
+        if response.status_code == 401:
+            # Token revoked or expired early: fetch a fresh one once
+            self.invalidate_token()
+            response = self._send(method, path, headers={'Authorization': f'Bearer {self.get_token()}'}, **kwargs)
+            if response.status_code == 401:
+                raise DarajaError('Daraja rejected the access token.')
+        return response
+
+    # --- API calls ---
+
+    def stk_push(self, phone, amount, reference, callback_url, description=''):
+        """Send an STK push; returns ``(request_payload, response_json, status_code)``."""
+        timestamp = timezone.now().astimezone(ZoneInfo('Africa/Nairobi')).strftime('%Y%m%d%H%M%S')
+        password = base64.b64encode(f'{self.shortcode}{self.passkey}{timestamp}'.encode()).decode()
+        payload = {
+            'BusinessShortCode': self.shortcode,
+            'Password': password,
+            'Timestamp': timestamp,
+            'TransactionType': 'CustomerPayBillOnline',
+            'Amount': int(Decimal(str(amount)).quantize(Decimal('1'), rounding=ROUND_HALF_UP)),
+            'PartyA': phone,
+            'PartyB': self.shortcode,
+            'PhoneNumber': phone,
+            'CallBackURL': callback_url,
+            'AccountReference': reference,
+            'TransactionDesc': description or f'Uzuri payment: {reference}',
+        }
+        response = self._authorized('POST', '/mpesa/stkpush/v1/processrequest', json=payload)
+        try:
+            body = response.json()
+        except ValueError:
+            body = {'status': 'invalid-json'}
+        return payload, body, response.status_code
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_daraja_client():
+    """Return the process-wide client for the configured credentials, or None if unconfigured."""
+    key = getattr(settings, 'MPESA_CONSUMER_KEY', '')
+    secret = getattr(settings, 'MPESA_CONSUMER_SECRET', '')
+    shortcode = getattr(settings, 'MPESA_SHORTCODE', '')
+    passkey = getattr(settings, 'MPESA_PASSKEY', '')
+    if not (key and secret and shortcode and passkey):
+        return None
+    env = getattr(settings, 'MPESA_ENV', 'sandbox')
+    base_url = getattr(settings, 'MPESA_BASE_URL', '') or BASE_URLS.get(env, BASE_URLS['sandbox'])
+    config = (key, secret, shortcode, passkey, base_url)
+    with _clients_lock:
+        client = _clients.get(config)
+        if client is None:
+            client = _clients[config] = DarajaClient(key, secret, shortcode, passkey, base_url)
+        return client
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_paymentcallback'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='paymentaudittrail',
+            index=models.Index(fields=['timestamp', 'id'], name='payaudit_ts_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentintegrationlog',
+            index=models.Index(fields=['created_at', 'id'], name='payintlog_created_id_idx'),
+        ),
+    ]
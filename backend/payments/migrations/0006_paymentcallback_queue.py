@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0005_paymentaudittrail_payaudit_ts_id_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentcallback',
+            name='error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='paymentcallback',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='paymentcallback',
+            name='reference',
+            field=models.CharField(blank=True, max_length=128),
+        ),
+        migrations.AddField(
+            model_name='paymentcallback',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processed', 'Processed'), ('unmatched', 'No matching payment'), ('failed', 'Failed')], default='processed', max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='paymentcallback',
+            index=models.Index(fields=['status', 'id'], name='paycallback_status_id_idx'),
+        ),
+    ]
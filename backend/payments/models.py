@@ -96,6 +96,10 @@ class PaymentAuditTrail(models.Model):
     actor = models.ForeignKey('core.CustomUser', on_delete=models.SET_NULL, null=True, blank=True)
     details = models.TextField(blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['timestamp', 'id'], name='payaudit_ts_id_idx')]
+
     def __str__(self):
         return f"{self.action} by {self.actor} on {self.payment} at {self.timestamp}"
 
@@ -154,17 +158,38 @@ class PaymentIntegrationLog(models.Model):
 	response_payload = models.JSONField(default=dict, blank=True)
 	status_code = models.CharField(max_length=16, blank=True)
 	created_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		indexes = [models.Index(fields=['created_at', 'id'], name='payintlog_created_id_idx')]
+
 	def __str__(self):
 		return f"IntegrationLog for {self.payment}"
 
 
 class PaymentCallback(models.Model):
-	"""Record provider callback IDs to ensure idempotent processing of webhooks."""
+	"""Record provider callback IDs to ensure idempotent processing of webhooks.
+
+	Webhooks are stored here as received (status ``pending``) and applied to
+	their Payment by ``payments.webhooks.process_callbacks``.
+	"""
+	STATUS_CHOICES = [
+		("pending", "Pending"),
+		("processed", "Processed"),
+		("unmatched", "No matching payment"),
+		("failed", "Failed"),
+	]
 	provider = models.CharField(max_length=64)
 	callback_id = models.CharField(max_length=128, unique=True)
+	reference = models.CharField(max_length=128, blank=True)
 	payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, null=True, blank=True)
 	payload = models.JSONField(default=dict, blank=True)
+	status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="processed")
+	error = models.TextField(blank=True)
 	created_at = models.DateTimeField(auto_now_add=True)
+	processed_at = models.DateTimeField(null=True, blank=True)
+
+	class Meta:
+		indexes = [models.Index(fields=['status', 'id'], name='paycallback_status_id_idx')]
 
 	def __str__(self):
 		return f"{self.provider} callback {self.callback_id} for {self.payment}" 
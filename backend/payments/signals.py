@@ -0,0 +1,12 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Payment
+from .webhooks import queue_processing, requeue_unmatched
+
+
+@receiver(post_save, sender=Payment)
+def match_early_callbacks(sender, instance, created, raw=False, **kwargs):
+    """Apply callbacks that arrived before this payment was created."""
+    if created and not raw and instance.reference and requeue_unmatched([instance.reference]):
+    	queue_processing()
@@ -0,0 +1,75 @@
+"""Fee statements built from a user's payments.
+
+Rendered PDFs are stored as ``statements/<user>/fee-statement-<stamp>.pdf``
+where the stamp combines the newest ``updated_at`` and the payment count,
+so any payment change (or a deletion) produces a new file and the old one
+is cleaned up.
+"""
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from fees.statements import StatementRenderer, get_or_render, stream_rows
+from .models import Payment
+
+# Above this many payments the statement is prepared in the background
+SYNC_ROW_LIMIT = 2000
+PREPARING_TTL = 60 * 10
+
+COLUMNS = [('Date', 80), ('Reference', 200), ('Amount', 90), ('Currency', 50), ('Status', 95)]
+
+
+def statement_state(user):
+    """Return ``(storage name, payment count)`` for the user's current statement."""
+    state = Payment.objects.filter(user=user).aggregate(last=Max('updated_at'), count=Count('id'))
+    stamp = f"{int(state['last'].timestamp() * 1_000_000) if state['last'] else 0}-{state['count']}"
+    return f'statements/{user.id}/fee-statement-{stamp}.pdf', state['count']
+
+
+def _preparing_key(name):
+    return f'fee_statement:preparing:{name}'
+
+
+def render_fee_statement(user, fileobj):
+    renderer = StatementRenderer(fileobj, f"Fee Statement for {user.email}")
+    rows = (
+        (created.date(), reference, amount, currency, status)
+        for created, reference, amount, currency, status in stream_rows(
+            Payment.objects.filter(user=user)
+            .order_by('created_at', 'id')
+            .values_list('created_at', 'reference', 'amount', 'currency', 'status')
+        )
+    )
+    renderer.section("Payments", COLUMNS, rows)
+    renderer.finish()
+
+
+def build_fee_statement(user):
+    """Render (or reuse) the user's statement and return its storage name."""
+    name, _ = statement_state(user)
+    try:
+        return get_or_render(
+            name,
+            lambda fileobj: render_fee_statement(user, fileobj),
+            keep_prefix=f'statements/{user.id}/fee-statement-',
+        )
+    finally:
+        cache.delete(_preparing_key(name))
+
+
+def prepare_fee_statement(user):
+    """Queue a background render unless the statement is ready or already queued.
+
+    Returns ``(status, storage name)`` with status ``ready``, ``preparing``
+    or ``queued``.
+    """
+    from django.core.files.storage import default_storage
+    from django.db import transaction
+    from .tasks import prepare_fee_statement_task
+
+    name, _ = statement_state(user)
+    if default_storage.exists(name):
+        return 'ready', name
+    if not cache.add(_preparing_key(name), True, PREPARING_TTL):
+        return 'preparing', name
+    transaction.on_commit(lambda: prepare_fee_statement_task.delay(user.id))
+    return 'queued', name
@@ -0,0 +1,20 @@
+from celery import shared_task
+
+from .webhooks import drain_callbacks, requeue_unmatched
+
+
+@shared_task
+def process_payment_callbacks_task():
+    """Apply every pending M-Pesa/Airtel callback, one locked batch at a time."""
+    # Callbacks that came in before their payment are retried here, since
+    # the provider got its 200 and will not send them again
+    requeue_unmatched()
+    return drain_callbacks()
+
+
+@shared_task
+def prepare_fee_statement_task(user_id):
+    """Render a large fee statement to storage ahead of download."""
+    from core.models import CustomUser
+    from .statements import build_fee_statement
+    return build_fee_statement(CustomUser.objects.get(id=user_id))
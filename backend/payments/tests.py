@@ -317,3 +317,310 @@ class PaymentAPITest(TestCase):
 		# Simulate non-dict (string) payload - should return 400
 		resp = self.client.post(url, 'not-a-json', content_type='application/json')
 		self.assertIn(resp.status_code, [400, 415])
+
+
+class PaymentWebhookQueueTest(TestCase):
+	def setUp(self):
+		self.client = APIClient()
+		self.user = CustomUser.objects.create_user(email="queue@example.com", password="testpass123")
+		self.payments = [
+			Payment.objects.create(user=self.user, amount=500, currency='KES', status='processing', reference=f'QREF{i}')
+			for i in range(2)
+		]
+
+	def _stk(self, reference, checkout_id, result_code=0):
+		return {'Body': {'stkCallback': {
+			'CheckoutRequestID': checkout_id,
+			'ResultCode': result_code,
+			'CallbackMetadata': {'Item': [
+				{'Name': 'Amount', 'Value': 500},
+				{'Name': 'MpesaReceiptNumber', 'Value': f'R-{checkout_id}'},
+				{'Name': 'AccountReference', 'Value': reference},
+			]},
+		}}}
+
+	def test_callbacks_are_stored_then_applied_in_batch(self):
+		from django.test import override_settings
+		from notifications.models import Notification
+		from .models import PaymentCallback, PaymentIntegrationLog
+		from .tasks import process_payment_callbacks_task
+		url = reverse('mpesa-callback')
+		with override_settings(PAYMENT_WEBHOOK_ASYNC=True), self.captureOnCommitCallbacks(execute=False) as queued:
+			first = self.client.post(url, self._stk('QREF0', 'C0'), format='json')
+			self.client.post(url, self._stk('QREF1', 'C1'), format='json')
+			duplicate = self.client.post(url, self._stk('QREF0', 'C0'), format='json')
+			unknown = self.client.post(url, self._stk('NOPE', 'C2'), format='json')
+		self.assertEqual(first.status_code, status.HTTP_200_OK)
+		self.assertIn('already processed', duplicate.data['detail'].lower())
+		self.assertEqual(unknown.status_code, status.HTTP_200_OK)
+		self.assertEqual(len(queued), 3)
+		self.assertEqual(PaymentCallback.objects.filter(status='pending').count(), 3)
+		self.assertFalse(Payment.objects.filter(status='successful').exists())
+
+		self.assertEqual(process_payment_callbacks_task(), 3)
+		self.assertEqual(Payment.objects.filter(status='successful', is_verified=True).count(), 2)
+		self.assertEqual(PaymentIntegrationLog.objects.count(), 2)
+		self.assertEqual(Notification.objects.filter(user=self.user, type='payment_update').count(), 2)
+		self.assertEqual(
+			dict(PaymentCallback.objects.values_list('callback_id', 'status')),
+			{'C0': 'processed', 'C1': 'processed', 'C2': 'unmatched'},
+		)
+
+
+	def test_callback_before_its_payment_is_applied_later(self):
+		from datetime import timedelta
+		from django.test import override_settings
+		from django.utils import timezone
+		from .models import PaymentCallback
+		from .tasks import process_payment_callbacks_task
+		url = reverse('mpesa-callback')
+		with override_settings(PAYMENT_WEBHOOK_ASYNC=True), self.captureOnCommitCallbacks(execute=False):
+			early = self.client.post(url, self._stk('LATE1', 'C10'), format='json')
+			self.client.post(url, self._stk('LATE2', 'C11'), format='json')
+			self.client.post(url, self._stk('LATE3', 'C12'), format='json')
+		self.assertEqual(early.status_code, status.HTTP_200_OK)
+		self.assertEqual(process_payment_callbacks_task(), 3)
+		self.assertEqual(PaymentCallback.objects.filter(status='unmatched').count(), 3)
+		PaymentCallback.objects.filter(callback_id='C12').update(created_at=timezone.now() - timedelta(days=30))
+
+		# Creating the payment queues its callback straight away
+		with self.captureOnCommitCallbacks(execute=False) as queued:
+			Payment.objects.create(user=self.user, amount=500, currency='KES', reference='LATE1', status='pending')
+		self.assertEqual(len(queued), 1)
+		# Rows written without signals are caught by the periodic run; old callbacks are left alone
+		Payment.objects.bulk_create([
+			Payment(user=self.user, amount=500, currency='KES', reference=ref, status='pending')
+			for ref in ('LATE2', 'LATE3')
+		])
+		self.assertEqual(process_payment_callbacks_task(), 2)
+		self.assertEqual(
+			dict(PaymentCallback.objects.values_list('callback_id', 'status')),
+			{'C10': 'processed', 'C11': 'processed', 'C12': 'unmatched'},
+		)
+		self.assertEqual(Payment.objects.get(reference='LATE1').status, 'successful')
+
+class FakeDaraja:
+	"""Minimal local Daraja server: OAuth token and STK push endpoints."""
+
+	def __init__(self, stk_status=200):
+		import json
+		import threading
+		from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+		fake = self
+		self.calls = []
+		self.stk_status = stk_status
+
+		class Handler(BaseHTTPRequestHandler):
+			protocol_version = 'HTTP/1.1'
+
+			def _reply(self, code, body):
+				data = json.dumps(body).encode()
+				self.send_response(code)
+				self.send_header('Content-Type', 'application/json')
+				self.send_header('Content-Length', str(len(data)))
+				self.end_headers()
+				self.wfile.write(data)
+
+			def do_GET(self):
+				fake.calls.append(('token', self.client_address[1]))
+				self._reply(200, {'access_token': f'token-{len(fake.calls)}', 'expires_in': '3599'})
+
+			def do_POST(self):
+				body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+				fake.calls.append(('stk', self.client_address[1]))
+				self._reply(fake.stk_status, {'CheckoutRequestID': f"ws_{body['AccountReference']}", 'ResponseCode': '0'})
+
+			def log_message(self, *args):
+				pass
+
+		self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+		threading.Thread(target=self.server.serve_forever, daemon=True).start()
+		self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+	def count(self, kind):
+		return sum(1 for call, _ in self.calls if call == kind)
+
+	def settings(self):
+		from django.test import override_settings
+		return override_settings(
+			MPESA_CONSUMER_KEY='key', MPESA_CONSUMER_SECRET='secret', MPESA_SHORTCODE='174379',
+			MPESA_PASSKEY='passkey', MPESA_BASE_URL=self.url, MPESA_CALLBACK_URL='https://example.com/cb/',
+		)
+
+	def close(self):
+		self.server.shutdown()
+		self.server.server_close()
+
+
+class DarajaClientTest(TestCase):
+	def setUp(self):
+		from django.core.cache import cache
+		cache.clear()
+		self.client = APIClient()
+		self.user = CustomUser.objects.create_user(email="daraja@example.com", password="testpass123")
+		self.client.force_authenticate(user=self.user)
+		self.daraja = FakeDaraja()
+		self.addCleanup(self.daraja.close)
+
+	def test_token_is_cached_and_connections_reused(self):
+		from .models import PaymentIntegrationLog
+		url = reverse('mpesa-initiate')
+		with self.daraja.settings():
+			for _ in range(3):
+				response = self.client.post(url, {'amount': 150, 'phone': '254700000000'}, format='json')
+				self.assertEqual(response.status_code, status.HTTP_200_OK)
+				self.assertEqual(response.data['response']['CheckoutRequestID'], f"ws_{response.data['reference']}")
+		self.assertEqual(self.daraja.count('token'), 1)
+		self.assertEqual(self.daraja.count('stk'), 3)
+		# Keep-alive: every request arrived over the same client socket
+		self.assertEqual(len({port for _, port in self.daraja.calls}), 1)
+		self.assertEqual(PaymentIntegrationLog.objects.filter(payment__user=self.user, status_code='200').count(), 3)
+
+	def test_fees_pay_uses_shared_client(self):
+		from fees.models import Invoice, Transaction
+		invoice = Invoice.objects.create(student=self.user, amount=1000, due_date='2025-10-01', status='unpaid')
+		with self.daraja.settings(), self.captureOnCommitCallbacks(execute=False):
+			response = self.client.post('/api/fees/transactions/pay/', {
+				'invoice_id': invoice.id, 'amount': 1000, 'method': 'mpesa', 'phone': '254700000000', 'reference': 'FEE-1',
+			}, format='json')
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data['gateway']['CheckoutRequestID'], 'ws_FEE-1')
+		self.assertTrue(Transaction.objects.filter(reference='FEE-1', status='pending').exists())
+
+	def test_failures_open_the_circuit(self):
+		from unittest.mock import patch
+		from .daraja import CircuitBreaker, CircuitOpenError, DarajaClient, DarajaError
+		self.daraja.stk_status = 503
+		client = DarajaClient('key', 'secret', '174379', 'passkey', self.daraja.url, breaker=CircuitBreaker(failure_threshold=3))
+		with patch('payments.daraja.RETRY_BACKOFF', 0):
+			for i in range(3):
+				with self.assertRaises(DarajaError):
+					client.stk_push('254700000000', 10, f'R{i}', 'https://example.com/cb/')
+			calls = len(self.daraja.calls)
+			with self.assertRaises(CircuitOpenError):
+				client.stk_push('254700000000', 10, 'R3', 'https://example.com/cb/')
+		# 1 token + one attempt per push (a 5xx push is never resent), then fail fast
+		self.assertEqual(calls, 4)
+		self.assertEqual(len(self.daraja.calls), calls)
+
+	def test_only_unsent_posts_are_retried(self):
+		from unittest.mock import Mock, patch
+		import requests
+		from urllib3.exceptions import NewConnectionError
+		from .daraja import CircuitBreaker, DarajaClient, DarajaError
+		client = DarajaClient('key', 'secret', '174379', 'passkey', self.daraja.url, breaker=CircuitBreaker(failure_threshold=10))
+		ok = Mock(status_code=200)
+		refused = requests.ConnectionError(Mock(reason=NewConnectionError(None, 'refused')))
+		with patch('payments.daraja.RETRY_BACKOFF', 0):
+			with patch.object(client.session, 'request', side_effect=[requests.ReadTimeout(), ok]) as request:
+				with self.assertRaises(DarajaError):
+					client._send('POST', '/mpesa/stkpush/v1/processrequest')
+				self.assertEqual(request.call_count, 1)
+			with patch.object(client.session, 'request', side_effect=[refused, ok]) as request:
+				self.assertIs(client._send('POST', '/mpesa/stkpush/v1/processrequest'), ok)
+				self.assertEqual(request.call_count, 2)
+			with patch.object(client.session, 'request', side_effect=[requests.ReadTimeout(), ok]) as request:
+				self.assertIs(client._send('GET', '/oauth/v1/generate'), ok)
+				self.assertEqual(request.call_count, 2)
+
+	def test_unexpected_error_ends_the_half_open_trial(self):
+		from unittest.mock import patch
+		from .daraja import CircuitBreaker, DarajaClient
+		breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+		breaker.record_failure()
+		client = DarajaClient('key', 'secret', '174379', 'passkey', self.daraja.url, breaker=breaker)
+		with patch.object(client.session, 'request', side_effect=ValueError('bad header')):
+			with self.assertRaises(ValueError):
+				client._send('GET', '/oauth/v1/generate')
+		self.assertTrue(breaker.allow())
+
+class FeeStatementTest(TestCase):
+	def setUp(self):
+		import shutil
+		import tempfile
+		from django.test import override_settings
+		media_root = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+		settings_override = override_settings(MEDIA_ROOT=media_root)
+		settings_override.enable()
+		self.addCleanup(settings_override.disable)
+		self.client = APIClient()
+		self.user = CustomUser.objects.create_user(email="statement@example.com", password="testpass123")
+		self.client.force_authenticate(user=self.user)
+		Payment.objects.bulk_create([
+			Payment(user=self.user, amount=100 + i, currency='KES', status='successful', reference=f'STMT{i}')
+			for i in range(120)
+		])
+
+	def _download(self):
+		response = self.client.get('/api/payments/payments/fee-statement/')
+		self.assertEqual(response.status_code, 200)
+		return b''.join(response.streaming_content)
+
+	def test_statement_is_paginated_and_cached_until_payments_change(self):
+		from django.core.files.storage import default_storage
+		from unittest import mock
+		from .statements import statement_state
+
+		pdf = self._download()
+		self.assertTrue(pdf.startswith(b'%PDF'))
+		self.assertGreaterEqual(pdf.count(b'/Type /Page\n') + pdf.count(b'/Type /Page\r'), 3)
+		first_name, count = statement_state(self.user)
+		self.assertEqual(count, 120)
+		self.assertTrue(default_storage.exists(first_name))
+
+		with mock.patch('payments.statements.render_fee_statement') as render:
+			self.assertEqual(self._download(), pdf)
+		render.assert_not_called()
+
+		Payment.objects.create(user=self.user, amount=5, currency='KES', status='pending', reference='STMTNEW')
+		self._download()
+		second_name, _ = statement_state(self.user)
+		self.assertNotEqual(second_name, first_name)
+		self.assertTrue(default_storage.exists(second_name))
+		self.assertFalse(default_storage.exists(first_name))
+
+	def test_concurrent_renders_keep_each_others_files(self):
+		from django.core.files.base import ContentFile
+		from django.core.files.storage import default_storage
+		from fees.statements import get_or_render
+		prefix = f'statements/{self.user.id}/fee-statement-'
+		old = default_storage.save(f'{prefix}1-1.pdf', ContentFile(b'old'))
+
+		def render(fileobj):
+			# Another worker finishes its render while this one is running
+			default_storage.save(f'{prefix}3-3.pdf', ContentFile(b'newer'))
+			default_storage.save(f'{prefix}2-2.pdf', ContentFile(b'same'))
+			fileobj.write(b'mine')
+
+		self.assertEqual(get_or_render(f'{prefix}2-2.pdf', render, keep_prefix=prefix), f'{prefix}2-2.pdf')
+		self.assertFalse(default_storage.exists(old))
+		self.assertTrue(default_storage.exists(f'{prefix}3-3.pdf'))
+		with default_storage.open(f'{prefix}2-2.pdf') as fileobj:
+			self.assertEqual(fileobj.read(), b'same')
+		self.assertEqual(sorted(default_storage.listdir(f'statements/{self.user.id}')[1]), ['fee-statement-2-2.pdf', 'fee-statement-3-3.pdf'])
+
+	def test_large_statement_is_prepared_in_background(self):
+		from unittest import mock
+		from .tasks import prepare_fee_statement_task
+
+		with mock.patch('payments.views.SYNC_ROW_LIMIT', 50), self.captureOnCommitCallbacks(execute=False) as callbacks:
+			response = self.client.get('/api/payments/payments/fee-statement/')
+		self.assertEqual(response.status_code, 202)
+		self.assertEqual(len(callbacks), 1)
+
+		with self.captureOnCommitCallbacks(execute=False) as again:
+			response = self.client.post('/api/payments/payments/fee-statement/prepare/')
+		self.assertEqual(response.data['status'], 'preparing')
+		self.assertEqual(again, [])
+
+		prepare_fee_statement_task(self.user.id)
+		response = self.client.get('/api/payments/payments/fee-statement/prepare/')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.data['status'], 'ready')
+		self.assertTrue(response.data['url'].endswith('/payments/payments/fee-statement/'))
+		download = self.client.get(response.data['url'])
+		self.assertEqual(download.status_code, 200)
+		self.assertTrue(b''.join(download.streaming_content).startswith(b'%PDF'))
+		self.client.force_authenticate(user=None)
+		self.assertEqual(self.client.get(response.data['url']).status_code, 401)
@@ -3,18 +3,21 @@ from django.db import models as dj_models
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.http import FileResponse
-import io
-from reportlab.pdfgen import canvas
+from django.core.files.storage import default_storage
 from .models import (
     PaymentMethod, PaymentGateway, Payment, PaymentReceipt, PaymentAuditTrail, Refund,
     PaymentNotification, PaymentReversal, PaymentDispute, PaymentSchedule, PaymentIntegrationLog,
     PaymentComment, PaymentAttachment
 )
 from . import serializers
+from .daraja import DarajaError, get_daraja_client
+from .statements import SYNC_ROW_LIMIT, build_fee_statement, prepare_fee_statement, statement_state
+from core.pagination import FlexiblePagination
 from notifications.models import Notification
-from notifications.utils import get_unread_count, get_notification_types, get_delivery_status
+from notifications.summary import get_notification_summary
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
+import logging
 import uuid
 import os
 import json
@@ -28,34 +31,7 @@ try:
 except Exception:
     stripe = None
 
-def _mpesa_get_token(mpesa_env, key, secret, timeout=10):
-    auth_url = 'https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials' if mpesa_env == 'sandbox' else 'https://api.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials'
-    r = requests.get(auth_url, auth=(key, secret), timeout=timeout)
-    if r is not None and r.status_code == 200:
-        return r.json().get('access_token')
-    return None
-
-def _mpesa_stk_push(mpesa_env, shortcode, passkey, amount, phone, reference, callback_url, token, timeout=10):
-    from datetime import datetime
-    timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-    password = base64.b64encode(f"{shortcode}{passkey}{timestamp}".encode()).decode()
-    stk_url = 'https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest' if mpesa_env == 'sandbox' else 'https://api.safaricom.co.ke/mpesa/stkpush/v1/processrequest'
-    payload = {
-        'BusinessShortCode': shortcode,
-        'Password': password,
-        'Timestamp': timestamp,
-        'TransactionType': 'CustomerPayBillOnline',
-        'Amount': str(amount),
-        'PartyA': phone,
-        'PartyB': shortcode,
-        'PhoneNumber': phone,
-        'CallBackURL': callback_url,
-        'AccountReference': reference,
-        'TransactionDesc': f'Uzuri payment: {reference}'
-    }
-    headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'} if token else {'Content-Type': 'application/json'}
-    r = requests.post(stk_url, json=payload, headers=headers, timeout=timeout)
-    return r, payload
+logger = logging.getLogger(__name__)
 
 class PaymentMethodViewSet(viewsets.ModelViewSet):
     queryset = PaymentMethod.objects.all()
@@ -98,35 +74,36 @@ class PaymentViewSet(viewsets.ModelViewSet):
         history = Payment.objects.filter(user=user).order_by("-created_at")[:10]
         # Next due payment: earliest pending payment
         next_due = Payment.objects.filter(user=user, status="pending").order_by("created_at").first()
-        notifications = Notification.objects.filter(user=user).order_by('-created_at')
-        unread_count = get_unread_count(user)
-        notification_types = get_notification_types(user)
-        delivery_status = get_delivery_status(user)
         return Response({
             "outstanding_balance": outstanding,
             "payment_history": serializers.PaymentSerializer(history, many=True).data,
             "next_due": serializers.PaymentSerializer(next_due).data if next_due else None,
-            "notifications": notifications,
-            "unread_notification_count": unread_count,
-            "notification_types": notification_types,
-            "notification_delivery_status": delivery_status,
+            **get_notification_summary(user, request),
         })
 
     @action(detail=False, methods=["get"], url_path="fee-statement")
     def fee_statement(self, request):
-        user = request.user
-        payments = Payment.objects.filter(user=user)
-        buffer = io.BytesIO()
-        p = canvas.Canvas(buffer)
-        p.drawString(100, 800, f"Fee Statement for {user.email}")
-        y = 780
-        for payment in payments:
-            p.drawString(100, y, f"{payment.created_at.date()} - {payment.reference} - {payment.amount} {payment.currency} - {payment.status}")
-            y -= 20
-        p.showPage()
-        p.save()
-        buffer.seek(0)
-        return FileResponse(buffer, as_attachment=True, filename="fee_statement.pdf")
+        name, count = statement_state(request.user)
+        if count > SYNC_ROW_LIMIT and not default_storage.exists(name):
+            # Too large to render inside the request
+            state, _ = prepare_fee_statement(request.user)
+            return Response({"status": state, "detail": "Statement is being prepared; poll fee-statement/prepare."}, status=202)
+        name = build_fee_statement(request.user)
+        return FileResponse(default_storage.open(name, "rb"), as_attachment=True, filename="fee_statement.pdf")
+
+    @action(detail=False, methods=["get", "post"], url_path="fee-statement/prepare")
+    def prepare_fee_statement(self, request):
+        """POST queues a background render; GET reports whether it is ready."""
+        if request.method == "POST":
+            state, name = prepare_fee_statement(request.user)
+        else:
+            name, _ = statement_state(request.user)
+            state = "ready" if default_storage.exists(name) else "pending"
+        body = {"status": state}
+        if state == "ready":
+            # Storage URLs are public; the download stays behind authentication
+            body["url"] = self.reverse_action("fee-statement")
+        return Response(body, status=200 if state == "ready" else 202)
 
     def perform_create(self, serializer):
         payment = serializer.save()
@@ -251,6 +228,8 @@ class PaymentAuditTrailViewSet(viewsets.ModelViewSet):
     queryset = PaymentAuditTrail.objects.all()
     serializer_class = serializers.PaymentAuditTrailSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = FlexiblePagination
+    cursor_ordering = ('-timestamp', '-id')
 
 class RefundViewSet(viewsets.ModelViewSet):
     queryset = Refund.objects.all()
@@ -281,6 +260,8 @@ class PaymentIntegrationLogViewSet(viewsets.ModelViewSet):
     queryset = PaymentIntegrationLog.objects.all()
     serializer_class = serializers.PaymentIntegrationLogSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = FlexiblePagination
+    cursor_ordering = ('-created_at', '-id')
 
 class PaymentCommentViewSet(viewsets.ModelViewSet):
     queryset = PaymentComment.objects.all()
@@ -370,42 +351,27 @@ def mpesa_initiate(request):
         reference=reference,
         description=f'M-Pesa payment initiated for {phone}',
     )
-    # Try real Daraja integration if credentials provided
-    mpesa_env = getattr(settings, 'MPESA_ENV', 'sandbox')
-    mpesa_key = getattr(settings, 'MPESA_CONSUMER_KEY', '')
-    mpesa_secret = getattr(settings, 'MPESA_CONSUMER_SECRET', '')
-    shortcode = getattr(settings, 'MPESA_SHORTCODE', '')
-    passkey = getattr(settings, 'MPESA_PASSKEY', '')
+    # Use the real Daraja integration if credentials are configured
+    client = get_daraja_client()
     callback = getattr(settings, 'MPESA_CALLBACK_URL', '') or request.build_absolute_uri('/api/v1/payments/mpesa/callback/')
-
-    if mpesa_key and mpesa_secret and shortcode and passkey:
+    if client is not None:
         try:
-            token = _mpesa_get_token(mpesa_env, mpesa_key, mpesa_secret)
-            r, payload = _mpesa_stk_push(mpesa_env, shortcode, passkey, amount, phone, reference, callback, token)
-            resp_json = None
-            status_code = '0'
-            try:
-                if r is not None and r.content:
-                    resp_json = r.json()
-                status_code = str(r.status_code) if r is not None else '0'
-            except Exception:
-                resp_json = {'status': 'invalid-json'}
-
+            payload, resp_json, status_code = client.stk_push(phone, amount, reference, callback)
             try:
                 PaymentIntegrationLog.objects.create(
                     payment=payment,
                     gateway=payment.gateway,
                     request_payload=payload,
                     response_payload=resp_json or {},
-                    status_code=status_code
+                    status_code=str(status_code)
                 )
             except Exception:
                 pass
 
             return Response({'detail': 'MPESA STK push initiated', 'reference': reference, 'response': resp_json or {}}, status=200)
-        except Exception:
+        except DarajaError:
             # fall through to simulated fallback logging
-            pass
+            logger.warning("Daraja STK push failed for %s", reference, exc_info=True)
 
     try:
         PaymentIntegrationLog.objects.create(
@@ -499,110 +465,41 @@ def airtel_initiate(request):
     return Response({'detail': 'Airtel STK push initiated (simulated)', 'reference': reference}, status=200)
 
 
-@api_view(['POST'])
-@permission_classes([AllowAny])
-def airtel_callback(request):
-    """Handle Airtel Money STK push webhook/callback.
-    Similar parsing to mpesa_callback but more generic for provider payloads.
-    """
-    expected = getattr(settings, 'AIRTEL_WEBHOOK_SECRET', '')
+def _handle_provider_callback(request, provider, secret_setting):
+    """Verify, store and (unless queued) apply a provider payment callback."""
+    from .webhooks import PARSERS, DuplicateCallback, ingest_callback, process_callbacks, queue_processing, webhook_async
+    expected = getattr(settings, secret_setting, '')
     if expected:
         secret = request.headers.get('X-Webhook-Secret') or request.META.get('HTTP_X_WEBHOOK_SECRET')
         if not secret or secret != expected:
             return Response({'detail': 'Invalid webhook secret.'}, status=403)
 
     payload = request.data
-    reference = None
-    receipt = None
-    amount = None
-    status_val = 'failed'
-    try:
-        # Provider-specific structure may vary; attempt to extract common fields
-        if isinstance(payload, dict):
-            reference = payload.get('account_reference') or payload.get('reference') or payload.get('AccountReference')
-            receipt = payload.get('receipt') or payload.get('transaction_id') or payload.get('AirtelReceipt')
-            amount = payload.get('amount') or payload.get('Amount')
-            status_val = 'successful' if payload.get('status') in ('success', 'successful', '0') else payload.get('status', 'failed')
-    except Exception:
-        pass
-
-    from .models import Payment, PaymentIntegrationLog, PaymentCallback
-    if not reference:
+    parsed = PARSERS[provider](payload)
+    if not parsed['reference']:
         return Response({'detail': 'reference not found in callback payload.'}, status=400)
-    payment = Payment.objects.filter(reference=reference).first()
     try:
-        PaymentIntegrationLog.objects.create(
-            payment=payment,
-            gateway=payment.gateway if payment else None,
-            request_payload=payload,
-            response_payload={'handled': True},
-            status_code=str(payload.get('status', '')) if isinstance(payload, dict) else ''
-        )
-    except Exception:
-        pass
-
-    if not payment:
+        callback = ingest_callback(provider, payload, parsed)
+    except DuplicateCallback:
+        return Response({'detail': 'Callback already processed.'}, status=200)
+
+    if webhook_async():
+        queue_processing()
+        return Response({'detail': 'Callback received.'}, status=200)
+    process_callbacks([callback.id])
+    callback.refresh_from_db(fields=['status'])
+    if callback.status == 'unmatched':
         return Response({'detail': 'Payment not found for reference.'}, status=404)
+    return Response({'detail': 'Payment updated.'}, status=200)
 
-    # Idempotency: attempt to extract a provider callback id to avoid double-processing
-    callback_id = None
-    try:
-        if isinstance(payload, dict):
-            callback_id = payload.get('callback_id') or payload.get('transaction_id') or payload.get('AirtelReceipt')
-    except Exception:
-        callback_id = None
 
-    if callback_id:
-        # Use a retry loop to handle rare IntegrityError races across processes
-        try:
-            from django.db import transaction, IntegrityError
-            import time
-            max_attempts = 3
-            for attempt in range(max_attempts):
-                try:
-                    with transaction.atomic():
-                        cb_obj, created = PaymentCallback.objects.get_or_create(
-                            callback_id=callback_id,
-                            defaults={'provider': 'airtel', 'payment': payment, 'payload': payload}
-                        )
-                        if not created:
-                            return Response({'detail': 'Callback already processed.'}, status=200)
-                        break
-                except IntegrityError:
-                    # possible concurrent insert, retry briefly
-                    if attempt < max_attempts - 1:
-                        time.sleep(0.1 * (attempt + 1))
-                        continue
-                    else:
-                        # final attempt failed, fallthrough (best-effort)
-                        break
-        except Exception:
-            pass
-
-    payment.transaction_id = receipt or payment.transaction_id
-    payment.status = status_val
-    payment.is_verified = status_val == 'successful'
-    if amount:
-        try:
-            payment.amount = amount
-        except Exception:
-            pass
-    payment.save()
-    # Create an in-app notification so WebSocket clients get updates
-    try:
-        Notification.objects.create(
-            user=payment.user,
-            category='finance',
-            type='payment_update',
-            title=f'Payment {payment.reference} updated',
-            message=f'Payment {payment.reference} status changed to {payment.status}.',
-            urgency='info',
-            channels=['in_app'],
-            personalized_context={'reference': payment.reference, 'status': payment.status, 'transaction_id': payment.transaction_id, 'amount': str(payment.amount), 'currency': payment.currency},
-        )
-    except Exception:
-        pass
-    return Response({'detail': 'Payment updated.'}, status=200)
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def airtel_callback(request):
+    """Handle Airtel Money STK push webhook/callback.
+    Similar parsing to mpesa_callback but more generic for provider payloads.
+    """
+    return _handle_provider_callback(request, 'airtel', 'AIRTEL_WEBHOOK_SECRET')
 
 
 @api_view(['POST'])
@@ -615,127 +512,7 @@ def mpesa_callback(request):
     If a webhook secret is configured in settings as MPESA_WEBHOOK_SECRET, the
     request must include header 'X-Webhook-Secret' with the same value.
     """
-    # Verify secret if configured
-    expected = getattr(settings, 'MPESA_WEBHOOK_SECRET', '')
-    if expected:
-        secret = request.headers.get('X-Webhook-Secret') or request.META.get('HTTP_X_WEBHOOK_SECRET')
-        if not secret or secret != expected:
-            return Response({'detail': 'Invalid webhook secret.'}, status=403)
-
-    payload = request.data
-    # Try to parse standard Daraja STK callback structure
-    reference = None
-    receipt = None
-    amount = None
-    phone = None
-    status_val = 'failed'
-    try:
-        body = payload.get('Body') if isinstance(payload, dict) else None
-        if body and 'stkCallback' in body:
-            cb = body['stkCallback']
-            result_code = cb.get('ResultCode')
-            status_val = 'successful' if result_code == 0 else 'failed'
-            metadata = cb.get('CallbackMetadata', {}) or {}
-            items = metadata.get('Item', [])
-            meta = {it.get('Name'): it.get('Value') for it in items if isinstance(it, dict)}
-            reference = meta.get('AccountReference') or meta.get('Account')
-            receipt = meta.get('MpesaReceiptNumber') or meta.get('ReceiptNumber')
-            amount = meta.get('Amount')
-            phone = meta.get('PhoneNumber') or meta.get('Phone')
-        else:
-            # Fallback generic payload
-            reference = payload.get('reference') or payload.get('account_reference') or payload.get('AccountReference')
-            status_val = 'successful' if payload.get('status') in ('success', 'successful', '0') else payload.get('status', 'failed')
-            receipt = payload.get('mpesa_receipt') or payload.get('transaction_id') or payload.get('MpesaReceiptNumber')
-            amount = payload.get('amount')
-            phone = payload.get('phone') or payload.get('PhoneNumber')
-    except Exception:
-        # best-effort parsing; continue
-        pass
-
-    # Find payment and update
-    from .models import Payment, PaymentIntegrationLog, PaymentCallback
-    if not reference:
-        return Response({'detail': 'reference not found in callback payload.'}, status=400)
-
-    payment = Payment.objects.filter(reference=reference).first()
-    # Log the incoming webhook regardless
-    try:
-        PaymentIntegrationLog.objects.create(
-            payment=payment,
-            gateway=payment.gateway if payment else None,
-            request_payload=payload,
-            response_payload={'handled': True},
-            status_code=str(payload.get('ResultCode', '')) if isinstance(payload, dict) else ''
-        )
-    except Exception:
-        pass
-
-    if not payment:
-        return Response({'detail': 'Payment not found for reference.'}, status=404)
-
-    # Idempotency: try to determine a provider callback id
-    callback_id = None
-    try:
-        if isinstance(payload, dict):
-            cb = payload.get('Body', {}).get('stkCallback') if payload.get('Body') else None
-            if cb:
-                callback_id = cb.get('CheckoutRequestID') or cb.get('MerchantRequestID')
-            else:
-                callback_id = payload.get('CallbackID') or payload.get('transaction_id') or payload.get('MpesaReceiptNumber')
-    except Exception:
-        callback_id = None
-
-    if callback_id:
-        # Use retry/backoff to handle IntegrityError races during creation
-        try:
-            from django.db import transaction, IntegrityError
-            import time
-            max_attempts = 3
-            for attempt in range(max_attempts):
-                try:
-                    with transaction.atomic():
-                        cb_obj, created = PaymentCallback.objects.get_or_create(
-                            callback_id=callback_id,
-                            defaults={'provider': 'mpesa', 'payment': payment, 'payload': payload}
-                        )
-                        if not created:
-                            return Response({'detail': 'Callback already processed.'}, status=200)
-                        break
-                except IntegrityError:
-                    if attempt < max_attempts - 1:
-                        time.sleep(0.1 * (attempt + 1))
-                        continue
-                    else:
-                        break
-        except Exception:
-            pass
-
-    # Update payment
-    payment.transaction_id = receipt or payment.transaction_id
-    payment.status = status_val
-    payment.is_verified = status_val == 'successful'
-    if amount:
-        try:
-            payment.amount = amount
-        except Exception:
-            pass
-    payment.save()
-    # Create an in-app notification so WebSocket clients get updates
-    try:
-        Notification.objects.create(
-            user=payment.user,
-            category='finance',
-            type='payment_update',
-            title=f'Payment {payment.reference} updated',
-            message=f'Payment {payment.reference} status changed to {payment.status}.',
-            urgency='info',
-            channels=['in_app'],
-            personalized_context={'reference': payment.reference, 'status': payment.status, 'transaction_id': payment.transaction_id, 'amount': str(payment.amount), 'currency': payment.currency},
-        )
-    except Exception:
-        pass
-    return Response({'detail': 'Payment updated.'}, status=200)
+    return _handle_provider_callback(request, 'mpesa', 'MPESA_WEBHOOK_SECRET')
 
 
 @api_view(['POST'])
@@ -778,15 +555,3 @@ def stripe_webhook(request):
 from django.shortcuts import render
 
 # Create your views here.
-
-def get_notification_context(user):
-    notifications = Notification.objects.filter(user=user).order_by('-created_at')
-    unread_count = get_unread_count(user)
-    notification_types = get_notification_types(user)
-    delivery_status = get_delivery_status(user)
-    return {
-        "notifications": notifications,
-        "unread_notification_count": unread_count,
-        "notification_types": notification_types,
-        "notification_delivery_status": delivery_status,
-    }
@@ -0,0 +1,241 @@
+"""M-Pesa and Airtel webhook ingestion.
+
+A callback is acknowledged once ``ingest_callback`` has stored it: one
+INSERT into ``PaymentCallback`` whose unique ``callback_id`` doubles as the
+idempotency check. ``process_callbacks`` later applies pending callbacks in
+batches: payments are locked with ``select_for_update`` and every payment
+touched by the batch gets a single notification, created in bulk.
+
+With ``PAYMENT_WEBHOOK_ASYNC`` off the views process the stored callback
+straight away, which keeps the old request/response behaviour.
+
+In async mode the provider is acknowledged before matching, so it never
+retries a callback that arrived before its payment. ``requeue_unmatched``
+puts such callbacks back in the queue once a payment with their reference
+exists: when the payment is created (``payments.signals``) and on every
+periodic run, for callbacks younger than ``UNMATCHED_RETRY_AGE``.
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Payment, PaymentCallback, PaymentIntegrationLog
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+UNMATCHED_RETRY_AGE = timedelta(days=3)
+
+
+class DuplicateCallback(Exception):
+    pass
+
+
+def parse_mpesa(payload):
+    """Extract the fields we need from a Daraja STK callback (or the generic fallback)."""
+    parsed = {'reference': None, 'receipt': None, 'amount': None, 'status': 'failed', 'result_code': '', 'callback_id': None}
+    if not isinstance(payload, dict):
+        return parsed
+    try:
+        body = payload.get('Body')
+        if body and 'stkCallback' in body:
+            cb = body['stkCallback']
+            result_code = cb.get('ResultCode')
+            items = (cb.get('CallbackMetadata', {}) or {}).get('Item', [])
+            meta = {it.get('Name'): it.get('Value') for it in items if isinstance(it, dict)}
+            parsed.update(
+                status='successful' if result_code == 0 else 'failed',
+                result_code=str(result_code if result_code is not None else ''),
+                reference=meta.get('AccountReference') or meta.get('Account'),
+                receipt=meta.get('MpesaReceiptNumber') or meta.get('ReceiptNumber'),
+                amount=meta.get('Amount'),
+                callback_id=cb.get('CheckoutRequestID') or cb.get('MerchantRequestID'),
+            )
+        else:
+            parsed.update(
+                reference=payload.get('reference') or payload.get('account_reference') or payload.get('AccountReference'),
+                status='successful' if payload.get('status') in ('success', 'successful', '0') else payload.get('status', 'failed'),
+                receipt=payload.get('mpesa_receipt') or payload.get('transaction_id') or payload.get('MpesaReceiptNumber'),
+                amount=payload.get('amount'),
+                result_code=str(payload.get('ResultCode', '')),
+                callback_id=payload.get('CallbackID') or payload.get('transaction_id') or payload.get('MpesaReceiptNumber'),
+            )
+    except Exception:
+        # best-effort parsing; missing fields are handled by the caller
+        pass
+    return parsed
+
+
+def parse_airtel(payload):
+    parsed = {'reference': None, 'receipt': None, 'amount': None, 'status': 'failed', 'result_code': '', 'callback_id': None}
+    if not isinstance(payload, dict):
+        return parsed
+    parsed.update(
+        reference=payload.get('account_reference') or payload.get('reference') or payload.get('AccountReference'),
+        receipt=payload.get('receipt') or payload.get('transaction_id') or payload.get('AirtelReceipt'),
+        amount=payload.get('amount') or payload.get('Amount'),
+        status='successful' if payload.get('status') in ('success', 'successful', '0') else payload.get('status', 'failed'),
+        result_code=str(payload.get('status', '')),
+        callback_id=payload.get('callback_id') or payload.get('transaction_id') or payload.get('AirtelReceipt'),
+    )
+    return parsed
+
+
+PARSERS = {
+    'mpesa': parse_mpesa,
+    'airtel': parse_airtel,
+}
+
+
+def _payload_digest(payload):
+    # Callbacks without a provider id are deduplicated on their exact content
+    raw = json.dumps(payload, sort_keys=True, default=str).encode()
+    return 'sha256:' + hashlib.sha256(raw).hexdigest()
+
+
+def ingest_callback(provider, payload, parsed):
+    """Store a verified callback; raises ``DuplicateCallback`` if it was seen before."""
+    callback_id = str(parsed['callback_id'] or _payload_digest(payload))[:128]
+    try:
+        with transaction.atomic():
+            callback = PaymentCallback.objects.create(
+                provider=provider,
+                callback_id=callback_id,
+                reference=str(parsed['reference'])[:128],
+                payload=payload,
+                status='pending',
+            )
+    except IntegrityError:
+        # A retry of a callback that arrived before its payment existed is
+        # queued again; anything else has already been handled.
+        retried = PaymentCallback.objects.filter(callback_id=callback_id, status='unmatched').update(status='pending')
+        if not retried:
+            raise DuplicateCallback(callback_id)
+        return PaymentCallback.objects.get(callback_id=callback_id)
+    return callback
+
+
+def queue_processing():
+    """Ask a worker to drain pending callbacks once the current transaction commits."""
+    from .tasks import process_payment_callbacks_task
+
+    def _enqueue():
+        try:
+            process_payment_callbacks_task.delay()
+        except Exception:
+            # The periodic beat run picks the callback up instead
+            logger.warning("Could not enqueue payment callback processing", exc_info=True)
+
+    transaction.on_commit(_enqueue)
+
+
+def webhook_async():
+    return getattr(settings, 'PAYMENT_WEBHOOK_ASYNC', False)
+
+
+def _apply(payment, parsed):
+    payment.transaction_id = parsed['receipt'] or payment.transaction_id
+    payment.status = parsed['status']
+    payment.is_verified = parsed['status'] == 'successful'
+    if parsed['amount']:
+        try:
+            payment.amount = Decimal(str(parsed['amount']))
+        except (InvalidOperation, ValueError):
+            pass
+
+
+def _payment_notification(payment):
+    from notifications.models import Notification
+    return Notification(
+        user_id=payment.user_id,
+        category='finance',
+        type='payment_update',
+        title=f'Payment {payment.reference} updated',
+        message=f'Payment {payment.reference} status changed to {payment.status}.',
+        urgency='info',
+        channels=['in_app'],
+        personalized_context={
+            'reference': payment.reference,
+            'status': payment.status,
+            'transaction_id': payment.transaction_id,
+            'amount': str(payment.amount),
+            'currency': payment.currency,
+        },
+    )
+
+
+def process_callbacks(callback_ids=None, batch_size=BATCH_SIZE):
+    """Apply one batch of pending callbacks; returns the processed callbacks."""
+    from notifications.fanout import bulk_notify
+
+    with transaction.atomic():
+        pending = PaymentCallback.objects.filter(status='pending')
+        if callback_ids is not None:
+            pending = pending.filter(id__in=callback_ids)
+        # skip_locked lets several workers drain the queue side by side
+        callbacks = list(pending.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+        if not callbacks:
+            return []
+        references = {cb.reference for cb in callbacks if cb.reference}
+        payments = {
+            p.reference: p
+            for p in Payment.objects.select_for_update().filter(reference__in=references).order_by('id')
+        }
+        now = timezone.now()
+        logs, touched = [], {}
+        for cb in callbacks:
+            parsed = PARSERS[cb.provider](cb.payload)
+            payment = payments.get(cb.reference)
+            cb.processed_at = now
+            if payment is None:
+                cb.status = 'unmatched'
+                continue
+            logs.append(PaymentIntegrationLog(
+                payment=payment,
+                gateway_id=payment.gateway_id,
+                request_payload=cb.payload,
+                response_payload={'handled': True},
+                status_code=parsed['result_code'],
+            ))
+            _apply(payment, parsed)
+            payment.updated_at = now
+            cb.payment = payment
+            cb.status = 'processed'
+            touched[payment.id] = payment
+        if touched:
+            Payment.objects.bulk_update(
+                list(touched.values()), ['transaction_id', 'status', 'is_verified', 'amount', 'updated_at']
+            )
+            PaymentIntegrationLog.objects.bulk_create(logs)
+            # One notification per payment, reflecting its final state in this batch
+            bulk_notify([_payment_notification(p) for p in touched.values()])
+        PaymentCallback.objects.bulk_update(callbacks, ['status', 'payment', 'processed_at'])
+    return callbacks
+
+
+def requeue_unmatched(references=None):
+    """Queue recent unmatched callbacks again if their payment now exists; returns how many."""
+    unmatched = PaymentCallback.objects.filter(
+        status='unmatched', created_at__gte=timezone.now() - UNMATCHED_RETRY_AGE,
+    )
+    if references is not None:
+        unmatched = unmatched.filter(reference__in=references)
+    return unmatched.filter(
+        reference__in=Payment.objects.values('reference'),
+    ).update(status='pending')
+
+
+def drain_callbacks(batch_size=BATCH_SIZE):
+    """Process pending callbacks until none are left; returns how many were handled."""
+    handled = 0
+    while True:
+        batch = process_callbacks(batch_size=batch_size)
+        if not batch:
+            return handled
+        handled += len(batch)
@@ -1,3 +1,195 @@
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from notifications.models import Notification
+from .models import GradingScale, Result, ResultAuditEntry
+
+IMPORT_URL = '/api/v1/provisional-results/results/import/'
+HEADER = 'student,unit_code,unit_name,academic_hours,marks,semester,year\n'
+
+
+class ResultImportTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        for grade, low, high in (('A', 70, 100), ('B', 60, 69.99), ('C', 50, 59.99), ('D', 40, 49.99), ('F', 0, 39.99)):
+            GradingScale.objects.create(grade=grade, min_score=low, max_score=high, description=grade)
+        self.staff = User.objects.create_user(email='registry@example.com', password='pass', is_staff=True)
+        self.students = [User.objects.create_user(email=f'student{i}@example.com', password='pass') for i in range(2)]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.staff)
+
+    def _upload(self, body):
+        upload = SimpleUploadedFile('marks.csv', (HEADER + body).encode(), content_type='text/csv')
+        with self.captureOnCommitCallbacks(execute=False):
+            return self.client.post(IMPORT_URL, {'file': upload}, format='multipart')
+
+    def test_csv_import_creates_results_with_audit_and_one_notification_per_student(self):
+        rows = ''.join(
+            f'{s.email},UNIT{u},Unit {u},3,{55 + u * 10},Sem 1,2025\n'
+            for s in self.students for u in range(3)
+        )
+        response = self._upload(rows)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['created'], 6)
+        self.assertEqual(
+            list(Result.objects.filter(student=self.students[0]).order_by('unit_code').values_list('grade', flat=True)),
+            ['C', 'B', 'A'],
+        )
+        self.assertEqual(ResultAuditEntry.objects.count(), 6)
+        self.assertEqual(Result.calculate_gpa(self.students[0]), 4.0)
+        self.assertEqual(Notification.objects.filter(type='result_imported').count(), 2)
+
+        response = self._upload(f'{self.students[0].email},UNIT0,Unit 0,3,35,Sem 1,2025\n')
+        self.assertEqual(response.data['updated'], 1)
+        result = Result.objects.get(student=self.students[0], unit_code='UNIT0')
+        self.assertEqual((result.grade, result.version), ('F', 2))
+        self.assertEqual(result.audit_entries.count(), 2)
+
+    def test_invalid_rows_reject_the_whole_upload(self):
+        rows = (
+            f'{self.students[0].email},UNIT1,Unit 1,3,72,Sem 1,2025\n'
+            'nobody@example.com,UNIT1,Unit 1,3,72,Sem 1,2025\n'
+            f'{self.students[1].email},UNIT1,Unit 1,3,140,Sem 1,2025\n'
+        )
+        response = self._upload(rows)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([e['row'] for e in response.data['errors']], [2, 3])
+        self.assertFalse(Result.objects.exists())
+
+    def test_students_cannot_import(self):
+        self.client.force_authenticate(user=self.students[0])
+        response = self.client.post(IMPORT_URL, {'rows': []}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_single_save_logs_once_without_resaving(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            result = Result.objects.create(
+                student=self.students[0], unit_code='U1', unit_name='Unit', academic_hours=3,
+                marks=80, grade='A', semester='Sem 1', year=2025,
+            )
+        result.refresh_from_db()
+        self.assertEqual(result.version, 1)
+        self.assertEqual(result.audit_entries.count(), 1)
+
+
+class ResultAggregateTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.student = User.objects.create_user(email='gpa@example.com', password='pass')
+
+    def _result(self, unit, grade, marks, hours=3, semester='Sem 1'):
+        with self.captureOnCommitCallbacks(execute=False):
+            return Result.objects.create(
+                student=self.student, unit_code=unit, unit_name=unit, academic_hours=hours,
+                marks=marks, grade=grade, semester=semester, year=2025,
+            )
+
+    def test_single_writes_keep_term_aggregates_current(self):
+        from .models import ResultAggregate
+        self._result('U1', 'A', 80, hours=4)
+        second = self._result('U2', 'C', 55, hours=2)
+        aggregate = ResultAggregate.objects.get(student=self.student, semester='Sem 1', year=2025)
+        self.assertEqual(aggregate.gpa, round((5 * 4 + 3 * 2) / 6, 2))
+        self.assertEqual(aggregate.grade_counts, {'A': 1, 'C': 1})
+
+        second.semester = 'Sem 2'
+        with self.captureOnCommitCallbacks(execute=False):
+            second.save()
+        self.assertEqual(ResultAggregate.objects.get(semester='Sem 1').units, 1)
+        self.assertEqual(ResultAggregate.objects.get(semester='Sem 2').gpa, 3.0)
+        with self.assertNumQueries(1):
+            self.assertEqual(Result.calculate_gpa(self.student), round(26 / 6, 2))
+        with self.captureOnCommitCallbacks(execute=False):
+            second.delete()
+        self.assertFalse(ResultAggregate.objects.filter(semester='Sem 2').exists())
+
+    def test_cohort_rebuild_matches_incremental_aggregates(self):
+        from core.results_analytics import rebuild_aggregates
+        from .models import ResultAggregate
+        for i, (grade, marks) in enumerate((('A', 75), ('B', 65), ('F', 20))):
+            self._result(f'U{i}', grade, marks, semester=f'Sem {i % 2 + 1}')
+        incremental = sorted(ResultAggregate.objects.values_list('semester', 'units', 'gpa', 'average', 'grade_counts'))
+        ResultAggregate.objects.all().delete()
+        rebuild_aggregates(Result, ResultAggregate, year=2025)
+        rebuilt = sorted(ResultAggregate.objects.values_list('semester', 'units', 'gpa', 'average', 'grade_counts'))
+        self.assertEqual(rebuilt, incremental)
+        self.assertEqual(Result.grade_distribution(self.student), {'A': 1, 'B': 1, 'F': 1})
+
+
+class TranscriptTest(TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.core.cache import cache
+        from django.test import override_settings
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(cache.clear)
+        cache.clear()
+        User = get_user_model()
+        GradingScale.objects.create(grade='A', min_score=70, max_score=100, description='Excellent')
+        GradingScale.objects.create(grade='F', min_score=0, max_score=39.99, description='Fail')
+        self.students = [User.objects.create_user(email=f'grad{i}@example.com', password='pass') for i in range(3)]
+        with self.captureOnCommitCallbacks(execute=False):
+            for student in self.students:
+                for unit in range(30):
+                    Result.objects.create(
+                        student=student, unit_code=f'U{unit:02}', unit_name=f'Unit {unit}', academic_hours=3,
+                        marks=75, grade='A', semester='Sem 1', year=2025,
+                    )
+
+    def test_transcripts_are_reused_until_their_content_changes(self):
+        from unittest import mock
+        from django.core.files.storage import default_storage
+        from core import transcripts
+
+        with mock.patch.object(transcripts, 'render_transcript_pdf', wraps=transcripts.render_transcript_pdf) as render:
+            first = transcripts.build_transcript('provisional', self.students[0])
+            self.assertEqual(transcripts.build_transcript('provisional', self.students[0]), first)
+            self.assertEqual(render.call_count, 1)
+            with default_storage.open(first, 'rb') as pdf:
+                content = pdf.read()
+            self.assertTrue(content.startswith(b'%PDF'))
+            # The template is written once as a form, however many pages there are
+            self.assertEqual(content.count(b'/Subtype /Form'), 2)
+
+            result = Result.objects.filter(student=self.students[0]).first()
+            result.grade = 'F'
+            with self.captureOnCommitCallbacks(execute=False):
+                result.save()
+            second = transcripts.build_transcript('provisional', self.students[0])
+            self.assertNotEqual(second, first)
+            self.assertEqual(render.call_count, 2)
+            self.assertFalse(default_storage.exists(first))
+
+    def test_template_is_cached_until_the_grading_scale_changes(self):
+        from core.transcripts import get_template
+        version = get_template('provisional').version
+        with self.assertNumQueries(0):
+            self.assertEqual(get_template('provisional').version, version)
+        GradingScale.objects.create(grade='B', min_score=60, max_score=69.99, description='Good')
+        self.assertNotEqual(get_template('provisional').version, version)
+
+    def test_cohort_render_bundles_transcripts_and_reuses_them(self):
+        import zipfile
+        from django.core.files.storage import default_storage
+        from core.transcripts import render_cohort
+
+        summary = render_cohort('provisional', year=2025, workers=1, chunk_size=2)
+        self.assertEqual((summary['students'], summary['rendered'], summary['reused']), (3, 3, 0))
+        with default_storage.open(summary['bundle'], 'rb') as bundle:
+            self.assertEqual(len(zipfile.ZipFile(bundle).namelist()), 3)
+        again = render_cohort('provisional', year=2025, workers=1)
+        self.assertEqual((again['rendered'], again['reused'], again['bundle']), (0, 3, summary['bundle']))
+
+    def test_download_pdf_serves_stored_transcript(self):
+        client = APIClient()
+        client.force_authenticate(user=self.students[1])
+        response = client.get('/api/v1/provisional-results/results/download_pdf/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
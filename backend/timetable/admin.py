@@ -17,6 +17,8 @@ from django import forms
 from django.contrib.admin import SimpleListFilter
 from .models import TimetableAudit
 from django.db import models
+from django.core.exceptions import ValidationError
+from .clashes import batch_clashes, describe_clash, invalidate_index, validate_entry
 
 class DepartmentFilter(SimpleListFilter):
 	title = 'Department'
@@ -91,20 +93,12 @@ class TimetableEntryForm(forms.ModelForm):
 
 	def clean(self):
 		cleaned_data = super().clean()
-		timetable = cleaned_data.get('timetable')
-		venue = cleaned_data.get('venue')
-		day = cleaned_data.get('day_of_week')
-		start = cleaned_data.get('start_time')
-		end = cleaned_data.get('end_time')
-		if timetable and venue and day and start and end:
-			overlap = TimetableEntry.objects.filter(
-				timetable=timetable, venue=venue, day_of_week=day,
-				start_time__lt=end, end_time__gt=start
-			)
-			if self.instance.pk:
-				overlap = overlap.exclude(pk=self.instance.pk)
-			if overlap.exists():
-				raise forms.ValidationError('Overlapping entry for this venue and time.')
+		# Check the instance as edited (ModelForm only copies the values over after clean())
+		if cleaned_data.get('timetable') and cleaned_data.get('start_time') and cleaned_data.get('end_time'):
+			for name in ('timetable', 'unit_code', 'venue', 'lecturer', 'day_of_week', 'start_time', 'end_time', 'is_active'):
+				if name in cleaned_data:
+					setattr(self.instance, name, cleaned_data[name])
+			validate_entry(self.instance)
 		return cleaned_data
 
 @admin.register(TimetableEntry)
@@ -175,11 +169,13 @@ class TimetableEntryAdmin(admin.ModelAdmin):
 
 	def soft_delete_selected(self, request, queryset):
 		updated = queryset.update(is_active=False)
+		invalidate_index(*queryset.values_list('timetable__semester', 'timetable__academic_year').distinct())
 		self.message_user(request, f"{updated} entries soft deleted.")
 	soft_delete_selected.short_description = 'Soft delete selected entries'
 
 	def restore_selected(self, request, queryset):
 		updated = queryset.update(is_active=True)
+		invalidate_index(*queryset.values_list('timetable__semester', 'timetable__academic_year').distinct())
 		self.message_user(request, f"{updated} entries restored.")
 	restore_selected.short_description = 'Restore selected entries'
 
@@ -200,11 +196,12 @@ class TimetableEntryAdmin(admin.ModelAdmin):
 			file = request.FILES['import_file']
 			try:
 				df = pd.read_csv(file) if file.name.endswith('.csv') else pd.read_excel(file)
-				created = 0
+				timetables = Timetable.objects.in_bulk(list(df['timetable'].dropna().astype(int).unique()))
+				entries, skipped = [], 0
 				for _, row in df.iterrows():
 					try:
-						TimetableEntry.objects.create(
-							timetable=Timetable.objects.get(id=row['timetable']),
+						entry = TimetableEntry(
+							timetable=timetables[int(row['timetable'])],
 							unit_code=row['unit_code'],
 							unit_name=row['unit_name'],
 							lecturer=row['lecturer'],
@@ -214,10 +211,19 @@ class TimetableEntryAdmin(admin.ModelAdmin):
 							venue=row['venue'],
 							is_active=row.get('is_active', True)
 						)
-						created += 1
-					except Exception as e:
-						continue
-				self.message_user(request, f"Imported {created} entries.")
+						entry.clean_fields(exclude=['timetable'])
+						entries.append(entry)
+					except (KeyError, ValueError, ValidationError):
+						skipped += 1
+				# The whole file is checked in one pass; rows in a clash are left out
+				clashes = batch_clashes(entries)
+				clashing = {side['entry'][1] for clash in clashes for side in clash['entries'] if isinstance(side['entry'], tuple)}
+				TimetableEntry.objects.bulk_create([entry for i, entry in enumerate(entries) if i not in clashing], batch_size=500)
+				invalidate_index(*{(entry.timetable.semester, entry.timetable.academic_year) for entry in entries})
+				self.message_user(request, f"Imported {len(entries) - len(clashing)} entries, skipped {skipped} invalid rows.")
+				if clashes:
+					details = '; '.join(describe_clash(clash) for clash in clashes[:10])
+					self.message_user(request, f"Left out {len(clashing)} clashing rows: {details}", level=messages.WARNING)
 				return HttpResponseRedirect(request.get_full_path())
 			except Exception as e:
 				self.message_user(request, f"Import failed: {e}", level=messages.ERROR)
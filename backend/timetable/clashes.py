@@ -0,0 +1,290 @@
+"""Clash detection for timetable entries.
+
+Entries of one semester (``Timetable.semester`` + ``academic_year``) are
+loaded with a single query into per-resource interval lists: one list
+per (venue, day), (lecturer, day) and (programme/year group, day), each
+sorted by start time, with a running maximum of end times alongside.
+
+* ``ClashIndex.check`` finds the clashes of one entry with two binary
+  searches per resource: entries starting inside it, and (through the
+  running maximum) entries that started earlier and are still running.
+* ``ClashIndex.check_batch`` merges a batch (an import) into the indexed
+  entries and sweeps each resource's intervals once in start order,
+  reporting only the pairs that involve the batch.
+* ``batch_clashes`` does the same for entries spread over semesters, and
+  ``semester_clashes`` sweeps every entry of a semester for the report.
+
+Only active entries take part. Two entries touching end-to-start
+(09:00-11:00 and 11:00-13:00) do not clash.
+
+``cached_index`` keeps each semester's index in the process between
+saves. A version key per semester in the shared cache, dropped whenever
+an entry of that semester is saved or deleted (``timetable.signals``,
+and explicitly after bulk writes), tells every process when to reload.
+"""
+import heapq
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import count
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .models import TimetableEntry
+
+RESOURCES = ('venue', 'lecturer', 'group')
+FIELDS = (
+	'id', 'timetable_id', 'unit_code', 'lecturer', 'venue', 'day_of_week', 'start_time', 'end_time',
+	'timetable__program', 'timetable__year_of_study',
+)
+# Semesters whose index a process keeps between saves
+MAX_CACHED_INDEXES = 8
+TIMETABLES_VERSION_KEY = 'timetable_clash_index:timetables:version'
+
+_indexes = {}
+
+
+def _norm(value):
+	return ' '.join(str(value or '').split()).casefold()
+
+
+def _minutes(value):
+	return value.hour * 60 + value.minute if hasattr(value, 'hour') else None
+
+
+class Slot:
+	"""One entry as the index sees it; ``ref`` is the entry id, or a batch position for unsaved entries."""
+	__slots__ = ('ref', 'unit_code', 'timetable_id', 'day', 'start', 'end', 'keys')
+
+	def __init__(self, ref, unit_code, timetable_id, day, start, end, venue, lecturer, group):
+		self.ref = ref
+		self.unit_code = unit_code
+		self.timetable_id = timetable_id
+		self.day = _norm(day)
+		self.start = _minutes(start)
+		self.end = _minutes(end)
+		self.keys = {
+			'venue': _norm(venue),
+			'lecturer': _norm(lecturer),
+			'group': f'{_norm(group[0])}|{group[1]}' if group[0] else '',
+		}
+
+	@classmethod
+	def from_row(cls, row):
+		return cls(
+			row['id'], row['unit_code'], row['timetable_id'], row['day_of_week'], row['start_time'], row['end_time'],
+			row['venue'], row['lecturer'], (row['timetable__program'], row['timetable__year_of_study']),
+		)
+
+	@classmethod
+	def from_entry(cls, entry, ref=None):
+		timetable = entry.timetable
+		return cls(
+			entry.pk if ref is None else ref, entry.unit_code, timetable.pk, entry.day_of_week,
+			entry.start_time, entry.end_time, entry.venue, entry.lecturer,
+			(timetable.program, timetable.year_of_study),
+		)
+
+	@property
+	def valid(self):
+		return bool(self.day) and self.start is not None and self.end is not None and self.start < self.end
+
+	def resource_keys(self):
+		for resource in RESOURCES:
+			if self.keys[resource]:
+				yield resource, (resource, self.keys[resource], self.day)
+
+	def describe(self):
+		return {
+			'entry': self.ref, 'unit_code': self.unit_code, 'timetable': self.timetable_id,
+			'start': f'{self.start // 60:02d}:{self.start % 60:02d}', 'end': f'{self.end // 60:02d}:{self.end % 60:02d}',
+		}
+
+
+def _clash(key, first, second):
+	resource, value, day = key
+	return {'resource': resource, 'value': value, 'day': day, 'entries': [first.describe(), second.describe()]}
+
+
+def _sweep(slots):
+	"""Overlapping pairs among ``slots`` (one resource and day), in start order."""
+	active = []
+	order = count()
+	for slot in sorted(slots, key=lambda s: (s.start, s.end)):
+		while active and active[0][0] <= slot.start:
+			heapq.heappop(active)
+		for _, _, other in active:
+			yield other, slot
+		heapq.heappush(active, (slot.end, next(order), slot))
+
+
+class ClashIndex:
+	"""Sorted per-resource intervals for the active entries of one semester."""
+
+	def __init__(self, slots):
+		self.groups = defaultdict(list)
+		for slot in slots:
+			if slot.valid:
+				for _, key in slot.resource_keys():
+					self.groups[key].append(slot)
+		self.starts = {}
+		self.max_ends = {}
+		for key, group in self.groups.items():
+			group.sort(key=lambda s: (s.start, s.end))
+			self.starts[key] = [s.start for s in group]
+			running, max_ends = 0, []
+			for s in group:
+				running = max(running, s.end)
+				max_ends.append(running)
+			self.max_ends[key] = max_ends
+
+	@classmethod
+	def for_semester(cls, semester, academic_year, exclude=()):
+		rows = TimetableEntry.objects.filter(
+			is_active=True, timetable__semester=semester, timetable__academic_year=academic_year,
+		).exclude(id__in=exclude).values(*FIELDS)
+		return cls(Slot.from_row(row) for row in rows.iterator(chunk_size=2000))
+
+	@classmethod
+	def for_timetable(cls, timetable):
+		return cls.for_semester(timetable.semester, timetable.academic_year)
+
+	def _overlapping(self, key, slot):
+		group = self.groups.get(key)
+		if not group:
+			return
+		starts, max_ends = self.starts[key], self.max_ends[key]
+		# Entries starting before ``slot`` ends; those from ``first`` on start inside it
+		end_index = bisect_left(starts, slot.end)
+		first = bisect_left(starts, slot.start)
+		for i in range(first, end_index):
+			yield group[i]
+		# Earlier starters still running at slot.start: walk back while the running max says so
+		i = first - 1
+		while i >= 0 and max_ends[i] > slot.start:
+			if group[i].end > slot.start:
+				yield group[i]
+			i -= 1
+
+	def check(self, slot):
+		"""Clashes of one slot with the indexed entries (itself excluded)."""
+		if not slot.valid:
+			return []
+		clashes = []
+		for _, key in slot.resource_keys():
+			for other in self._overlapping(key, slot):
+				if other.ref != slot.ref:
+					clashes.append(_clash(key, other, slot))
+		return clashes
+
+	def check_batch(self, slots):
+		"""Clashes involving ``slots`` (with the index or with each other), one sweep per resource."""
+		batch = defaultdict(list)
+		refs = set()
+		for slot in slots:
+			if slot.valid:
+				refs.add(slot.ref)
+				for _, key in slot.resource_keys():
+					batch[key].append(slot)
+		clashes = []
+		for key, new in batch.items():
+			for first, second in _sweep(self.groups.get(key, []) + new):
+				if first.ref != second.ref and (first.ref in refs or second.ref in refs):
+					clashes.append(_clash(key, first, second))
+		return clashes
+
+	def all_clashes(self):
+		clashes = []
+		for key, group in self.groups.items():
+			clashes.extend(_clash(key, first, second) for first, second in _sweep(group))
+		return clashes
+
+
+def _version_key(semester, academic_year):
+	return f'timetable_clash_index:{semester}:{academic_year}:version'
+
+
+def _version(key):
+	version = cache.get(key)
+	if version is None:
+		version = time.time_ns()
+		if not cache.add(key, version, timeout=None):
+			version = cache.get(key, version)
+	return version
+
+
+def cached_index(semester, academic_year):
+	"""The semester's ``ClashIndex``, reloaded only after an entry or timetable changed."""
+	# Timetable edits (programme, year) move entries between groups in every semester
+	version = (_version(_version_key(semester, academic_year)), _version(TIMETABLES_VERSION_KEY))
+	cached = _indexes.get((semester, academic_year))
+	if cached and cached[0] == version:
+		return cached[1]
+	index = ClashIndex.for_semester(semester, academic_year)
+	if len(_indexes) >= MAX_CACHED_INDEXES:
+		_indexes.clear()
+	_indexes[(semester, academic_year)] = (version, index)
+	return index
+
+
+def invalidate_index(*semesters):
+	"""Make every process reload the indexes of ``semesters``, ``(semester, academic_year)`` pairs."""
+	keys = [_version_key(semester, academic_year) for semester, academic_year in semesters]
+	for semester in semesters:
+		_indexes.pop(tuple(semester), None)
+	# Again once committed, so no process keeps an index loaded before the commit
+	cache.delete_many(keys)
+	transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_all_indexes():
+	_indexes.clear()
+	cache.delete(TIMETABLES_VERSION_KEY)
+	transaction.on_commit(lambda: cache.delete(TIMETABLES_VERSION_KEY))
+
+
+def semester_clashes(semester, academic_year):
+	return ClashIndex.for_semester(semester, academic_year).all_clashes()
+
+
+def batch_clashes(entries):
+	"""Clashes involving unsaved or edited ``entries``, one index and sweep per semester.
+
+	Each clash refers to batch entries by their position in ``entries``.
+	"""
+	semesters = defaultdict(list)
+	for position, entry in enumerate(entries):
+		timetable = entry.timetable
+		semesters[(timetable.semester, timetable.academic_year)].append(
+			Slot.from_entry(entry, ref=('batch', position)),
+		)
+	clashes = []
+	for (semester, academic_year), slots in semesters.items():
+		batch = [entries[slot.ref[1]] for slot in slots]
+		# Edited entries replace their saved version
+		index = ClashIndex.for_semester(semester, academic_year, exclude=[entry.pk for entry in batch if entry.pk])
+		clashes.extend(index.check_batch([slot for slot, entry in zip(slots, batch) if entry.is_active]))
+	return clashes
+
+
+def describe_clash(clash):
+	first, second = clash['entries']
+	return (
+		f"{clash['resource'].capitalize()} clash ({clash['value']}, {clash['day']}): "
+		f"{first['unit_code']} {first['start']}-{first['end']} overlaps {second['unit_code']} {second['start']}-{second['end']}"
+	)
+
+
+def validate_entry(entry, index=None):
+	"""Raise ``ValidationError`` if ``entry`` (saved or not) would clash with its semester's entries."""
+	if not entry.is_active:
+		return
+	slot = Slot.from_entry(entry)
+	if slot.start is not None and slot.end is not None and slot.start >= slot.end:
+		raise ValidationError('End time must be after start time.')
+	index = index or cached_index(entry.timetable.semester, entry.timetable.academic_year)
+	clashes = index.check(slot)
+	if clashes:
+		raise ValidationError([describe_clash(clash) for clash in clashes])
@@ -0,0 +1,124 @@
+import random
+import time
+from datetime import time as clock
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from timetable.clashes import ClashIndex, Slot, batch_clashes, semester_clashes
+from timetable.models import Timetable, TimetableEntry
+
+
+class _Rollback(Exception):
+	pass
+
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+SEMESTER, ACADEMIC_YEAR = 'semester_1', 'bench/clashes'
+
+
+def naive_clashes(entry):
+	"""Ids clashing with ``entry``: one overlap query per resource, as the admin form used to do for venues."""
+	timetable = entry.timetable
+	overlapping = TimetableEntry.objects.filter(
+		is_active=True, timetable__semester=timetable.semester, timetable__academic_year=timetable.academic_year,
+		day_of_week=entry.day_of_week, start_time__lt=entry.end_time, end_time__gt=entry.start_time,
+	)
+	if entry.pk:
+		overlapping = overlapping.exclude(pk=entry.pk)
+	ids = set()
+	for resource in (
+		Q(venue=entry.venue),
+		Q(lecturer=entry.lecturer),
+		Q(timetable__program=timetable.program, timetable__year_of_study=timetable.year_of_study),
+	):
+		ids.update(overlapping.filter(resource).values_list('id', flat=True))
+	return ids
+
+
+def clashing_ids(clashes):
+	return {side['entry'] for clash in clashes for side in clash['entries']}
+
+
+class Command(BaseCommand):
+	help = 'Compare the clash index and sweep with per-row overlap queries on synthetic timetable entries.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--entries', type=int, default=10000)
+		parser.add_argument('--batch', type=int, default=500, help='Rows in the simulated import')
+		parser.add_argument('--programs', type=int, default=40)
+		parser.add_argument('--venues', type=int, default=250)
+		parser.add_argument('--lecturers', type=int, default=400)
+
+	def _entry(self, rng, timetables, options):
+		start = rng.randrange(8, 18)
+		return TimetableEntry(
+			timetable=rng.choice(timetables),
+			unit_code=f'BEN{rng.randrange(1000):03d}',
+			unit_name='Benchmark unit',
+			lecturer=f'Lecturer {rng.randrange(options["lecturers"])}',
+			day_of_week=rng.choice(DAYS),
+			start_time=clock(start, rng.choice((0, 30))),
+			end_time=clock(min(start + rng.randint(1, 3), 20)),
+			venue=f'Room {rng.randrange(options["venues"])}',
+		)
+
+	def _time(self, label, fn):
+		started = time.perf_counter()
+		result = fn()
+		elapsed = (time.perf_counter() - started) * 1000
+		self.stdout.write(f'{label:<40} {elapsed:10.1f} ms')
+		return elapsed, result
+
+	def handle(self, *args, **options):
+		rng = random.Random(42)
+		try:
+			# Everything the benchmark writes is rolled back afterwards
+			with transaction.atomic():
+				timetables = Timetable.objects.bulk_create([
+					Timetable(program=f'Bench {p}', year_of_study=y, semester=SEMESTER, academic_year=ACADEMIC_YEAR)
+					for p in range(options['programs']) for y in range(1, 5)
+				])
+				TimetableEntry.objects.bulk_create(
+					[self._entry(rng, timetables, options) for _ in range(options['entries'])], batch_size=2000,
+				)
+				entries = list(TimetableEntry.objects.filter(timetable__academic_year=ACADEMIC_YEAR).select_related('timetable'))
+				self.stdout.write(f'seeded {len(entries)} entries over {len(timetables)} timetables\n')
+
+				probe = entries[len(entries) // 2]
+				self.stdout.write('single entry')
+				naive_ms, naive = self._time('  per-row queries', lambda: naive_clashes(probe))
+				load_ms, index = self._time('  load index (one query)', lambda: ClashIndex.for_timetable(probe.timetable))
+				slot = Slot.from_entry(probe)
+				check_ms, found = self._time('  check on loaded index', lambda: index.check(slot))
+				repeats = 10000
+				started = time.perf_counter()
+				for _ in range(repeats):
+					index.check(slot)
+				self.stdout.write(f'{"  check, mean of %d" % repeats:<40} {(time.perf_counter() - started) * 1e6 / repeats:10.1f} us')
+				if naive != clashing_ids(found) - {probe.pk}:
+					raise RuntimeError('single entry: naive and index results disagree')
+
+				batch = [self._entry(rng, timetables, options) for _ in range(options['batch'])]
+				for entry in batch:
+					entry.timetable_id = entry.timetable.pk
+				self.stdout.write(f'\nimport of {len(batch)} rows')
+				naive_ms, naive = self._time('  per-row queries', lambda: [naive_clashes(entry) for entry in batch])
+				sweep_ms, clashes = self._time('  one load + sweep', lambda: batch_clashes(batch))
+				self.stdout.write(f'  rows clashing with saved entries: {sum(1 for ids in naive if ids)} (naive); '
+					f'clashes found by the sweep (incl. within the batch): {len(clashes)}')
+				self.stdout.write(f'  speed-up {naive_ms / max(sweep_ms, 0.001):.1f}x')
+
+				self.stdout.write('\nsemester clash report')
+				naive_ms, naive = self._time('  per-row queries', lambda: {
+					entry.pk for entry in entries if naive_clashes(entry)
+				})
+				sweep_ms, clashes = self._time('  one load + sweep', lambda: semester_clashes(SEMESTER, ACADEMIC_YEAR))
+				if naive != clashing_ids(clashes):
+					raise RuntimeError('report: naive and sweep results disagree')
+				self.stdout.write(f'  {len(clashes)} clashing pairs, {len(naive)} entries involved; '
+					f'speed-up {naive_ms / max(sweep_ms, 0.001):.1f}x')
+				raise _Rollback
+		except _Rollback:
+			pass
@@ -58,3 +58,6 @@ class TimetableAudit(models.Model):
 	performed_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='timetable_audittrail')
 	timestamp = models.DateTimeField(auto_now_add=True)
 	details = models.JSONField(default=dict, blank=True)
+
+	class Meta:
+		indexes = [models.Index(fields=['timestamp', 'id'], name='tt_audit_ts_id_idx')]
@@ -1,4 +1,6 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
+from .clashes import validate_entry
 from .models import Timetable, TimetableEntry, TimetableChangeRequest, TimetableAudit
 
 class TimetableSerializer(serializers.ModelSerializer):
@@ -11,6 +13,20 @@ class TimetableEntrySerializer(serializers.ModelSerializer):
         model = TimetableEntry
         fields = '__all__'
 
+    def validate(self, attrs):
+        # Check the entry as it would be saved against the rest of its semester
+        entry = TimetableEntry(**{
+            field.attname: getattr(self.instance, field.attname) for field in TimetableEntry._meta.concrete_fields
+        }) if self.instance else TimetableEntry()
+        for name, value in attrs.items():
+            setattr(entry, name, value)
+        if entry.timetable_id:
+            try:
+                validate_entry(entry)
+            except DjangoValidationError as exc:
+                raise serializers.ValidationError({'non_field_errors': exc.messages})
+        return attrs
+
 class TimetableChangeRequestSerializer(serializers.ModelSerializer):
     class Meta:
         model = TimetableChangeRequest
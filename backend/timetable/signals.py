@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .clashes import invalidate_all_indexes, invalidate_index
+from .models import Timetable, TimetableEntry
+
+
+@receiver(post_save, sender=TimetableEntry)
+@receiver(post_delete, sender=TimetableEntry)
+def invalidate_entry_semester(sender, instance, **kwargs):
+	timetable = instance.timetable
+	invalidate_index((timetable.semester, timetable.academic_year))
+
+
+@receiver(post_save, sender=Timetable)
+@receiver(post_delete, sender=Timetable)
+def invalidate_timetables(sender, instance, **kwargs):
+	invalidate_all_indexes()
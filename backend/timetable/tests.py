@@ -1,7 +1,11 @@
 
+import datetime
+
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase
 from rest_framework import status
+from django.core.exceptions import ValidationError
+from .clashes import batch_clashes, validate_entry
 from .models import Timetable, TimetableEntry, TimetableChangeRequest
 
 User = get_user_model()
@@ -54,3 +58,85 @@ class TimetableTests(APITestCase):
 		self.assertEqual(resp.status_code, status.HTTP_200_OK)
 		cr.refresh_from_db()
 		self.assertEqual(cr.status, 'approved')
+
+
+class ClashTests(APITestCase):
+	def setUp(self):
+		self.user = User.objects.create_user('clash@example.com', 'pass')
+		self.client.force_authenticate(self.user)
+		self.first_years = Timetable.objects.create(program='BSc CS', year_of_study=1, semester='semester_1', academic_year='2023/2024')
+		self.second_years = Timetable.objects.create(program='BSc CS', year_of_study=2, semester='semester_1', academic_year='2023/2024')
+		self.long = TimetableEntry.objects.create(
+			timetable=self.first_years, unit_code='CS101', unit_name='Intro', lecturer='Dr. X',
+			day_of_week='Monday', start_time='08:00', end_time='13:00', venue='A1'
+		)
+		TimetableEntry.objects.create(
+			timetable=self.second_years, unit_code='CS201', unit_name='Data', lecturer='Dr. Y',
+			day_of_week='Monday', start_time='09:00', end_time='10:00', venue='B1'
+		)
+
+	def _post(self, **fields):
+		data = {
+			'timetable': self.second_years.id, 'unit_code': 'CS202', 'unit_name': 'Algorithms', 'lecturer': 'Dr. Z',
+			'day_of_week': 'Monday', 'start_time': '14:00', 'end_time': '16:00', 'venue': 'C1', **fields,
+		}
+		return self.client.post('/api/timetable/entries/', data, format='json')
+
+	def test_serializer_rejects_each_kind_of_clash(self):
+		# An entry that started earlier and is still running is found, whatever its programme
+		resp = self._post(venue=' a1 ', start_time='11:00', end_time='12:00')
+		self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+		self.assertIn('Venue clash', resp.data['non_field_errors'][0])
+		resp = self._post(lecturer='Dr. X', day_of_week='monday', start_time='12:30', end_time='14:00')
+		self.assertIn('Lecturer clash', resp.data['non_field_errors'][0])
+		resp = self._post(start_time='09:30', end_time='10:30')
+		self.assertIn('Group clash', resp.data['non_field_errors'][0])
+		self.assertEqual(self._post(start_time='13:00', end_time='14:00', venue='A1').status_code, status.HTTP_201_CREATED)
+		# Editing an entry does not clash with itself; other semesters are ignored
+		resp = self.client.patch(f'/api/timetable/entries/{self.long.id}/', {'end_time': '12:00'}, format='json')
+		self.assertEqual(resp.status_code, status.HTTP_200_OK)
+		other = Timetable.objects.create(program='BSc CS', year_of_study=2, semester='semester_2', academic_year='2023/2024')
+		self.assertEqual(self._post(timetable=other.id, venue='A1', start_time='09:00', end_time='10:00').status_code, status.HTTP_201_CREATED)
+
+	def test_batch_and_report(self):
+		batch = [
+			TimetableEntry(timetable=self.first_years, unit_code='CS102', lecturer='Dr. Q', day_of_week='Tuesday',
+				start_time=datetime.time(9), end_time=datetime.time(11), venue='D1'),
+			TimetableEntry(timetable=self.second_years, unit_code='CS203', lecturer='Dr. Q', day_of_week='Tuesday',
+				start_time=datetime.time(10), end_time=datetime.time(12), venue='D2'),
+			TimetableEntry(timetable=self.second_years, unit_code='CS204', lecturer='Dr. R', day_of_week='Monday',
+				start_time=datetime.time(12), end_time=datetime.time(14), venue='A1'),
+		]
+		with self.assertNumQueries(1):
+			clashes = batch_clashes(batch)
+		self.assertEqual(
+			sorted((c['resource'], [side['entry'] for side in c['entries']]) for c in clashes),
+			[('lecturer', [('batch', 0), ('batch', 1)]), ('venue', [self.long.id, ('batch', 2)])],
+		)
+		TimetableEntry.objects.create(
+			timetable=self.first_years, unit_code='CS103', unit_name='Maths', lecturer='Dr. X',
+			day_of_week='Monday', start_time='10:00', end_time='11:00', venue='A2'
+		)
+		resp = self.client.get('/api/timetable/entries/clashes/', {'semester': 'semester_1', 'academic_year': '2023/2024'})
+		self.assertEqual(resp.data['count'], 2)
+		self.assertEqual({c['resource'] for c in resp.data['results']}, {'lecturer', 'group'})
+		resp = self.client.get('/api/timetable/entries/clashes/', {'semester': 'semester_1', 'academic_year': '2023/2024', 'resource': 'group'})
+		self.assertEqual(resp.data['count'], 1)
+		self.assertEqual(self.client.get('/api/timetable/entries/clashes/').status_code, status.HTTP_400_BAD_REQUEST)
+
+	def test_index_is_reused_until_an_entry_changes(self):
+		def entry(**fields):
+			values = dict(timetable=self.second_years, unit_code='CS205', lecturer='Dr. W', day_of_week='Friday',
+				start_time=datetime.time(9), end_time=datetime.time(10), venue='E1')
+			values.update(fields)
+			return TimetableEntry(**values)
+
+		validate_entry(entry())
+		with self.assertNumQueries(0):
+			validate_entry(entry(venue='E2'))
+		saved = TimetableEntry.objects.create(**{field: getattr(entry(), field) for field in
+			('timetable', 'unit_code', 'lecturer', 'day_of_week', 'start_time', 'end_time', 'venue')})
+		with self.assertRaises(ValidationError):
+			validate_entry(entry(unit_code='CS206', lecturer='Dr. V'))
+		saved.delete()
+		validate_entry(entry(unit_code='CS206', lecturer='Dr. V'))
@@ -1,25 +1,15 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from .clashes import RESOURCES, semester_clashes
 from .models import Timetable, TimetableEntry, TimetableChangeRequest, TimetableAudit
 from .serializers import (
 	TimetableSerializer, TimetableEntrySerializer,
 	TimetableChangeRequestSerializer, TimetableAuditSerializer
 )
 from notifications.models import Notification
-from notifications.utils import get_unread_count, get_notification_types, get_delivery_status
-
-def get_notification_context(user):
-	notifications = Notification.objects.filter(user=user).order_by('-timestamp')
-	unread_count = get_unread_count(user)
-	notification_types = get_notification_types(user)
-	delivery_status = get_delivery_status(user)
-	return {
-		"notifications": notifications,
-		"unread_notification_count": unread_count,
-		"notification_types": notification_types,
-		"notification_delivery_status": delivery_status,
-	}
+from core.pagination import FlexiblePagination
+from notifications.summary import get_notification_summary
 
 class TimetableViewSet(viewsets.ModelViewSet):
 	queryset = Timetable.objects.all()
@@ -29,22 +19,20 @@ class TimetableViewSet(viewsets.ModelViewSet):
 	def perform_update(self, serializer):
 		instance = serializer.save()
 		# Business Rule: Auto-notification when timetable is updated
-		from notifications.models import Notification
+		from notifications.fanout import start_fanout
 		from core.models import CustomUser
-		students = CustomUser.objects.filter(is_active=True, is_staff=False)
-		for student in students:
-			Notification.objects.create(
-				user=student,
-				message="Timetable has been updated. Please check the latest schedule.",
-				type="timetable_update",
-			)
+		students = CustomUser.objects.filter(is_active=True, is_staff=False).values_list('id', flat=True)
+		start_fanout(students, {
+			'message': "Timetable has been updated. Please check the latest schedule.",
+			'type': "timetable_update",
+		}, created_by=self.request.user)
 		return instance
 
 	def retrieve(self, request, *args, **kwargs):
 		instance = self.get_object()
 		serializer = self.get_serializer(instance)
 		data = serializer.data
-		data.update(get_notification_context(request.user))
+		data.update(get_notification_summary(request.user, request))
 		return Response(data)
 
 	def list(self, request, *args, **kwargs):
@@ -53,11 +41,11 @@ class TimetableViewSet(viewsets.ModelViewSet):
 		if page is not None:
 			serializer = self.get_serializer(page, many=True)
 			data = {"results": serializer.data}
-			data.update(get_notification_context(request.user))
+			data.update(get_notification_summary(request.user, request))
 			return self.get_paginated_response(data)
 		serializer = self.get_serializer(queryset, many=True)
 		data = {"results": serializer.data}
-		data.update(get_notification_context(request.user))
+		data.update(get_notification_summary(request.user, request))
 		return Response(data)
 
 class TimetableEntryViewSet(viewsets.ModelViewSet):
@@ -65,6 +53,21 @@ class TimetableEntryViewSet(viewsets.ModelViewSet):
 	serializer_class = TimetableEntrySerializer
 	permission_classes = [permissions.IsAuthenticated]
 
+	@action(detail=False, methods=['get'])
+	def clashes(self, request):
+		"""Venue, lecturer and programme/year clashes among a semester's active entries."""
+		semester = request.query_params.get('semester')
+		academic_year = request.query_params.get('academic_year')
+		if not semester or not academic_year:
+			return Response({'error': 'semester and academic_year are required.'}, status=status.HTTP_400_BAD_REQUEST)
+		resource = request.query_params.get('resource')
+		if resource and resource not in RESOURCES:
+			return Response({'error': f'resource must be one of {", ".join(RESOURCES)}.'}, status=status.HTTP_400_BAD_REQUEST)
+		clashes = semester_clashes(semester, academic_year)
+		if resource:
+			clashes = [clash for clash in clashes if clash['resource'] == resource]
+		return Response({'count': len(clashes), 'results': clashes})
+
 class TimetableChangeRequestViewSet(viewsets.ModelViewSet):
 	queryset = TimetableChangeRequest.objects.all()
 	serializer_class = TimetableChangeRequestSerializer
@@ -94,3 +97,5 @@ class TimetableAuditViewSet(viewsets.ReadOnlyModelViewSet):
 	queryset = TimetableAudit.objects.all()
 	serializer_class = TimetableAuditSerializer
 	permission_classes = [permissions.IsAdminUser]
+	pagination_class = FlexiblePagination
+	cursor_ordering = ('-timestamp', '-id')
@@ -1,3 +1,13 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import UnitSeats
+
+
+@admin.register(UnitSeats)
+class UnitSeatsAdmin(admin.ModelAdmin):
+	list_display = ('unit', 'semester', 'capacity', 'taken', 'updated_at')
+	list_editable = ('capacity',)
+	list_filter = ('semester',)
+	search_fields = ('unit__code', 'unit__name')
+	# Maintained by registrations and the reconciler
+	readonly_fields = ('taken', 'updated_at')
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_seats(apps, schema_editor):
+    # Existing offerings start with what they already have taken and no limit
+    UnitRegistrationItem = apps.get_model('unit_registration', 'UnitRegistrationItem')
+    UnitSeats = apps.get_model('unit_registration', 'UnitSeats')
+    rows = UnitRegistrationItem.objects.values('unit_id', 'registration__semester').annotate(n=Count('id')).order_by()
+    UnitSeats.objects.bulk_create(
+        [UnitSeats(unit_id=row['unit_id'], semester=row['registration__semester'], taken=row['n']) for row in rows],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_systemmetric_alter_customuser_groups_and_more'),
+        ('unit_registration', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnitSeats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('semester', models.CharField(max_length=16)),
+                ('capacity', models.PositiveIntegerField(blank=True, null=True)),
+                ('taken', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('unit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_counters', to='core.unit')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('unit', 'semester'), name='unique_unit_seats')],
+            },
+        ),
+        migrations.RunPython(backfill_seats, migrations.RunPython.noop),
+    ]
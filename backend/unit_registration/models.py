@@ -11,12 +11,11 @@ def check_corequisites(student_profile, unit, selected_units):
 	selected_ids = set(u.id for u in selected_units)
 	return all(cr.id in selected_ids for cr in coreqs)
 
-def check_unit_capacity(unit):
-	# Example: check if unit has available slots
-	if hasattr(unit, 'capacity'):
-		current = unit.unitregistrationitem_set.count()
-		return current < unit.capacity
-	return True
+def check_unit_capacity(unit, semester=None):
+	# Reads the unit's seat counter (see unit_registration.seats); no counter means no limit
+	from .seats import seats_left
+	left = seats_left(unit, semester)
+	return left is None or left > 0
 # Registration window and add/drop logic
 from django.utils import timezone
 
@@ -55,7 +54,9 @@ def validate_credit_hours(selected_units):
 	MAX_CREDITS = 24
 	return MIN_CREDITS <= total_credits <= MAX_CREDITS, total_credits
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.conf import settings
 from my_profile.models import StudentProfile
 from core.models import Unit
@@ -79,3 +80,37 @@ class UnitRegistrationItem(models.Model):
 
 	def __str__(self):
 		return f"{self.unit.code} ({self.unit.name})"
+
+	def save(self, *args, **kwargs):
+		if not self._state.adding:
+			return super().save(*args, **kwargs)
+		# A new item takes a seat first; raises UnitFull when there is none left
+		from .seats import reserve_seat
+		with transaction.atomic():
+			reserve_seat(self.unit_id, self.registration.semester)
+			super().save(*args, **kwargs)
+
+
+class UnitSeats(models.Model):
+	"""Seat counter for a unit in one semester, kept in step with UnitRegistrationItem."""
+	unit = models.ForeignKey(Unit, on_delete=models.CASCADE, related_name='seat_counters')
+	semester = models.CharField(max_length=16)
+	capacity = models.PositiveIntegerField(null=True, blank=True)  # None: no limit
+	taken = models.PositiveIntegerField(default=0)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['unit', 'semester'], name='unique_unit_seats'),
+		]
+
+	def __str__(self):
+		return f"{self.unit.code} {self.semester}: {self.taken}/{self.capacity or '-'}"
+
+
+@receiver(post_delete, sender=UnitRegistrationItem)
+def release_unit_seat(sender, instance, **kwargs):
+	from .seats import item_semester, release_seat
+	semester = item_semester(instance)
+	if semester is not None:
+		release_seat(instance.unit_id, semester)
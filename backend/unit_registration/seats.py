@@ -0,0 +1,100 @@
+"""Seat counters for unit registration.
+
+Each (unit, semester) offering has a ``UnitSeats`` row. Adding a
+``UnitRegistrationItem`` takes a seat with one conditional
+``UPDATE ... SET taken = taken + 1 WHERE taken < capacity`` inside the
+item's transaction, so two students racing for the last seat cannot both
+get it and nothing counts the items table on the way. Deleting an item
+gives its seat back (``post_delete``), which also covers bulk and cascade
+deletes.
+
+A unit without a counter, or with no ``capacity``, has no limit; the
+counter is created on first use and registrars set the capacity in the
+admin. ``reconcile_seats`` recounts the items periodically and corrects
+any counter that has drifted (items edited in place, raw SQL, fixtures).
+"""
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import UnitRegistration, UnitRegistrationItem, UnitSeats
+
+
+class UnitFull(Exception):
+	pass
+
+
+def _available():
+	return Q(capacity__isnull=True) | Q(taken__lt=F('capacity'))
+
+
+def _take(unit_id, semester):
+	return UnitSeats.objects.filter(_available(), unit_id=unit_id, semester=semester).update(
+		taken=F('taken') + 1, updated_at=timezone.now(),
+	)
+
+
+def reserve_seat(unit_id, semester):
+	"""Take one seat in the unit's offering for ``semester``, or raise ``UnitFull``."""
+	if _take(unit_id, semester):
+		return
+	if not UnitSeats.objects.filter(unit_id=unit_id, semester=semester).exists():
+		# First registration for this offering: the counter starts without a limit
+		UnitSeats.objects.bulk_create([UnitSeats(unit_id=unit_id, semester=semester)], ignore_conflicts=True)
+		if _take(unit_id, semester):
+			return
+	raise UnitFull(f'Unit {unit_id} has no seats left for {semester}.')
+
+
+def release_seat(unit_id, semester, count=1):
+	UnitSeats.objects.filter(unit_id=unit_id, semester=semester).update(
+		taken=Greatest(F('taken') - count, 0), updated_at=timezone.now(),
+	)
+
+
+def item_semester(item):
+	"""Semester of an item's registration, without loading a registration that may be gone."""
+	registration = item._state.fields_cache.get('registration')
+	if registration is not None:
+		return registration.semester
+	return UnitRegistration.objects.filter(pk=item.registration_id).values_list('semester', flat=True).first()
+
+
+def seats_left(unit, semester):
+	"""Seats left in the unit's offering for ``semester``; None when there is no limit."""
+	counter = UnitSeats.objects.filter(unit=unit, semester=semester).values_list('capacity', 'taken').first()
+	if counter is None or counter[0] is None:
+		return None
+	return max(counter[0] - counter[1], 0)
+
+
+def set_capacity(unit, semester, capacity):
+	UnitSeats.objects.update_or_create(unit=unit, semester=semester, defaults={'capacity': capacity})
+
+
+def item_counts():
+	rows = UnitRegistrationItem.objects.values('unit_id', 'registration__semester').annotate(n=Count('id')).order_by()
+	return {(row['unit_id'], row['registration__semester']): row['n'] for row in rows}
+
+
+def reconcile_seats():
+	"""Correct counters that disagree with the items; returns counts of what was done."""
+	counts = item_counts()
+	counters = {(unit_id, semester): taken for unit_id, semester, taken in UnitSeats.objects.values_list('unit_id', 'semester', 'taken')}
+	missing = [
+		UnitSeats(unit_id=unit_id, semester=semester, taken=n)
+		for (unit_id, semester), n in counts.items() if (unit_id, semester) not in counters
+	]
+	UnitSeats.objects.bulk_create(missing, ignore_conflicts=True)
+	fixed = 0
+	for unit_id, semester in [key for key, taken in counters.items() if taken != counts.get(key, 0)]:
+		# Recount under the counter's lock: reservations in flight hold it until they commit
+		with transaction.atomic():
+			counter = UnitSeats.objects.select_for_update().get(unit_id=unit_id, semester=semester)
+			actual = UnitRegistrationItem.objects.filter(unit_id=unit_id, registration__semester=semester).count()
+			if counter.taken != actual:
+				counter.taken = actual
+				counter.save(update_fields=['taken', 'updated_at'])
+				fixed += 1
+	return {'counters': len(counters) + len(missing), 'created': len(missing), 'fixed': fixed}
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import UnitRegistration, UnitRegistrationItem
+from .seats import UnitFull
 from core.models import Unit
 
 class UnitRegistrationItemSerializer(serializers.ModelSerializer):
@@ -18,5 +19,8 @@ class UnitRegistrationSerializer(serializers.ModelSerializer):
         items_data = validated_data.pop('items')
         registration = UnitRegistration.objects.create(**validated_data)
         for item_data in items_data:
-            UnitRegistrationItem.objects.create(registration=registration, **item_data)
+            try:
+                UnitRegistrationItem.objects.create(registration=registration, **item_data)
+            except UnitFull:
+                raise serializers.ValidationError({'items': [f"{item_data['unit'].code} is full."]})
         return registration
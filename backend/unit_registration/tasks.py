@@ -0,0 +1,9 @@
+from celery import shared_task
+
+from .seats import reconcile_seats
+
+
+@shared_task
+def reconcile_unit_seats_task():
+	"""Correct unit seat counters that drifted from the registration items."""
+	return reconcile_seats()
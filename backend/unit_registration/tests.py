@@ -1,3 +1,112 @@
-from django.test import TestCase
+import threading
+import time
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+
+from core.models import Course, Program, Unit
+from my_profile.models import StudentProfile
+
+from .models import UnitRegistration, UnitRegistrationItem, UnitSeats, check_unit_capacity
+from .seats import UnitFull, reconcile_seats, set_capacity
+
+User = get_user_model()
+SEMESTER = '2025-1'
+
+
+def make_unit(code='CS101'):
+	program = Program.objects.create(name='CS', department='Computing')
+	course = Course.objects.create(code=f'BSC-{code}', name='Computer Science', program=program)
+	return Unit.objects.create(code=code, name='Intro', course=course, semester='1', credits=3)
+
+
+def make_registrations(count):
+	registrations = []
+	for i in range(count):
+		user = User.objects.create(email=f'seat{i}@example.com', password='!')
+		profile = StudentProfile.objects.create(user=user, program='CS', year_of_study=1, gender='F', phone='0700', address='A')
+		registrations.append(UnitRegistration.objects.create(student=profile, semester=SEMESTER))
+	return registrations
+
+
+class UnitSeatTests(TestCase):
+	def setUp(self):
+		self.unit = make_unit()
+		self.registrations = make_registrations(3)
+		set_capacity(self.unit, SEMESTER, 2)
+
+	def _add(self, registration):
+		client = APIClient()
+		client.force_authenticate(registration.student.user)
+		return client.post('/api/unit/add/', {'registration_id': registration.id, 'unit_id': self.unit.id}, format='json')
+
+	def test_add_and_drop_move_the_counter(self):
+		self.assertEqual([self._add(r).status_code for r in self.registrations], [200, 200, 409])
+		self.assertFalse(check_unit_capacity(self.unit, SEMESTER))
+		client = APIClient()
+		client.force_authenticate(self.registrations[0].student.user)
+		resp = client.post('/api/unit/drop/', {'registration_id': self.registrations[0].id, 'unit_id': self.unit.id}, format='json')
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual(UnitSeats.objects.get(unit=self.unit, semester=SEMESTER).taken, 1)
+		self.assertEqual(self._add(self.registrations[2]).status_code, 200)
+
+	def test_bulk_add_stops_at_capacity_and_bulk_drop_releases(self):
+		admin = User.objects.create_user('registrar@example.com', 'pass', is_staff=True)
+		client = APIClient()
+		client.force_authenticate(admin)
+		ids = [r.id for r in self.registrations]
+		resp = client.post('/api/unit/bulk-add/', {'registration_ids': ids, 'unit_id': self.unit.id}, format='json')
+		self.assertEqual((resp.data['added'], resp.data['full']), (ids[:2], ids[2:]))
+		resp = client.post('/api/unit/bulk-drop/', {'registration_ids': ids, 'unit_id': self.unit.id}, format='json')
+		self.assertEqual(resp.data['dropped'], 2)
+		self.assertEqual(UnitSeats.objects.get(unit=self.unit).taken, 0)
+
+	def test_reconciler_fixes_drift(self):
+		UnitRegistrationItem.objects.create(registration=self.registrations[0], unit=self.unit)
+		UnitSeats.objects.update(taken=2)
+		other = make_unit('CS102')
+		UnitRegistrationItem.objects.bulk_create([UnitRegistrationItem(registration=self.registrations[1], unit=other)])
+		self.assertEqual(reconcile_seats(), {'counters': 2, 'created': 1, 'fixed': 1})
+		self.assertEqual(UnitSeats.objects.get(unit=self.unit).taken, 1)
+		self.assertEqual(UnitSeats.objects.get(unit=other).taken, 1)
+
+
+class ConcurrentSeatTests(TransactionTestCase):
+	CAPACITY = 5
+	STUDENTS = 20
+
+	def test_parallel_adds_fill_exactly_the_capacity(self):
+		unit = make_unit()
+		registrations = make_registrations(self.STUDENTS)
+		set_capacity(unit, SEMESTER, self.CAPACITY)
+		start = threading.Barrier(self.STUDENTS)
+		outcomes = []
+
+		def add(registration):
+			start.wait()
+			try:
+				while True:
+					try:
+						UnitRegistrationItem.objects.create(registration=registration, unit=unit)
+						outcomes.append('added')
+						return
+					except UnitFull:
+						outcomes.append('full')
+						return
+					except OperationalError:
+						# SQLite serialises writers; a locked database is retried, not a result
+						time.sleep(0.01)
+			finally:
+				connection.close()
+
+		threads = [threading.Thread(target=add, args=(registration,)) for registration in registrations]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		self.assertEqual(outcomes.count('added'), self.CAPACITY)
+		self.assertEqual(outcomes.count('full'), self.STUDENTS - self.CAPACITY)
+		self.assertEqual(UnitRegistrationItem.objects.filter(unit=unit).count(), self.CAPACITY)
+		self.assertEqual(UnitSeats.objects.get(unit=unit).taken, self.CAPACITY)
@@ -9,25 +9,24 @@ class RegistrationRateThrottle(UserRateThrottle):
 def bulk_drop_units(request):
 	reg_ids = request.data.get('registration_ids', [])
 	unit_id = request.data.get('unit_id')
-	for reg_id in reg_ids:
-		reg = UnitRegistration.objects.filter(id=reg_id).first()
-		if reg:
-			item = reg.items.filter(unit_id=unit_id).first()
-			if item:
-    				item.delete()
-	return Response({'detail': f'Bulk dropped unit {unit_id} from registrations.'})
+	# Each deleted item gives its seat back (see unit_registration.seats)
+	dropped, _ = UnitRegistrationItem.objects.filter(registration_id__in=reg_ids, unit_id=unit_id).delete()
+	return Response({'detail': f'Bulk dropped unit {unit_id} from registrations.', 'dropped': dropped})
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAdminUser])
 def bulk_add_units(request):
 	reg_ids = request.data.get('registration_ids', [])
-	unit_id = request.data.get('unit_id')
-	unit = Unit.objects.filter(id=unit_id).first()
-	for reg_id in reg_ids:
-		reg = UnitRegistration.objects.filter(id=reg_id).first()
-		if reg and unit:
+	unit = get_object_or_404(Unit, id=request.data.get('unit_id'))
+	added, full = [], []
+	for reg in UnitRegistration.objects.filter(id__in=reg_ids).order_by('id'):
+		try:
 			UnitRegistrationItem.objects.create(registration=reg, unit=unit, selected=True)
-	return Response({'detail': f'Bulk added unit {unit_id} to registrations.'})
+		except UnitFull:
+			full.append(reg.id)
+		else:
+			added.append(reg.id)
+	return Response({'detail': f'Bulk added unit {unit.id} to registrations.', 'added': added, 'full': full})
 import csv
 from django.http import HttpResponse
 @api_view(['GET'])
@@ -55,7 +54,7 @@ def export_registrations_csv(request):
 		writer.writerow([reg.student.user.email, reg.semester, reg.status, units])
 	return response
 from notifications.models import Notification
-from notifications.utils import get_unread_count, get_notification_types, get_delivery_status
+from notifications.summary import get_notification_summary
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def registration_history(request):
@@ -63,16 +62,9 @@ def registration_history(request):
 	profile = get_object_or_404(StudentProfile, user=user)
 	regs = UnitRegistration.objects.filter(student=profile).order_by('-created_at')
 	data = UnitRegistrationSerializer(regs, many=True).data
-	notifications = Notification.objects.filter(user=user).order_by('-created_at')
-	unread_count = get_unread_count(user)
-	notification_types = get_notification_types(user)
-	delivery_status = get_delivery_status(user)
 	return Response({
 		'history': data,
-		'notifications': notifications,
-		'unread_notification_count': unread_count,
-		'notification_types': notification_types,
-		'notification_delivery_status': delivery_status,
+		**get_notification_summary(user, request),
 	})
 
 @api_view(['GET'])
@@ -85,29 +77,25 @@ def download_receipt(request, reg_id):
 	receipt = f"Unit Registration Receipt\nStudent: {profile.user.email}\nSemester: {reg.semester}\nUnits: {[item.unit.code for item in reg.items.all()]}"
 	return Response({'receipt': receipt})
 def send_deadline_reminders():
-	from notifications.models import Notification
+	from notifications.fanout import start_fanout
 	# Example: send reminders to students with pending registrations
 	from django.utils import timezone
 	today = timezone.now().date()
 	# Assume REGISTRATION_END is set
 	if REGISTRATION_END and (REGISTRATION_END - today).days <= 3:
-		pending_regs = UnitRegistration.objects.filter(status='pending')
-		for reg in pending_regs:
-			Notification.objects.create(
-				user=reg.student.user,
-				message=f"Unit registration deadline is approaching!",
-				type="unit_registration",
-			)
+		pending = UnitRegistration.objects.filter(status='pending').values_list('student__user_id', flat=True)
+		start_fanout(pending, {
+			'message': "Unit registration deadline is approaching!",
+			'type': "unit_registration",
+		})
 	# Notify admins of pending approvals
 	from django.contrib.auth import get_user_model
 	User = get_user_model()
-	admins = User.objects.filter(is_staff=True)
-	for admin in admins:
-		Notification.objects.create(
-			user=admin,
-			message="There are pending unit registrations to approve.",
-			type="unit_registration_admin",
-		)
+	admins = User.objects.filter(is_staff=True).values_list('id', flat=True)
+	start_fanout(admins, {
+		'message': "There are pending unit registrations to approve.",
+		'type': "unit_registration_admin",
+	})
 from core.models import AuditLog
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -120,7 +108,10 @@ def add_unit(request):
 	if not can_add_or_drop():
 		return Response({'error': 'Add/drop period is closed.'}, status=status.HTTP_403_FORBIDDEN)
 	unit = get_object_or_404(Unit, id=unit_id)
-	UnitRegistrationItem.objects.create(registration=registration, unit=unit, selected=True)
+	try:
+		UnitRegistrationItem.objects.create(registration=registration, unit=unit, selected=True)
+	except UnitFull:
+		return Response({'error': 'Unit is full.'}, status=status.HTTP_409_CONFLICT)
 	return Response({'detail': 'Unit added.'})
 
 @api_view(['POST'])
@@ -172,6 +163,7 @@ from rest_framework.response import Response
 from rest_framework.decorators import action, api_view, permission_classes
 from .models import UnitRegistration, UnitRegistrationItem, can_register_units, get_available_units, validate_credit_hours, can_add_or_drop, REGISTRATION_END
 from .serializers import UnitRegistrationSerializer, UnitRegistrationItemSerializer
+from .seats import UnitFull
 from my_profile.models import StudentProfile
 from core.models import Unit
 from finance_registration.models import FinanceRegistration
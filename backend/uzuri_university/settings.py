@@ -123,6 +123,8 @@ LOGGING = {
 }
 # --- Payment Gateway & SMS Provider Production Credentials ---
 MPESA_ENV = 'production'  # or 'sandbox'
+# Overrides the Daraja host picked from MPESA_ENV (e.g. a local fake Daraja server)
+MPESA_BASE_URL = os.environ.get('MPESA_BASE_URL', '')
 MPESA_CONSUMER_KEY = os.environ.get('MPESA_CONSUMER_KEY', '')
 MPESA_CONSUMER_SECRET = os.environ.get('MPESA_CONSUMER_SECRET', '')
 # Stripe settings
@@ -131,7 +133,13 @@ STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', '')
 MPESA_SHORTCODE = os.environ.get('MPESA_SHORTCODE', '')
 MPESA_PASSKEY = os.environ.get('MPESA_PASSKEY', '')
 MPESA_CALLBACK_URL = os.environ.get('MPESA_CALLBACK_URL', '')
+# Attachment virus scanning: dotted path of a scanner class (see attachments.scanning)
+ATTACHMENT_SCANNER = os.environ.get('ATTACHMENT_SCANNER', 'attachments.scanning.NullScanner')
+CLAMD_HOST = os.environ.get('CLAMD_HOST', '127.0.0.1')
+CLAMD_PORT = int(os.environ.get('CLAMD_PORT', '3310'))
 MPESA_WEBHOOK_SECRET = os.environ.get('MPESA_WEBHOOK_SECRET', '')
+# Store M-Pesa/Airtel callbacks and apply them from a Celery worker instead of in the request
+PAYMENT_WEBHOOK_ASYNC = os.environ.get('PAYMENT_WEBHOOK_ASYNC', 'true').lower() in ('1', 'true', 'yes')
 SMS_API_KEY = os.environ.get('SMS_API_KEY', '')
 SMS_SENDER = os.environ.get('SMS_SENDER', 'sandbox')
 SMS_URL = os.environ.get('SMS_URL', 'https://api.sandbox.africastalking.com/version1/messaging')
@@ -154,6 +162,20 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'fees.tasks.auto_clearance_task',
         'schedule': crontab(hour=3, minute=0),  # daily at 3am
     },
+    'process-payment-callbacks': {
+        # Safety net for callbacks whose on-commit enqueue was lost
+        'task': 'payments.tasks.process_payment_callbacks_task',
+        'schedule': 60.0,
+    },
+    'process-pending-attachments': {
+        # Safety net for uploads whose on-commit enqueue was lost
+        'task': 'attachments.tasks.process_attachments_task',
+        'schedule': 300.0,
+    },
+    'reconcile-unit-seats': {
+        'task': 'unit_registration.tasks.reconcile_unit_seats_task',
+        'schedule': 600.0,
+    },
     'mark-unpaid-hostel-invoices-overdue': {
         'task': 'hostel.views.mark_unpaid_hostel_invoices_overdue',
         'schedule': crontab(hour=7, minute=0),  # daily at 7am
@@ -240,10 +262,16 @@ if 'test' in sys.argv or os.environ.get('PYTEST_CURRENT_TEST'):
     ALLOWED_HOSTS = ALLOWED_HOSTS + ['testserver', 'localhost']
     # Disable MFA enforcement during tests so middleware doesn't block APIClient.force_authenticate
     MFA_ENABLED = False
+    # No Celery worker in tests: apply payment callbacks inside the request
+    PAYMENT_WEBHOOK_ASYNC = False
     # Note: do not change REST_FRAMEWORK here; keep test-time overrides minimal.
 
 # Exam card expiry (days)
 EXAM_CARD_EXPIRY_DAYS = 30
+# Largest fee balance (fees.StudentBalance) a student may owe and still be issued a card
+EXAM_CARD_MAX_BALANCE = 0
+# Semester the nightly issuance runs for; None uses the latest approved unit registration's
+EXAM_CARD_SEMESTER = None
 
 # Branding assets and PDF template settings for exam card
 EXAM_CARD_LOGO_PATH = BASE_DIR / 'branding' / 'logo.png'